@@ -14,13 +14,12 @@
 # limitations under the License.
 
 import getopt
-import socket
 import sys
 import traceback
+from zephyr.common.echo_server import EchoServer
 from zephyr.common import exceptions
 
 DEFAULT_ECHO_PORT = 5080
-TERMINATION_STRING = chr(0x03) + chr(0x04)
 
 
 def usage():
@@ -65,41 +64,8 @@ for arg, value in arg_map:
             "Option not recognized: " + arg)
 
 try:
-    req = echo_request_string + TERMINATION_STRING
-    if protocol == 'tcp':
-        new_socket = socket.create_connection((ip_addr, port), timeout)
-        new_socket.sendall(req)
-    elif protocol == 'udp':
-        new_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        new_socket.settimeout(timeout)
-        new_socket.sendto(req, (ip_addr, port))
-    else:
-        raise exceptions.ArgMismatchException(
-            'Unsupported self.protocol: ' + protocol)
-    new_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    new_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-    data = ''
-    if protocol == 'tcp':
-        while True:
-            new_data = new_socket.recv(2048)
-            """ :type: str"""
-            pos = new_data.find(TERMINATION_STRING)
-            if pos != -1:
-                data += new_data[0:pos]
-                break
-            else:
-                data += new_data
-
-    elif protocol == 'udp':
-        data, addr = new_socket.recvfrom(2048)
-
-    new_socket.close()
-
-    pos = data.find(TERMINATION_STRING)
-    out_str = data
-    if pos != -1:
-        out_str = data[0:pos]
-
+    out_str = EchoServer.send(ip_addr, port, echo_request_string,
+                              protocol=protocol, timeout=timeout)
     print(out_str.strip())
 
 except Exception as e:
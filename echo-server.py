@@ -13,30 +13,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import errno
 import getopt
 import logging
-import select
 import signal
-import socket
 import sys
-import threading
-import time
 
+from zephyr.common.echo_server import EchoServer
 from zephyr.common import exceptions
 from zephyr.common import log_manager
+from zephyr.common.netns_agent import NetNSAgent
 
 
 DEFAULT_ECHO_PORT = 5080
-TIMEOUT = 5
-TERMINATION_STRING = chr(0x03) + chr(0x04)
-ECHO_SERVER_TIMEOUT = 3
 
 
 def usage():
     print('Usage: echo-server.py [-i <ip>] [-p <port>] [-d] [-c <protocol>]')
     print('                      [-o <output_string>] [-t <timeout>]')
     print('                      [-l <log_file>] [-r <log_root>]')
+    print('                      [-s <control_socket>]')
+    print('With -s, run as an agent which starts and stops listeners,')
+    print('and sends echo requests, pings and probes, on control')
+    print('messages (see NetNSAgentClient), and only listens on startup')
+    print('if -p is given.')
 
 
 arg_map, _ = getopt.getopt(
@@ -50,16 +49,18 @@ arg_map, _ = getopt.getopt(
     'l:'
     'r:'
     'n:'
+    's:'
     'h',
     ['help', 'ip=', 'port=', 'debug', 'out-str=', 'protocol=',
-     'timeout=', 'log-file=', 'log-dir=', 'log-name='])
+     'timeout=', 'log-file=', 'log-dir=', 'log-name=', 'control='])
 
 ip_addr = 'localhost'
-port = DEFAULT_ECHO_PORT
+port = None
 debug = False
 echo_reply_string = "pong"
 protocol = "tcp"
-timeout = 3600
+timeout = None
+control_path = None
 log_dir = '/tmp'
 log_file = 'echo-server-status.log'
 log_name = 'echo_server'
@@ -83,6 +84,8 @@ for arg, value in arg_map:
         log_dir = value
     elif arg in ('-n', 'name'):
         log_name = value
+    elif arg in ('-s', 'control'):
+        control_path = value
     elif arg in ('-h', 'help'):
         usage()
         exit(0)
@@ -97,109 +100,34 @@ LOG = lm.add_tee_logger(
     file_log_level=logging.DEBUG if debug else logging.INFO,
     stdout_log_level=logging.DEBUG if debug else logging.INFO)
 
-stop_event = threading.Event()
-finished_event = threading.Event()
+if control_path is not None:
+    server = NetNSAgent(control_path=control_path, logger=LOG)
+else:
+    server = EchoServer(ip_addr=ip_addr,
+                        port=port if port is not None else DEFAULT_ECHO_PORT,
+                        echo_data=echo_reply_string, protocol=protocol,
+                        logger=LOG)
+    if timeout is None:
+        timeout = 3600
 
 
 def term_handler(_, __):
     print("Exiting...")
     LOG.info('Stopping based on signal')
-    stop_event.set()
-    LOG.info('Exiting based on signal')
+    server.stop_event.set()
     exit(0)
 
 signal.signal(signal.SIGTERM, term_handler)
 signal.signal(signal.SIGINT, term_handler)
 
 
-stop_event.clear()
 LOG.info('Starting Echo Server on IP: ' + ip_addr + ', port: ' + str(port))
 try:
-    if protocol == 'tcp':
-        _socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    # TODO(micucci): Enable UDP
-    # elif protocol == 'udp':
-    #     _socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
-    #                             socket.IPPROTO_UDP)
-    else:
-        raise exceptions.ArgMismatchException(
-            'Unsupported protocol: ' + protocol)
-    _socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    _socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-    _socket.setblocking(0)
-    _socket.bind((ip_addr, port))
-    if protocol == 'tcp':
-        _socket.listen(2)
-        LOG.debug('Listener TCP Socket listening')
-
-    deadline = time.time() + int(timeout)
-    while not stop_event.is_set():
-        if time.time() > deadline:
-            stop_event.set()
-            LOG.debug('Listener TCP Socket timeout reached')
-            break
-
-        ready_list, _, _ = select.select([_socket], [], [], 0)
-        if ready_list:
-
-            if protocol == 'tcp':
-                debug and LOG.debug(
-                    'Listener TCP Socket connected')
-                conn, addr = ready_list[0].accept()
-                conn.setblocking(0)
-
-            data = ''
-            addr = None
-            while True:
-                try:
-                    if protocol == 'tcp':
-                        new_data = conn.recv(
-                            1024, socket.MSG_WAITALL)
-                    elif protocol == 'udp':
-                        new_data, addr = _socket.recvfrom(
-                            1024, socket.MSG_WAITALL)
-                except socket.error as e:
-                    if (e.args[0] == errno.EAGAIN or
-                            e.args[0] == errno.EWOULDBLOCK):
-                        continue
-                debug and LOG.debug(
-                    'Listener Socket read some ' +
-                    protocol + ' data: ' + new_data)
-                pos = new_data.find(TERMINATION_STRING)
-                if pos != -1:
-                    data += new_data[0:pos]
-                    break
-                else:
-                    data += new_data
-
-            debug and LOG.debug(
-                'Listener Socket received all  ' +
-                protocol + ' data: ' + data)
-
-            send_data = echo_reply_string + TERMINATION_STRING
-            if protocol == 'tcp':
-                conn.sendall(data + ':' + send_data)
-            elif protocol == 'udp':
-                _socket.sendto(data + ':' + send_data, addr)
-
-            debug and LOG.debug(
-                'Listener Socket sent appended ' +
-                protocol + ' data: ' + send_data)
-
-            if protocol == 'tcp':
-                conn.close()
-            elif protocol == 'udp':
-                _socket.close()
-        time.sleep(0)
-
-    LOG.debug('Listener Socket terminating')
-    if protocol == 'tcp':
-        _socket.shutdown(socket.SHUT_RDWR)
-    _socket.close()
-    LOG.debug('Listener Socket finished')
+    server.open()
+    if control_path is not None and port is not None:
+        server.add_listener(ip_addr, port, echo_reply_string, protocol)
+    server.serve(timeout=float(timeout) if timeout is not None else None)
+    LOG.debug('Echo server finished')
 except Exception as e:
     LOG.error('SERVER ERROR: ' + str(e))
     raise
-except socket.error as e:
-    LOG.error('SOCKET-SETUP ERROR: ' + str(e))
-    raise
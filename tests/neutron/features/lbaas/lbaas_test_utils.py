@@ -25,6 +25,9 @@ from zephyr.tsm.neutron_test_case import NeutronTestCase
 LBNetData = namedtuple('LBNetData', 'lbaas member pinger router member_vms')
 
 NUM_PACKETS_TO_SEND = 50
+# How many echo requests are in flight at once when sending to a VIP
+ECHO_CONCURRENCY = 10
+MISMATCHED_RESPONSE = 'MISMATCHED_RESPONSE_'
 DEFAULT_POOL_PORT = DEFAULT_ECHO_PORT
 
 
@@ -169,15 +172,13 @@ class LBaaSTestCase(NeutronTestCase):
         net_id = self.topos[name][net]['network']['id']
         gw_ip = self.topos[name][net]['subnet']['gateway_ip']
 
-        ret = []
         new_name = name.translate(None, 'aeiou')
-        for i in range(0, num_members):
-            ret.append(GuestData(*self.create_vm_server(
-                name='m_' + new_name + '_' + str(i),
-                net_id=net_id,
-                gw_ip=gw_ip,
-                hv_host=hv_host)))
-        return ret
+        return [GuestData(*server) for server in self.create_vm_servers(
+            [{'name': 'm_' + new_name + '_' + str(i),
+              'net_id': net_id,
+              'gw_ip': gw_ip,
+              'hv_host': hv_host}
+             for i in range(0, num_members)])]
 
     def create_pinger_vm(self,
                          name='main',
@@ -320,7 +321,8 @@ class LBaaSTestCase(NeutronTestCase):
 
     def send_packets_to_vip(self, member_list, pinger,
                             vip, num_packets=NUM_PACKETS_TO_SEND,
-                            to_port=DEFAULT_POOL_PORT):
+                            to_port=DEFAULT_POOL_PORT,
+                            concurrency=ECHO_CONCURRENCY):
         """
         :type self: NeutronTestCase
         :type member_list: list[GuestData]
@@ -328,6 +330,7 @@ class LBaaSTestCase(NeutronTestCase):
         :type vip: str
         :type num_packets: int
         :type to_port: int
+        :type concurrency: int
         :return:
         """
         host_replies = {}
@@ -344,34 +347,20 @@ class LBaaSTestCase(NeutronTestCase):
 
             self.LOG.debug("Sending " + str(num_packets) +
                            " TCP count from LBaaS VM to VIP:" + str(vip))
-            streak_no_response = 0
-            for i in range(0, num_packets):
-                reply = pinger.vm.send_echo_request(
-                    dest_ip=str(vip), dest_port=to_port,
-                    echo_request='ping').strip()
-                self.LOG.debug('Got reply from echo-server: ' + reply)
-                replying_vm = reply.split(':')[-1]
-                if replying_vm != '':
-                    if replying_vm not in host_replies:
-                        if "MISMATCH_RESPONSE_" + replying_vm \
-                                not in host_replies:
-                            host_replies["MISMIATCHED_RESPONSE_" +
-                                         replying_vm] = 0
-                        host_replies["MISMIATCHED_RESPONSE_" +
-                                     replying_vm] += 1
-                    else:
-                        host_replies[replying_vm] += 1
-                    streak_no_response = 0
+            result = pinger.vm.send_echo_requests(
+                dest_ip=str(vip), dest_port=to_port, count=num_packets,
+                concurrency=concurrency)
+            self.LOG.debug('Got replies from echo-servers: ' +
+                           result.to_str())
+            for replying_vm, count in result.replies.iteritems():
+                if replying_vm == '':
+                    continue
+                if replying_vm not in host_replies:
+                    host_replies[MISMATCHED_RESPONSE + replying_vm] = count
                 else:
-                    host_replies["NO_RESPONSE"] += 1
-                    streak_no_response += 1
-                    if streak_no_response >= 5:
-                        self.LOG.fatal("5 missed packets in a row: giving up")
-                        # Fill in the rest of the "NO_RESPONSE"
-                        # (minus one because we already marked
-                        # this packet as NO_RESPONSE)
-                        host_replies["NO_RESPONSE"] += num_packets - i - 1
-                        break
+                    host_replies[replying_vm] += count
+            host_replies["NO_RESPONSE"] = (
+                num_packets - sum(host_replies.itervalues()))
         finally:
             for g in member_list:
                 g.vm.stop_echo_server(ip_addr=g.ip, port=to_port)
@@ -402,8 +391,8 @@ class LBaaSTestCase(NeutronTestCase):
                                       str(failed_response) + ']')
 
         for vm in [m for m in host_replies.iterkeys()
-                   if m.startswith("MISMIATCHED_RESPONSE_")]:
-            mismatch_name = vm[21:]
+                   if m.startswith(MISMATCHED_RESPONSE)]:
+            mismatch_name = vm[len(MISMATCHED_RESPONSE):]
             failure_conditions.append(
                 'Received [' + str(host_replies[vm]) +
                 '] mismatched and unexpected reply(ies): ' +
@@ -428,7 +417,7 @@ class LBaaSTestCase(NeutronTestCase):
 
         for h in member_list:
             name = h.vm.vm_underlay.name
-            count = host_replies[name]
+            count = host_replies.get(name, 0)
             self.LOG.debug("Got " + str(count) + " packets on VM: " + name)
 
             if name not in host_replies or host_replies[name] == 0:
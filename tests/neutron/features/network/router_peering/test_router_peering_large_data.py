@@ -18,6 +18,11 @@ from zephyr.vtm import neutron_api
 
 from router_peering_utils import L2GWNeutronTestCase
 
+BULK_DATA_SIZE = 10 * 1024 * 1024
+# Only meant to catch a path which is broken for bulk data (e.g. by
+# fragmentation or retransmissions), not to benchmark it
+MIN_BULK_THROUGHPUT = 1000000
+
 
 class TestRouterPeeringLargeData(L2GWNeutronTestCase):
     def create_neutron_main_pub_networks(
@@ -139,3 +144,7 @@ class TestRouterPeeringLargeData(L2GWNeutronTestCase):
         echo_response = vm1.send_echo_request(dest_ip=ip2,
                                               echo_request=long_data)
         self.assertEqual(long_data + ':pong', echo_response)
+
+        # Bulk TCP both ways over the peering
+        self.check_throughput(vm1, ip2, size=BULK_DATA_SIZE,
+                              min_bps=MIN_BULK_THROUGHPUT)
@@ -201,6 +201,7 @@ try:
         log_manager=log_manager)
     vtm.configure_logging(debug=debug)
     vtm.read_underlay_config(underlay_config)
+    vtm.underlay_system.fill_vm_pool()
 
     console_log.debug('Setting up tsm')
     tsm = TestSystemManager(vtm, log_manager=log_manager)
@@ -265,6 +266,7 @@ try:
                 print(err)
 
     finally:
+        vtm.underlay_system.clear_vm_pool()
         rdir = results_dir + '/' + name
         tsm.create_results(results_dir=rdir)
 
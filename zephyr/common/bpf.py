@@ -0,0 +1,702 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import struct
+import threading
+
+from zephyr.common.exceptions import *
+from zephyr.common import pcap
+from zephyr.common.pcap_packet import *
+
+# Classic BPF opcodes (linux/filter.h)
+BPF_LD = 0x00
+BPF_LDX = 0x01
+BPF_ALU = 0x04
+BPF_JMP = 0x05
+BPF_RET = 0x06
+
+BPF_W = 0x00
+BPF_H = 0x08
+BPF_B = 0x10
+
+BPF_ABS = 0x20
+BPF_IND = 0x40
+BPF_LEN = 0x80
+BPF_MSH = 0xa0
+
+BPF_AND = 0x50
+
+BPF_JA = 0x00
+BPF_JEQ = 0x10
+BPF_JGT = 0x20
+BPF_JGE = 0x30
+BPF_JSET = 0x40
+
+BPF_K = 0x00
+
+# Conditional jumps can only skip this many instructions
+BPF_MAX_JUMP = 0xff
+
+# Filters are compiled for Ethernet framing, which is what AF_PACKET raw
+# sockets see on ethernet, veth, tap and loopback devices.
+ETHER_HEADER_LEN = 14
+ETHER_TYPE_OFFSET = 12
+IP4_PROTO_OFFSET = ETHER_HEADER_LEN + 9
+IP4_FRAG_OFFSET = ETHER_HEADER_LEN + 6
+IP4_SRC_OFFSET = ETHER_HEADER_LEN + 12
+IP4_DST_OFFSET = ETHER_HEADER_LEN + 16
+IP6_NEXT_HEADER_OFFSET = ETHER_HEADER_LEN + 6
+IP6_PAYLOAD_OFFSET = ETHER_HEADER_LEN + 40
+ARP_SPA_OFFSET = ETHER_HEADER_LEN + 14
+ARP_TPA_OFFSET = ETHER_HEADER_LEN + 24
+
+# Offsets in a Linux cooked (SLL) header, which 'any' captures use
+SLL_ADDR_OFFSET = 6
+SLL_PROTOCOL_OFFSET = 14
+SLL_HEADER_LEN = 16
+
+IP_PROTOCOL_SCTP = 132
+
+IP_PROTOCOL_NAMES = {'icmp': IP4_PROTOCOL_ICMP,
+                     'igmp': 2,
+                     'tcp': IP4_PROTOCOL_TCP,
+                     'udp': IP4_PROTOCOL_UDP,
+                     'gre': 47,
+                     'sctp': IP_PROTOCOL_SCTP}
+
+ETHER_PROTOCOL_NAMES = {'ip': ETHERNET_PROTOCOL_TYPE_IP4,
+                        'ip6': ETHERNET_PROTOCOL_TYPE_IP6,
+                        'arp': ETHERNET_PROTOCOL_TYPE_ARP,
+                        'rarp': ETHERNET_PROTOCOL_TYPE_RARP}
+
+# How many compiled filters (BPF programs and Python predicates) to keep
+COMPILE_CACHE_SIZE = 256
+
+TRUE = ('true',)
+FALSE = ('false',)
+
+
+def _test(load, op, k, mask=None):
+    return 'test', load, op, k, mask
+
+
+def _and(*exprs):
+    return 'and', list(exprs)
+
+
+def _or(*exprs):
+    return 'or', list(exprs)
+
+
+def _not(expr):
+    return 'not', expr
+
+
+def _ether_type(ether_type):
+    return _test(('abs', BPF_H, ETHER_TYPE_OFFSET), 'eq', ether_type)
+
+
+def _directional(source, dest, src_expr, dst_expr):
+    if source and dest:
+        return _and(src_expr, dst_expr)
+    if source:
+        return src_expr
+    if dest:
+        return dst_expr
+    return _or(src_expr, dst_expr)
+
+
+def _ip4_to_int(addr):
+    return struct.unpack('!I', socket.inet_aton(addr))[0]
+
+
+def _resolve_ip4(host):
+    try:
+        return _ip4_to_int(socket.gethostbyname(host))
+    except (socket.error, UnicodeError):
+        raise FilterCompileException('Cannot resolve host: ' + str(host))
+
+
+def _mac_to_ints(mac):
+    try:
+        octets = [int(o, 16) for o in mac.replace('-', ':').split(':')]
+    except ValueError:
+        octets = []
+    if len(octets) != 6:
+        raise FilterCompileException('Invalid MAC address: ' + str(mac))
+    return (((octets[0] << 8) | octets[1]),
+            struct.unpack('!I', bytes(bytearray(octets[2:])))[0])
+
+
+def _mac_equal(offset, mac):
+    high, low = _mac_to_ints(mac)
+    return _and(_test(('abs', BPF_W, offset + 2), 'eq', low),
+                _test(('abs', BPF_H, offset), 'eq', high))
+
+
+def _ip_proto_number(proto):
+    proto = str(proto).lstrip('\\')
+    if proto in IP_PROTOCOL_NAMES:
+        return IP_PROTOCOL_NAMES[proto]
+    try:
+        return int(proto)
+    except ValueError:
+        try:
+            return socket.getprotobyname(proto)
+        except socket.error:
+            raise FilterCompileException('Unknown IP protocol: ' + proto)
+
+
+def _port_number(port, proto):
+    try:
+        return int(port)
+    except ValueError:
+        try:
+            return socket.getservbyname(str(port),
+                                        proto if proto != '' else None)
+        except socket.error:
+            raise FilterCompileException('Unknown port: ' + str(port))
+
+
+def _ip_proto(proto_num):
+    """ ip proto <n> or ip6 proto <n> (like tcpdump's 'tcp'/'udp') """
+    return _or(_and(_ether_type(ETHERNET_PROTOCOL_TYPE_IP4),
+                    _test(('abs', BPF_B, IP4_PROTO_OFFSET), 'eq',
+                          proto_num)),
+               _and(_ether_type(ETHERNET_PROTOCOL_TYPE_IP6),
+                    _test(('abs', BPF_B, IP6_NEXT_HEADER_OFFSET), 'eq',
+                          proto_num)))
+
+
+def _port_match(rule, proto_num, port_test):
+    # IPv4 ports are only present in the first fragment, and start after
+    # the (variable length) IP header; IPv6 ports are taken to follow the
+    # fixed header directly
+    ip4 = _and(_ether_type(ETHERNET_PROTOCOL_TYPE_IP4),
+               _test(('abs', BPF_B, IP4_PROTO_OFFSET), 'eq', proto_num),
+               _not(_test(('abs', BPF_H, IP4_FRAG_OFFSET), 'set', 0x1fff)),
+               _directional(rule.source, rule.dest,
+                            port_test(('ind', BPF_H, ETHER_HEADER_LEN)),
+                            port_test(('ind', BPF_H, ETHER_HEADER_LEN + 2))))
+    ip6 = _and(_ether_type(ETHERNET_PROTOCOL_TYPE_IP6),
+               _test(('abs', BPF_B, IP6_NEXT_HEADER_OFFSET), 'eq', proto_num),
+               _directional(rule.source, rule.dest,
+                            port_test(('abs', BPF_H, IP6_PAYLOAD_OFFSET)),
+                            port_test(('abs', BPF_H,
+                                       IP6_PAYLOAD_OFFSET + 2))))
+    return _or(ip4, ip6)
+
+
+def _port_protos(rule):
+    if rule.proto == '':
+        return [IP4_PROTOCOL_TCP, IP4_PROTOCOL_UDP, IP_PROTOCOL_SCTP]
+    if rule.proto in ('tcp', 'udp', 'sctp'):
+        return [IP_PROTOCOL_NAMES[rule.proto]]
+    raise FilterCompileException(
+        'Ports are not valid for protocol: ' + rule.proto)
+
+
+def _host_expr(rule):
+    if rule.proto == 'ether':
+        return _directional(rule.source, rule.dest,
+                            _mac_equal(6, rule.host),
+                            _mac_equal(0, rule.host))
+
+    addr = _resolve_ip4(rule.host)
+    ip = _and(_ether_type(ETHERNET_PROTOCOL_TYPE_IP4),
+              _directional(
+                  rule.source, rule.dest,
+                  _test(('abs', BPF_W, IP4_SRC_OFFSET), 'eq', addr),
+                  _test(('abs', BPF_W, IP4_DST_OFFSET), 'eq', addr)))
+    arps = [_and(_ether_type(t),
+                 _directional(
+                     rule.source, rule.dest,
+                     _test(('abs', BPF_W, ARP_SPA_OFFSET), 'eq', addr),
+                     _test(('abs', BPF_W, ARP_TPA_OFFSET), 'eq', addr)))
+            for t in (ETHERNET_PROTOCOL_TYPE_ARP, ETHERNET_PROTOCOL_TYPE_RARP)]
+
+    if rule.proto == 'ip':
+        return ip
+    if rule.proto == 'arp':
+        return arps[0]
+    if rule.proto == 'rarp':
+        return arps[1]
+    if rule.proto == '':
+        return _or(ip, *arps)
+    raise FilterCompileException(
+        'Hosts are not supported for protocol: ' + rule.proto)
+
+
+def _net_expr(rule):
+    net = rule.net
+    if '/' in net:
+        net, prefix_len = net.split('/', 1)
+        mask = (0xffffffff << (32 - int(prefix_len))) & 0xffffffff
+        octets = net.split('.')
+    elif rule.mask != '':
+        mask = _ip4_to_int(rule.mask)
+        octets = net.split('.')
+    else:
+        # tcpdump treats 'net 10.1' as 10.1.0.0/16
+        octets = net.split('.')
+        mask = (0xffffffff << (8 * (4 - len(octets)))) & 0xffffffff
+    addr = _ip4_to_int('.'.join((octets + ['0', '0', '0'])[0:4]))
+    if addr & ~mask & 0xffffffff:
+        raise FilterCompileException(
+            'Non-network bits set in net: ' + rule.net)
+
+    def net_test(offset):
+        return _test(('abs', BPF_W, offset), 'eq', addr, mask)
+
+    ip = _and(_ether_type(ETHERNET_PROTOCOL_TYPE_IP4),
+              _directional(rule.source, rule.dest,
+                           net_test(IP4_SRC_OFFSET), net_test(IP4_DST_OFFSET)))
+    arps = [_and(_ether_type(t),
+                 _directional(rule.source, rule.dest,
+                              net_test(ARP_SPA_OFFSET),
+                              net_test(ARP_TPA_OFFSET)))
+            for t in (ETHERNET_PROTOCOL_TYPE_ARP, ETHERNET_PROTOCOL_TYPE_RARP)]
+    if rule.proto == 'ip':
+        return ip
+    if rule.proto == '':
+        return _or(ip, *arps)
+    raise FilterCompileException(
+        'Nets are not supported for protocol: ' + rule.proto)
+
+
+def _comparison_expr(rule):
+    # Only comparisons of the packet length against a constant can be
+    # compiled; arbitrary packet accessor expressions are left to tcpdump
+    lhs, op, rhs = str(rule.lhs).strip(), rule.operation, str(rule.rhs).strip()
+    if lhs != 'len':
+        if rhs != 'len':
+            raise FilterCompileException(
+                'Unsupported comparison: ' + rule.to_str())
+        lhs, rhs = rhs, lhs
+        op = {'>': '<', '>=': '<=', '<': '>', '<=': '>='}.get(op, op)
+    try:
+        value = int(rhs, 0)
+    except ValueError:
+        raise FilterCompileException(
+            'Unsupported comparison: ' + rule.to_str())
+
+    load = ('len',)
+    if op == '=':
+        return _test(load, 'eq', value)
+    if op == '!=':
+        return _not(_test(load, 'eq', value))
+    if op == '>':
+        return _test(load, 'gt', value)
+    if op == '>=':
+        return _test(load, 'ge', value)
+    if op == '<':
+        return _not(_test(load, 'ge', value))
+    if op == '<=':
+        return _not(_test(load, 'gt', value))
+    raise FilterCompileException('Unsupported comparison: ' + rule.to_str())
+
+
+def rule_to_expr(rule):
+    """
+    Translates a pcap Rule tree into the boolean test expression the BPF
+    code generator works from.  Raises FilterCompileException for rules
+    which can't be expressed (e.g. free-form Simple rules).
+    :type rule: pcap.Rule
+    :return: tuple
+    """
+    if rule is None:
+        return TRUE
+
+    if isinstance(rule, pcap.Simple):
+        if rule.explicit_val.strip() == '':
+            return TRUE
+        raise FilterCompileException(
+            'Free-form filter cannot be compiled: ' + rule.explicit_val)
+
+    if isinstance(rule, pcap.And):
+        return _and(*[rule_to_expr(r) for r in rule.rule_set])
+
+    if isinstance(rule, pcap.Or):
+        if len(rule.rule_set) == 0:
+            return TRUE
+        return _or(*[rule_to_expr(r) for r in rule.rule_set])
+
+    if isinstance(rule, pcap.Not):
+        return _not(rule_to_expr(rule.rule))
+
+    if isinstance(rule, pcap.Host):
+        return _host_expr(rule)
+
+    if isinstance(rule, pcap.Net):
+        return _net_expr(rule)
+
+    if isinstance(rule, pcap.Port):
+        port = _port_number(rule.port, rule.proto)
+        return _or(*[
+            _port_match(rule, p, lambda load: _test(load, 'eq', port))
+            for p in _port_protos(rule)])
+
+    if isinstance(rule, pcap.PortRange):
+        start = _port_number(rule.start_port, rule.proto)
+        end = _port_number(rule.end_port, rule.proto)
+        return _or(*[
+            _port_match(rule, p, lambda load: _and(
+                _test(load, 'ge', start), _not(_test(load, 'gt', end))))
+            for p in _port_protos(rule)])
+
+    if isinstance(rule, pcap.EtherProto):
+        if rule.filter_proto not in ETHER_PROTOCOL_NAMES:
+            raise FilterCompileException(
+                'Unsupported ether protocol: ' + rule.filter_proto)
+        return _ether_type(ETHER_PROTOCOL_NAMES[rule.filter_proto])
+
+    if isinstance(rule, pcap.IPProto):
+        return _and(_ether_type(ETHERNET_PROTOCOL_TYPE_IP4),
+                    _test(('abs', BPF_B, IP4_PROTO_OFFSET), 'eq',
+                          _ip_proto_number(rule.filter_proto)))
+
+    if isinstance(rule, pcap.ICMPProto):
+        return _and(_ether_type(ETHERNET_PROTOCOL_TYPE_IP4),
+                    _test(('abs', BPF_B, IP4_PROTO_OFFSET), 'eq',
+                          IP4_PROTOCOL_ICMP))
+
+    if isinstance(rule, (pcap.TCPProto, pcap.UDPProto)):
+        return _ip_proto(IP_PROTOCOL_NAMES[rule.proto])
+
+    if isinstance(rule, pcap.Broadcast) and rule.proto == 'ether':
+        return _mac_equal(0, 'ff:ff:ff:ff:ff:ff')
+
+    if isinstance(rule, pcap.Multicast) and rule.proto == 'ether':
+        return _test(('abs', BPF_B, 0), 'set', 0x01)
+
+    if isinstance(rule, pcap.Multicast) and rule.proto == 'ip':
+        return _and(_ether_type(ETHERNET_PROTOCOL_TYPE_IP4),
+                    _test(('abs', BPF_B, IP4_DST_OFFSET), 'ge', 224))
+
+    if isinstance(rule, pcap._PrimitiveComparison):
+        return _comparison_expr(rule)
+
+    raise FilterCompileException('Rule cannot be compiled: ' + rule.to_str())
+
+
+class _CodeGen(object):
+    def __init__(self):
+        self.insns = []
+        """ :type: list[list]"""
+        self.labels = {}
+        """ :type: dict[int, int]"""
+        self.next_label = 0
+
+    def new_label(self):
+        self.next_label += 1
+        return self.next_label
+
+    def place(self, label):
+        self.labels[label] = len(self.insns)
+
+    def emit(self, code, k=0, jt=None, jf=None):
+        self.insns.append([code, jt, jf, k])
+
+    def gen(self, expr, t, f):
+        kind = expr[0]
+        if kind == 'true':
+            self.emit(BPF_JMP | BPF_JA, k=t)
+        elif kind == 'false':
+            self.emit(BPF_JMP | BPF_JA, k=f)
+        elif kind == 'not':
+            self.gen(expr[1], f, t)
+        elif kind in ('and', 'or'):
+            children = expr[1]
+            if len(children) == 0:
+                self.gen(TRUE, t, f)
+                return
+            for child in children[:-1]:
+                next_label = self.new_label()
+                if kind == 'and':
+                    self.gen(child, next_label, f)
+                else:
+                    self.gen(child, t, next_label)
+                self.place(next_label)
+            self.gen(children[-1], t, f)
+        else:
+            _, load, op, k, mask = expr
+            self.gen_load(load)
+            if mask is not None:
+                self.emit(BPF_ALU | BPF_AND | BPF_K, k=mask)
+            jump = {'eq': BPF_JEQ, 'gt': BPF_JGT,
+                    'ge': BPF_JGE, 'set': BPF_JSET}[op]
+            self.emit(BPF_JMP | jump | BPF_K, k=k, jt=t, jf=f)
+
+    def gen_load(self, load):
+        if load[0] == 'len':
+            self.emit(BPF_LD | BPF_W | BPF_LEN)
+        elif load[0] == 'abs':
+            self.emit(BPF_LD | load[1] | BPF_ABS, k=load[2])
+        else:
+            # X = IP header length, then load relative to it
+            self.emit(BPF_LDX | BPF_B | BPF_MSH, k=ETHER_HEADER_LEN)
+            self.emit(BPF_LD | load[1] | BPF_IND, k=load[2])
+
+    def assemble(self):
+        program = []
+        for i, (code, jt, jf, k) in enumerate(self.insns):
+            if code == BPF_JMP | BPF_JA:
+                k = self.labels[k] - (i + 1)
+                jt = jf = 0
+            elif jt is not None:
+                jt = self.labels[jt] - (i + 1)
+                jf = self.labels[jf] - (i + 1)
+                if jt > BPF_MAX_JUMP or jf > BPF_MAX_JUMP:
+                    raise FilterCompileException(
+                        'Filter is too large to compile')
+            else:
+                jt = jf = 0
+            program.append((code, jt, jf, k))
+        return program
+
+
+class _PredicateGen(object):
+    """
+    Generates the source of a Python function which evaluates a test
+    expression over a frame's data directly, instead of running the
+    equivalent BPF program in run_filter.  A load past the end of the
+    frame raises struct.error, which rejects the frame just as it does
+    in BPF.
+    """
+    _UNPACKERS = {BPF_W: '_unpack_w', BPF_H: '_unpack_h', BPF_B: '_unpack_b'}
+
+    def gen(self, expr):
+        kind = expr[0]
+        if kind == 'true':
+            return 'True'
+        if kind == 'false':
+            return 'False'
+        if kind == 'not':
+            return '(not ' + self.gen(expr[1]) + ')'
+        if kind in ('and', 'or'):
+            if len(expr[1]) == 0:
+                return 'True'
+            return ('(' + (' ' + kind + ' ').join(
+                self.gen(child) for child in expr[1]) + ')')
+
+        _, load, op, k, mask = expr
+        value = self.gen_load(load)
+        if mask is not None:
+            value = '(' + value + ' & ' + str(mask) + ')'
+        if op == 'set':
+            return '(' + value + ' & ' + str(k) + ' != 0)'
+        return ('(' + value + ' ' + {'eq': '==', 'gt': '>', 'ge': '>='}[op] +
+                ' ' + str(k) + ')')
+
+    def gen_load(self, load):
+        if load[0] == 'len':
+            return 'len(data)'
+        if load[0] == 'abs':
+            return self._UNPACKERS[load[1]] + '(data, ' + str(load[2]) + ')[0]'
+        return (self._UNPACKERS[load[1]] + '(data, (_unpack_b(data, ' +
+                str(ETHER_HEADER_LEN) + ')[0] & 0x0f) * 4 + ' +
+                str(load[2]) + ')[0]')
+
+    def function(self, expr):
+        """
+        :type expr: tuple
+        :return: callable
+        """
+        source = ('def matches(data):\n'
+                  '    try:\n'
+                  '        return ' + self.gen(expr) + '\n'
+                  '    except struct.error:\n'
+                  '        return False\n')
+        namespace = {'struct': struct,
+                     '_unpack_w': struct.Struct('!I').unpack_from,
+                     '_unpack_h': struct.Struct('!H').unpack_from,
+                     '_unpack_b': struct.Struct('!B').unpack_from}
+        exec(compile(source, '<pcap filter>', 'exec'), namespace)
+        return namespace['matches']
+
+
+_compile_cache = {}
+""" :type: dict[(str, str, int), object]"""
+_compile_cache_lock = threading.Lock()
+
+
+def _cached_compile(kind, rule, snaplen, build):
+    # Rules are keyed by their tcpdump filter string, which determines
+    # exactly what they match
+    key = (kind, rule.to_str() if rule is not None else '', snaplen)
+    with _compile_cache_lock:
+        if key in _compile_cache:
+            return _compile_cache[key]
+    compiled = build()
+    with _compile_cache_lock:
+        if len(_compile_cache) >= COMPILE_CACHE_SIZE:
+            _compile_cache.clear()
+        _compile_cache[key] = compiled
+    return compiled
+
+
+def clear_compile_cache():
+    with _compile_cache_lock:
+        _compile_cache.clear()
+
+
+def _compile_program(rule, snaplen):
+    codegen = _CodeGen()
+    accept = codegen.new_label()
+    reject = codegen.new_label()
+    codegen.gen(rule_to_expr(rule), accept, reject)
+    codegen.place(accept)
+    codegen.emit(BPF_RET | BPF_K, k=snaplen)
+    codegen.place(reject)
+    codegen.emit(BPF_RET | BPF_K, k=0)
+    return tuple(codegen.assemble())
+
+
+def compile_rule(rule, snaplen=0xffff):
+    """
+    Compiles a pcap Rule tree into a classic BPF program (a list of
+    (code, jt, jf, k) instructions) matching frames with an Ethernet
+    header, which accepts up to snaplen bytes of each matching frame.
+    Compiled programs are cached, so compiling the same filter again is
+    cheap.
+    :type rule: pcap.Rule
+    :type snaplen: int
+    :return: list[(int, int, int, int)]
+    """
+    return list(_cached_compile('bpf', rule, snaplen,
+                                lambda: _compile_program(rule, snaplen)))
+
+
+def compile_frame_predicate(rule):
+    """
+    Compiles a pcap Rule tree into a Python function which tells whether
+    a frame with an Ethernet header (as a str) matches it, exactly as the
+    rule's BPF program would, but without interpreting the program.
+    Compiled functions are cached like BPF programs.
+    :type rule: pcap.Rule
+    :return: callable
+    """
+    return _cached_compile(
+        'python', rule, 0,
+        lambda: _PredicateGen().function(rule_to_expr(rule)))
+
+
+_LOAD_SIZES = {BPF_W: struct.Struct('!I'),
+               BPF_H: struct.Struct('!H'),
+               BPF_B: struct.Struct('!B')}
+
+
+def run_filter(program, data, offset=0, length=None):
+    """
+    Runs a classic BPF program (as produced by compile_rule) over a frame
+    the way the kernel would, and returns the number of bytes it accepts
+    (0 if the frame is rejected).  The frame is the length bytes of data
+    starting at offset, so frames can be filtered in place in a larger
+    buffer (e.g. an mmap-ed capture file).
+    :type program: list[(int, int, int, int)]
+    :type data: str | buffer | mmap.mmap
+    :type offset: int
+    :type length: int
+    :return: int
+    """
+    if length is None:
+        length = len(data) - offset
+    a = x = 0
+    pc = 0
+    while pc < len(program):
+        code, jt, jf, k = program[pc]
+        pc += 1
+        insn_class = code & 0x07
+        if insn_class == BPF_RET:
+            return min(k, length)
+
+        if insn_class == BPF_LD:
+            mode = code & 0xe0
+            if mode == BPF_LEN:
+                a = length
+                continue
+            load = _LOAD_SIZES[code & 0x18]
+            pos = k + (x if mode == BPF_IND else 0)
+            # Out of bounds loads reject the frame, as in the kernel
+            if pos + load.size > length:
+                return 0
+            a = load.unpack_from(data, offset + pos)[0]
+        elif insn_class == BPF_LDX and code == BPF_LDX | BPF_B | BPF_MSH:
+            if k >= length:
+                return 0
+            x = (_LOAD_SIZES[BPF_B].unpack_from(data, offset + k)[0] &
+                 0x0f) * 4
+        elif insn_class == BPF_ALU and code == BPF_ALU | BPF_AND | BPF_K:
+            a &= k
+        elif insn_class == BPF_JMP:
+            op = code & 0xf0
+            if op == BPF_JA:
+                pc += k
+                continue
+            if op == BPF_JEQ:
+                taken = a == k
+            elif op == BPF_JGT:
+                taken = a > k
+            elif op == BPF_JGE:
+                taken = a >= k
+            elif op == BPF_JSET:
+                taken = a & k != 0
+            else:
+                raise FilterCompileException(
+                    'Unsupported BPF jump: 0x{0:02x}'.format(code))
+            pc += jt if taken else jf
+        else:
+            raise FilterCompileException(
+                'Unsupported BPF instruction: 0x{0:02x}'.format(code))
+    return 0
+
+
+def sll_to_ethernet(data, offset=0, length=None):
+    """
+    Re-frames a Linux cooked (SLL) frame with an Ethernet header, so
+    programs compiled for Ethernet can be run on it.  The destination MAC
+    isn't recorded by SLL, so it reads as all zeroes (which is also what
+    PCAPSLL reports).
+    :type data: str | mmap.mmap
+    :type offset: int
+    :type length: int
+    :return: str
+    """
+    if length is None:
+        length = len(data) - offset
+    if length < SLL_HEADER_LEN:
+        return ''
+    return ('\0' * 6 +
+            data[offset + SLL_ADDR_OFFSET:offset + SLL_ADDR_OFFSET + 6] +
+            data[offset + SLL_PROTOCOL_OFFSET:offset + length])
+
+
+def rule_predicate(rule):
+    """
+    Returns a function which tells whether a PCAPPacket matches a pcap
+    Rule, so captured or saved packets can be filtered in-process.  The
+    rule is compiled (once) to a Python function which is run over each
+    packet's data.
+    :type rule: pcap.Rule
+    :return: callable
+    """
+    matches_frame = compile_frame_predicate(rule)
+
+    def matches(packet):
+        if packet.link_layer is PCAPSLL:
+            return matches_frame(sll_to_ethernet(packet.packet_data))
+        return matches_frame(packet.packet_data)
+
+    return matches
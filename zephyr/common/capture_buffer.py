@@ -0,0 +1,193 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import Queue
+import threading
+import time
+
+from zephyr.common.exceptions import *
+
+# What to do with a packet which arrives when the buffer is full: drop it
+# (keeping the oldest packets), or drop the oldest packet to make room
+BUFFER_KEEP_FIRST = 'keep-first'
+BUFFER_KEEP_LAST = 'keep-last'
+
+# Default bounds for each capture's buffer (0 means no bound)
+CAPTURE_BUFFER_PACKETS = 100000
+CAPTURE_BUFFER_BYTES = 64 * 1024 * 1024
+
+
+class CapturedPackets(list):
+    def __init__(self, packets=(), dropped_packets=0, dropped_bytes=0,
+                 kernel_dropped_packets=0):
+        """
+        A list of captured packets, along with how many packets the
+        capture had dropped by the time they were returned: either from
+        its full buffer, or in the kernel before they could be read.
+        :type packets: list[PCAPPacket]
+        :type dropped_packets: int
+        :type dropped_bytes: int
+        :type kernel_dropped_packets: int
+        """
+        super(CapturedPackets, self).__init__(packets)
+        self.dropped_packets = dropped_packets
+        self.dropped_bytes = dropped_bytes
+        self.kernel_dropped_packets = kernel_dropped_packets
+
+    def drop_summary(self):
+        """
+        Returns a description of the drops for logs, or '' if there
+        were none.
+        :return: str
+        """
+        if not self.dropped_packets and not self.kernel_dropped_packets:
+            return ''
+        return (str(self.dropped_packets) + ' packets (' +
+                str(self.dropped_bytes) + ' bytes) dropped from full ' +
+                'capture buffer, ' + str(self.kernel_dropped_packets) +
+                ' dropped by the kernel')
+
+
+class CaptureBuffer(object):
+    def __init__(self, max_packets=CAPTURE_BUFFER_PACKETS,
+                 max_bytes=CAPTURE_BUFFER_BYTES, policy=BUFFER_KEEP_FIRST):
+        """
+        A bounded FIFO of captured packets, with the same get/put interface
+        as a Queue.  Once it holds max_packets packets or max_bytes bytes
+        of packet data (either may be 0 for no bound), packets are dropped
+        according to the policy, and counted.
+        :type max_packets: int
+        :type max_bytes: int
+        :type policy: str
+        """
+        if policy not in (BUFFER_KEEP_FIRST, BUFFER_KEEP_LAST):
+            raise ArgMismatchException(
+                'Unknown capture buffer policy: ' + str(policy))
+        self.max_packets = max_packets
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.packets = collections.deque()
+        self.size = 0
+        self.dropped_packets = 0
+        self.dropped_bytes = 0
+        self.kernel_dropped_packets = 0
+        self.admit = None
+        self.not_empty = threading.Condition(threading.Lock())
+
+    def __len__(self):
+        with self.not_empty:
+            return len(self.packets)
+
+    def _full(self, packet_len):
+        return ((0 < self.max_packets <= len(self.packets)) or
+                (0 < self.max_bytes < self.size + packet_len))
+
+    def set_admission_filter(self, predicate):
+        """
+        Only hold packets which match the predicate (a callable taking a
+        PCAPPacket and returning a bool) from now on, and discard any
+        buffered packets which don't, or hold every packet again if it is
+        None.  Packets which are filtered out don't take up room in the
+        buffer, and aren't counted as dropped.  Returns the previous
+        filter.
+        :type predicate: callable
+        :return: callable
+        """
+        with self.not_empty:
+            old_predicate = self.admit
+            self.admit = predicate
+            if predicate is not None:
+                self.packets = collections.deque(
+                    p for p in self.packets if self._admits(predicate, p))
+                self.size = sum(len(p.packet_data) for p in self.packets)
+            return old_predicate
+
+    @staticmethod
+    def _admits(predicate, packet):
+        # A predicate which fails lets the packet in, so the failure is
+        # seen by whoever reads it rather than by the capture thread
+        try:
+            return predicate(packet)
+        except Exception:
+            return True
+
+    def put(self, packet):
+        """
+        :type packet: PCAPPacket
+        """
+        predicate = self.admit
+        if predicate is not None and not self._admits(predicate, packet):
+            return
+        packet_len = len(packet.packet_data)
+        with self.not_empty:
+            if self.policy == BUFFER_KEEP_LAST:
+                while self.packets and self._full(packet_len):
+                    dropped = self.packets.popleft()
+                    self.size -= len(dropped.packet_data)
+                    self.dropped_packets += 1
+                    self.dropped_bytes += len(dropped.packet_data)
+            if self._full(packet_len):
+                self.dropped_packets += 1
+                self.dropped_bytes += packet_len
+                return
+            self.packets.append(packet)
+            self.size += packet_len
+            self.not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+        """
+        Remove and return the oldest packet, waiting up to timeout
+        seconds (or forever, if None) for one if block is set.  Raises
+        Queue.Empty if there isn't one.
+        :type block: bool
+        :type timeout: float
+        :return: PCAPPacket
+        """
+        with self.not_empty:
+            if block:
+                deadline = (time.time() + timeout if timeout is not None
+                            else None)
+                while not self.packets:
+                    if deadline is None:
+                        self.not_empty.wait()
+                        continue
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.not_empty.wait(remaining)
+            if not self.packets:
+                raise Queue.Empty()
+            packet = self.packets.popleft()
+            self.size -= len(packet.packet_data)
+            return packet
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def add_kernel_drops(self, count):
+        with self.not_empty:
+            self.kernel_dropped_packets += count
+
+    def result(self, packets):
+        """
+        Wrap packets taken from this buffer with its current drop counts.
+        :type packets: list[PCAPPacket]
+        :return: CapturedPackets
+        """
+        with self.not_empty:
+            return CapturedPackets(
+                packets, dropped_packets=self.dropped_packets,
+                dropped_bytes=self.dropped_bytes,
+                kernel_dropped_packets=self.kernel_dropped_packets)
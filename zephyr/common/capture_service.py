@@ -0,0 +1,291 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import logging
+import os
+import select
+import socket
+import threading
+import time
+
+from zephyr.common.capture_buffer import CaptureBuffer
+from zephyr.common.packet_capture import format_timestamp
+from zephyr.common.packet_capture import RING_BLOCK_TIMEOUT_MS
+from zephyr.common.pcap_packet import PCAPPacket
+
+# How long to wait for the kernel to hand over the last partially filled
+# ring block when a native capture is stopped
+NATIVE_CAPTURE_FLUSH_TIMEOUT = (RING_BLOCK_TIMEOUT_MS * 2) / 1000.0
+
+
+class NativeCapture(object):
+    def __init__(self, packet_socket, flag_set, count=0, packet_queue=None,
+                 callback=None, callback_args=None, dump_writer=None):
+        """
+        A capture reading frames from an open packet socket into
+        PCAPPackets in a capture buffer, until count packets have been read (if
+        count is set) or it is stopped.  Frames are also written to the
+        dump writer, if one is given (which is closed once the capture
+        finishes).  It is either run in a thread of its own, or added to
+        a CaptureService along with other captures.  When it finishes,
+        the number of packets the kernel dropped is added to the buffer's
+        drop counts.
+        :type packet_socket: zephyr.common.packet_capture.PacketSocket
+        :type flag_set: (threading.Event, threading.Event,
+                         threading.Event, threading.Event)
+        :type count: int
+        :type packet_queue: CaptureBuffer
+        :type callback: callable
+        :type callback_args: list[T]
+        :type dump_writer: zephyr.common.pcap_file.PCAPFileWriter
+        """
+        self.packet_socket = packet_socket
+        self.stop_flag = flag_set[2]
+        self.finished = flag_set[3]
+        self.count = count
+        self.packet_queue = (packet_queue if packet_queue is not None
+                             else CaptureBuffer())
+        self.callback = callback
+        self.callback_args = callback_args
+        self.dump_writer = dump_writer
+        self.received = 0
+
+    def deliver(self, frames):
+        """
+        Queue the frames as packets.  Returns True once the capture has
+        all the packets it was asked for.
+        :type frames: list[(str, int, int)]
+        :return: bool
+        """
+        for data, sec, usec in frames:
+            if self.dump_writer is not None:
+                self.dump_writer.write_packet(data, sec, usec)
+            packet = PCAPPacket(data, format_timestamp(sec, usec))
+            self.packet_queue.put(packet)
+            if self.callback is not None:
+                self.callback(packet,
+                              *(self.callback_args
+                                if self.callback_args is not None
+                                else ()))
+            self.received += 1
+            if 0 < self.count <= self.received:
+                return True
+        return False
+
+    def finish(self):
+        try:
+            if self.dump_writer is not None:
+                self.dump_writer.close()
+            if self.packet_socket.sock is not None:
+                try:
+                    self.packet_queue.add_kernel_drops(
+                        self.packet_socket.stats()[1])
+                except socket.error:
+                    pass
+        finally:
+            self.finished.set()
+
+    def run(self):
+        """
+        Read packets until done or stopped (for a capture with a thread
+        of its own).
+        """
+        try:
+            while not self.stop_flag.is_set():
+                if self.deliver(self.packet_socket.read()):
+                    return
+
+            # Pick up anything still in a ring block the kernel hasn't
+            # handed over yet
+            deadline = time.time() + NATIVE_CAPTURE_FLUSH_TIMEOUT
+            while time.time() < deadline:
+                if self.deliver(self.packet_socket.read(
+                        deadline - time.time())):
+                    break
+        finally:
+            self.finish()
+
+    def join(self, timeout=None):
+        self.finished.wait(timeout)
+
+    def is_alive(self):
+        return not self.finished.is_set()
+
+
+class CaptureService(object):
+    def __init__(self, name='', logger=None):
+        """
+        Runs any number of native captures (e.g. on all of a host's
+        interfaces) from a single thread, which waits on all of their
+        packet sockets with one epoll set and routes each socket's frames
+        to its own capture's queue.  The thread is started when the first
+        capture is added, and exits once the last one has finished.  A
+        capture which fails (e.g. in its callback) is logged and finished
+        on its own, leaving the others running.
+        :type name: str
+        :type logger: logging.Logger
+        """
+        self.name = name
+        if logger is not None:
+            self.LOG = logger
+        else:
+            self.LOG = logging.getLogger('capture-service')
+            self.LOG.addHandler(logging.NullHandler())
+        self.lock = threading.Lock()
+        self.captures = {}
+        """ :type: dict[int, NativeCapture]"""
+        self.flush_deadlines = {}
+        """ :type: dict[int, float]"""
+        self.epoll = None
+        self.wake_pipe = None
+        self.thread = None
+        """ :type: threading.Thread"""
+
+    def add(self, capture):
+        """
+        :type capture: NativeCapture
+        """
+        with self.lock:
+            if self.thread is None:
+                self.epoll = select.epoll()
+                self.wake_pipe = os.pipe()
+                self.epoll.register(self.wake_pipe[0], select.EPOLLIN)
+                self.thread = threading.Thread(
+                    target=self.run, name='capture-service-' + self.name)
+                self.thread.daemon = True
+                self.thread.start()
+
+            fd = capture.packet_socket.fileno()
+            self.captures[fd] = capture
+            self.epoll.register(fd, select.EPOLLIN)
+
+    def stop(self, capture, timeout=5):
+        """
+        Stop a capture once any packets still held by the kernel have been
+        read, and wait for it to finish.
+        :type capture: NativeCapture
+        :type timeout: float
+        """
+        with self.lock:
+            fd = capture.packet_socket.fileno()
+            if self.captures.get(fd, None) is capture:
+                self.flush_deadlines[fd] = (time.time() +
+                                            NATIVE_CAPTURE_FLUSH_TIMEOUT)
+                os.write(self.wake_pipe[1], 'x')
+        capture.join(timeout)
+
+    def active_count(self):
+        with self.lock:
+            return len(self.captures)
+
+    def run(self):
+        try:
+            self.serve()
+        except Exception as e:
+            self.LOG.error('Capture service ' + self.name + ' failed: ' +
+                           str(e))
+        finally:
+            # If the thread is leaving on an error, finish its captures
+            # (rather than leave them to time out) and let the next
+            # capture added start a new thread
+            with self.lock:
+                captures = (self.close()
+                            if self.thread is threading.current_thread()
+                            else [])
+            for capture in captures:
+                capture.finish()
+
+    def serve(self):
+        while True:
+            with self.lock:
+                if not self.captures:
+                    self.close()
+                    return
+                epoll = self.epoll
+                wake_fd = self.wake_pipe[0]
+                timeout = (max(0, min(self.flush_deadlines.itervalues()) -
+                               time.time())
+                           if self.flush_deadlines else -1)
+
+            try:
+                events = epoll.poll(timeout)
+            except IOError as e:
+                if e.errno != errno.EINTR:
+                    raise
+                continue
+
+            for fd, _ in events:
+                if fd == wake_fd:
+                    os.read(wake_fd, 4096)
+                    continue
+                with self.lock:
+                    capture = self.captures.get(fd, None)
+                if capture is not None:
+                    self.deliver(fd, capture)
+
+            now = time.time()
+            with self.lock:
+                flushed = [(fd, self.captures[fd])
+                           for fd, deadline in self.flush_deadlines.items()
+                           if deadline <= now]
+            for fd, capture in flushed:
+                self.deliver(fd, capture, flush=True)
+
+    def deliver(self, fd, capture, flush=False):
+        """
+        Deliver the frames waiting on a capture's socket, and remove the
+        capture if it is done, being flushed, or fails.
+        :type fd: int
+        :type capture: NativeCapture
+        :type flush: bool
+        """
+        try:
+            done = capture.deliver(capture.packet_socket.read_available())
+        except Exception as e:
+            self.LOG.error('Capture on ' + self.name + ' (' +
+                           capture.packet_socket.interface + ') failed: ' +
+                           str(e))
+            done = True
+        if done or flush:
+            self.remove(fd)
+
+    def close(self):
+        """
+        Tear down the thread's epoll set, and return the captures it still
+        had.  Must be called with the lock held.
+        :return: list[NativeCapture]
+        """
+        captures = self.captures.values()
+        self.captures = {}
+        self.flush_deadlines = {}
+        self.epoll.close()
+        os.close(self.wake_pipe[0])
+        os.close(self.wake_pipe[1])
+        self.epoll = None
+        self.wake_pipe = None
+        self.thread = None
+        return captures
+
+    def remove(self, fd):
+        with self.lock:
+            capture = self.captures.pop(fd)
+            self.flush_deadlines.pop(fd, None)
+            self.epoll.unregister(fd)
+        try:
+            capture.finish()
+        except Exception as e:
+            self.LOG.error('Error finishing capture on ' + self.name +
+                           ' (' + capture.packet_socket.interface + '): ' +
+                           str(e))
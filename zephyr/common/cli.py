@@ -18,6 +18,8 @@ import pwd
 import subprocess
 import time
 from zephyr.common.exceptions import *
+from zephyr.common import netns
+from zephyr.common import process_table
 
 
 def _create_ns(name):
@@ -26,12 +28,47 @@ def _create_ns(name):
 
 def _remove_ns(name):
     LinuxCLI().cmd('ip netns del ' + name)
+    netns.NETNS_CACHE.close(name)
 
 
 CREATENSCMD = _create_ns
 REMOVENSCMD = _remove_ns
 DEBUG = 0
 
+# When set, privileged blocking commands are sent to this long-lived
+# root helper instead of forking 'sudo -E' (and a shell) for every call.
+COMMAND_BROKER = None
+""" :type: zephyr.common.cli_broker.CommandBroker"""
+
+# When possible, NetNSCLI commands enter their namespace with a direct
+# setns() call on a cached namespace fd, rather than through an extra
+# 'ip netns exec' process.
+USE_SETNS = True
+
+
+def start_command_broker(socket_path=None):
+    """
+    Start the privileged command broker and route all privileged, blocking
+    LinuxCLI commands through it.  Returns the running broker.
+    :type socket_path: str
+    :return: zephyr.common.cli_broker.CommandBroker
+    """
+    global COMMAND_BROKER
+    from zephyr.common import cli_broker
+    if COMMAND_BROKER is None:
+        broker = cli_broker.CommandBroker(socket_path=socket_path)
+        broker.start()
+        COMMAND_BROKER = broker
+    return COMMAND_BROKER
+
+
+def stop_command_broker():
+    global COMMAND_BROKER
+    if COMMAND_BROKER is not None:
+        broker = COMMAND_BROKER
+        COMMAND_BROKER = None
+        broker.stop()
+
 
 def terminate_process(process):
     """
@@ -84,7 +121,9 @@ class CommandStatus(object):
         """ :type: list[subprocess.Popen]"""
 
     def __repr__(self):
-        return 'PID: ' + str(self.process.pid) + '\n' + \
+        return 'PID: ' + (str(self.process.pid)
+                          if self.process is not None
+                          else 'None') + '\n' + \
                'RETCODE: ' + str(self.ret_code) + '\n' + \
                'CMD: ' + self.command + '\n' + \
                'STDOUT: [' + self.stdout + ']' + '\n' + \
@@ -95,7 +134,7 @@ class CommandStatus(object):
         if self.process_array:
             for p in self.process_array:
                 out = terminate_process(p)
-        else:
+        elif self.process is not None:
             out = terminate_process(self.process)
 
         if out and len(out) >= 2:
@@ -152,13 +191,18 @@ class LinuxCLI(object):
         if len(commands) == 0:
             return ret
 
+        use_broker = self.use_broker(blocking, stdin, stdout, stderr)
+        priv_prefix = '' if use_broker else self.priv_prefix()
+        setns_name = None if self.debug else self.setns_target(use_broker)
+        ns_prefix = '' if setns_name else self.cmd_prefix()
+
         cmd_array = [(['timeout'] if timeout else []) +
-                     self.priv_prefix().split() + self.cmd_prefix().split() +
+                     priv_prefix.split() + ns_prefix.split() +
                      commands[0]]
 
         for cmd in commands[1:]:
-            cmd_array.append(self.priv_prefix().split() +
-                             self.cmd_prefix().split() + cmd)
+            cmd_array.append(priv_prefix.split() +
+                             ns_prefix.split() + cmd)
 
         if self.log_cmd is True:
             if self.logger is not None:
@@ -170,6 +214,11 @@ class LinuxCLI(object):
         if self.debug is True:
             return CommandStatus(command=cmd_str)
 
+        if use_broker:
+            return self.broker_cmd(cmd_array, cmd_str, timeout, verify,
+                                   setns_name)
+
+        preexec_fn = self.preexec_fn(setns_name)
         processes = []
         """ :type: list[subprocess.Popen]"""
 
@@ -184,7 +233,7 @@ class LinuxCLI(object):
                 stdout=stdout if i == len(cmd_array) - 1 else subprocess.PIPE,
                 stderr=stderr if i == len(cmd_array) - 1 else subprocess.PIPE,
                 env=self.env_map,
-                preexec_fn=os.setsid)
+                preexec_fn=preexec_fn)
             processes.append(p)
 
         # The resulting process error code, output, etc is dependent on
@@ -241,9 +290,12 @@ class LinuxCLI(object):
         :param stderr: int File descriptor for std in (PIPE by default)
         :return: zephyr.common.cli.CommandStatus
         """
+        use_broker = self.use_broker(blocking, stdin, stdout, stderr)
+        setns_name = None if self.debug else self.setns_target(use_broker)
         cmd = (('timeout ' + str(timeout) + ' ' if timeout is not None
                 else '') +
-               self.priv_prefix() + self.cmd_prefix() + cmd_line)
+               ('' if use_broker else self.priv_prefix()) +
+               ('' if setns_name else self.cmd_prefix()) + cmd_line)
 
         if self.log_cmd is True:
             if self.logger is not None:
@@ -254,9 +306,13 @@ class LinuxCLI(object):
         if self.debug is True:
             return CommandStatus(command=cmd)
 
+        if use_broker:
+            return self.broker_cmd(cmd, cmd, timeout, verify, setns_name)
+
         p = subprocess.Popen(cmd, shell=True,
                              stdin=stdin, stdout=stdout, stderr=stderr,
-                             env=self.env_map, preexec_fn=os.setsid)
+                             env=self.env_map,
+                             preexec_fn=self.preexec_fn(setns_name))
         if blocking is False:
             return CommandStatus(process=p, command=cmd)
 
@@ -286,6 +342,68 @@ class LinuxCLI(object):
         return CommandStatus(process=p, command=cmd, ret_code=p.returncode,
                              stdout=out, stderr=err)
 
+    def use_broker(self, blocking, stdin, stdout, stderr):
+        """
+        Only privileged, blocking commands with the default (captured)
+        std streams can be handed to the command broker.
+        :type blocking: bool
+        :return: bool
+        """
+        return (COMMAND_BROKER is not None and self.priv and
+                blocking is True and stdin == subprocess.PIPE and
+                stdout == subprocess.PIPE and stderr == subprocess.PIPE)
+
+    def setns_target(self, use_broker=False):
+        """
+        Returns the name of the network namespace the command process
+        should enter directly with setns() (instead of prefixing the
+        command with cmd_prefix()), or None to run it as-is.
+        :type use_broker: bool
+        :return: str | None
+        """
+        return None
+
+    @staticmethod
+    def preexec_fn(setns_name=None):
+        if setns_name is not None:
+            return netns.make_preexec_fn(setns_name)
+        return os.setsid
+
+    def broker_cmd(self, command, cmd_str, timeout=None, verify=False,
+                   setns_name=None):
+        """
+        Run a command (shell string or list of piped argument lists) on
+        the command broker, with the same timeout/verify semantics as a
+        locally run command.
+        :type command: str | list[list[str]]
+        :type cmd_str: str
+        :type timeout: int
+        :type verify: bool
+        :type setns_name: str
+        :return: zephyr.common.cli.CommandStatus
+        """
+        result = COMMAND_BROKER.execute(command, env=self.env_map,
+                                        netns_name=setns_name)
+        ret_code = result['ret_code']
+        out = result['stdout']
+        err = result['stderr']
+
+        # 'timeout' returns 124 on timeout
+        if ret_code == 124 and timeout is not None:
+            raise SubprocessTimeoutException('Process timed out: ' + cmd_str)
+
+        if verify and ret_code != 0:
+            raise SubprocessFailedException(
+                'Command: [' + str(cmd_str) + '] returned error: ' +
+                str(ret_code) + ', output was stdout[' +
+                str(out) + ']/stderr[' + str(err) + ']')
+
+        if self.print_cmd_out:
+            print("stdout: " + str(out) + "/stderr: " + str(err))
+
+        return CommandStatus(command=cmd_str, ret_code=ret_code,
+                             stdout=out, stderr=err)
+
     def cmd_prefix(self):
         return ''
 
@@ -336,31 +454,38 @@ class LinuxCLI(object):
         Gets all running processes' PIDS as a list
         :return: list[str]
         """
-        return [i.strip()
-                for i in self.cmd(
-                "ps -aef | grep -v grep | awk '{print $2}'").stdout.split()]
+        return [str(pid) for pid in process_table.PROCESS_TABLE.pids()]
 
     def get_process_pids(self, process_name):
         """
         Gets all running processes' PIDS which match the process name as a list
         :return: list[str]
         """
-        awk_cmd = r'{printf "%s\n", $2}'
-        return [i.strip() for i in
-                self.cmd("ps -aef | grep -v grep | grep " + process_name +
-                         r" | awk '" + awk_cmd + r"'").stdout.split()]
+        return [str(p.pid)
+                for p in process_table.PROCESS_TABLE.find(process_name)]
 
     def get_parent_pids(self, child_pid):
         """
-        Gets all running processes' PIDS which match the process name as a list
+        Gets all running processes' PIDS whose parent is the given PID
+        (i.e. the children of that process) as a list
         :return: list[str]
         """
-        return [i.strip() for i in
-                self.cmd("ps -aef | grep -v grep | awk '{ if ($3==" +
-                         str(child_pid) + ") print $2 }'").stdout.split()]
+        return [str(p.pid)
+                for p in process_table.PROCESS_TABLE.children(child_pid)]
 
     def is_pid_running(self, pid):
-        return str(pid) in self.get_running_pids()
+        return process_table.PROCESS_TABLE.is_running(pid)
+
+    @staticmethod
+    def wait_for_pid_exit(pid, timeout=None):
+        """
+        Wait for the given process to exit, returning True if it did so
+        within the timeout.
+        :type pid: int | str
+        :type timeout: float
+        :return: bool
+        """
+        return process_table.wait_for_exit(pid, timeout)
 
     def replace_text_in_file(self, rfile, search_str, replace_str,
                              line_global_replace=False):
@@ -532,3 +657,20 @@ class NetNSCLI(LinuxCLI):
 
     def cmd_prefix(self):
         return 'ip netns exec ' + self.name + ' '
+
+    def get_running_pids(self):
+        """
+        Gets the PIDS of all processes running in this namespace as a list
+        :return: list[str]
+        """
+        return LinuxCLI().cmd('ip netns pids ' + self.name).stdout.split()
+
+    def setns_target(self, use_broker=False):
+        # The broker runs as root, so it can always setns() on our behalf.
+        # Missing namespaces fall back to 'ip netns exec' so the command
+        # fails the same way it always has.
+        if (USE_SETNS and
+                os.path.exists(netns.NETNS_RUN_DIR + '/' + self.name) and
+                netns.setns_available(self.name, check_priv=not use_broker)):
+            return self.name
+        return None
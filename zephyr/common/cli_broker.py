@@ -0,0 +1,376 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import getopt
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from zephyr.common.exceptions import *
+from zephyr.common import netns
+
+BROKER_START_TIMEOUT = 10
+BROKER_STOP_TIMEOUT = 5
+
+# Command output is carried through JSON, so it is decoded as latin-1 on
+# the broker side and encoded back on the client side, which is lossless
+# for arbitrary bytes.
+OUTPUT_ENCODING = 'latin-1'
+
+
+def _send_msg(sock, msg):
+    data = json.dumps(msg)
+    sock.sendall(struct.pack('!I', len(data)) + data)
+
+
+def _recv_all(sock, size):
+    data = ''
+    while len(data) < size:
+        new_data = sock.recv(size - len(data))
+        if new_data == '':
+            return None
+        data += new_data
+    return data
+
+
+def _recv_msg(sock):
+    header = _recv_all(sock, 4)
+    if header is None:
+        return None
+    data = _recv_all(sock, struct.unpack('!I', header)[0])
+    if data is None:
+        return None
+    return json.loads(data)
+
+
+def _str_env(env):
+    if env is None:
+        return None
+    return {str(k): str(v) for k, v in env.iteritems()}
+
+
+class CommandBrokerServer(object):
+    def __init__(self, socket_path, parent_pid=None):
+        """
+        The privileged side of the command broker.  Runs as root (started
+        once through sudo), and executes command batches sent over a Unix
+        socket by CommandBroker clients, returning the exit code and
+        output for each command.
+        :type socket_path: str
+        :type parent_pid: int
+        """
+        self.socket_path = socket_path
+        self.parent_pid = parent_pid
+        self.stop_event = threading.Event()
+        self.listen_socket = None
+        """ :type: socket.socket"""
+
+    def serve(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        self.listen_socket = socket.socket(socket.AF_UNIX,
+                                           socket.SOCK_STREAM)
+        self.listen_socket.bind(self.socket_path)
+
+        # Only the user who started the broker (through sudo) is
+        # allowed to connect and run commands as root
+        os.chmod(self.socket_path, 0o600)
+        if 'SUDO_UID' in os.environ:
+            os.chown(self.socket_path,
+                     int(os.environ['SUDO_UID']),
+                     int(os.environ.get('SUDO_GID', -1)))
+
+        self.listen_socket.listen(32)
+
+        if self.parent_pid is not None:
+            watchdog = threading.Thread(target=self.watch_parent)
+            watchdog.daemon = True
+            watchdog.start()
+
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    conn, _ = self.listen_socket.accept()
+                except socket.error as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    if self.stop_event.is_set():
+                        break
+                    raise
+                t = threading.Thread(target=self.handle_connection,
+                                     args=(conn,))
+                t.daemon = True
+                t.start()
+        finally:
+            self.listen_socket.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def stop(self):
+        self.stop_event.set()
+        # Wake the accept() call up so the serve loop can exit
+        try:
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            s.connect(self.socket_path)
+            s.close()
+        except socket.error:
+            pass
+
+    def watch_parent(self):
+        while not self.stop_event.is_set():
+            try:
+                os.kill(self.parent_pid, 0)
+            except OSError as e:
+                if e.errno == errno.ESRCH:
+                    self.stop()
+                    return
+            time.sleep(1)
+
+    def handle_connection(self, conn):
+        try:
+            while not self.stop_event.is_set():
+                request = _recv_msg(conn)
+                if request is None:
+                    break
+                if request.get('op') == 'shutdown':
+                    _send_msg(conn, {'results': []})
+                    self.stop()
+                    break
+                env = _str_env(request.get('env'))
+                netns_name = request.get('netns')
+                _send_msg(conn, {'results': [
+                    self.run_command(c, env, netns_name)
+                    for c in request['commands']]})
+        finally:
+            conn.close()
+
+    @staticmethod
+    def run_command(command, env=None, netns_name=None):
+        """
+        Run a single command, either as a shell string or as a pipeline of
+        argument lists (which is run without a shell, each stdout feeding
+        the next stdin), optionally inside a network namespace.
+        :type command: str | list[list[str]]
+        :type env: dict[str, str]
+        :type netns_name: str
+        :return: dict[str, any]
+        """
+        try:
+            preexec_fn = (netns.make_preexec_fn(str(netns_name))
+                          if netns_name else os.setsid)
+            if isinstance(command, basestring):
+                p = subprocess.Popen(str(command), shell=True,
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     env=env, preexec_fn=preexec_fn)
+                processes = [p]
+            else:
+                processes = []
+                for i, args in enumerate(command):
+                    p = subprocess.Popen(
+                        [str(a) for a in args], shell=False,
+                        stdin=(subprocess.PIPE if i == 0
+                               else processes[i - 1].stdout),
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                        env=env, preexec_fn=preexec_fn)
+                    processes.append(p)
+
+            out, err = processes[-1].communicate()
+            for p in processes[:-1]:
+                p.wait()
+            ret_code = processes[-1].returncode
+        except (OSError, ObjectNotFoundException) as e:
+            out = ''
+            err = str(e)
+            ret_code = 127
+
+        return {'ret_code': ret_code,
+                'stdout': (out or '').decode(OUTPUT_ENCODING),
+                'stderr': (err or '').decode(OUTPUT_ENCODING)}
+
+
+class CommandBroker(object):
+    def __init__(self, socket_path=None, priv=True):
+        """
+        Client side of a long-lived privileged command helper.  Once
+        started, commands sent through the broker are run by a single
+        root process instead of forking 'sudo -E' and a shell for every
+        call.  Connections are kept per-process, so the broker may be used
+        safely after a fork (e.g. from a multiprocessing.Process).
+        :type socket_path: str
+        :type priv: bool
+        """
+        self.socket_path = (socket_path if socket_path is not None
+                            else '/tmp/zephyr-cli-broker.' +
+                                 str(os.getpid()) + '.sock')
+        self.priv = priv
+        self.process = None
+        """ :type: subprocess.Popen"""
+        self.conn = None
+        """ :type: socket.socket"""
+        self.conn_pid = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.process is not None:
+            raise SubprocessFailedException('command broker already started')
+
+        root_dir = os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__))))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = (root_dir + ':' + env['PYTHONPATH']
+                             if 'PYTHONPATH' in env else root_dir)
+
+        cmd = ((['sudo', '-E'] if self.priv else []) +
+               [sys.executable, '-m', 'zephyr.common.cli_broker',
+                '-s', self.socket_path, '-p', str(os.getpid())])
+        self.process = subprocess.Popen(cmd, env=env, preexec_fn=os.setsid)
+
+        deadline = time.time() + BROKER_START_TIMEOUT
+        while True:
+            try:
+                self._connect()
+                return
+            except socket.error:
+                if self.process.poll() is not None:
+                    self.process = None
+                    raise SubprocessFailedException(
+                        'command broker exited on startup')
+                if time.time() > deadline:
+                    self.stop()
+                    raise SubprocessTimeoutException(
+                        'command broker failed to start within timeout')
+                time.sleep(0.01)
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            with self.lock:
+                self._get_conn()
+                _send_msg(self.conn, {'op': 'shutdown'})
+                _recv_msg(self.conn)
+        except socket.error:
+            pass
+        self._close()
+
+        deadline = time.time() + BROKER_STOP_TIMEOUT
+        while self.process.poll() is None and time.time() < deadline:
+            time.sleep(0.01)
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process = None
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def execute(self, command, env=None, netns_name=None):
+        """
+        Run a single command on the broker.
+        :type command: str | list[list[str]]
+        :type env: dict[str, str]
+        :type netns_name: str
+        :return: dict[str, any]
+        """
+        return self.execute_batch([command], env, netns_name)[0]
+
+    def execute_batch(self, commands, env=None, netns_name=None):
+        """
+        Run a list of commands, in order, on the broker with a single
+        round-trip and return a result map (ret_code, stdout, stderr)
+        for each command.  If a network namespace name is given, the
+        commands are run inside that namespace.
+        :type commands: list[str | list[list[str]]]
+        :type env: dict[str, str]
+        :type netns_name: str
+        :return: list[dict[str, any]]
+        """
+        with self.lock:
+            try:
+                conn = self._get_conn()
+                _send_msg(conn, {'commands': commands, 'env': env,
+                                 'netns': netns_name})
+                reply = _recv_msg(conn)
+            except socket.error as e:
+                self._close()
+                raise SubprocessFailedException(
+                    'command broker connection failed: ' + str(e))
+
+        if reply is None:
+            self._close()
+            raise SubprocessFailedException(
+                'command broker closed connection')
+
+        return [{'ret_code': r['ret_code'],
+                 'stdout': r['stdout'].encode(OUTPUT_ENCODING),
+                 'stderr': r['stderr'].encode(OUTPUT_ENCODING)}
+                for r in reply['results']]
+
+    def _get_conn(self):
+        # A forked child must not share the parent's connection, or
+        # replies will be interleaved between processes.
+        if self.conn is None or self.conn_pid != os.getpid():
+            self._connect()
+        return self.conn
+
+    def _connect(self):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.socket_path)
+        except socket.error:
+            conn.close()
+            raise
+        self.conn = conn
+        self.conn_pid = os.getpid()
+
+    def _close(self):
+        if self.conn is not None and self.conn_pid == os.getpid():
+            self.conn.close()
+        self.conn = None
+        self.conn_pid = None
+
+
+def usage():
+    print('Usage: python -m zephyr.common.cli_broker -s <socket_path> '
+          '[-p <parent_pid>]')
+
+
+if __name__ == '__main__':
+    arg_map, _ = getopt.getopt(sys.argv[1:], 's:p:h',
+                               ['socket=', 'parent=', 'help'])
+    sock_path = None
+    parent = None
+    for arg, value in arg_map:
+        if arg in ('-s', '--socket'):
+            sock_path = value
+        elif arg in ('-p', '--parent'):
+            parent = int(value)
+        elif arg in ('-h', '--help'):
+            usage()
+            exit(0)
+
+    if sock_path is None:
+        usage()
+        exit(1)
+
+    CommandBrokerServer(sock_path, parent).serve()
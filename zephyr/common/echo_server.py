@@ -0,0 +1,765 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import json
+import logging
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+from zephyr.common import exceptions
+from zephyr.common import netns
+from zephyr.common.zephyr_constants import DEFAULT_ECHO_PORT
+
+TERMINATION_STRING = chr(0x03) + chr(0x04)
+# Ending a TCP request with this keeps the connection open for more
+KEEP_ALIVE_STRING = chr(0x05)
+# A TCP request of "<BULK_REQUEST>upload|download <bytes> <seconds>"
+# streams data instead of echoing (see EchoService.start_bulk)
+BULK_REQUEST = chr(0x06) + 'bulk '
+BULK_CHUNK_SIZE = 65536
+BULK_DATA = 'z' * BULK_CHUNK_SIZE
+# struct tcp_info, up to tcpi_total_retrans
+TCP_INFO = struct.Struct('=8B24I')
+ECHO_RECV_SIZE = 65536
+ECHO_SEND_TIMEOUT = 5
+
+
+def make_reply(request, echo_data):
+    """
+    The reply to an echo request: the request's data (up to the
+    termination string), a colon, and the server's echo data.
+    :type request: str
+    :type echo_data: str
+    :return: str
+    """
+    pos = request.find(TERMINATION_STRING)
+    if pos != -1:
+        request = request[0:pos]
+    return request + ':' + echo_data + TERMINATION_STRING
+
+
+def tcp_info(sock):
+    """
+    The kernel's round-trip time (in seconds), MSS, congestion window and
+    retransmission count for a TCP socket, or None if it can't be had.
+    :type sock: socket.socket
+    :return: dict[str, any] | None
+    """
+    try:
+        data = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO,
+                               TCP_INFO.size)
+    except (socket.error, AttributeError):
+        return None
+    if len(data) < TCP_INFO.size:
+        return None
+    info = TCP_INFO.unpack(data)
+    return {'rtt': info[8 + 15] / 1000000.0, 'snd_mss': info[8 + 2],
+            'snd_cwnd': info[8 + 18], 'retransmits': info[8 + 23]}
+
+
+def bulk_stats(sock, count):
+    """
+    The end of a bulk transfer from the server: the number of bytes sent
+    or received and the connection's retransmissions so far.
+    :type sock: socket.socket
+    :type count: int
+    :return: str
+    """
+    info = tcp_info(sock)
+    return (str(count) + ' ' +
+            str(info['retransmits'] if info is not None else -1) +
+            TERMINATION_STRING)
+
+
+class _EchoListener(object):
+    def __init__(self, sock, ip_addr, port, protocol, echo_data):
+        self.sock = sock
+        self.ip_addr = ip_addr
+        self.port = port
+        self.protocol = protocol
+        self.echo_data = echo_data
+        self.requests = 0
+
+    def to_dict(self):
+        return {'ip_addr': self.ip_addr, 'port': self.port,
+                'protocol': self.protocol, 'echo_data': self.echo_data,
+                'requests': self.requests}
+
+
+class _EchoConnection(object):
+    def __init__(self, sock, listener=None):
+        self.sock = sock
+        self.listener = listener
+        self.request = ''
+        self.reply = None
+        self.pending = False
+        self.keep_alive = False
+        self.bulk = None
+        self.bulk_bytes = 0
+        self.bulk_remaining = None
+        self.bulk_deadline = None
+        self.bulk_tail = ''
+
+
+class EchoService(object):
+    def __init__(self, netns_name=None, control_path=None, logger=None):
+        """
+        Answers echo requests on any number of TCP and UDP listeners
+        (each with its own address, port and reply string) from a single
+        epoll thread.  Listeners can be added and removed while it runs,
+        either directly or, if a control path is given, by sending JSON
+        control messages to the Unix socket at that path (see
+        EchoServiceClient).  Listening sockets are opened in the given
+        network namespace.
+        :type netns_name: str
+        :type control_path: str
+        :type logger: logging.Logger
+        """
+        self.netns_name = netns_name
+        self.control_path = control_path
+        if logger is not None:
+            self.LOG = logger
+        else:
+            self.LOG = logging.getLogger('echo-server')
+            self.LOG.addHandler(logging.NullHandler())
+        self.lock = threading.RLock()
+        self.listeners = {}
+        """ :type: dict[int, _EchoListener]"""
+        self.conns = {}
+        """ :type: dict[int, _EchoConnection]"""
+        self.control_sock = None
+        """ :type: socket.socket"""
+        self.epoll = None
+        self.wake_pipe = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        """ :type: threading.Thread"""
+        self.started = False
+        self.commands = {'start': self.add_listener,
+                         'stop': self.remove_listener,
+                         'list': self.list_listeners,
+                         'shutdown': self.shutdown}
+        """ :type: dict[str, callable]"""
+        self.blocking_commands = {}
+        """ :type: dict[str, callable]"""
+
+    def start(self):
+        """
+        Start answering requests (and control messages) in the
+        background.
+        """
+        self.open()
+        self.thread = threading.Thread(target=self.serve,
+                                       name='echo-service')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def open(self):
+        if self.started:
+            raise exceptions.SubprocessFailedException(
+                'Echo service has already been run')
+        self.started = True
+
+        self.epoll = select.epoll()
+        self.wake_pipe = os.pipe()
+        self.epoll.register(self.wake_pipe[0], select.EPOLLIN)
+
+        if self.control_path is not None:
+            if os.path.exists(self.control_path):
+                os.unlink(self.control_path)
+            self.control_sock = socket.socket(socket.AF_UNIX,
+                                              socket.SOCK_STREAM)
+            self.control_sock.setblocking(0)
+            self.control_sock.bind(self.control_path)
+            self.control_sock.listen(socket.SOMAXCONN)
+            self.epoll.register(self.control_sock.fileno(), select.EPOLLIN)
+            self.LOG.info('Echo service control socket at ' +
+                          self.control_path)
+
+    def add_listener(self, ip_addr='', port=DEFAULT_ECHO_PORT,
+                     echo_data='pong', protocol='tcp'):
+        """
+        Start answering echo requests on the given address and port,
+        replacing any listener already there.
+        :type ip_addr: str
+        :type port: int
+        :type echo_data: str
+        :type protocol: str
+        :return: bool
+        """
+        if protocol not in ('tcp', 'udp'):
+            raise exceptions.ArgMismatchException(
+                'Unsupported protocol: ' + str(protocol))
+        port = int(port)
+
+        def open_socket():
+            if protocol == 'tcp':
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setblocking(0)
+            sock.bind((ip_addr, port))
+            if protocol == 'tcp':
+                sock.listen(socket.SOMAXCONN)
+            return sock
+
+        with self.lock:
+            for fd, listener in self.listeners.items():
+                if (listener.ip_addr, listener.port, listener.protocol) == \
+                        (ip_addr, port, protocol):
+                    self.close_listener(fd)
+            try:
+                if self.netns_name is not None:
+                    with netns.in_netns(self.netns_name):
+                        sock = open_socket()
+                else:
+                    sock = open_socket()
+            except socket.error as e:
+                raise exceptions.SocketException(
+                    'Failed to start echo server on ' + ip_addr + ':' +
+                    str(port) + ': ' + str(e))
+            self.listeners[sock.fileno()] = _EchoListener(
+                sock, ip_addr, port, protocol, echo_data)
+            self.epoll.register(sock.fileno(), select.EPOLLIN)
+        self.LOG.info('Echo server listening on ' + protocol + ' ' +
+                      ip_addr + ':' + str(port))
+        return True
+
+    def remove_listener(self, ip_addr='', port=DEFAULT_ECHO_PORT,
+                        protocol=None):
+        """
+        Stop answering requests on the given address and port (for
+        either protocol unless one is given).  If nothing listens on
+        exactly that address, every listener on the port is removed.
+        Returns how many listeners were removed.
+        :type ip_addr: str
+        :type port: int
+        :type protocol: str
+        :return: int
+        """
+        port = int(port)
+        with self.lock:
+            on_port = [fd for fd, l in self.listeners.iteritems()
+                       if l.port == port and
+                       (protocol is None or l.protocol == protocol)]
+            exact = [fd for fd in on_port
+                     if self.listeners[fd].ip_addr == ip_addr]
+            for fd in exact or on_port:
+                self.close_listener(fd)
+            return len(exact or on_port)
+
+    def list_listeners(self):
+        """
+        :return: list[dict[str, any]]
+        """
+        with self.lock:
+            return [l.to_dict() for l in self.listeners.itervalues()]
+
+    def serve(self, timeout=None):
+        """
+        Answer requests until stopped, or until the timeout (in seconds)
+        runs out.  Runs in the calling thread.
+        :type timeout: float
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        try:
+            while not self.stop_event.is_set():
+                wait = -1
+                if deadline is not None:
+                    wait = deadline - time.time()
+                    if wait <= 0:
+                        self.LOG.debug('Echo server timeout reached')
+                        break
+                try:
+                    events = self.epoll.poll(wait)
+                except IOError as e:
+                    if e.errno != errno.EINTR:
+                        raise
+                    continue
+
+                for fd, event in events:
+                    with self.lock:
+                        self.handle(fd, event)
+        finally:
+            self.close()
+
+    def handle(self, fd, event):
+        if fd == self.wake_pipe[0]:
+            os.read(fd, 4096)
+        elif (self.control_sock is not None and
+                fd == self.control_sock.fileno()):
+            self.accept(self.control_sock, None)
+        elif fd in self.listeners:
+            listener = self.listeners[fd]
+            if listener.protocol == 'tcp':
+                self.accept(listener.sock, listener)
+            else:
+                self.answer_datagrams(listener)
+        elif fd in self.conns:
+            if event & select.EPOLLOUT:
+                self.write(fd)
+            else:
+                self.read(fd)
+
+    def accept(self, sock, listener):
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self.LOG.error('Echo server accept failed: ' + str(e))
+                return
+            conn.setblocking(0)
+            self.conns[conn.fileno()] = _EchoConnection(conn, listener)
+            self.epoll.register(conn.fileno(), select.EPOLLIN)
+
+    def answer_datagrams(self, listener):
+        while True:
+            try:
+                data, addr = listener.sock.recvfrom(ECHO_RECV_SIZE)
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self.LOG.error('Echo server receive failed: ' + str(e))
+                return
+            listener.requests += 1
+            try:
+                listener.sock.sendto(make_reply(data, listener.echo_data),
+                                     addr)
+            except socket.error as e:
+                self.LOG.error('Echo server reply to ' + str(addr) +
+                               ' failed: ' + str(e))
+
+    def read(self, fd):
+        conn = self.conns[fd]
+        try:
+            data = conn.sock.recv(ECHO_RECV_SIZE)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = ''
+        if not data:
+            self.drop(fd)
+            return
+
+        if conn.bulk == 'upload':
+            self.read_bulk(conn, data)
+        elif conn.listener is None:
+            # A control connection; requests are a single line of JSON
+            conn.request += data
+            if '\n' in conn.request and not conn.pending:
+                reply = self.control(fd, conn.request)
+                if reply is not None:
+                    conn.reply = reply + '\n'
+        else:
+            conn.request += data
+            if TERMINATION_STRING in conn.request:
+                request, _, conn.request = conn.request.partition(
+                    TERMINATION_STRING)
+                conn.listener.requests += 1
+                if request.startswith(BULK_REQUEST):
+                    self.start_bulk(conn, request)
+                else:
+                    conn.keep_alive = request.endswith(KEEP_ALIVE_STRING)
+                    if conn.keep_alive:
+                        request = request[:-len(KEEP_ALIVE_STRING)]
+                    conn.reply = make_reply(request,
+                                            conn.listener.echo_data)
+        if conn.reply is not None or conn.bulk == 'download':
+            self.epoll.modify(fd, select.EPOLLOUT)
+            self.write(fd)
+
+    def start_bulk(self, conn, request):
+        """
+        Start a bulk transfer on a connection.  For an upload, the client
+        streams data ending with the termination string, which is counted
+        and discarded, and then gets the bulk stats (see bulk_stats).  For
+        a download, the server streams [bytes] bytes, or streams for
+        [seconds] seconds, then sends the termination string and the bulk
+        stats.
+        :type conn: _EchoConnection
+        :type request: str
+        """
+        try:
+            direction, size, duration = request[len(BULK_REQUEST):].split()
+            size = int(size)
+            duration = float(duration)
+            if direction not in ('upload', 'download'):
+                raise ValueError(direction)
+        except ValueError:
+            conn.reply = make_reply(request, 'bad bulk request')
+            return
+        conn.bulk = direction
+        conn.bulk_bytes = 0
+        if direction == 'upload':
+            data, conn.request = conn.request, ''
+            if data:
+                self.read_bulk(conn, data)
+        else:
+            conn.bulk_remaining = size if size > 0 else None
+            conn.bulk_deadline = (time.time() + duration if duration > 0
+                                  else None)
+
+    def read_bulk(self, conn, data):
+        # Keep back a byte in case the termination string is split
+        data = conn.bulk_tail + data
+        pos = data.find(TERMINATION_STRING)
+        if pos == -1:
+            keep = len(TERMINATION_STRING) - 1
+            conn.bulk_bytes += len(data) - keep
+            conn.bulk_tail = data[-keep:]
+            return
+        conn.bulk_bytes += pos
+        conn.bulk = None
+        conn.reply = bulk_stats(conn.sock, conn.bulk_bytes)
+
+    def write_bulk(self, fd, conn):
+        # One chunk per event, so other connections get their turn
+        if ((conn.bulk_remaining is not None and
+                conn.bulk_remaining <= 0) or
+                (conn.bulk_deadline is not None and
+                 time.time() >= conn.bulk_deadline)):
+            conn.bulk = None
+            conn.reply = TERMINATION_STRING + bulk_stats(conn.sock,
+                                                         conn.bulk_bytes)
+            self.write(fd)
+            return
+        chunk = BULK_DATA
+        if conn.bulk_remaining is not None:
+            chunk = BULK_DATA[:conn.bulk_remaining]
+        try:
+            sent = conn.sock.send(chunk)
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self.drop(fd)
+            return
+        conn.bulk_bytes += sent
+        if conn.bulk_remaining is not None:
+            conn.bulk_remaining -= sent
+
+    def write(self, fd):
+        conn = self.conns[fd]
+        if conn.bulk == 'download':
+            self.write_bulk(fd, conn)
+            return
+        try:
+            sent = conn.sock.send(conn.reply)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self.drop(fd)
+            return
+        conn.reply = conn.reply[sent:]
+        if conn.reply:
+            return
+        if conn.keep_alive:
+            # Wait for the client's next request on the same connection
+            conn.reply = None
+            conn.keep_alive = False
+            self.epoll.modify(fd, select.EPOLLIN)
+        else:
+            self.drop(fd)
+
+    def control(self, fd, request):
+        """
+        Carry out a control message and return the JSON reply.  Blocking
+        commands are instead run on a worker thread, which sends the
+        reply itself when done, and None is returned.
+        :type fd: int
+        :type request: str
+        :return: str | None
+        """
+        try:
+            message = dict(
+                (str(k), str(v) if isinstance(v, unicode) else v)
+                for k, v in json.loads(request).iteritems())
+            command = message.pop('command')
+            if command in self.blocking_commands:
+                conn = self.conns[fd]
+                conn.pending = True
+                worker = threading.Thread(
+                    target=self.run_blocking,
+                    args=(fd, conn, self.blocking_commands[command],
+                          message),
+                    name='echo-service-' + command)
+                worker.daemon = True
+                worker.start()
+                return None
+            if command not in self.commands:
+                raise exceptions.ArgMismatchException(
+                    'Unknown echo service command: ' + str(command))
+        except (ValueError, KeyError, TypeError,
+                exceptions.TestException) as e:
+            self.LOG.error('Echo service control message failed: ' +
+                           str(e))
+            return json.dumps({'error': str(e)})
+        return self.call(self.commands[command], message)
+
+    def call(self, func, message):
+        """
+        Call a command's function with the control message's arguments
+        and return the JSON reply.
+        :type func: callable
+        :type message: dict[str, any]
+        :return: str
+        """
+        try:
+            result = func(**message)
+        except (ValueError, KeyError, TypeError, socket.error,
+                exceptions.TestException) as e:
+            self.LOG.error('Echo service control message failed: ' +
+                           str(e))
+            return json.dumps({'error': str(e)})
+        return json.dumps({'result': result})
+
+    def run_blocking(self, fd, conn, func, message):
+        reply = self.call(func, message)
+        with self.lock:
+            # The client may have gone away (and the fd been reused)
+            if self.conns.get(fd) is not conn:
+                return
+            conn.reply = reply + '\n'
+            self.epoll.modify(fd, select.EPOLLOUT)
+            self.write(fd)
+
+    def shutdown(self):
+        """
+        Stop serving once the current round of requests is answered.
+        :return: bool
+        """
+        self.stop_event.set()
+        return True
+
+    def close_listener(self, fd):
+        listener = self.listeners.pop(fd)
+        self.epoll.unregister(fd)
+        listener.sock.close()
+
+    def drop(self, fd):
+        conn = self.conns.pop(fd)
+        self.epoll.unregister(fd)
+        conn.sock.close()
+
+    def stop(self, timeout=5):
+        """
+        Stop answering requests and close all of the sockets.
+        :type timeout: float
+        """
+        self.stop_event.set()
+        if self.wake_pipe is not None:
+            try:
+                os.write(self.wake_pipe[1], 'x')
+            except OSError:
+                pass
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def close(self):
+        with self.lock:
+            for fd in self.conns.keys():
+                self.drop(fd)
+            for fd in self.listeners.keys():
+                self.close_listener(fd)
+            if self.control_sock is not None:
+                self.control_sock.close()
+                self.control_sock = None
+                if os.path.exists(self.control_path):
+                    os.unlink(self.control_path)
+            if self.epoll is not None:
+                self.epoll.close()
+                self.epoll = None
+            if self.wake_pipe is not None:
+                os.close(self.wake_pipe[0])
+                os.close(self.wake_pipe[1])
+                self.wake_pipe = None
+
+
+class EchoServer(EchoService):
+    def __init__(self, ip_addr='localhost', port=DEFAULT_ECHO_PORT,
+                 echo_data='pong', protocol='tcp', netns_name=None,
+                 logger=None):
+        """
+        An echo service with a single listener.  Each request is read up
+        to the termination string and answered with
+        "<request>:<echo_data>" followed by the termination string (after
+        which TCP connections are closed, unless the request ended with
+        KEEP_ALIVE_STRING).  A server can only be started once.
+        :type ip_addr: str
+        :type port: int
+        :type echo_data: str
+        :type protocol: str
+        :type netns_name: str
+        :type logger: logging.Logger
+        """
+        if protocol not in ('tcp', 'udp'):
+            raise exceptions.ArgMismatchException(
+                'Unsupported protocol: ' + protocol)
+        super(EchoServer, self).__init__(netns_name=netns_name,
+                                         logger=logger)
+        self.ip_addr = ip_addr
+        self.port = port
+        self.echo_data = echo_data
+        self.protocol = protocol
+
+    def open(self):
+        super(EchoServer, self).open()
+        self.add_listener(self.ip_addr, self.port, self.echo_data,
+                          self.protocol)
+
+    def requests(self):
+        """
+        :return: int
+        """
+        with self.lock:
+            return sum(l.requests for l in self.listeners.itervalues())
+
+    @staticmethod
+    def send(ip_addr='localhost', port=DEFAULT_ECHO_PORT,
+             echo_request='ping', protocol='tcp',
+             timeout=ECHO_SEND_TIMEOUT, netns_name=None):
+        """
+        Send an echo request (from the given network namespace) and
+        return the reply, without its termination string.
+        :type ip_addr: str
+        :type port: int
+        :type echo_request: str
+        :type protocol: str
+        :type timeout: float
+        :type netns_name: str
+        :return: str
+        """
+        if netns_name is not None:
+            with netns.in_netns(netns_name):
+                return EchoServer.send(ip_addr, port, echo_request,
+                                       protocol, timeout)
+
+        req = echo_request + TERMINATION_STRING
+        if protocol == 'tcp':
+            sock = socket.create_connection((ip_addr, port), timeout)
+        elif protocol == 'udp':
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.settimeout(timeout)
+        else:
+            raise exceptions.ArgMismatchException(
+                'Unsupported protocol: ' + protocol)
+
+        try:
+            data = ''
+            if protocol == 'tcp':
+                sock.sendall(req)
+                while TERMINATION_STRING not in data:
+                    new_data = sock.recv(ECHO_RECV_SIZE)
+                    if not new_data:
+                        break
+                    data += new_data
+            else:
+                sock.sendto(req, (ip_addr, port))
+                data, _ = sock.recvfrom(ECHO_RECV_SIZE)
+        finally:
+            sock.close()
+
+        pos = data.find(TERMINATION_STRING)
+        if pos != -1:
+            data = data[0:pos]
+        return data
+
+
+class EchoServiceClient(object):
+    def __init__(self, control_path, timeout=ECHO_SEND_TIMEOUT):
+        """
+        Sends control messages to an EchoService (e.g. one run by
+        echo-server.py in a VM) through its control socket.
+        :type control_path: str
+        :type timeout: float
+        """
+        self.control_path = control_path
+        self.timeout = timeout
+
+    def request(self, command, wait=None, **kwargs):
+        """
+        Send a control message and return its result, waiting up to
+        [wait] seconds (the client's timeout by default) for it.  Raises
+        SocketException if the service can't be reached, and
+        SubprocessFailedException if it fails to carry out the command.
+        :type command: str
+        :type wait: float
+        :return: any
+        """
+        kwargs['command'] = command
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(wait if wait is not None else self.timeout)
+        try:
+            sock.connect(self.control_path)
+            sock.sendall(json.dumps(kwargs) + '\n')
+            reply = ''
+            while '\n' not in reply:
+                data = sock.recv(ECHO_RECV_SIZE)
+                if not data:
+                    break
+                reply += data
+        except socket.error as e:
+            raise exceptions.SocketException(
+                'Failed to reach echo service at ' + self.control_path +
+                ': ' + str(e))
+        finally:
+            sock.close()
+
+        try:
+            reply = json.loads(reply)
+        except ValueError:
+            raise exceptions.SocketException(
+                'Bad reply from echo service at ' + self.control_path +
+                ': ' + repr(reply))
+        if 'error' in reply:
+            raise exceptions.SubprocessFailedException(
+                'Echo service ' + command + ' failed: ' + reply['error'])
+        return reply['result']
+
+    def is_running(self):
+        """
+        :return: bool
+        """
+        try:
+            self.request('list')
+        except exceptions.TestException:
+            return False
+        return True
+
+    def start_listener(self, ip_addr='', port=DEFAULT_ECHO_PORT,
+                       echo_data='pong', protocol='tcp'):
+        return self.request('start', ip_addr=ip_addr, port=port,
+                            echo_data=echo_data, protocol=protocol)
+
+    def stop_listener(self, ip_addr='', port=DEFAULT_ECHO_PORT,
+                      protocol=None):
+        """
+        :return: int The number of listeners stopped
+        """
+        return self.request('stop', ip_addr=ip_addr, port=port,
+                            protocol=protocol)
+
+    def list_listeners(self):
+        """
+        :return: list[dict[str, any]]
+        """
+        return self.request('list')
+
+    def shutdown(self):
+        return self.request('shutdown')
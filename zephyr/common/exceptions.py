@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+
 
 class TestException(Exception):
     def __init__(self, info):
@@ -82,3 +84,38 @@ class PacketParsingException(TestException):
 class FileNotFoundException(TestException):
     def __init__(self, info):
         super(FileNotFoundException, self).__init__(info)
+
+
+class NetlinkException(TestException):
+    def __init__(self, errors):
+        """
+        :type errors: list[(object, str, int)] List of (owner, request
+        description, errno) for each failed request
+        """
+        super(NetlinkException, self).__init__(
+            '; '.join(
+                (getattr(owner, 'name', str(owner)) + ': '
+                 if owner is not None else '') +
+                desc + ': ' + os.strerror(err)
+                for owner, desc, err in errors))
+        self.errors = errors
+
+
+class IPBatchException(TestException):
+    def __init__(self, errors):
+        """
+        :type errors: list[(object, str, str)] List of (owner, command,
+        error output) for each failed command
+        """
+        super(IPBatchException, self).__init__(
+            '; '.join(
+                (getattr(owner, 'name', str(owner)) + ': '
+                 if owner is not None else '') +
+                command + ': ' + reason
+                for owner, command, reason in errors))
+        self.errors = errors
+
+
+class FilterCompileException(TestException):
+    def __init__(self, info):
+        super(FilterCompileException, self).__init__(info)
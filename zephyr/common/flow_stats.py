@@ -0,0 +1,371 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import namedtuple
+import socket
+import struct
+import threading
+
+from zephyr.common.bpf import IP_PROTOCOL_NAMES
+from zephyr.common.bpf import IP_PROTOCOL_SCTP
+from zephyr.common.exceptions import *
+from zephyr.common.pcap_packet import *
+
+FlowKey = namedtuple('FlowKey',
+                     'proto source_ip source_port dest_ip dest_port')
+
+# Protocols whose first four bytes are the source and destination ports
+PORT_PROTOCOLS = (IP4_PROTOCOL_TCP, IP4_PROTOCOL_UDP, IP_PROTOCOL_SCTP)
+
+# How many TCP flag values are kept, in order, for each flow
+FLOW_FLAG_HISTORY = 32
+
+_ETHER_TYPE = struct.Struct('!H')
+_IP4_HEADER = struct.Struct('!BxH2xH1xB2x4s4s')
+_IP6_HEADER = struct.Struct('!4xHB1x16s16s')
+_PORTS = struct.Struct('!HH')
+_TCP_HEADER = struct.Struct('!4xI4xBB')
+
+_SEQ_MOD = 1 << 32
+_SEQ_HALF = 1 << 31
+
+
+def timestamp_seconds(timestamp):
+    """
+    Converts a capture timestamp ('HH:MM:SS.ffffff', as tcpdump prints
+    it) into seconds since midnight, or None if it isn't one.
+    :type timestamp: str
+    :return: float
+    """
+    try:
+        hours, minutes, seconds = timestamp.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except (AttributeError, ValueError):
+        return None
+
+
+def reverse_key(key):
+    """
+    Returns the key of the flow going the other way (e.g. the replies).
+    :type key: FlowKey
+    :return: FlowKey
+    """
+    return FlowKey(key.proto, key.dest_ip, key.dest_port,
+                   key.source_ip, key.source_port)
+
+
+def decode_flow(packet):
+    """
+    Decodes just the fields flow accounting needs straight from a
+    packet's data (without parsing its layers): the raw 5-tuple, the
+    transport payload length, and for TCP the sequence number and flags.
+    VLAN tags are skipped.  Returns None for packets which aren't IP.
+    :type packet: PCAPPacket
+    :return: ((int, str, int, str, int), int, int, int)
+    """
+    data = packet.packet_data
+    if packet.link_layer is PCAPSLL:
+        offset = 16
+    else:
+        offset = 14
+    try:
+        ether_type = _ETHER_TYPE.unpack_from(data, offset - 2)[0]
+        while ether_type in (ETHERNET_PROTOCOL_TYPE_VLAN,
+                             ETHERNET_PROTOCOL_TYPE_QINQ):
+            ether_type = _ETHER_TYPE.unpack_from(data, offset + 2)[0]
+            offset += 4
+
+        if ether_type == ETHERNET_PROTOCOL_TYPE_IP4:
+            (version_ihl, total_len, frag, proto, source,
+             dest) = _IP4_HEADER.unpack_from(data, offset)
+            header_len = (version_ihl & 0x0f) * 4
+            payload_len = total_len - header_len
+            # Only the first fragment carries the transport header
+            if frag & 0x1fff:
+                return (proto, source, 0, dest, 0), payload_len, None, None
+        elif ether_type == ETHERNET_PROTOCOL_TYPE_IP6:
+            (payload_len, proto, source,
+             dest) = _IP6_HEADER.unpack_from(data, offset)
+            header_len = 40
+        else:
+            return None
+
+        l4 = offset + header_len
+        if proto not in PORT_PROTOCOLS:
+            return (proto, source, 0, dest, 0), payload_len, None, None
+        source_port, dest_port = _PORTS.unpack_from(data, l4)
+        if proto != IP4_PROTOCOL_TCP:
+            return ((proto, source, source_port, dest, dest_port),
+                    payload_len - (8 if proto == IP4_PROTOCOL_UDP else 0),
+                    None, None)
+
+        seq, offset_ns, flags = _TCP_HEADER.unpack_from(data, l4)
+        return ((proto, source, source_port, dest, dest_port),
+                payload_len - (offset_ns >> 4) * 4, seq,
+                ((offset_ns & 0x1) << 8) | flags)
+    except struct.error:
+        return None
+
+
+def _format_address(raw):
+    if len(raw) == 4:
+        return socket.inet_ntoa(raw)
+    return socket.inet_ntop(socket.AF_INET6, raw)
+
+
+class FlowStats(object):
+    __slots__ = ('key', 'packets', 'bytes', 'payload_bytes', 'first_time',
+                 'last_time', 'tcp_flags', 'syn_packets', 'fin_packets',
+                 'reset_packets', 'retransmissions', 'next_seq',
+                 'gaps', 'gap_mean', 'gap_m2', 'gap_min', 'gap_max')
+
+    def __init__(self, key):
+        """
+        Running totals for one direction of a flow.  Inter-arrival times
+        are kept as a running mean and variance, so they take the same
+        space however many packets the flow has.
+        :type key: FlowKey
+        """
+        self.key = key
+        """ :type: FlowKey"""
+        self.packets = 0
+        self.bytes = 0
+        self.payload_bytes = 0
+        self.first_time = None
+        """ :type: float"""
+        self.last_time = None
+        """ :type: float"""
+        self.tcp_flags = []
+        """ :type: list[int]"""
+        self.syn_packets = 0
+        self.fin_packets = 0
+        self.reset_packets = 0
+        self.retransmissions = 0
+        self.next_seq = None
+        """ :type: int"""
+        self.gaps = 0
+        self.gap_mean = 0.0
+        self.gap_m2 = 0.0
+        self.gap_min = None
+        """ :type: float"""
+        self.gap_max = None
+        """ :type: float"""
+
+    def update(self, frame_len, payload_len, seq, flags, when):
+        self.packets += 1
+        self.bytes += frame_len
+        self.payload_bytes += payload_len
+
+        if when is not None:
+            if self.last_time is None:
+                self.first_time = when
+            else:
+                gap = when - self.last_time
+                # Timestamps are times of day, so they wrap at midnight
+                if gap < -43200:
+                    gap += 86400
+                self.gaps += 1
+                delta = gap - self.gap_mean
+                self.gap_mean += delta / self.gaps
+                self.gap_m2 += delta * (gap - self.gap_mean)
+                if self.gap_min is None or gap < self.gap_min:
+                    self.gap_min = gap
+                if self.gap_max is None or gap > self.gap_max:
+                    self.gap_max = gap
+            self.last_time = when
+
+        if flags is None:
+            return
+        if len(self.tcp_flags) < FLOW_FLAG_HISTORY:
+            self.tcp_flags.append(flags)
+        syn = flags & TCP_PROTOCOL_FLAG_SYN != 0
+        fin = flags & TCP_PROTOCOL_FLAG_FINAL != 0
+        self.syn_packets += syn
+        self.fin_packets += fin
+        self.reset_packets += flags & TCP_PROTOCOL_FLAG_RESET != 0
+
+        # A segment which takes up sequence space but doesn't go past
+        # what has already been sent is (most likely) a retransmission
+        seq_len = payload_len + syn + fin
+        if seq_len == 0:
+            return
+        seq_end = (seq + seq_len) % _SEQ_MOD
+        if (self.next_seq is not None and
+                (self.next_seq - seq_end) % _SEQ_MOD < _SEQ_HALF):
+            self.retransmissions += 1
+        else:
+            self.next_seq = seq_end
+
+    def duration(self):
+        """
+        :return: float
+        """
+        if self.first_time is None:
+            return 0.0
+        duration = self.last_time - self.first_time
+        return duration + 86400 if duration < 0 else duration
+
+    def gap_stddev(self):
+        """
+        :return: float
+        """
+        if self.gaps < 2:
+            return 0.0
+        return (self.gap_m2 / (self.gaps - 1)) ** 0.5
+
+    def has_flags(self, *flag_sequence):
+        """
+        Tells whether the flow's TCP segments carried the given flag
+        values in this order (not necessarily one right after another),
+        e.g. has_flags(SYN, ACK, FIN | ACK).
+        :type flag_sequence: list[int]
+        :return: bool
+        """
+        flags = iter(self.tcp_flags)
+        return all(f in flags for f in flag_sequence)
+
+    def to_str(self):
+        return ('FLOW ' + str(self.key.proto) + ' ' + self.key.source_ip +
+                ':' + str(self.key.source_port) + ' -> ' +
+                self.key.dest_ip + ':' + str(self.key.dest_port) +
+                ' packets[' + str(self.packets) + '] bytes[' +
+                str(self.bytes) + '] retrans[' +
+                str(self.retransmissions) + ']')
+
+    def __repr__(self):
+        return self.to_str()
+
+
+class FlowTable(object):
+    def __init__(self, packets=None):
+        """
+        Groups packets into 5-tuple flows (one per direction) and keeps
+        running statistics for each, updated as each packet is added.
+        Packets can be added from any iterable in one pass (e.g. a
+        PCAPFileReader, so large captures are never held in memory), or
+        one at a time: add can be used as a native capture's callback to
+        account for packets as they are captured.  Ports are 0 for
+        protocols without them (and for non-first IP fragments).
+        :type packets: collections.Iterable[PCAPPacket]
+        """
+        self.lock = threading.Lock()
+        self.flows = {}
+        """ :type: dict[(int, str, int, str, int), FlowStats]"""
+        self.other_packets = 0
+        if packets is not None:
+            self.add_packets(packets)
+
+    def add(self, packet):
+        """
+        :type packet: PCAPPacket
+        """
+        decoded = decode_flow(packet)
+        when = timestamp_seconds(packet.timestamp)
+        with self.lock:
+            if decoded is None:
+                self.other_packets += 1
+                return
+            raw_key, payload_len, seq, flags = decoded
+            flow = self.flows.get(raw_key, None)
+            if flow is None:
+                flow = FlowStats(FlowKey(
+                    raw_key[0], _format_address(raw_key[1]), raw_key[2],
+                    _format_address(raw_key[3]), raw_key[4]))
+                self.flows[raw_key] = flow
+            flow.update(len(packet.packet_data), payload_len, seq, flags,
+                        when)
+
+    def add_packets(self, packets):
+        """
+        :type packets: collections.Iterable[PCAPPacket]
+        :return: FlowTable
+        """
+        for packet in packets:
+            self.add(packet)
+        return self
+
+    def __len__(self):
+        with self.lock:
+            return len(self.flows)
+
+    def __iter__(self):
+        with self.lock:
+            return iter(self.flows.values())
+
+    def find(self, proto=None, source_ip=None, source_port=None,
+             dest_ip=None, dest_port=None):
+        """
+        Returns the flows matching all of the given key fields.  The
+        protocol may be given by name (e.g. 'tcp', 'udp' or 'icmp').
+        :type proto: int | str
+        :type source_ip: str
+        :type source_port: int
+        :type dest_ip: str
+        :type dest_port: int
+        :return: list[FlowStats]
+        """
+        if proto in IP_PROTOCOL_NAMES:
+            proto = IP_PROTOCOL_NAMES[proto]
+        match = [(i, v) for i, v in enumerate(
+            (proto, source_ip, source_port, dest_ip, dest_port))
+            if v is not None]
+        return [f for f in self
+                if all(f.key[i] == v for i, v in match)]
+
+    def get(self, **key_fields):
+        """
+        Returns the one flow matching the given key fields (as for find),
+        raising ObjectNotFoundException if there isn't exactly one.
+        :return: FlowStats
+        """
+        flows = self.find(**key_fields)
+        if len(flows) != 1:
+            raise ObjectNotFoundException(
+                'Expected one flow matching ' + str(key_fields) +
+                ', found ' + str(len(flows)))
+        return flows[0]
+
+    def total_packets(self, **key_fields):
+        """
+        :return: int
+        """
+        return sum(f.packets for f in self.find(**key_fields))
+
+    def total_bytes(self, **key_fields):
+        """
+        :return: int
+        """
+        return sum(f.bytes for f in self.find(**key_fields))
+
+    def total_retransmissions(self, **key_fields):
+        """
+        :return: int
+        """
+        return sum(f.retransmissions for f in self.find(**key_fields))
+
+    def packets_by(self, field, **key_fields):
+        """
+        Totals the packets of the matching flows by one of the key's
+        fields, e.g. packets_by('dest_ip', dest_port=80) to see how
+        requests were spread over a pool's members.
+        :type field: str
+        :return: dict[object, int]
+        """
+        if field not in FlowKey._fields:
+            raise ArgMismatchException('Not a flow key field: ' + field)
+        ret = {}
+        for f in self.find(**key_fields):
+            value = getattr(f.key, field)
+            ret[value] = ret.get(value, 0) + f.packets
+        return ret
@@ -0,0 +1,217 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import tempfile
+
+from zephyr.common.cli import LinuxCLI
+from zephyr.common.cli import NetNSCLI
+from zephyr.common.exceptions import *
+
+IP_BATCH_FAILED_REGEX = re.compile(r'^Command failed .*:(\d+)$')
+IPTABLES_RESTORE_FAILED_REGEX = re.compile(r'line (\d+) failed')
+
+
+def _default_cli(netns_name):
+    return NetNSCLI(netns_name) if netns_name is not None else LinuxCLI()
+
+
+class IPBatchTransaction(object):
+    def __init__(self, cli_factory=_default_cli):
+        """
+        Collects link, address and route changes (possibly across several
+        network namespaces) as 'ip' commands, plus iptables rules, and
+        applies them with one 'ip -force -batch' exec per run of
+        consecutive commands for the same namespace, and one
+        'iptables-restore --noflush' exec per namespace.  This has the
+        same interface as NetlinkTransaction, so either can be handed to
+        the PTM host/interface configuration methods.  Each command
+        carries an owner (e.g. the Interface, Bridge or IPForwardRuleDef
+        that queued it), which is used to report any failures.
+        :type cli_factory: callable
+        """
+        self.cli_factory = cli_factory
+        self.segments = []
+        """ :type: list[(str, list[(str, object)])]"""
+        self.iptables_rules = {}
+        """ :type: dict[str, list[(str, str, object)]]"""
+        self.iptables_order = []
+        """ :type: list[str]"""
+
+    def __len__(self):
+        return (sum(len(lines) for _, lines in self.segments) +
+                sum(len(rules) for rules in self.iptables_rules.itervalues()))
+
+    def add(self, netns_name, command, owner=None):
+        """
+        Queue an 'ip' command (without the leading 'ip').
+        :type netns_name: str
+        :type command: str
+        :type owner: object
+        """
+        if not self.segments or self.segments[-1][0] != netns_name:
+            self.segments.append((netns_name, []))
+        self.segments[-1][1].append((command, owner))
+
+    def iptables(self, netns_name, table, rule, owner=None):
+        """
+        Queue an iptables rule change, in iptables-restore syntax
+        (e.g. '-A FORWARD -i eth0 -j ACCEPT').
+        :type netns_name: str
+        :type table: str
+        :type rule: str
+        :type owner: object
+        """
+        if netns_name not in self.iptables_rules:
+            self.iptables_rules[netns_name] = []
+            self.iptables_order.append(netns_name)
+        self.iptables_rules[netns_name].append((table, rule, owner))
+
+    def link_add_bridge(self, netns_name, name, stp=False, owner=None):
+        self.add(netns_name, 'link add name ' + name + ' type bridge' +
+                 (' stp_state 1' if stp else ''), owner)
+
+    def link_add_veth(self, netns_name, name, peer_name,
+                      peer_netns_name=None, owner=None):
+        self.add(netns_name, 'link add dev ' + name +
+                 ' type veth peer name ' + peer_name +
+                 (' netns ' + peer_netns_name
+                  if peer_netns_name is not None else ''), owner)
+
+    def link_add_vlan(self, netns_name, name, parent, vlan_id, owner=None):
+        self.add(netns_name, 'link add link ' + parent + ' name ' + name +
+                 ' type vlan id ' + str(vlan_id), owner)
+
+    def link_del(self, netns_name, name, owner=None):
+        self.add(netns_name, 'link del dev ' + name, owner)
+
+    def link_set(self, netns_name, name, up=None, mac=None, master=None,
+                 owner=None):
+        self.add(netns_name, 'link set dev ' + name +
+                 (' address ' + mac if mac is not None else '') +
+                 (' master ' + master if master is not None else '') +
+                 (' up' if up else ' down' if up is not None else ''),
+                 owner)
+
+    def addr_add(self, netns_name, name, ip, replace=False, owner=None):
+        self.add(netns_name, 'addr ' + ('replace ' if replace else 'add ') +
+                 str(ip) + ' dev ' + name, owner)
+
+    def addr_del(self, netns_name, name, ip, owner=None):
+        self.add(netns_name, 'addr del ' + str(ip) + ' dev ' + name, owner)
+
+    def route_add(self, netns_name, dest='default', gw=None, dev=None,
+                  owner=None):
+        self.add(netns_name, 'route add ' + str(dest) +
+                 (' via ' + str(gw) if gw is not None else '') +
+                 (' dev ' + dev if dev is not None else ''), owner)
+
+    def route_del(self, netns_name, dest, owner=None):
+        self.add(netns_name, 'route del ' + str(dest), owner)
+
+    def commit(self):
+        """
+        Apply all queued commands, in order, followed by the iptables
+        rules.  Every command is attempted; if any of them failed, an
+        IPBatchException listing each failure (with its owner) is raised
+        once all have been processed.
+        """
+        errors = []
+        try:
+            for netns_name, lines in self.segments:
+                errors += self.run_ip_batch(netns_name, lines)
+            for netns_name in self.iptables_order:
+                errors += self.run_iptables_restore(
+                    netns_name, self.iptables_rules[netns_name])
+        finally:
+            self.segments = []
+            self.iptables_rules = {}
+            self.iptables_order = []
+
+        if errors:
+            raise IPBatchException(errors)
+
+    def run_ip_batch(self, netns_name, lines):
+        """
+        :type netns_name: str
+        :type lines: list[(str, object)]
+        :return: list[(object, str, str)]
+        """
+        result = self._exec(netns_name, 'ip -force -batch ',
+                            [command for command, _ in lines])
+        if result.ret_code == 0:
+            return []
+
+        # ip prints the error(s) for each failed line, followed by
+        # 'Command failed <file>:<line>'
+        errors = []
+        reason = []
+        for line in (result.stderr or '').splitlines():
+            match = IP_BATCH_FAILED_REGEX.match(line.strip())
+            if match is None:
+                reason.append(line.strip())
+                continue
+            index = int(match.group(1)) - 1
+            if 0 <= index < len(lines):
+                errors.append((lines[index][1], 'ip ' + lines[index][0],
+                               ' '.join(reason)))
+            reason = []
+
+        if not errors:
+            errors.append((None, 'ip -batch', (result.stderr or '').strip()))
+        return errors
+
+    def run_iptables_restore(self, netns_name, rules):
+        """
+        :type netns_name: str
+        :type rules: list[(str, str, object)]
+        :return: list[(object, str, str)]
+        """
+        payload = []
+        line_owners = {}
+        tables = []
+        for table, _, _ in rules:
+            if table not in tables:
+                tables.append(table)
+        for table in tables:
+            payload.append('*' + table)
+            for rule_table, rule, owner in rules:
+                if rule_table == table:
+                    payload.append(rule)
+                    line_owners[len(payload)] = (owner, rule)
+            payload.append('COMMIT')
+
+        result = self._exec(netns_name, 'iptables-restore --noflush < ',
+                            payload)
+        if result.ret_code == 0:
+            return []
+
+        # iptables-restore is all-or-nothing, so report the line it
+        # stopped at, if it says which one
+        stderr = (result.stderr or '').strip()
+        match = IPTABLES_RESTORE_FAILED_REGEX.search(stderr)
+        if match is not None and int(match.group(1)) in line_owners:
+            owner, rule = line_owners[int(match.group(1))]
+            return [(owner, 'iptables ' + rule, stderr)]
+        return [(None, 'iptables-restore', stderr)]
+
+    def _exec(self, netns_name, command, lines):
+        fd, path = tempfile.mkstemp(prefix='zephyr-batch-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+            return self.cli_factory(netns_name).cmd(command + path)
+        finally:
+            os.unlink(path)
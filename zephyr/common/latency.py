@@ -0,0 +1,190 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from zephyr.common import exceptions
+
+# Latencies are bucketed with 7 significant bits (under 1% error)
+HISTOGRAM_PRECISION_BITS = 7
+HISTOGRAM_PERCENTILES = (50, 90, 99)
+
+
+class LatencyHistogram(object):
+    def __init__(self):
+        """
+        A histogram of latencies (in seconds) in the style of an HDR
+        histogram: values are kept in microseconds, exactly below 128us
+        and in buckets of 7 significant bits above, so memory stays small
+        however many values are recorded while percentiles stay within 1%
+        of the real values.
+        """
+        self.buckets = {}
+        """ :type: dict[int, int]"""
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def bucket_of(usecs):
+        shift = max(usecs.bit_length() - HISTOGRAM_PRECISION_BITS, 0)
+        return (shift << HISTOGRAM_PRECISION_BITS) | (usecs >> shift)
+
+    @staticmethod
+    def bucket_top(bucket):
+        """
+        The highest value (in microseconds) which falls in a bucket.
+        :type bucket: int
+        :return: int
+        """
+        shift = bucket >> HISTOGRAM_PRECISION_BITS
+        mantissa = bucket & ((1 << HISTOGRAM_PRECISION_BITS) - 1)
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, latency):
+        """
+        :type latency: float
+        """
+        if latency < 0:
+            raise exceptions.ArgMismatchException(
+                'Negative latency: ' + str(latency))
+        bucket = self.bucket_of(int(round(latency * 1000000)))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += latency
+        self.min = latency if self.min is None else min(self.min, latency)
+        self.max = latency if self.max is None else max(self.max, latency)
+
+    def merge(self, other):
+        """
+        :type other: LatencyHistogram
+        """
+        for bucket, count in other.buckets.iteritems():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        if other.count:
+            self.min = (other.min if self.min is None
+                        else min(self.min, other.min))
+            self.max = (other.max if self.max is None
+                        else max(self.max, other.max))
+        self.count += other.count
+        self.total += other.total
+
+    def mean(self):
+        """
+        :return: float | None
+        """
+        return self.total / self.count if self.count else None
+
+    def percentile(self, pct):
+        """
+        The latency (in seconds) at or under which pct percent of the
+        recorded latencies fall, or None if nothing was recorded.
+        :type pct: float
+        :return: float | None
+        """
+        if not self.count:
+            return None
+        if pct >= 100:
+            return self.max
+        rank = max(1, int(-(-pct * self.count // 100)))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(max(self.bucket_top(bucket) / 1000000.0,
+                               self.min), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'buckets': self.buckets, 'count': self.count,
+                'total': self.total, 'min': self.min, 'max': self.max}
+
+    @staticmethod
+    def from_dict(histogram_map):
+        """
+        :type histogram_map: dict[str, any]
+        :return: LatencyHistogram
+        """
+        histogram = LatencyHistogram()
+        histogram.buckets = dict((int(b), c) for b, c in
+                                 histogram_map['buckets'].iteritems())
+        histogram.count = histogram_map['count']
+        histogram.total = histogram_map['total']
+        histogram.min = histogram_map['min']
+        histogram.max = histogram_map['max']
+        return histogram
+
+    def to_str(self):
+        if not self.count:
+            return 'no samples'
+
+        def ms(value):
+            return str(round(value * 1000, 3)) + 'ms'
+        return (', '.join('p' + str(p) + '=' + ms(self.percentile(p))
+                          for p in HISTOGRAM_PERCENTILES) +
+                ', max=' + ms(self.max) + ', mean=' + ms(self.mean()) +
+                ' (' + str(self.count) + ' samples)')
+
+
+class LatencyReport(object):
+    def __init__(self, mode='persistent', protocol='tcp'):
+        """
+        Latencies measured by a run of echo probes, with the cost of
+        setting up each new flow (a TCP handshake, or the first UDP probe)
+        kept apart from the round trips of probes over flows which are
+        already set up.
+        :type mode: str
+        :type protocol: str
+        """
+        self.mode = mode
+        self.protocol = protocol
+        self.first_packet = LatencyHistogram()
+        self.steady = LatencyHistogram()
+        self.sent = 0
+        self.failures = 0
+        self.errors = {}
+        """ :type: dict[str, int]"""
+
+    def add_error(self, error):
+        self.failures += 1
+        self.errors[error] = self.errors.get(error, 0) + 1
+
+    def to_dict(self):
+        return {'mode': self.mode, 'protocol': self.protocol,
+                'first_packet': self.first_packet.to_dict(),
+                'steady': self.steady.to_dict(), 'sent': self.sent,
+                'failures': self.failures, 'errors': self.errors}
+
+    @staticmethod
+    def from_dict(report_map):
+        """
+        :type report_map: dict[str, any]
+        :return: LatencyReport
+        """
+        report = LatencyReport(str(report_map['mode']),
+                               str(report_map['protocol']))
+        report.first_packet = LatencyHistogram.from_dict(
+            report_map['first_packet'])
+        report.steady = LatencyHistogram.from_dict(report_map['steady'])
+        report.sent = report_map['sent']
+        report.failures = report_map['failures']
+        report.errors = dict((str(k), v) for k, v in
+                             report_map['errors'].iteritems())
+        return report
+
+    def to_str(self):
+        return (self.protocol + ' ' + self.mode + ' latency: ' +
+                str(self.sent) + ' probes, ' + str(self.failures) +
+                ' failed ' + str(self.errors) + '\n' +
+                '  first packet: ' + self.first_packet.to_str() + '\n' +
+                '  steady state: ' + self.steady.to_str())
@@ -0,0 +1,503 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import binascii
+import errno
+import socket
+import struct
+
+from zephyr.common.exceptions import *
+from zephyr.common import netns
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_ACK = 0x4
+NLM_F_REPLACE = 0x100
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+NLM_F_DUMP = 0x300
+
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+
+IFF_UP = 0x1
+
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_LINK = 5
+IFLA_MASTER = 10
+IFLA_LINKINFO = 18
+IFLA_NET_NS_FD = 28
+IFLA_INFO_KIND = 1
+IFLA_INFO_DATA = 2
+IFLA_VLAN_ID = 1
+IFLA_BR_STP_STATE = 5
+VETH_INFO_PEER = 1
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+
+RT_TABLE_MAIN = 254
+RTPROT_BOOT = 3
+RT_SCOPE_UNIVERSE = 0
+RT_SCOPE_LINK = 253
+RT_SCOPE_HOST = 254
+RTN_UNICAST = 1
+
+NLMSGHDR = struct.Struct('=LHHLL')
+NLATTR = struct.Struct('=HH')
+IFINFOMSG = struct.Struct('=BxHiII')
+IFADDRMSG = struct.Struct('=BBBBI')
+RTMSG = struct.Struct('=BBBBBBBBI')
+NLMSGERR = struct.Struct('=i')
+
+# Number of requests sent in one sendmsg before draining the ACKs, which
+# keeps the socket receive buffer from overflowing on very large batches
+MAX_REQUESTS_PER_SEND = 128
+RECV_BUFFER_SIZE = 65536
+
+
+def netlink_available():
+    """
+    Returns True if this process may configure links directly over
+    rtnetlink (which requires CAP_NET_ADMIN) and switch namespaces to
+    do so.
+    :return: bool
+    """
+    return netns.setns_available(check_priv=True)
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _attr(attr_type, data):
+    length = NLATTR.size + len(data)
+    return (NLATTR.pack(length, attr_type) + data +
+            '\0' * (_align(length) - length))
+
+
+def _attr_str(attr_type, value):
+    return _attr(attr_type, str(value) + '\0')
+
+
+def _attr_u32(attr_type, value):
+    return _attr(attr_type, struct.pack('=I', value))
+
+
+def _attr_u16(attr_type, value):
+    return _attr(attr_type, struct.pack('=H', value))
+
+
+def _attr_mac(attr_type, mac):
+    return _attr(attr_type, binascii.unhexlify(mac.replace(':', '')))
+
+
+def _parse_attrs(data):
+    """
+    :type data: str
+    :return: dict[int, str]
+    """
+    attrs = {}
+    pos = 0
+    while pos + NLATTR.size <= len(data):
+        length, attr_type = NLATTR.unpack_from(data, pos)
+        if length < NLATTR.size:
+            break
+        attrs[attr_type & 0x3fff] = data[pos + NLATTR.size:pos + length]
+        pos += _align(length)
+    return attrs
+
+
+def _ip_addr(ip):
+    """
+    :type ip: zephyr.common.ip.IP | str
+    :return: (str, int)
+    """
+    if isinstance(ip, basestring):
+        if ip == 'default':
+            return None, 0
+        addr, _, prefix = ip.partition('/')
+        return socket.inet_aton(addr), int(prefix) if prefix else 32
+    return socket.inet_aton(ip.ip), int(ip.subnet)
+
+
+class RTNetlink(object):
+    def __init__(self, netns_name=None):
+        """
+        A NETLINK_ROUTE socket bound to the given network namespace (or
+        the caller's namespace if none is given).  Requests are sent in
+        batches, with each request asking for its own ACK, so a single
+        send can carry many link/address/route changes.
+        :type netns_name: str
+        """
+        self.netns_name = netns_name
+        if netns_name is not None:
+            with netns.in_netns(netns_name):
+                self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                          NETLINK_ROUTE)
+        else:
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                      NETLINK_ROUTE)
+        self.sock.bind((0, 0))
+        self.seq = 0
+        self.link_indexes = None
+        """ :type: dict[str, int]"""
+
+    def close(self):
+        self.sock.close()
+
+    def next_seq(self):
+        self.seq += 1
+        return self.seq
+
+    def message(self, msg_type, flags, body):
+        """
+        Builds a netlink message and returns its sequence number and data.
+        :type msg_type: int
+        :type flags: int
+        :type body: str
+        :return: (int, str)
+        """
+        seq = self.next_seq()
+        return seq, NLMSGHDR.pack(NLMSGHDR.size + len(body), msg_type,
+                                  flags | NLM_F_REQUEST, seq, 0) + body
+
+    def send_batch(self, messages):
+        """
+        Send a list of messages (as returned by message(), each with
+        NLM_F_ACK set) and wait for all of their ACKs.  Returns a map of
+        sequence number to errno for every request which failed.
+        :type messages: list[(int, str)]
+        :return: dict[int, int]
+        """
+        errors = {}
+        for start in range(0, len(messages), MAX_REQUESTS_PER_SEND):
+            chunk = messages[start:start + MAX_REQUESTS_PER_SEND]
+            outstanding = set(seq for seq, _ in chunk)
+            self.sock.sendall(''.join(data for _, data in chunk))
+            while outstanding:
+                for msg_type, _, seq, payload in self._recv():
+                    if msg_type != NLMSG_ERROR or seq not in outstanding:
+                        continue
+                    outstanding.discard(seq)
+                    err = NLMSGERR.unpack_from(payload)[0]
+                    if err != 0:
+                        errors[seq] = -err
+        return errors
+
+    def dump_links(self):
+        """
+        Returns a map of interface name to ifindex for every link in
+        this namespace.
+        :return: dict[str, int]
+        """
+        seq, data = self.message(RTM_GETLINK, NLM_F_DUMP,
+                                 IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0))
+        self.sock.sendall(data)
+        links = {}
+        while True:
+            for msg_type, _, msg_seq, payload in self._recv():
+                if msg_seq != seq:
+                    continue
+                if msg_type == NLMSG_DONE:
+                    self.link_indexes = links
+                    return links
+                if msg_type == NLMSG_ERROR:
+                    err = -NLMSGERR.unpack_from(payload)[0]
+                    raise NetlinkException(
+                        [(None, 'dump links', err)])
+                index = IFINFOMSG.unpack_from(payload)[2]
+                attrs = _parse_attrs(payload[IFINFOMSG.size:])
+                if IFLA_IFNAME in attrs:
+                    links[attrs[IFLA_IFNAME].rstrip('\0')] = index
+
+    def link_index(self, name):
+        """
+        Returns the ifindex for the given link, refreshing the cached
+        table once if the name isn't known.
+        :type name: str
+        :return: int
+        """
+        if self.link_indexes is None or name not in self.link_indexes:
+            self.dump_links()
+        if name not in self.link_indexes:
+            raise ObjectNotFoundException('Link not found: ' + name)
+        return self.link_indexes[name]
+
+    def _recv(self):
+        data = self.sock.recv(RECV_BUFFER_SIZE)
+        pos = 0
+        while pos + NLMSGHDR.size <= len(data):
+            length, msg_type, flags, seq, _ = NLMSGHDR.unpack_from(data, pos)
+            if length < NLMSGHDR.size:
+                break
+            yield (msg_type, flags, seq,
+                   data[pos + NLMSGHDR.size:pos + length])
+            pos += _align(length)
+
+
+class NetlinkOperation(object):
+    def __init__(self, netns_name, msg_type, flags, build, owner,
+                 description, changes_links=False):
+        """
+        A single queued rtnetlink request.  The body is built only when
+        the transaction is committed, so that ifindex lookups can see
+        links created earlier in the same transaction.
+        :type netns_name: str
+        :type msg_type: int
+        :type flags: int
+        :type build: callable
+        :type owner: object
+        :type description: str
+        :type changes_links: bool
+        """
+        self.netns_name = netns_name
+        self.msg_type = msg_type
+        self.flags = flags
+        self.build = build
+        self.owner = owner
+        self.description = description
+        self.changes_links = changes_links
+
+
+class NetlinkTransaction(object):
+    def __init__(self):
+        """
+        Collects link, address and route changes (possibly across several
+        network namespaces) and applies them with as few netlink
+        round-trips as possible.  Consecutive requests for the same
+        namespace go out in a single send; a batch is only flushed early
+        when a request needs the ifindex of a link which is still queued.
+        Each request carries an owner (e.g. the Interface or Bridge that
+        queued it), which is used to report any failures.
+        """
+        self.ops = []
+        """ :type: list[NetlinkOperation]"""
+        self.sockets = {}
+        """ :type: dict[str, RTNetlink]"""
+
+    def __len__(self):
+        return len(self.ops)
+
+    def add(self, netns_name, msg_type, flags, build, owner=None,
+            description='', changes_links=False):
+        self.ops.append(NetlinkOperation(netns_name, msg_type,
+                                         flags | NLM_F_ACK, build, owner,
+                                         description, changes_links))
+
+    def link_add_bridge(self, netns_name, name, stp=False, owner=None):
+        def build(nl):
+            info = _attr_str(IFLA_INFO_KIND, 'bridge')
+            if stp:
+                info += _attr(IFLA_INFO_DATA,
+                              _attr_u32(IFLA_BR_STP_STATE, 1))
+            return (IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0) +
+                    _attr_str(IFLA_IFNAME, name) +
+                    _attr(IFLA_LINKINFO, info))
+        self.add(netns_name, RTM_NEWLINK, NLM_F_CREATE | NLM_F_EXCL, build,
+                 owner, 'add bridge ' + name, changes_links=True)
+
+    def link_add_veth(self, netns_name, name, peer_name,
+                      peer_netns_name=None, owner=None):
+        def build(nl):
+            peer = (IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0) +
+                    _attr_str(IFLA_IFNAME, peer_name))
+            if peer_netns_name is not None:
+                peer += _attr_u32(IFLA_NET_NS_FD,
+                                  netns.NETNS_CACHE.get_fd(peer_netns_name))
+            info = (_attr_str(IFLA_INFO_KIND, 'veth') +
+                    _attr(IFLA_INFO_DATA, _attr(VETH_INFO_PEER, peer)))
+            return (IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0) +
+                    _attr_str(IFLA_IFNAME, name) +
+                    _attr(IFLA_LINKINFO, info))
+        self.add(netns_name, RTM_NEWLINK, NLM_F_CREATE | NLM_F_EXCL, build,
+                 owner, 'add veth ' + name + ' peer ' + peer_name,
+                 changes_links=True)
+
+    def link_add_vlan(self, netns_name, name, parent, vlan_id, owner=None):
+        def build(nl):
+            info = (_attr_str(IFLA_INFO_KIND, 'vlan') +
+                    _attr(IFLA_INFO_DATA,
+                          _attr_u16(IFLA_VLAN_ID, int(vlan_id))))
+            return (IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0) +
+                    _attr_str(IFLA_IFNAME, name) +
+                    _attr_u32(IFLA_LINK, nl.link_index(parent)) +
+                    _attr(IFLA_LINKINFO, info))
+        self.add(netns_name, RTM_NEWLINK, NLM_F_CREATE | NLM_F_EXCL, build,
+                 owner, 'add vlan ' + name + ' on ' + parent,
+                 changes_links=True)
+
+    def link_del(self, netns_name, name, owner=None):
+        def build(nl):
+            return (IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0) +
+                    _attr_str(IFLA_IFNAME, name))
+        self.add(netns_name, RTM_DELLINK, 0, build, owner,
+                 'del link ' + name, changes_links=True)
+
+    def link_set(self, netns_name, name, up=None, mac=None, master=None,
+                 owner=None):
+        """
+        Change state, MAC address and/or bridge master of an existing
+        link, looked up by name.
+        :type netns_name: str
+        :type name: str
+        :type up: bool
+        :type mac: str
+        :type master: str
+        :type owner: object
+        """
+        def build(nl):
+            flags = IFF_UP if up else 0
+            change = IFF_UP if up is not None else 0
+            body = (IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, flags, change) +
+                    _attr_str(IFLA_IFNAME, name))
+            if mac is not None:
+                body += _attr_mac(IFLA_ADDRESS, mac)
+            if master is not None:
+                body += _attr_u32(IFLA_MASTER, nl.link_index(master))
+            return body
+
+        desc = ('set link ' + name +
+                (' up' if up else ' down' if up is not None else '') +
+                (' address ' + mac if mac is not None else '') +
+                (' master ' + master if master is not None else ''))
+        self.add(netns_name, RTM_NEWLINK, 0, build, owner, desc)
+
+    def addr_add(self, netns_name, name, ip, replace=False, owner=None):
+        self._addr(netns_name, RTM_NEWADDR,
+                   NLM_F_CREATE | (NLM_F_REPLACE if replace else NLM_F_EXCL),
+                   name, ip, owner, 'add address ' + str(ip) + ' dev ' + name)
+
+    def addr_del(self, netns_name, name, ip, owner=None):
+        self._addr(netns_name, RTM_DELADDR, 0, name, ip, owner,
+                   'del address ' + str(ip) + ' dev ' + name)
+
+    def _addr(self, netns_name, msg_type, flags, name, ip, owner, desc):
+        def build(nl):
+            addr, prefix = _ip_addr(ip)
+            scope = (RT_SCOPE_HOST if addr[0] == '\x7f'
+                     else RT_SCOPE_UNIVERSE)
+            return (IFADDRMSG.pack(socket.AF_INET, prefix, 0, scope,
+                                   nl.link_index(name)) +
+                    _attr(IFA_LOCAL, addr) +
+                    _attr(IFA_ADDRESS, addr))
+        self.add(netns_name, msg_type, flags, build, owner, desc)
+
+    def route_add(self, netns_name, dest='default', gw=None, dev=None,
+                  owner=None):
+        """
+        :type netns_name: str
+        :type dest: zephyr.common.ip.IP | str
+        :type gw: zephyr.common.ip.IP | str
+        :type dev: str
+        :type owner: object
+        """
+        self._route(netns_name, RTM_NEWROUTE, NLM_F_CREATE | NLM_F_EXCL,
+                    dest, gw, dev, owner,
+                    'add route ' + str(dest) +
+                    (' via ' + str(gw) if gw is not None else '') +
+                    (' dev ' + dev if dev is not None else ''))
+
+    def route_del(self, netns_name, dest, owner=None):
+        self._route(netns_name, RTM_DELROUTE, 0, dest, None, None, owner,
+                    'del route ' + str(dest))
+
+    def _route(self, netns_name, msg_type, flags, dest, gw, dev, owner,
+               desc):
+        def build(nl):
+            dst, dst_len = _ip_addr(dest)
+            scope = (RT_SCOPE_LINK
+                     if gw is None and msg_type == RTM_NEWROUTE
+                     else RT_SCOPE_UNIVERSE)
+            body = RTMSG.pack(socket.AF_INET, dst_len, 0, 0, RT_TABLE_MAIN,
+                              RTPROT_BOOT, scope, RTN_UNICAST, 0)
+            if dst is not None and dst_len > 0:
+                body += _attr(RTA_DST, dst)
+            if gw is not None:
+                body += _attr(RTA_GATEWAY, _ip_addr(gw)[0])
+            if dev is not None:
+                body += _attr_u32(RTA_OIF, nl.link_index(dev))
+            return body
+        self.add(netns_name, msg_type, flags, build, owner, desc)
+
+    def commit(self):
+        """
+        Apply all queued requests, in order.  Every request is attempted;
+        if any of them failed, a NetlinkException listing each failure
+        (with its owner) is raised once all have been processed.
+        """
+        errors = []
+        pending = []
+        """ :type: list[(NetlinkOperation, int, str)]"""
+        try:
+            for op in self.ops:
+                nl = self._socket(op.netns_name)
+                if pending and pending[0][0].netns_name != op.netns_name:
+                    self._flush(pending, errors)
+                try:
+                    body = op.build(nl)
+                except ObjectNotFoundException:
+                    # The link may still be queued, so push out what we
+                    # have and look again
+                    self._flush(pending, errors)
+                    nl.link_indexes = None
+                    try:
+                        body = op.build(nl)
+                    except ObjectNotFoundException:
+                        errors.append((op.owner, op.description,
+                                       errno.ENODEV))
+                        continue
+                seq, data = nl.message(op.msg_type, op.flags, body)
+                pending.append((op, seq, data))
+            self._flush(pending, errors)
+        finally:
+            self.ops = []
+            for nl in self.sockets.itervalues():
+                nl.close()
+            self.sockets = {}
+
+        if errors:
+            raise NetlinkException(errors)
+
+    def _socket(self, netns_name):
+        if netns_name not in self.sockets:
+            self.sockets[netns_name] = RTNetlink(netns_name)
+        return self.sockets[netns_name]
+
+    def _flush(self, pending, errors):
+        if not pending:
+            return
+        nl = self.sockets[pending[0][0].netns_name]
+        failed = nl.send_batch([(seq, data) for _, seq, data in pending])
+        for op, seq, _ in pending:
+            if seq in failed:
+                errors.append((op.owner, op.description, failed[seq]))
+        if any(op.changes_links for op, _, _ in pending):
+            nl.link_indexes = None
+        del pending[:]
@@ -0,0 +1,156 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import ctypes
+import ctypes.util
+import fcntl
+import os
+import threading
+
+from zephyr.common.exceptions import *
+
+CLONE_NEWNET = 0x40000000
+NETNS_RUN_DIR = '/var/run/netns'
+NETNS_ETC_DIR = '/etc/netns'
+
+_libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+
+def setns(fd, nstype=CLONE_NEWNET):
+    """
+    Move the calling thread into the namespace referred to by fd.
+    :type fd: int
+    :type nstype: int
+    """
+    if _libc.setns(fd, nstype) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, 'setns failed: ' + os.strerror(err))
+
+
+def setns_available(name=None, check_priv=True):
+    """
+    Returns True if commands for the given namespace can be run by
+    switching namespaces directly instead of through 'ip netns exec'.
+    setns() needs CAP_SYS_ADMIN, and namespaces with per-namespace
+    configuration in /etc/netns/<name> need the bind mounts that
+    'ip netns exec' sets up, so those still go through 'ip netns exec'.
+    :type name: str
+    :type check_priv: bool
+    :return: bool
+    """
+    if not hasattr(_libc, 'setns'):
+        return False
+    if check_priv and os.geteuid() != 0:
+        return False
+    if name is not None and os.path.isdir(NETNS_ETC_DIR + '/' + name):
+        return False
+    return True
+
+
+class NetNSCache(object):
+    def __init__(self):
+        """
+        Cache of open /var/run/netns/<name> file descriptors, so that
+        entering a namespace costs a single setns() call rather than an
+        'ip netns exec' fork/exec.  Descriptors are re-opened if the
+        namespace has been deleted and re-created under the same name.
+        """
+        self.fds = {}
+        """ :type: dict[str, int]"""
+        self.lock = threading.Lock()
+
+    def get_fd(self, name):
+        """
+        :type name: str
+        :return: int
+        """
+        path = NETNS_RUN_DIR + '/' + name
+        with self.lock:
+            fd = self.fds.get(name, None)
+            try:
+                ns_stat = os.stat(path)
+            except OSError:
+                self._close(name)
+                raise ObjectNotFoundException(
+                    'Network namespace not found: ' + name)
+
+            if fd is not None:
+                fd_stat = os.fstat(fd)
+                if (fd_stat.st_ino == ns_stat.st_ino and
+                        fd_stat.st_dev == ns_stat.st_dev):
+                    return fd
+                self._close(name)
+
+            fd = os.open(path, os.O_RDONLY)
+            fcntl.fcntl(fd, fcntl.F_SETFD,
+                        fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+            self.fds[name] = fd
+            return fd
+
+    def close(self, name):
+        with self.lock:
+            self._close(name)
+
+    def close_all(self):
+        with self.lock:
+            for name in self.fds.keys():
+                self._close(name)
+
+    def _close(self, name):
+        fd = self.fds.pop(name, None)
+        if fd is not None:
+            os.close(fd)
+
+
+NETNS_CACHE = NetNSCache()
+
+
+def make_preexec_fn(name):
+    """
+    Returns a subprocess preexec_fn which starts a new session (as all
+    LinuxCLI commands do) and then enters the given network namespace in
+    the child, before the command is exec'd.
+    :type name: str
+    :return: callable
+    """
+    fd = NETNS_CACHE.get_fd(name)
+
+    def preexec():
+        os.setsid()
+        setns(fd)
+
+    return preexec
+
+
+@contextlib.contextmanager
+def in_netns(name):
+    """
+    Run the enclosed block (in the calling thread only) inside the given
+    network namespace, so sockets created in the block belong to that
+    namespace.  The thread's original namespace is restored on exit.
+    :type name: str
+    """
+    self_path = ('/proc/thread-self/ns/net'
+                 if os.path.exists('/proc/thread-self')
+                 else '/proc/self/ns/net')
+    orig_fd = os.open(self_path, os.O_RDONLY)
+    try:
+        setns(NETNS_CACHE.get_fd(name))
+        try:
+            yield
+        finally:
+            setns(orig_fd)
+    finally:
+        os.close(orig_fd)
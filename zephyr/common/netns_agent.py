@@ -0,0 +1,771 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+from zephyr.common.echo_server import BULK_CHUNK_SIZE
+from zephyr.common.echo_server import BULK_DATA
+from zephyr.common.echo_server import BULK_REQUEST
+from zephyr.common.echo_server import ECHO_RECV_SIZE
+from zephyr.common.echo_server import ECHO_SEND_TIMEOUT
+from zephyr.common.echo_server import tcp_info
+from zephyr.common.echo_server import TERMINATION_STRING
+from zephyr.common.echo_server import EchoServer
+from zephyr.common.echo_server import EchoService
+from zephyr.common.echo_server import EchoServiceClient
+from zephyr.common.echo_server import KEEP_ALIVE_STRING
+from zephyr.common import exceptions
+from zephyr.common.latency import LatencyReport
+from zephyr.common import netns
+from zephyr.common.packet_generator import build_packet
+from zephyr.common.packet_generator import GenICMP
+from zephyr.common.pcap_packet import ICMP_PROTOCOL_TYPE_ECHO_REPLY
+from zephyr.common.zephyr_constants import DEFAULT_ECHO_PORT
+
+PING_TIMEOUT = 1
+PING_PAYLOAD = 'zephyr-ping'
+PROBE_TIMEOUT = 3
+LATENCY_PROBE_COUNT = 100
+LATENCY_MODES = ('persistent', 'connect')
+THROUGHPUT_DIRECTIONS = ('upload', 'download')
+# How long a client waits for a transfer of a given size by default
+THROUGHPUT_WAIT = 60
+# Extra time a client waits for the agent on top of the command's timeout
+AGENT_REPLY_MARGIN = 2
+SO_BINDTODEVICE = 25
+
+ICMP_ECHO_HEADER = struct.Struct('!BBHHH')
+
+
+def _error_name(e):
+    """
+    :type e: socket.error
+    :return: str
+    """
+    if isinstance(e, socket.timeout):
+        return 'timed out'
+    if e.errno is not None:
+        return errno.errorcode.get(e.errno, str(e))
+    return str(e)
+
+
+def _wait_for_echo_reply(sock, ident, seq, deadline):
+    while True:
+        wait = deadline - time.time()
+        if wait <= 0:
+            return False
+        ready, _, _ = select.select([sock], [], [], wait)
+        if not ready:
+            return False
+        data = sock.recv(ECHO_RECV_SIZE)
+        # Raw IPv4 sockets get the IP header as well
+        icmp = data[(ord(data[0]) & 0x0f) * 4:]
+        if len(icmp) < ICMP_ECHO_HEADER.size:
+            continue
+        icmp_type, _, _, reply_id, reply_seq = ICMP_ECHO_HEADER.unpack(
+            icmp[:ICMP_ECHO_HEADER.size])
+        if (icmp_type == ICMP_PROTOCOL_TYPE_ECHO_REPLY and
+                reply_id == ident and reply_seq == seq):
+            return True
+
+
+def ping(target_ip, iface=None, count=1, timeout=None, netns_name=None):
+    """
+    Send [count] ICMP echo requests to the target (from the given network
+    namespace) one after another, each waiting up to [timeout] seconds
+    (PING_TIMEOUT by default) for its reply.  As with "ping -I", iface
+    can be either an interface or a source address.  Returns the number
+    of requests sent and replies received, and the replies' round-trip
+    times.
+    :type target_ip: str
+    :type iface: str
+    :type count: int
+    :type timeout: float
+    :type netns_name: str
+    :return: dict[str, any]
+    """
+    if netns_name is not None:
+        with netns.in_netns(netns_name):
+            return ping(target_ip, iface, count, timeout)
+
+    wait = float(timeout) if timeout is not None else PING_TIMEOUT
+    ident = (os.getpid() ^ threading.current_thread().ident) & 0xffff
+    sock = socket.socket(socket.AF_INET, socket.SOCK_RAW,
+                         socket.IPPROTO_ICMP)
+    try:
+        if iface is not None:
+            try:
+                socket.inet_aton(iface)
+                sock.bind((iface, 0))
+            except socket.error:
+                sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, iface)
+        rtts = []
+        for seq in xrange(int(count)):
+            request = build_packet([GenICMP(id=ident, seq=seq)],
+                                   PING_PAYLOAD)
+            start = time.time()
+            sock.sendto(request, (target_ip, 0))
+            if _wait_for_echo_reply(sock, ident, seq, start + wait):
+                rtts.append(time.time() - start)
+    finally:
+        sock.close()
+    return {'sent': int(count), 'received': len(rtts), 'rtts': rtts}
+
+
+def probe(dest_ip, dest_port, protocol='tcp', payload=None,
+          timeout=PROBE_TIMEOUT, netns_name=None):
+    """
+    Check whether anything answers on the given port (from the given
+    network namespace).  A TCP port is open if a connection can be made,
+    and a UDP port if a datagram (the payload, or an empty one) gets any
+    reply.  If a payload is given, the first reply to it is returned as
+    well.  Returns whether the port is open, the error otherwise, and how
+    long the probe took.
+    :type dest_ip: str
+    :type dest_port: int
+    :type protocol: str
+    :type payload: str
+    :type timeout: float
+    :type netns_name: str
+    :return: dict[str, any]
+    """
+    if netns_name is not None:
+        with netns.in_netns(netns_name):
+            return probe(dest_ip, dest_port, protocol, payload, timeout)
+
+    if protocol == 'tcp':
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    elif protocol == 'udp':
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if payload is None:
+            payload = ''
+    else:
+        raise exceptions.ArgMismatchException(
+            'Unsupported protocol: ' + str(protocol))
+
+    result = {'open': False, 'error': None, 'reply': None}
+    sock.settimeout(float(timeout))
+    start = time.time()
+    try:
+        sock.connect((dest_ip, int(dest_port)))
+        if payload is not None:
+            sock.sendall(payload)
+            result['reply'] = sock.recv(ECHO_RECV_SIZE)
+        result['open'] = True
+    except socket.error as e:
+        result['error'] = _error_name(e)
+    finally:
+        sock.close()
+    result['time'] = time.time() - start
+    return result
+
+
+class EchoBatchResult(object):
+    def __init__(self, count=0):
+        """
+        What came of a batch of echo requests: how many replies each
+        responder (the echo data after the reply's last colon) sent, how
+        many requests timed out, failed (by error) or got a reply which
+        didn't echo the request, and each request's latency (None if it
+        got no proper reply).
+        :type count: int
+        """
+        self.count = count
+        self.replies = {}
+        """ :type: dict[str, int]"""
+        self.timeouts = 0
+        self.errors = {}
+        """ :type: dict[str, int]"""
+        self.mismatches = 0
+        self.latencies = [None] * count
+        """ :type: list[float | None]"""
+        self.duration = 0.0
+
+    def answered(self):
+        """
+        :return: int
+        """
+        return sum(self.replies.itervalues())
+
+    def unanswered(self):
+        """
+        :return: int
+        """
+        return self.count - self.answered()
+
+    def to_dict(self):
+        return {'count': self.count, 'replies': self.replies,
+                'timeouts': self.timeouts, 'errors': self.errors,
+                'mismatches': self.mismatches,
+                'latencies': self.latencies, 'duration': self.duration}
+
+    @staticmethod
+    def from_dict(result_map):
+        """
+        :type result_map: dict[str, any]
+        :return: EchoBatchResult
+        """
+        result = EchoBatchResult(result_map['count'])
+        result.replies = dict((str(k), v) for k, v in
+                              result_map['replies'].iteritems())
+        result.timeouts = result_map['timeouts']
+        result.errors = dict((str(k), v) for k, v in
+                             result_map['errors'].iteritems())
+        result.mismatches = result_map['mismatches']
+        result.latencies = result_map['latencies']
+        result.duration = result_map['duration']
+        return result
+
+    def to_str(self):
+        return ('Echo requests: ' + str(self.count) + ', replies: ' +
+                str(self.replies) + ', timeouts: ' + str(self.timeouts) +
+                ', errors: ' + str(self.errors) + ', mismatches: ' +
+                str(self.mismatches) + ' in ' +
+                str(round(self.duration, 3)) + 's')
+
+
+class _PendingEcho(object):
+    def __init__(self, index, request, sock, deadline):
+        self.index = index
+        self.request = request
+        self.sock = sock
+        self.deadline = deadline
+        self.start = time.time()
+        self.connected = False
+        self.data = ''
+
+
+def send_echo_requests(dest_ip, dest_port=DEFAULT_ECHO_PORT, count=1,
+                       concurrency=10, echo_request='ping', protocol='tcp',
+                       timeout=ECHO_SEND_TIMEOUT, netns_name=None):
+    """
+    Send [count] echo requests (from the given network namespace), each
+    over its own connection (or UDP socket), keeping up to [concurrency]
+    of them in flight at once.  Each request is the echo_request with its
+    index appended, so replies can be checked against it, and gets up to
+    [timeout] seconds to be answered.
+    :type dest_ip: str
+    :type dest_port: int
+    :type count: int
+    :type concurrency: int
+    :type echo_request: str
+    :type protocol: str
+    :type timeout: float
+    :type netns_name: str
+    :return: EchoBatchResult
+    """
+    if netns_name is not None:
+        with netns.in_netns(netns_name):
+            return send_echo_requests(dest_ip, dest_port, count,
+                                      concurrency, echo_request, protocol,
+                                      timeout)
+    if protocol not in ('tcp', 'udp'):
+        raise exceptions.ArgMismatchException(
+            'Unsupported protocol: ' + str(protocol))
+
+    count = int(count)
+    dest = (dest_ip, int(dest_port))
+    result = EchoBatchResult(count)
+    epoll = select.epoll()
+    pending = {}
+    """ :type: dict[int, _PendingEcho]"""
+
+    def finish(fd, error=None):
+        echo = pending.pop(fd)
+        epoll.unregister(fd)
+        echo.sock.close()
+        if error is None and not echo.data:
+            error = 'no reply'
+        if error is not None:
+            result.errors[error] = result.errors.get(error, 0) + 1
+            return
+        pos = echo.data.find(TERMINATION_STRING)
+        reply = echo.data[0:pos] if pos != -1 else echo.data
+        if not reply.startswith(echo.request + ':'):
+            result.mismatches += 1
+            return
+        responder = reply[len(echo.request) + 1:]
+        result.replies[responder] = result.replies.get(responder, 0) + 1
+        result.latencies[echo.index] = time.time() - echo.start
+
+    def send(fd):
+        echo = pending[fd]
+        try:
+            if protocol == 'tcp':
+                echo.sock.sendall(echo.request + TERMINATION_STRING)
+            else:
+                echo.sock.sendto(echo.request + TERMINATION_STRING, dest)
+        except socket.error as e:
+            finish(fd, _error_name(e))
+            return
+        epoll.modify(fd, select.EPOLLIN)
+
+    def receive(fd):
+        echo = pending[fd]
+        try:
+            data = echo.sock.recv(ECHO_RECV_SIZE)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            finish(fd, _error_name(e))
+            return
+        echo.data += data
+        if not data or protocol == 'udp' or TERMINATION_STRING in data:
+            finish(fd)
+
+    start = time.time()
+    next_index = 0
+    try:
+        while next_index < count or pending:
+            while next_index < count and len(pending) < concurrency:
+                request = echo_request + '-' + str(next_index)
+                if protocol == 'tcp':
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                else:
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.setblocking(0)
+                fd = sock.fileno()
+                pending[fd] = _PendingEcho(next_index, request, sock,
+                                           time.time() + timeout)
+                next_index += 1
+                if protocol == 'udp':
+                    epoll.register(fd, select.EPOLLIN)
+                    send(fd)
+                    continue
+                epoll.register(fd, select.EPOLLOUT)
+                err = sock.connect_ex(dest)
+                if err not in (0, errno.EINPROGRESS):
+                    finish(fd, errno.errorcode.get(err, str(err)))
+
+            if not pending:
+                continue
+            wait = min(e.deadline for e in pending.itervalues())
+            try:
+                events = epoll.poll(max(0, wait - time.time()))
+            except IOError as e:
+                if e.errno != errno.EINTR:
+                    raise
+                continue
+            for fd, event in events:
+                if fd not in pending:
+                    continue
+                echo = pending[fd]
+                if protocol == 'tcp' and not echo.connected:
+                    err = echo.sock.getsockopt(socket.SOL_SOCKET,
+                                               socket.SO_ERROR)
+                    if err != 0:
+                        finish(fd, errno.errorcode.get(err, str(err)))
+                        continue
+                    echo.connected = True
+                    send(fd)
+                else:
+                    receive(fd)
+
+            now = time.time()
+            for fd in [fd for fd, e in pending.iteritems()
+                       if e.deadline <= now]:
+                pending.pop(fd).sock.close()
+                epoll.unregister(fd)
+                result.timeouts += 1
+    finally:
+        for echo in pending.itervalues():
+            echo.sock.close()
+        epoll.close()
+    result.duration = time.time() - start
+    return result
+
+
+def _latency_probe(sock, protocol, seq, keep_alive):
+    """
+    Send a probe stamped with its sequence number and send time, and
+    return its round-trip time, or None if the reply doesn't match it.
+    """
+    probe_id = 'latency-' + str(seq) + '-'
+    request = probe_id + repr(time.time())
+    if protocol == 'tcp':
+        sock.sendall(request + (KEEP_ALIVE_STRING if keep_alive else '') +
+                     TERMINATION_STRING)
+        data = ''
+        while TERMINATION_STRING not in data:
+            new_data = sock.recv(ECHO_RECV_SIZE)
+            if not new_data:
+                raise socket.error('no reply')
+            data += new_data
+    else:
+        sock.send(request + TERMINATION_STRING)
+        data = sock.recv(ECHO_RECV_SIZE)
+        # Skip late replies to earlier probes which timed out
+        while (data.startswith('latency-') and
+               not data.startswith(probe_id)):
+            data = sock.recv(ECHO_RECV_SIZE)
+    now = time.time()
+    reply = data[0:data.find(TERMINATION_STRING)]
+    if not reply.startswith(probe_id):
+        return None
+    try:
+        return now - float(reply.split(':')[0][len(probe_id):])
+    except ValueError:
+        return None
+
+
+def measure_latency(dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                    count=LATENCY_PROBE_COUNT, mode='persistent',
+                    protocol='tcp', interval=0, timeout=ECHO_SEND_TIMEOUT,
+                    netns_name=None):
+    """
+    Measure the latency to an echo server with [count] probes (from the
+    given network namespace), [interval] seconds apart, each stamped with
+    its send time.  In 'persistent' mode the probes are all sent over a
+    single TCP connection (or UDP socket), whose handshake (or first UDP
+    probe) is the new flow's setup latency and the rest steady-state
+    round trips.  In 'connect' mode each probe has a connection (or
+    socket) of its own, so every one of them sets up a new flow.  After
+    a failure, the next probe starts a new connection.
+    :type dest_ip: str
+    :type dest_port: int
+    :type count: int
+    :type mode: str
+    :type protocol: str
+    :type interval: float
+    :type timeout: float
+    :type netns_name: str
+    :return: LatencyReport
+    """
+    if netns_name is not None:
+        with netns.in_netns(netns_name):
+            return measure_latency(dest_ip, dest_port, count, mode,
+                                   protocol, interval, timeout)
+    if mode not in LATENCY_MODES:
+        raise exceptions.ArgMismatchException(
+            'Unsupported latency mode: ' + str(mode))
+    if protocol not in ('tcp', 'udp'):
+        raise exceptions.ArgMismatchException(
+            'Unsupported protocol: ' + str(protocol))
+
+    dest = (dest_ip, int(dest_port))
+    report = LatencyReport(mode, protocol)
+    keep_alive = mode == 'persistent'
+    sock = None
+    new_flow = False
+    try:
+        for seq in xrange(int(count)):
+            if seq and interval:
+                time.sleep(interval)
+            report.sent += 1
+            try:
+                if sock is None:
+                    if protocol == 'tcp':
+                        start = time.time()
+                        sock = socket.create_connection(dest, timeout)
+                        report.first_packet.record(time.time() - start)
+                    else:
+                        sock = socket.socket(socket.AF_INET,
+                                             socket.SOCK_DGRAM)
+                        sock.settimeout(timeout)
+                        sock.connect(dest)
+                        new_flow = True
+                rtt = _latency_probe(sock, protocol, seq, keep_alive)
+            except socket.error as e:
+                report.add_error(_error_name(e))
+                rtt = None
+            else:
+                if rtt is None:
+                    report.add_error('mismatch')
+                elif new_flow:
+                    report.first_packet.record(rtt)
+                else:
+                    report.steady.record(rtt)
+                new_flow = False
+            if rtt is None or not keep_alive:
+                if sock is not None:
+                    sock.close()
+                sock = None
+    finally:
+        if sock is not None:
+            sock.close()
+    return report
+
+
+class ThroughputReport(object):
+    def __init__(self, direction='upload'):
+        """
+        What a bulk transfer achieved: the bytes the receiver got, how
+        long it took from the first byte sent to the receiver having the
+        last, and the sender's TCP retransmissions (None if unknown).
+        :type direction: str
+        """
+        self.direction = direction
+        self.bytes = 0
+        self.duration = 0.0
+        self.retransmits = None
+        self.rtt = None
+
+    def goodput_bps(self):
+        """
+        :return: float
+        """
+        return self.bytes * 8 / self.duration if self.duration else 0.0
+
+    def to_dict(self):
+        return {'direction': self.direction, 'bytes': self.bytes,
+                'duration': self.duration, 'retransmits': self.retransmits,
+                'rtt': self.rtt, 'goodput_bps': self.goodput_bps()}
+
+    @staticmethod
+    def from_dict(report_map):
+        """
+        :type report_map: dict[str, any]
+        :return: ThroughputReport
+        """
+        report = ThroughputReport(str(report_map['direction']))
+        report.bytes = report_map['bytes']
+        report.duration = report_map['duration']
+        report.retransmits = report_map['retransmits']
+        report.rtt = report_map['rtt']
+        return report
+
+    def to_str(self):
+        return (self.direction + ': ' + str(self.bytes) + ' bytes in ' +
+                str(round(self.duration, 3)) + 's (' +
+                str(round(self.goodput_bps() / 1000000, 3)) +
+                ' Mbit/s), retransmits: ' + str(self.retransmits))
+
+
+def _read_bulk_stats(sock, data=''):
+    while TERMINATION_STRING not in data:
+        new_data = sock.recv(ECHO_RECV_SIZE)
+        if not new_data:
+            raise socket.error('connection closed before bulk stats')
+        data += new_data
+    count, retransmits = data[0:data.find(TERMINATION_STRING)].split()
+    return int(count), int(retransmits)
+
+
+def measure_throughput(dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                       direction='upload', size=None, duration=None,
+                       timeout=ECHO_SEND_TIMEOUT, netns_name=None):
+    """
+    Stream [size] bytes, or stream for [duration] seconds, over a TCP
+    connection to an echo server (from the given network namespace),
+    either to it ('upload') or from it ('download'), and report the
+    goodput and the sender's retransmissions.  Raises socket.error if the
+    transfer fails.
+    :type dest_ip: str
+    :type dest_port: int
+    :type direction: str
+    :type size: int
+    :type duration: float
+    :type timeout: float
+    :type netns_name: str
+    :return: ThroughputReport
+    """
+    if netns_name is not None:
+        with netns.in_netns(netns_name):
+            return measure_throughput(dest_ip, dest_port, direction, size,
+                                      duration, timeout)
+    if direction not in THROUGHPUT_DIRECTIONS:
+        raise exceptions.ArgMismatchException(
+            'Unsupported direction: ' + str(direction))
+    if not size and not duration:
+        raise exceptions.ArgMismatchException(
+            'Either a size or a duration is needed for a bulk transfer')
+    size = int(size) if size else 0
+    duration = float(duration) if duration else 0.0
+
+    report = ThroughputReport(direction)
+    sock = socket.create_connection((dest_ip, int(dest_port)), timeout)
+    try:
+        sock.sendall(BULK_REQUEST + direction + ' ' + str(size) + ' ' +
+                     repr(duration) + TERMINATION_STRING)
+        start = time.time()
+        if direction == 'upload':
+            sent = 0
+            while ((size and sent < size) or
+                   (duration and time.time() - start < duration)):
+                chunk = BULK_DATA[:size - sent] if size else BULK_DATA
+                sock.sendall(chunk)
+                sent += len(chunk)
+            sock.sendall(TERMINATION_STRING)
+            report.bytes, _ = _read_bulk_stats(sock)
+            report.duration = time.time() - start
+            info = tcp_info(sock)
+        else:
+            # Everything up to the termination string is data
+            received = 0
+            tail = ''
+            while True:
+                data = sock.recv(BULK_CHUNK_SIZE)
+                if not data:
+                    raise socket.error('connection closed during transfer')
+                pos = (tail + data).find(TERMINATION_STRING)
+                if pos != -1:
+                    break
+                received += len(data)
+                tail = data[-1:]
+            report.duration = time.time() - start
+            report.bytes = received - len(tail) + pos
+            rest = (tail + data)[pos + len(TERMINATION_STRING):]
+            _, retransmits = _read_bulk_stats(sock, rest)
+            report.retransmits = retransmits if retransmits >= 0 else None
+            info = None
+        if info is not None:
+            report.retransmits = info['retransmits']
+            report.rtt = info['rtt']
+    finally:
+        sock.close()
+    return report
+
+
+class NetNSAgent(EchoService):
+    def __init__(self, netns_name=None, control_path=None, logger=None):
+        """
+        An echo service which also sends echo requests, pings and probes
+        on behalf of its clients (see NetNSAgentClient), so that tests
+        can do these from a VM's namespace with a control message rather
+        than a process each.  Those commands run on worker threads, so
+        the agent keeps answering echo requests (its own included)
+        meanwhile.
+        :type netns_name: str
+        :type control_path: str
+        :type logger: logging.Logger
+        """
+        super(NetNSAgent, self).__init__(netns_name=netns_name,
+                                         control_path=control_path,
+                                         logger=logger)
+        self.blocking_commands.update({'echo': self.send_echo_request,
+                                       'echo_batch': self.send_echo_requests,
+                                       'latency': self.measure_latency,
+                                       'throughput': self.measure_throughput,
+                                       'ping': self.ping,
+                                       'probe': self.probe})
+
+    def send_echo_request(self, dest_ip='localhost',
+                          dest_port=DEFAULT_ECHO_PORT, echo_request='ping',
+                          protocol='tcp', timeout=ECHO_SEND_TIMEOUT):
+        return EchoServer.send(dest_ip, dest_port, echo_request, protocol,
+                               timeout, netns_name=self.netns_name)
+
+    def send_echo_requests(self, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                           count=1, concurrency=10, echo_request='ping',
+                           protocol='tcp', timeout=ECHO_SEND_TIMEOUT):
+        return send_echo_requests(
+            dest_ip, dest_port, count, concurrency, echo_request, protocol,
+            timeout, netns_name=self.netns_name).to_dict()
+
+    def measure_latency(self, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                        count=LATENCY_PROBE_COUNT, mode='persistent',
+                        protocol='tcp', interval=0,
+                        timeout=ECHO_SEND_TIMEOUT):
+        return measure_latency(
+            dest_ip, dest_port, count, mode, protocol, interval, timeout,
+            netns_name=self.netns_name).to_dict()
+
+    def measure_throughput(self, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                           direction='upload', size=None, duration=None,
+                           timeout=ECHO_SEND_TIMEOUT):
+        return measure_throughput(
+            dest_ip, dest_port, direction, size, duration, timeout,
+            netns_name=self.netns_name).to_dict()
+
+    def ping(self, target_ip, iface=None, count=1, timeout=None):
+        return ping(target_ip, iface, count, timeout,
+                    netns_name=self.netns_name)
+
+    def probe(self, dest_ip, dest_port, protocol='tcp', payload=None,
+              timeout=PROBE_TIMEOUT):
+        return probe(dest_ip, dest_port, protocol, payload, timeout,
+                     netns_name=self.netns_name)
+
+
+class NetNSAgentClient(EchoServiceClient):
+    """
+    Sends echo requests, pings and probes through a NetNSAgent (e.g. one
+    run by echo-server.py in a VM), besides managing its listeners.
+    """
+    def send_echo_request(self, dest_ip='localhost',
+                          dest_port=DEFAULT_ECHO_PORT, echo_request='ping',
+                          protocol='tcp', timeout=ECHO_SEND_TIMEOUT):
+        """
+        :return: str The reply, without its termination string
+        """
+        return str(self.request('echo', wait=timeout + AGENT_REPLY_MARGIN,
+                                dest_ip=dest_ip, dest_port=dest_port,
+                                echo_request=echo_request,
+                                protocol=protocol, timeout=timeout))
+
+    def send_echo_requests(self, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                           count=1, concurrency=10, echo_request='ping',
+                           protocol='tcp', timeout=ECHO_SEND_TIMEOUT):
+        """
+        :return: EchoBatchResult
+        """
+        rounds = -(-int(count) // max(int(concurrency), 1))
+        return EchoBatchResult.from_dict(self.request(
+            'echo_batch', wait=rounds * timeout + AGENT_REPLY_MARGIN,
+            dest_ip=dest_ip, dest_port=dest_port, count=count,
+            concurrency=concurrency, echo_request=echo_request,
+            protocol=protocol, timeout=timeout))
+
+    def measure_latency(self, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                        count=LATENCY_PROBE_COUNT, mode='persistent',
+                        protocol='tcp', interval=0,
+                        timeout=ECHO_SEND_TIMEOUT):
+        """
+        :return: zephyr.common.latency.LatencyReport
+        """
+        wait = int(count) * (timeout + interval)
+        return LatencyReport.from_dict(self.request(
+            'latency', wait=wait + AGENT_REPLY_MARGIN, dest_ip=dest_ip,
+            dest_port=dest_port, count=count, mode=mode,
+            protocol=protocol, interval=interval, timeout=timeout))
+
+    def measure_throughput(self, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                           direction='upload', size=None, duration=None,
+                           timeout=ECHO_SEND_TIMEOUT, wait=None):
+        """
+        :param wait: How long to wait for the transfer (by default, the
+        duration or, for a given size, THROUGHPUT_WAIT, plus the timeout)
+        :return: ThroughputReport
+        """
+        if wait is None:
+            wait = (duration if duration else THROUGHPUT_WAIT) + timeout
+        return ThroughputReport.from_dict(self.request(
+            'throughput', wait=wait + AGENT_REPLY_MARGIN, dest_ip=dest_ip,
+            dest_port=dest_port, direction=direction, size=size,
+            duration=duration, timeout=timeout))
+
+    def ping(self, target_ip, iface=None, count=1, timeout=None):
+        """
+        :return: dict[str, any] See netns_agent.ping
+        """
+        wait = count * (timeout if timeout is not None else PING_TIMEOUT)
+        return self.request('ping', wait=wait + AGENT_REPLY_MARGIN,
+                            target_ip=target_ip, iface=iface, count=count,
+                            timeout=timeout)
+
+    def probe(self, dest_ip, dest_port, protocol='tcp', payload=None,
+              timeout=PROBE_TIMEOUT):
+        """
+        :return: dict[str, any] See netns_agent.probe
+        """
+        return self.request('probe', wait=timeout + AGENT_REPLY_MARGIN,
+                            dest_ip=dest_ip, dest_port=dest_port,
+                            protocol=protocol, payload=payload,
+                            timeout=timeout)
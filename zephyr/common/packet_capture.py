@@ -0,0 +1,316 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import errno
+import mmap
+import os
+import select
+import socket
+import struct
+import time
+
+from zephyr.common.exceptions import *
+from zephyr.common import netns
+
+ETH_P_ALL = 0x0003
+
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+
+SO_ATTACH_FILTER = 26
+
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+
+PACKET_OUTGOING = 4
+ARPHRD_LOOPBACK = 772
+
+# The RX ring is made of fixed-size blocks which hold a variable number
+# of frames.  The kernel hands a block over once it is full or once the
+# retire timeout passes, which bounds the capture latency.
+RING_BLOCK_SIZE = 1 << 20
+RING_BLOCK_COUNT = 8
+RING_FRAME_SIZE = 1 << 11
+RING_BLOCK_TIMEOUT_MS = 10
+
+DEFAULT_SNAPLEN = 262144
+
+SOCK_FILTER = struct.Struct('HBBI')
+SOCK_FPROG = struct.Struct('HL')
+TPACKET_REQ3 = struct.Struct('IIIIIII')
+TPACKET_STATS = struct.Struct('II')
+TPACKET_STATS_V3 = struct.Struct('III')
+
+# struct tpacket_block_desc (offset_to_first_pkt comes from the nested
+# tpacket_hdr_v1)
+BLOCK_DESC = struct.Struct('IIIII')
+BLOCK_STATUS_OFFSET = 8
+
+# struct tpacket3_hdr, followed by a struct sockaddr_ll
+TPACKET3_HDR = struct.Struct('IIIIIIHH')
+TPACKET3_HDR_LEN = 48
+SOCKADDR_LL = struct.Struct('HHiHB')
+
+# A filter which drops everything, used while the socket is set up
+REJECT_ALL_PROGRAM = [(0x06, 0, 0, 0)]
+
+
+def native_capture_available(netns_name=None):
+    """
+    Returns True if packets can be captured from this process directly
+    through an AF_PACKET socket (which needs CAP_NET_RAW, plus setns()
+    if the capture is in another namespace).
+    :type netns_name: str
+    :return: bool
+    """
+    if not hasattr(socket, 'AF_PACKET') or os.geteuid() != 0:
+        return False
+    if netns_name is not None:
+        return (os.path.exists(netns.NETNS_RUN_DIR + '/' + netns_name) and
+                netns.setns_available(netns_name))
+    return True
+
+
+def attach_filter(sock, program):
+    """
+    Attach a classic BPF program to a socket.
+    :type sock: socket.socket
+    :type program: list[(int, int, int, int)]
+    """
+    insns = ctypes.create_string_buffer(
+        ''.join(SOCK_FILTER.pack(*i) for i in program))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER,
+                    SOCK_FPROG.pack(len(program), ctypes.addressof(insns)))
+
+
+def format_timestamp(sec, usec):
+    """
+    Formats a capture timestamp the same way tcpdump prints it.
+    :type sec: int
+    :type usec: int
+    :return: str
+    """
+    return time.strftime('%H:%M:%S', time.localtime(sec)) + \
+        '.{0:06d}'.format(usec)
+
+
+class PacketSocket(object):
+    def __init__(self, interface='any', netns_name=None, bpf_program=None,
+                 snaplen=DEFAULT_SNAPLEN, use_ring=True):
+        """
+        Captures frames on an interface (or all interfaces, for 'any')
+        through an AF_PACKET socket created in the given network namespace.
+        The BPF program is attached in the kernel, and frames are read out
+        of a memory-mapped TPACKET_V3 ring if the kernel supports it, or
+        with recvfrom() otherwise.  Outgoing copies on loopback devices
+        are skipped (as libpcap does) so each frame is seen once.
+        :type interface: str
+        :type netns_name: str
+        :type bpf_program: list[(int, int, int, int)]
+        :type snaplen: int
+        :type use_ring: bool
+        """
+        self.interface = interface
+        self.netns_name = netns_name
+        self.bpf_program = bpf_program
+        self.snaplen = snaplen
+        self.use_ring = use_ring
+        self.sock = None
+        """ :type: socket.socket"""
+        self.ring = None
+        """ :type: mmap.mmap"""
+        self.next_block = 0
+        self.poller = None
+        self.wake_pipe = None
+
+    def open(self):
+        """
+        Open the socket, and return once it is bound and filtering.
+        :return: PacketSocket
+        """
+        try:
+            if self.netns_name is not None:
+                with netns.in_netns(self.netns_name):
+                    self._open()
+            else:
+                self._open()
+        except (socket.error, EnvironmentError) as e:
+            self.close()
+            raise SocketException(
+                'Failed to open packet socket on ' +
+                (self.netns_name + '/' if self.netns_name else '') +
+                self.interface + ': ' + str(e))
+
+        self.wake_pipe = os.pipe()
+        self.poller = select.poll()
+        self.poller.register(self.sock.fileno(), select.POLLIN)
+        self.poller.register(self.wake_pipe[0], select.POLLIN)
+        return self
+
+    def _open(self):
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+                                  socket.htons(ETH_P_ALL))
+
+        # Drop anything which arrived before the real filter is in place
+        attach_filter(self.sock, REJECT_ALL_PROGRAM)
+        self.sock.setblocking(False)
+        try:
+            while True:
+                self.sock.recv(1)
+        except socket.error as e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+        if self.interface != 'any':
+            self.sock.bind((self.interface, ETH_P_ALL))
+
+        if self.use_ring:
+            try:
+                self._setup_ring()
+            except (socket.error, EnvironmentError):
+                self.ring = None
+
+        attach_filter(self.sock,
+                      self.bpf_program if self.bpf_program is not None
+                      else [(0x06, 0, 0, self.snaplen)])
+
+    def _setup_ring(self):
+        self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        self.sock.setsockopt(
+            SOL_PACKET, PACKET_RX_RING,
+            TPACKET_REQ3.pack(RING_BLOCK_SIZE, RING_BLOCK_COUNT,
+                              RING_FRAME_SIZE,
+                              (RING_BLOCK_SIZE // RING_FRAME_SIZE) *
+                              RING_BLOCK_COUNT,
+                              RING_BLOCK_TIMEOUT_MS, 0, 0))
+        self.ring = mmap.mmap(self.sock.fileno(),
+                              RING_BLOCK_SIZE * RING_BLOCK_COUNT,
+                              mmap.MAP_SHARED,
+                              mmap.PROT_READ | mmap.PROT_WRITE)
+        self.next_block = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def wakeup(self):
+        """
+        Wake up a thread blocked in read().
+        """
+        if self.wake_pipe is not None:
+            os.write(self.wake_pipe[1], 'x')
+
+    def read(self, timeout=None):
+        """
+        Wait up to timeout seconds (forever if None) for frames, and
+        return the ones available as a list of (frame data, timestamp
+        seconds, timestamp microseconds).  Returns an empty list if
+        woken up or timed out.
+        :type timeout: float
+        :return: list[(str, int, int)]
+        """
+        frames = self.read_available()
+        if frames:
+            return frames
+
+        try:
+            events = self.poller.poll(
+                None if timeout is None else int(timeout * 1000))
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return []
+
+        for fd, _ in events:
+            if fd == self.wake_pipe[0]:
+                os.read(self.wake_pipe[0], 4096)
+        return self.read_available()
+
+    def read_available(self):
+        """
+        Returns the frames which are available without waiting.
+        :return: list[(str, int, int)]
+        """
+        if self.ring is not None:
+            return self._read_ring()
+        return self._read_socket()
+
+    def _read_ring(self):
+        frames = []
+        while True:
+            block_offset = self.next_block * RING_BLOCK_SIZE
+            _, _, status, num_pkts, first_offset = BLOCK_DESC.unpack_from(
+                self.ring, block_offset)
+            if not status & TP_STATUS_USER:
+                return frames
+
+            pkt_offset = block_offset + first_offset
+            for _ in xrange(num_pkts):
+                (next_offset, sec, nsec, snaplen, _, _,
+                 mac, _) = TPACKET3_HDR.unpack_from(self.ring, pkt_offset)
+                _, _, _, hatype, pkttype = SOCKADDR_LL.unpack_from(
+                    self.ring, pkt_offset + TPACKET3_HDR_LEN)
+                if not (pkttype == PACKET_OUTGOING and
+                        hatype == ARPHRD_LOOPBACK):
+                    frames.append((self.ring[pkt_offset + mac:
+                                             pkt_offset + mac + snaplen],
+                                   sec, nsec // 1000))
+                pkt_offset += next_offset
+
+            # Hand the block back to the kernel
+            struct.pack_into('I', self.ring,
+                             block_offset + BLOCK_STATUS_OFFSET,
+                             TP_STATUS_KERNEL)
+            self.next_block = (self.next_block + 1) % RING_BLOCK_COUNT
+
+    def _read_socket(self):
+        frames = []
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(self.snaplen)
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return frames
+                raise
+            if addr[2] == PACKET_OUTGOING and addr[3] == ARPHRD_LOOPBACK:
+                continue
+            now = time.time()
+            frames.append((data, int(now), int((now % 1) * 1000000)))
+
+    def stats(self):
+        """
+        Returns the number of frames the kernel has accepted and dropped
+        (for lack of ring or buffer space) since the last call.
+        :return: (int, int)
+        """
+        # Without the ring this is the (shorter) struct tpacket_stats
+        return TPACKET_STATS.unpack_from(
+            self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS,
+                                 TPACKET_STATS_V3.size))
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.wake_pipe is not None:
+            os.close(self.wake_pipe[0])
+            os.close(self.wake_pipe[1])
+            self.wake_pipe = None
+        self.poller = None
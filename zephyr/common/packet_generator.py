@@ -0,0 +1,413 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fcntl
+import random
+import socket
+import struct
+import time
+
+from zephyr.common.exceptions import *
+from zephyr.common import netns
+from zephyr.common.pcap_packet import *
+
+MAC_BROADCAST = 'ff:ff:ff:ff:ff:ff'
+MAC_ZERO = '00:00:00:00:00:00'
+
+SIOCGIFADDR = 0x8915
+SIOCGIFHWADDR = 0x8927
+IFREQ = struct.Struct('16s16x')
+
+ARP_HEADER_SEND = struct.Struct('!HHBBH6s4s6s4s')
+IP4_HEADER_SEND = struct.Struct('!BBHHHBBH4s4s')
+TCP_HEADER_SEND = struct.Struct('!HHIIBBHHH')
+ICMP_ECHO_HEADER = struct.Struct('!BBHHH')
+PSEUDO_HEADER = struct.Struct('!4s4sBBH')
+UDP_HEADER_SEND = struct.Struct('!HHHH')
+
+# TCP flags by the names mz uses for them
+TCP_FLAGS = {'fin': TCP_PROTOCOL_FLAG_FINAL,
+             'syn': TCP_PROTOCOL_FLAG_SYN,
+             'rst': TCP_PROTOCOL_FLAG_RESET,
+             'psh': TCP_PROTOCOL_FLAG_PUSH,
+             'ack': TCP_PROTOCOL_FLAG_ACK,
+             'urg': TCP_PROTOCOL_FLAG_URGENT,
+             'ece': TCP_PROTOCOL_FLAG_ECE,
+             'cwr': TCP_PROTOCOL_FLAG_CWS}
+
+
+def mac_to_bytes(mac):
+    """
+    Converts a MAC address to its 6 raw bytes.  As with mz, 'bc' or
+    'bcast' mean the broadcast address and 'rand' a random unicast one.
+    :type mac: str
+    :return: str
+    """
+    if mac in ('bc', 'bcast'):
+        mac = MAC_BROADCAST
+    if mac == 'rand':
+        octets = [random.randint(0, 255) for _ in range(6)]
+        # Locally administered and unicast
+        octets[0] = (octets[0] | 0x02) & 0xfe
+        return bytes(bytearray(octets))
+    try:
+        octets = [int(o, 16) for o in mac.replace('-', ':').split(':')]
+        raw = bytes(bytearray(octets))
+    except (ValueError, AttributeError):
+        raw = ''
+    if len(raw) != 6:
+        raise ArgMismatchException('Invalid MAC address: ' + str(mac))
+    return raw
+
+
+def ip_to_bytes(ip):
+    """
+    :type ip: str
+    :return: str
+    """
+    try:
+        return socket.inet_pton(socket.AF_INET, ip)
+    except (socket.error, TypeError):
+        raise ArgMismatchException('Invalid IPv4 address: ' + str(ip))
+
+
+def checksum(data):
+    """
+    The 16-bit one's complement checksum used by IP, ICMP, TCP and UDP.
+    :type data: str
+    :return: int
+    """
+    if len(data) % 2:
+        data += '\0'
+    total = sum(struct.unpack('!' + str(len(data) // 2) + 'H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+class GenLayer(object):
+    """
+    A header to build, mirroring the layer of the same name in
+    pcap_packet.  Fields left as None are filled in from the layers
+    around it when the packet is built (see build_packet).
+    """
+    def serialize(self, payload, outer=None, inner=None):
+        """
+        Returns the header followed by the payload (everything inside
+        it).
+        :type payload: str
+        :type outer: GenLayer
+        :type inner: GenLayer
+        :return: str
+        """
+        raise ArgMismatchException(
+            'All layers should override the "serialize" method!')
+
+
+class GenEthernet(GenLayer):
+    def __init__(self, dest_mac=MAC_BROADCAST, source_mac=MAC_ZERO,
+                 type=None):
+        """
+        :type dest_mac: str
+        :type source_mac: str
+        :type type: int
+        """
+        self.dest_mac = dest_mac
+        self.source_mac = source_mac
+        self.type = type
+
+    def serialize(self, payload, outer=None, inner=None):
+        ether_type = self.type
+        if ether_type is None:
+            if isinstance(inner, GenIP4):
+                ether_type = ETHERNET_PROTOCOL_TYPE_IP4
+            elif isinstance(inner, GenARP):
+                ether_type = ETHERNET_PROTOCOL_TYPE_ARP
+            else:
+                raise ArgMismatchException(
+                    'Ethernet type must be set for a raw payload')
+        return (mac_to_bytes(self.dest_mac) + mac_to_bytes(self.source_mac) +
+                struct.pack('!H', ether_type) + payload)
+
+
+class GenARP(GenLayer):
+    def __init__(self, operation=ARP_PROTOCOL_OPERATION_REQUEST,
+                 sender_mac=MAC_ZERO, sender_ip='0.0.0.0',
+                 target_mac=MAC_ZERO, target_ip='0.0.0.0'):
+        """
+        An Ethernet/IPv4 ARP request or reply.
+        :type operation: int
+        :type sender_mac: str
+        :type sender_ip: str
+        :type target_mac: str
+        :type target_ip: str
+        """
+        self.operation = operation
+        self.sender_mac = sender_mac
+        self.sender_ip = sender_ip
+        self.target_mac = target_mac
+        self.target_ip = target_ip
+
+    def serialize(self, payload, outer=None, inner=None):
+        return ARP_HEADER_SEND.pack(
+            ARP_PROTOCOL_HW_TYPE_EHTERNET, ETHERNET_PROTOCOL_TYPE_IP4, 6, 4,
+            self.operation, mac_to_bytes(self.sender_mac),
+            ip_to_bytes(self.sender_ip), mac_to_bytes(self.target_mac),
+            ip_to_bytes(self.target_ip)) + payload
+
+
+class GenIP4(GenLayer):
+    def __init__(self, source_ip='0.0.0.0', dest_ip='0.0.0.0',
+                 protocol=None, ttl=64, tos=0, id=0, flags=0,
+                 total_length=None):
+        """
+        An IPv4 header without options.  The total length and checksum
+        are calculated unless given.
+        :type source_ip: str
+        :type dest_ip: str
+        :type protocol: int
+        :type ttl: int
+        :type tos: int
+        :type id: int
+        :type flags: int
+        :type total_length: int
+        """
+        self.source_ip = source_ip
+        self.dest_ip = dest_ip
+        self.protocol = protocol
+        self.ttl = ttl
+        self.tos = tos
+        self.id = id
+        self.flags = flags
+        self.total_length = total_length
+
+    def serialize(self, payload, outer=None, inner=None):
+        protocol = self.protocol
+        if protocol is None:
+            protocol = {GenTCP: IP4_PROTOCOL_TCP,
+                        GenUDP: IP4_PROTOCOL_UDP,
+                        GenICMP: IP4_PROTOCOL_ICMP}.get(type(inner), 0)
+        total_length = (self.total_length if self.total_length is not None
+                        else IP4_HEADER_SEND.size + len(payload))
+        header = [0x45, self.tos, total_length, self.id, self.flags << 13,
+                  self.ttl, protocol, 0, ip_to_bytes(self.source_ip),
+                  ip_to_bytes(self.dest_ip)]
+        header[7] = checksum(IP4_HEADER_SEND.pack(*header))
+        return IP4_HEADER_SEND.pack(*header) + payload
+
+
+def _transport_checksum(outer, protocol, segment):
+    if not isinstance(outer, GenIP4):
+        return 0
+    return checksum(PSEUDO_HEADER.pack(ip_to_bytes(outer.source_ip),
+                                       ip_to_bytes(outer.dest_ip), 0,
+                                       protocol, len(segment)) + segment)
+
+
+class GenTCP(GenLayer):
+    def __init__(self, source_port=0, dest_port=0, seq=0, ack=0,
+                 flags=TCP_PROTOCOL_FLAG_SYN, window_size=65535):
+        """
+        A TCP header without options.  The checksum is calculated when
+        the segment is inside a GenIP4 layer.
+        :type source_port: int
+        :type dest_port: int
+        :type seq: int
+        :type ack: int
+        :type flags: int
+        :type window_size: int
+        """
+        self.source_port = source_port
+        self.dest_port = dest_port
+        self.seq = seq
+        self.ack = ack
+        self.flags = flags
+        self.window_size = window_size
+
+    def serialize(self, payload, outer=None, inner=None):
+        header = [self.source_port, self.dest_port, self.seq, self.ack,
+                  (5 << 4) | ((self.flags >> 8) & 0x1), self.flags & 0xff,
+                  self.window_size, 0, 0]
+        header[7] = _transport_checksum(
+            outer, IP4_PROTOCOL_TCP, TCP_HEADER_SEND.pack(*header) + payload)
+        return TCP_HEADER_SEND.pack(*header) + payload
+
+
+class GenUDP(GenLayer):
+    def __init__(self, source_port=0, dest_port=0):
+        """
+        A UDP header.  The checksum is calculated when the datagram is
+        inside a GenIP4 layer.
+        :type source_port: int
+        :type dest_port: int
+        """
+        self.source_port = source_port
+        self.dest_port = dest_port
+
+    def serialize(self, payload, outer=None, inner=None):
+        header = [self.source_port, self.dest_port,
+                  UDP_HEADER_SEND.size + len(payload), 0]
+        header[3] = _transport_checksum(
+            outer, IP4_PROTOCOL_UDP, UDP_HEADER_SEND.pack(*header) + payload)
+        # A zero checksum would mean 'no checksum'
+        if header[3] == 0 and isinstance(outer, GenIP4):
+            header[3] = 0xffff
+        return UDP_HEADER_SEND.pack(*header) + payload
+
+
+class GenICMP(GenLayer):
+    def __init__(self, type=ICMP_PROTOCOL_TYPE_ECHO_REQUEST, code=0,
+                 id=0, seq=0):
+        """
+        An ICMP header, with the identifier and sequence number of an
+        echo request or reply as the rest of the header.
+        :type type: int
+        :type code: int
+        :type id: int
+        :type seq: int
+        """
+        self.type = type
+        self.code = code
+        self.id = id
+        self.seq = seq
+
+    def serialize(self, payload, outer=None, inner=None):
+        sum16 = checksum(ICMP_ECHO_HEADER.pack(self.type, self.code, 0,
+                                               self.id, self.seq) + payload)
+        return ICMP_ECHO_HEADER.pack(self.type, self.code, sum16, self.id,
+                                     self.seq) + payload
+
+
+def build_packet(layers, payload=''):
+    """
+    Serializes a stack of layers (outermost first) and the payload into
+    the bytes to send, filling in types, lengths and checksums.
+    :type layers: list[GenLayer]
+    :type payload: str
+    :return: str
+    """
+    data = payload
+    for i in xrange(len(layers) - 1, -1, -1):
+        data = layers[i].serialize(
+            data, outer=layers[i - 1] if i > 0 else None,
+            inner=layers[i + 1] if i + 1 < len(layers) else None)
+    return data
+
+
+class PacketSender(object):
+    def __init__(self, interface, netns_name=None, link_layer=True):
+        """
+        Sends packets out of an interface in the given network namespace
+        from this process, without running a tool for each send.  With
+        link_layer set, whole Ethernet frames are sent through an
+        AF_PACKET socket; otherwise IPv4 packets are sent through a raw IP
+        socket bound to the interface, so the kernel routes them and
+        resolves the next hop's MAC address.
+        :type interface: str
+        :type netns_name: str
+        :type link_layer: bool
+        """
+        self.interface = interface
+        self.netns_name = netns_name
+        self.link_layer = link_layer
+        self.sock = None
+        """ :type: socket.socket"""
+        self.mac = None
+        """ :type: str"""
+        self.ip = None
+        """ :type: str"""
+
+    def open(self):
+        """
+        Open the socket and look up the interface's MAC and IPv4
+        addresses (the defaults for the packets' source addresses).
+        :return: PacketSender
+        """
+        try:
+            if self.netns_name is not None:
+                with netns.in_netns(self.netns_name):
+                    self._open()
+            else:
+                self._open()
+        except (socket.error, EnvironmentError) as e:
+            self.close()
+            raise SocketException(
+                'Failed to open packet sender on ' +
+                (self.netns_name + '/' if self.netns_name else '') +
+                self.interface + ': ' + str(e))
+        return self
+
+    def _open(self):
+        ifreq = IFREQ.pack(self.interface)
+        query = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.mac = PCAPPacket.bytes_to_mac_address(
+                fcntl.ioctl(query.fileno(), SIOCGIFHWADDR, ifreq)[18:24])
+            try:
+                self.ip = socket.inet_ntoa(
+                    fcntl.ioctl(query.fileno(), SIOCGIFADDR, ifreq)[20:24])
+            except IOError:
+                # No IPv4 address on the interface
+                self.ip = None
+        finally:
+            query.close()
+
+        if self.link_layer:
+            self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+            self.sock.bind((self.interface, 0))
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_RAW,
+                                      socket.IPPROTO_RAW)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE,
+                                 self.interface)
+
+    def send(self, packet, count=1, interval=0):
+        """
+        Send the packet count times, interval seconds apart.
+        :type packet: str
+        :type count: int
+        :type interval: float
+        """
+        if self.link_layer:
+            address = None
+        else:
+            address = (socket.inet_ntoa(packet[16:20]), 0)
+
+        next_send = time.time()
+        for i in xrange(count):
+            if interval > 0 and i > 0:
+                next_send += interval
+                delay = next_send - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            try:
+                if address is None:
+                    self.sock.send(packet)
+                else:
+                    self.sock.sendto(packet, address)
+            except socket.error as e:
+                raise SocketException(
+                    'Failed to send packet on ' + self.interface + ': ' +
+                    str(e))
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -191,6 +191,7 @@ class Host(_PrimitiveTypeRule):
         :param dest: bool
         """
         super(Host, self).__init__('host ' + host, proto, source, dest)
+        self.host = host
 
 
 class PortRange(_PrimitiveTypeRule):
@@ -206,6 +207,8 @@ class PortRange(_PrimitiveTypeRule):
         super(PortRange, self).__init__('portrange ' + str(start_port) +
                                         '-' + str(end_port),
                                         proto, source, dest)
+        self.start_port = start_port
+        self.end_port = end_port
 
 
 class Port(_PrimitiveTypeRule):
@@ -218,6 +221,7 @@ class Port(_PrimitiveTypeRule):
         """
         super(Port, self).__init__('port ' + str(port), proto,
                                    source, dest)
+        self.port = port
 
 
 class Net(_PrimitiveTypeRule):
@@ -231,6 +235,8 @@ class Net(_PrimitiveTypeRule):
         super(Net, self).__init__(
             'net ' + net + (' mask ' + mask if mask != '' else ''),
             proto, source, dest)
+        self.net = net
+        self.mask = mask
 
 
 class _PrimitiveProtoRule(Rule):
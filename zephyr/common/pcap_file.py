@@ -0,0 +1,339 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import mmap
+import os
+import struct
+
+from zephyr.common import bpf
+from zephyr.common.exceptions import *
+from zephyr.common.packet_capture import DEFAULT_SNAPLEN
+from zephyr.common.packet_capture import format_timestamp
+from zephyr.common.pcap_packet import *
+
+PCAP_MAGIC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+PCAP_VERSION_MAJOR = 2
+PCAP_VERSION_MINOR = 4
+
+PCAPNG_BLOCK_SHB = 0x0a0d0d0a
+PCAPNG_BLOCK_IDB = 0x00000001
+PCAPNG_BLOCK_SPB = 0x00000003
+PCAPNG_BLOCK_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+PCAPNG_OPT_END = 0
+PCAPNG_OPT_IF_TSRESOL = 9
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_LINUX_SLL = 113
+
+LINK_LAYERS = {LINKTYPE_ETHERNET: PCAPEthernet,
+               LINKTYPE_LINUX_SLL: PCAPSLL}
+
+# struct pcap_file_header and struct pcap_sf_pkthdr, without the byte
+# order (which is whatever the writer's was)
+PCAP_FILE_HEADER = 'IHHiIII'
+PCAP_RECORD_HEADER = 'IIII'
+PCAP_FILE_HEADER_LEN = 24
+PCAP_RECORD_HEADER_LEN = 16
+
+STREAM_READ_SIZE = 1 << 16
+
+
+def _pcap_byte_order(data):
+    """
+    Returns the byte order ('<' or '>') and whether timestamps have
+    nanosecond resolution for a libpcap file header, or None if it isn't
+    one.
+    :type data: str | mmap.mmap
+    :return: (str, bool)
+    """
+    for byte_order in ('<', '>'):
+        magic = struct.unpack_from(byte_order + 'I', data)[0]
+        if magic == PCAP_MAGIC:
+            return byte_order, False
+        if magic == PCAP_MAGIC_NSEC:
+            return byte_order, True
+    return None
+
+
+class PCAPFileWriter(object):
+    def __init__(self, filename, snaplen=DEFAULT_SNAPLEN,
+                 linktype=LINKTYPE_ETHERNET):
+        """
+        Writes frames to a standard libpcap file (as 'tcpdump -w' does),
+        which tcpdump, wireshark or PCAPFileReader can read back.
+        :type filename: str
+        :type snaplen: int
+        :type linktype: int
+        """
+        self.filename = filename
+        self.snaplen = snaplen
+        self.linktype = linktype
+        self.file = None
+        self.record_header = struct.Struct('=' + PCAP_RECORD_HEADER)
+
+    def open(self):
+        """
+        :return: PCAPFileWriter
+        """
+        self.file = open(self.filename, 'wb')
+        self.file.write(struct.pack('=' + PCAP_FILE_HEADER, PCAP_MAGIC,
+                                    PCAP_VERSION_MAJOR, PCAP_VERSION_MINOR,
+                                    0, 0, self.snaplen, self.linktype))
+        return self
+
+    def write_packet(self, data, sec, usec, orig_len=None):
+        """
+        :type data: str
+        :type sec: int
+        :type usec: int
+        :type orig_len: int
+        """
+        self.file.write(self.record_header.pack(
+            sec, usec, len(data),
+            orig_len if orig_len is not None else len(data)))
+        self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PCAPFileReader(object):
+    def __init__(self, filename, pcap_filter=None):
+        """
+        Streams the packets in a libpcap or pcapng file as PCAPPackets.
+        The file is mmap-ed and each packet is only copied out (and
+        parsed, lazily) when it is reached, so the file can be much larger
+        than memory.  If a pcap filter Rule is given, it is compiled once
+        to a Python predicate and only the matching packets are returned.
+        :type filename: str
+        :type pcap_filter: pcap.Rule
+        """
+        self.filename = filename
+        self.pcap_filter = pcap_filter
+        self.matches_frame = (bpf.compile_frame_predicate(pcap_filter)
+                              if pcap_filter is not None else None)
+        """ :type: callable"""
+
+    def __iter__(self):
+        if not os.path.exists(self.filename):
+            raise FileNotFoundException(self.filename)
+
+        with open(self.filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if len(data) >= 4 and struct.unpack_from(
+                        '=I', data)[0] == PCAPNG_BLOCK_SHB:
+                    records = self._pcapng_records(data)
+                else:
+                    records = self._pcap_records(data)
+                for offset, length, sec, usec, linktype in records:
+                    frame = data[offset:offset + length]
+                    if not self.matches(frame, linktype):
+                        continue
+                    yield PCAPPacket(frame, format_timestamp(sec, usec),
+                                     LINK_LAYERS.get(linktype, None))
+            finally:
+                data.close()
+
+    def read_all(self):
+        """
+        :return: list[PCAPPacket]
+        """
+        return list(self)
+
+    def matches(self, frame, linktype):
+        if self.matches_frame is None:
+            return True
+        if linktype == LINKTYPE_ETHERNET:
+            return self.matches_frame(frame)
+        if linktype == LINKTYPE_LINUX_SLL:
+            return self.matches_frame(bpf.sll_to_ethernet(frame))
+        raise FilterCompileException(
+            'Cannot filter packets with link type ' + str(linktype))
+
+    def _pcap_records(self, data):
+        if len(data) < PCAP_FILE_HEADER_LEN:
+            raise PacketParsingException(
+                self.filename + ' is too short to be a pcap file')
+        file_format = _pcap_byte_order(data)
+        if file_format is None:
+            raise PacketParsingException(
+                self.filename + ' is not a pcap or pcapng file')
+        byte_order, nsec = file_format
+        linktype = struct.unpack_from(byte_order + PCAP_FILE_HEADER,
+                                      data)[6]
+        record_header = struct.Struct(byte_order + PCAP_RECORD_HEADER)
+
+        offset = PCAP_FILE_HEADER_LEN
+        while offset + PCAP_RECORD_HEADER_LEN <= len(data):
+            sec, frac, incl_len, _ = record_header.unpack_from(data, offset)
+            offset += PCAP_RECORD_HEADER_LEN
+            # A truncated last record means the capture was cut short
+            if offset + incl_len > len(data):
+                return
+            yield (offset, incl_len, sec,
+                   frac // 1000 if nsec else frac, linktype)
+            offset += incl_len
+
+    def _pcapng_records(self, data):
+        byte_order = '<'
+        interfaces = []
+        """ :type: list[(int, int)]"""
+        offset = 0
+        while offset + 12 <= len(data):
+            if struct.unpack_from('=I', data, offset)[0] == PCAPNG_BLOCK_SHB:
+                # Each section sets its own byte order
+                byte_order = ('<' if struct.unpack_from(
+                    '<I', data, offset + 8)[0] == PCAPNG_BYTE_ORDER_MAGIC
+                    else '>')
+                interfaces = []
+            block_type, block_len = struct.unpack_from(byte_order + 'II',
+                                                       data, offset)
+            if block_len < 12 or offset + block_len > len(data):
+                return
+
+            if block_type == PCAPNG_BLOCK_IDB:
+                linktype = struct.unpack_from(byte_order + 'H', data,
+                                              offset + 8)[0]
+                interfaces.append(
+                    (linktype, self._pcapng_ts_units(
+                        data, byte_order, offset + 16,
+                        offset + block_len - 4)))
+            elif block_type == PCAPNG_BLOCK_EPB:
+                if_id, ts_high, ts_low, cap_len, _ = struct.unpack_from(
+                    byte_order + 'IIIII', data, offset + 8)
+                if if_id < len(interfaces):
+                    linktype, units = interfaces[if_id]
+                    ts = (ts_high << 32) | ts_low
+                    yield (offset + 28, cap_len, ts // units,
+                           (ts % units) * 1000000 // units, linktype)
+            elif block_type == PCAPNG_BLOCK_SPB and interfaces:
+                orig_len = struct.unpack_from(byte_order + 'I', data,
+                                              offset + 8)[0]
+                yield (offset + 12, min(orig_len, block_len - 16), 0, 0,
+                       interfaces[0][0])
+            offset += block_len
+
+    @staticmethod
+    def _pcapng_ts_units(data, byte_order, offset, end):
+        """
+        Returns the number of timestamp units per second from an
+        interface's options (microseconds unless if_tsresol says
+        otherwise).
+        """
+        while offset + 4 <= end:
+            code, length = struct.unpack_from(byte_order + 'HH', data,
+                                              offset)
+            if code == PCAPNG_OPT_END:
+                break
+            if code == PCAPNG_OPT_IF_TSRESOL and length >= 1:
+                resolution = struct.unpack_from('B', data, offset + 4)[0]
+                if resolution & 0x80:
+                    return 2 ** (resolution & 0x7f)
+                return 10 ** resolution
+            offset += 4 + ((length + 3) & ~3)
+        return 1000000
+
+
+class PCAPStreamReader(object):
+    def __init__(self, stream):
+        """
+        Incrementally decodes a libpcap file which is still being written
+        (e.g. the output of 'tcpdump -U -w -'), returning each packet once
+        it has been written out in full.  The stream (a file, or a pipe
+        in non-blocking mode) is read through its file descriptor, so it
+        must not be read from otherwise.
+        :type stream: file
+        """
+        self.stream = stream
+        self.buffer = ''
+        self.offset = 0
+        self.record_header = None
+        """ :type: struct.Struct"""
+        self.nsec = False
+        self.linktype = None
+        """ :type: int"""
+
+    def read_packet(self):
+        """
+        Returns the next packet, or None if it hasn't been written yet.
+        :return: PCAPPacket
+        """
+        packet = self._next_packet()
+        if packet is None:
+            self.buffer = self.buffer[self.offset:] + self._read_available()
+            self.offset = 0
+            packet = self._next_packet()
+        return packet
+
+    def _read_available(self):
+        # Read from the descriptor directly: stdio treats end-of-file as
+        # sticky, which would hide anything written after it was reached
+        chunks = []
+        while True:
+            try:
+                chunk = os.read(self.stream.fileno(), STREAM_READ_SIZE)
+            except OSError as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+                chunk = ''
+            if not chunk:
+                return ''.join(chunks)
+            chunks.append(chunk)
+
+    def _next_packet(self):
+        if self.record_header is None:
+            if len(self.buffer) < PCAP_FILE_HEADER_LEN:
+                return None
+            file_format = _pcap_byte_order(self.buffer)
+            if file_format is None:
+                raise PacketParsingException(
+                    'Capture output is not in pcap format')
+            byte_order, self.nsec = file_format
+            self.linktype = struct.unpack_from(byte_order + PCAP_FILE_HEADER,
+                                               self.buffer)[6]
+            self.record_header = struct.Struct(byte_order +
+                                               PCAP_RECORD_HEADER)
+            self.offset = PCAP_FILE_HEADER_LEN
+
+        if len(self.buffer) - self.offset < PCAP_RECORD_HEADER_LEN:
+            return None
+        sec, frac, incl_len, _ = self.record_header.unpack_from(self.buffer,
+                                                                self.offset)
+        start = self.offset + PCAP_RECORD_HEADER_LEN
+        if len(self.buffer) < start + incl_len:
+            return None
+
+        self.offset = start + incl_len
+        return PCAPPacket(self.buffer[start:start + incl_len],
+                          format_timestamp(sec,
+                                           frac // 1000 if self.nsec
+                                           else frac),
+                          LINK_LAYERS.get(self.linktype, None))
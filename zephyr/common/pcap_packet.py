@@ -12,18 +12,45 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import binascii
+import socket
+import struct
+
 from zephyr.common.exceptions import *
 
 ETHERNET_PROTOCOL_TYPE_IP4 = 0x0800
 ETHERNET_PROTOCOL_TYPE_ARP = 0x0806
 ETHERNET_PROTOCOL_TYPE_RARP = 0x8035
 ETHERNET_PROTOCOL_TYPE_IP6 = 0x86DD
+ETHERNET_PROTOCOL_TYPE_VLAN = 0x8100
+ETHERNET_PROTOCOL_TYPE_QINQ = 0x88A8
+ETHERNET_PROTOCOL_TYPE_TEB = 0x6558
 
 ARP_PROTOCOL_HW_TYPE_EHTERNET = 1
 
 IP4_PROTOCOL_ICMP = 1
 IP4_PROTOCOL_TCP = 6
 IP4_PROTOCOL_UDP = 17
+IP_PROTOCOL_GRE = 47
+IP6_PROTOCOL_ICMP6 = 58
+
+IP6_EXT_HOP_BY_HOP = 0
+IP6_EXT_ROUTING = 43
+IP6_EXT_FRAGMENT = 44
+IP6_EXT_DEST_OPTIONS = 60
+
+GRE_FLAG_CHECKSUM = 0x8000
+GRE_FLAG_KEY = 0x2000
+GRE_FLAG_SEQUENCE = 0x1000
+
+VXLAN_FLAG_VNI = 0x08
+VXLAN_PORT = 4789
+VXLAN_LINUX_PORT = 8472
+
+# Layers decoded from inside a tunnel (GRE or VXLAN) are keyed by their
+# name with this prefix, once per level of encapsulation, so they don't
+# replace the outer layers of the same type (e.g. 'inner.ip')
+INNER_LAYER_PREFIX = 'inner.'
 
 TCP_PROTOCOL_FLAG_NS = 0x100
 TCP_PROTOCOL_FLAG_CWS = 0x80
@@ -59,8 +86,55 @@ ICMP_PROTOCOL_DU_CODE_COMM_PROHIBIT = 13
 ICMP_PROTOCOL_DU_CODE_HOST_PRECEDENCE_VIOLATION = 14
 ICMP_PROTOCOL_DU_CODE_PRECEDENCE_CUTOFF = 15
 
+ICMP6_PROTOCOL_TYPE_DESTINATION_UNREACHABLE = 1
+ICMP6_PROTOCOL_TYPE_ECHO_REQUEST = 128
+ICMP6_PROTOCOL_TYPE_ECHO_REPLY = 129
+
+# Precompiled header decoders.  Address fields are unpacked as raw byte
+# strings and only formatted when they are accessed.
+ETHERNET_HEADER = struct.Struct('!6s6sH')
+SLL_HEADER = struct.Struct('!6x6s2xH')
+IP4_HEADER = struct.Struct('!B8xB2x4s4s')
+ARP_HEADER = struct.Struct('!HHBBH')
+TCP_HEADER = struct.Struct('!HHIIBBH')
+UDP_HEADER = struct.Struct('!HHH')
+ICMP_HEADER = struct.Struct('!BB2x4s')
+VLAN_HEADER = struct.Struct('!HH')
+IP6_HEADER = struct.Struct('!IHBB16s16s')
+IP6_EXT_HEADER = struct.Struct('!BB')
+GRE_HEADER = struct.Struct('!HH')
+VXLAN_HEADER = struct.Struct('!B3xI')
+
+
+def as_buffer(packet_data):
+    """
+    Returns a view on the given packet data which can be sliced without
+    copying.  Lists of ints are packed into a byte string first.
+    :type packet_data: str | bytearray | memoryview | list[int]
+    :return: memoryview
+    """
+    if isinstance(packet_data, memoryview):
+        return packet_data
+    if isinstance(packet_data, list):
+        packet_data = bytes(bytearray(packet_data))
+    return memoryview(packet_data)
+
+
+def _payload(packet_data, buf, offset):
+    # Callers passing in a list of ints get a list back; everything else
+    # gets a view on the same underlying buffer.
+    if isinstance(packet_data, list):
+        return packet_data[offset:]
+    return buf[offset:]
+
+
+def _byte_list(raw):
+    return list(bytearray(raw))
+
 
 class PCAPPacket(object):
+    __slots__ = ('timestamp', 'packet_data', 'layer_data', 'extra_data',
+                 'parsed', 'link_layer', 'tunnel_depth')
 
     @staticmethod
     def char8_to_int16(char_msb, char_lsb):
@@ -120,20 +194,74 @@ class PCAPPacket(object):
         return '{0:02x}:{1:02x}:{2:02x}:{3:02x}:{4:02x}:{5:02x}'.format(
             char1, char2, char3, char4, char5, char6)
 
-    def __init__(self, packet_data, timestamp):
+    @staticmethod
+    def bytes_to_ip4(raw):
         """
-        :param packet_data: list[int]
+        Converts a raw 4-byte string into a dotted IP string.
+        :param raw: str
+        :return: str
+        """
+        if len(raw) != 4:
+            return ''
+        return socket.inet_ntoa(raw)
+
+    @staticmethod
+    def bytes_to_mac_address(raw):
+        """
+        Converts a raw byte string into a MAC Address string (using
+        hexadecimal notation)
+        :param raw: str
+        :return: str
+        """
+        hex_str = binascii.hexlify(raw)
+        return ':'.join([hex_str[i:i + 2]
+                         for i in xrange(0, len(hex_str), 2)])
+
+    def __init__(self, packet_data, timestamp, link_layer=None):
+        """
+        The packet data is held as a single immutable byte string.  Layers
+        are decoded from views on that string (without copying the
+        payload at each layer), and only once the packet is parsed or its
+        layers are first accessed.  The link layer class is where parsing
+        starts when no parsing stack is given (Ethernet if not set).
+        Packets inside tunnels are decoded too, with the inner layers
+        keyed as 'inner.<layer>' (see innermost).
+        :param packet_data: str | bytearray | memoryview | list[int]
         :param timestamp: str
+        :param link_layer: class
         """
+        if isinstance(packet_data, memoryview):
+            packet_data = packet_data.tobytes()
+        elif not isinstance(packet_data, bytes):
+            packet_data = bytes(bytearray(packet_data))
         self.timestamp = timestamp
         self.packet_data = packet_data
+        """ :type: str """
         self.layer_data = {}
         """ :type: dict[str, PCAPEncapsulatedLayer] """
         self.extra_data = {}
         """ :type: dict[str, list[str]] """
+        self.parsed = False
+        self.link_layer = link_layer
+        self.tunnel_depth = 0
+        """ :type: int """
+
+    def __getstate__(self):
+        # Layers are re-decoded on demand, so only the raw packet needs
+        # to cross process boundaries
+        return self.packet_data, self.timestamp, self.link_layer
+
+    def __setstate__(self, state):
+        self.__init__(*state)
 
     def __iter__(self):
-        return iter(self.layer_data)
+        return iter(self.get_data())
+
+    def __contains__(self, layer_name):
+        return layer_name in self.get_data()
+
+    def __getitem__(self, layer_name):
+        return self.get_data()[layer_name]
 
     def to_str(self):
         ret_str = 'PACKET { time[' + str(self.timestamp) + '] '
@@ -143,20 +271,51 @@ class PCAPPacket(object):
         return ret_str
 
     def get_data(self):
+        """
+        Returns the decoded layers, parsing the packet with the default
+        parser stack on first access.  Parsing errors are recorded in
+        extra_data, and any layers decoded before the error are returned.
+        :return: dict[str, PCAPEncapsulatedLayer]
+        """
+        if not self.parsed:
+            try:
+                self.parse()
+            except PacketParsingException:
+                self.parsed = True
         return self.layer_data
 
+    def innermost(self, layer_name):
+        """
+        Returns the most deeply encapsulated layer of the given type (e.g.
+        the tenant's IP header in a tunnelled packet, or just the 'ip'
+        layer in one which isn't), or None if there is none.
+        :type layer_name: str
+        :return: PCAPEncapsulatedLayer
+        """
+        layers = self.get_data()
+        for depth in xrange(self.tunnel_depth, -1, -1):
+            layer = layers.get(INNER_LAYER_PREFIX * depth + layer_name, None)
+            if layer is not None:
+                return layer
+        return None
+
     def parse(self, parse_class_stack=None):
         """
         :param parse_class_stack: list[class] Stack of classes to parse
         packet (highest layer first in list)
         :return: dict[str, PCAPEncapsulatedLayer]
         """
+        # Parsing with the default stack is only done once
+        if self.parsed and not parse_class_stack:
+            return self.layer_data
 
-        self.extra_data['parse_classes'] = []
-        self.extra_data['parse_types'] = []
+        self.layer_data = {}
+        self.extra_data = {'parse_classes': [], 'parse_types': []}
+        self.tunnel_depth = 0
+        layer_prefix = ''
 
         # Start parsing with the whole packet (starting from Link-Layer)
-        current_data = self.packet_data
+        current_data = memoryview(self.packet_data)
 
         # By default, the parsing stack is None, which tells us to figure
         # it out automatically, so let's start with Ethernet_II, as it's
@@ -164,7 +323,9 @@ class PCAPPacket(object):
         # that means to just use the recommended parser, which in this case
         #  would mean to use Ethernet, since it's the first step.
         if parse_class_stack is None or len(parse_class_stack) == 0:
-            parse_class_name = PCAPEthernet
+            parse_class_name = (self.link_layer
+                                if self.link_layer is not None
+                                else PCAPEthernet)
         else:
             # Otherwise, let's pop the first parsing class and continue
             parse_class_name = parse_class_stack.pop()
@@ -174,16 +335,16 @@ class PCAPPacket(object):
 
             # Check type and set up some extra information about the classes
             # used to parse
-            if not isinstance(parse_class_name(), PCAPEncapsulatedLayer):
+            if (not isinstance(parse_class_name, type) or
+                    not issubclass(parse_class_name, PCAPEncapsulatedLayer)):
                 raise ArgMismatchException(
                     'Parsing classes must be of type "PCAPEncapsulatedLayer"')
 
+            layer_name = layer_prefix + parse_class_name.layer_name()
             self.extra_data['parse_classes'].append(
                 parse_class_name.__name__)
-            self.extra_data['parse_types'].append(
-                parse_class_name.layer_name())
-            self.extra_data['parse_errors.' +
-                            parse_class_name.layer_name()] = []
+            self.extra_data['parse_types'].append(layer_name)
+            self.extra_data['parse_errors.' + layer_name] = []
 
             # Instantiate the object based on the class given as the
             # "next parser"
@@ -196,14 +357,18 @@ class PCAPPacket(object):
                 #  next layer to parse.
                 current_data = link_obj.parse_layer(current_data)
             except PacketParsingException as e:
-                self.extra_data['parse_errors.' +
-                                parse_class_name.layer_name()].append(e.info)
+                self.extra_data['parse_errors.' + layer_name].append(e.info)
                 if e.fatal is True:
                     raise e
 
             # Set the item in the data map with the parsed object keyed to
             # the name the object itself uses to access the data
-            self.layer_data[parse_class_name.layer_name()] = link_obj
+            self.layer_data[layer_name] = link_obj
+
+            # Anything a tunnel carries is keyed as the next level in
+            if link_obj.tunnel:
+                self.tunnel_depth += 1
+                layer_prefix += INNER_LAYER_PREFIX
 
             # If the last parser recommended a parser for the rest of the
             # data and there were no other parsers configured manually to
@@ -221,6 +386,7 @@ class PCAPPacket(object):
                 # None", that signals us to stop parsing and finish the loop.
                 parse_class_name = parse_class_stack.pop()
 
+        self.parsed = True
         return self.layer_data
 
     def __str__(self):
@@ -231,6 +397,10 @@ class PCAPPacket(object):
 
 
 class PCAPEncapsulatedLayer(object):
+    __slots__ = ('next_parse_recommendation',)
+
+    # Whether the layer's payload is a whole encapsulated packet
+    tunnel = False
 
     @staticmethod
     def layer_name():
@@ -250,9 +420,9 @@ class PCAPEncapsulatedLayer(object):
 
     def parse_layer(self, packet_data):
         """
-        :param packet_data: list[int] Array of int representing the bytes in
-        the packet
-        :return: list[int]
+        :param packet_data: memoryview | str | list[int] The bytes in the
+        packet
+        :return: memoryview | list[int]
         """
         raise PacketParsingException(
             "Base layer class shouldn't be used directly.  "
@@ -261,6 +431,7 @@ class PCAPEncapsulatedLayer(object):
 
 
 class PCAPEthernet(PCAPEncapsulatedLayer):
+    __slots__ = ('_dest_mac', '_source_mac', 'type')
 
     @staticmethod
     def layer_name():
@@ -271,13 +442,21 @@ class PCAPEthernet(PCAPEncapsulatedLayer):
 
     def __init__(self):
         super(PCAPEthernet, self).__init__()
-        self.dest_mac = ''
-        """ :type: str """
-        self.source_mac = ''
-        """ :type: str """
+        self._dest_mac = ''
+        self._source_mac = ''
         self.type = 0
         """ :type: int """
 
+    @property
+    def dest_mac(self):
+        """ :rtype: str """
+        return PCAPPacket.bytes_to_mac_address(self._dest_mac)
+
+    @property
+    def source_mac(self):
+        """ :rtype: str """
+        return PCAPPacket.bytes_to_mac_address(self._source_mac)
+
     def to_str(self):
         return 's_mac[' + self.source_mac + '] ' + 'd_mac[' + \
                self.dest_mac + '] ' + \
@@ -285,40 +464,40 @@ class PCAPEthernet(PCAPEncapsulatedLayer):
 
     def parse_layer(self, packet_data):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_data: memoryview | str | list[int]
+        :return: memoryview | list[int]
 
         Ethernet_II frame structure:
         6 bytes - dest_mac
         6 bytes - source mac
         2 bytes - type (should be 0x0800 for IP and 0x0806 for ARP)
         """
+        buf = as_buffer(packet_data)
+
         # First, check length of packet to make sure it is at least long
         # enough for the header
-        if len(packet_data) < 14:
+        if len(buf) < ETHERNET_HEADER.size:
             raise PacketParsingException(
                 'Ethernet layer data must at least be 14 bytes, '
                 'but packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
+                str(len(buf)) + ']', fatal=True)
 
-        self.dest_mac = PCAPPacket.char8_to_mac_address(*packet_data[0:6])
-        self.source_mac = PCAPPacket.char8_to_mac_address(*packet_data[6:12])
-        self.type = PCAPPacket.char8_to_int16(*packet_data[12:14])
+        self._dest_mac, self._source_mac, self.type = \
+            ETHERNET_HEADER.unpack_from(buf)
 
         # Otherwise, judge based on the type from our built-ins
-        if self.type == 0x0800:
-            self.next_parse_recommendation = PCAPIP4
-        elif self.type == 0x0806:
-            self.next_parse_recommendation = PCAPARP
-        else:
+        self.next_parse_recommendation = ETHER_TYPE_PARSERS.get(self.type,
+                                                                None)
+        if self.next_parse_recommendation is None:
             raise PacketParsingException(
                 "No known handler for Ethernet type: " +
                 str(self.type), fatal=False)
 
-        return packet_data[14:]
+        return _payload(packet_data, buf, ETHERNET_HEADER.size)
 
 
 class PCAPSLL(PCAPEncapsulatedLayer):
+    __slots__ = ('_source_mac', 'type')
 
     @staticmethod
     def layer_name():
@@ -329,13 +508,20 @@ class PCAPSLL(PCAPEncapsulatedLayer):
 
     def __init__(self):
         super(PCAPSLL, self).__init__()
-        self.dest_mac = ''
-        """ :type: str """
-        self.source_mac = ''
-        """ :type: str """
+        self._source_mac = ''
         self.type = 0
         """ :type: int """
 
+    @property
+    def dest_mac(self):
+        """ :rtype: str """
+        return '00:00:00:00:00:00'
+
+    @property
+    def source_mac(self):
+        """ :rtype: str """
+        return PCAPPacket.bytes_to_mac_address(self._source_mac)
+
     def to_str(self):
         return 's_mac[' + self.source_mac + '] ' + 'd_mac[' + \
                self.dest_mac + '] ' + \
@@ -343,8 +529,8 @@ class PCAPSLL(PCAPEncapsulatedLayer):
 
     def parse_layer(self, packet_data):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_data: memoryview | str | list[int]
+        :return: memoryview | list[int]
 
         If Linux-Cooked (SLL) link-layer (i.e. the 'any' interface was used):
         6 bytes - Linux Cooked Protocol info
@@ -352,32 +538,104 @@ class PCAPSLL(PCAPEncapsulatedLayer):
         2 bytes - padding (00 00)
         2 bytes - type (should be 0x0800 for IP and 0x0806 for ARP)
         """
+        buf = as_buffer(packet_data)
+
         # First, check length of packet to make sure it is at least long
         # enough for the header
-        if len(packet_data) < 16:
+        if len(buf) < SLL_HEADER.size:
             raise PacketParsingException(
                 "'Linux-cooked' layer data must at least be 16 bytes, "
                 "but packet size is [" +
-                str(len(packet_data)) + ']', fatal=True)
+                str(len(buf)) + ']', fatal=True)
 
-        self.dest_mac = PCAPPacket.char8_to_mac_address(*([0] * 6))
-        self.source_mac = PCAPPacket.char8_to_mac_address(*packet_data[6:12])
-        self.type = PCAPPacket.char8_to_int16(packet_data[14], packet_data[15])
+        self._source_mac, self.type = SLL_HEADER.unpack_from(buf)
 
         # Otherwise, judge based on the type from our built-ins
-        if self.type == 0x0800:
-            self.next_parse_recommendation = PCAPIP4
-        elif self.type == 0x0806:
-            self.next_parse_recommendation = PCAPARP
-        else:
+        self.next_parse_recommendation = ETHER_TYPE_PARSERS.get(self.type,
+                                                                None)
+        if self.next_parse_recommendation is None:
             raise PacketParsingException(
                 "Encapsulated type [" +
                 str(self.type) + "] unknown", fatal=False)
 
-        return packet_data[16:]
+        return _payload(packet_data, buf, SLL_HEADER.size)
+
+
+class PCAPVLAN(PCAPEncapsulatedLayer):
+    __slots__ = ('tags', 'type')
+
+    @staticmethod
+    def layer_name():
+        """
+        :return: str
+        """
+        return 'vlan'
+
+    def __init__(self):
+        super(PCAPVLAN, self).__init__()
+        self.tags = []
+        """ :type: list[(int, int)] """
+        self.type = 0
+        """ :type: int """
+
+    @property
+    def vlan_id(self):
+        """ :rtype: int """
+        return self.tags[0][1] & 0x0fff if self.tags else 0
+
+    @property
+    def vlan_ids(self):
+        """ :rtype: list[int] """
+        return [tci & 0x0fff for _, tci in self.tags]
+
+    @property
+    def priority(self):
+        """ :rtype: int """
+        return self.tags[0][1] >> 13 if self.tags else 0
+
+    def to_str(self):
+        return 'vlans[' + ','.join(str(v) for v in self.vlan_ids) + '] ' + \
+               'type[0x' + '{0:04x}'.format(self.type) + ']'
+
+    def parse_layer(self, packet_data):
+        """
+        :type packet_data: memoryview | str | list[int]
+        :return: memoryview | list[int]
+
+        802.1Q tag(s), following an Ethernet header with type 0x8100 (or
+        0x88a8 for the outer tag of a QinQ frame).  Stacked tags are all
+        decoded into this one layer, outermost first:
+        2 bytes - Priority (3 bits), DEI (1 bit), VLAN ID (12 bits)
+        2 bytes - type of the next tag or of the payload
+        """
+        buf = as_buffer(packet_data)
+
+        offset = 0
+        self.type = ETHERNET_PROTOCOL_TYPE_VLAN
+        while self.type in (ETHERNET_PROTOCOL_TYPE_VLAN,
+                            ETHERNET_PROTOCOL_TYPE_QINQ):
+            if len(buf) < offset + VLAN_HEADER.size:
+                raise PacketParsingException(
+                    'VLAN tag must be 4 bytes, but packet size is [' +
+                    str(len(buf) - offset) + ']', fatal=True)
+            tci, next_type = VLAN_HEADER.unpack_from(buf, offset)
+            self.tags.append((self.type, tci))
+            self.type = next_type
+            offset += VLAN_HEADER.size
+
+        self.next_parse_recommendation = ETHER_TYPE_PARSERS.get(self.type,
+                                                                None)
+        if self.next_parse_recommendation is None:
+            raise PacketParsingException(
+                "No known handler for VLAN encapsulated type: " +
+                str(self.type), fatal=False)
+
+        return _payload(packet_data, buf, offset)
 
 
 class PCAPIP4(PCAPEncapsulatedLayer):
+    __slots__ = ('version', 'header_length', 'protocol',
+                 '_source_ip', '_dest_ip')
 
     @staticmethod
     def layer_name():
@@ -394,10 +652,18 @@ class PCAPIP4(PCAPEncapsulatedLayer):
         """ :type: int """
         self.protocol = 0
         """ :type: int """
-        self.source_ip = ''
-        """ :type: str """
-        self.dest_ip = ''
-        """ :type: str """
+        self._source_ip = ''
+        self._dest_ip = ''
+
+    @property
+    def source_ip(self):
+        """ :rtype: str """
+        return PCAPPacket.bytes_to_ip4(self._source_ip)
+
+    @property
+    def dest_ip(self):
+        """ :rtype: str """
+        return PCAPPacket.bytes_to_ip4(self._dest_ip)
 
     def to_str(self):
         return 'ver[' + str(self.version) + '] ' + 'h_len[' + \
@@ -408,8 +674,8 @@ class PCAPIP4(PCAPEncapsulatedLayer):
 
     def parse_layer(self, packet_data):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_data: memoryview | str | list[int]
+        :return: memoryview | list[int]
 
         If IP, the packet will look like this with word, word offset, and
         total offset followed by size of field):
@@ -427,15 +693,19 @@ class PCAPIP4(PCAPEncapsulatedLayer):
         word 6-20: total 20-160: 0-40 bytes - Options
         20 - 60: Data
         """
+        buf = as_buffer(packet_data)
+
         # First, check length of packet to make sure it is at least long
         # enough for the header
-        if len(packet_data) < 20:
+        if len(buf) < IP4_HEADER.size:
             raise PacketParsingException(
                 'IP layer data must at least be 20 bytes, '
                 'but packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
+                str(len(buf)) + ']', fatal=True)
 
-        self.version = (packet_data[0] & 0xf0) >> 4
+        (version_ihl, protocol,
+         self._source_ip, self._dest_ip) = IP4_HEADER.unpack_from(buf)
+        self.version = (version_ihl & 0xf0) >> 4
 
         # Version must be either 4 or 6, no exceptions
         if self.version != 4 and self.version != 6:
@@ -443,7 +713,7 @@ class PCAPIP4(PCAPEncapsulatedLayer):
                 'IP version must be either 4 or 6, but it was [' +
                 str(self.version) + ']', fatal=True)
 
-        self.header_length = packet_data[0] & 0x0f
+        self.header_length = version_ihl & 0x0f
 
         # Do a sanity check on header length vs. packet size
         if self.header_length < 5:
@@ -451,41 +721,138 @@ class PCAPIP4(PCAPEncapsulatedLayer):
                 'IP header length field must be at least 5, but it was [' +
                 str(self.header_length), fatal=True)
 
-        if (self.header_length * 4) > len(packet_data):
+        if (self.header_length * 4) > len(buf):
             raise PacketParsingException(
                 'IP header length field specifies length [' +
                 str(self.header_length) + '] longer than the packet size [' +
-                str(len(packet_data)) + ']!', fatal=True)
+                str(len(buf)) + ']!', fatal=True)
 
-        self.protocol = packet_data[9]
+        self.protocol = protocol
 
         # Otherwise, judge based on the type from our built-ins
-        if self.protocol == IP4_PROTOCOL_TCP:
-            self.next_parse_recommendation = PCAPTCP
-        elif self.protocol == IP4_PROTOCOL_UDP:
-            self.next_parse_recommendation = PCAPUDP
-        elif self.protocol == IP4_PROTOCOL_ICMP:
-            self.next_parse_recommendation = PCAPICMP
-        else:
+        self.next_parse_recommendation = IP_PROTOCOL_PARSERS.get(
+            self.protocol, None)
+        if self.next_parse_recommendation is None:
             raise PacketParsingException(
                 "IP protocol [" +
                 str(self.protocol) + "] unknown", fatal=False)
 
-        self.source_ip = PCAPPacket.char8_to_ip4(packet_data[12],
-                                                 packet_data[13],
-                                                 packet_data[14],
-                                                 packet_data[15])
-        self.dest_ip = PCAPPacket.char8_to_ip4(packet_data[16],
-                                               packet_data[17],
-                                               packet_data[18],
-                                               packet_data[19])
-
         # Remember, header length is in 4-octet words, so multiply by 4 to
         # get the data's starting byte
-        return packet_data[(self.header_length * 4):]
+        return _payload(packet_data, buf, self.header_length * 4)
+
+
+class PCAPIP6(PCAPEncapsulatedLayer):
+    __slots__ = ('version', 'traffic_class', 'flow_label', 'payload_length',
+                 'protocol', 'hop_limit', '_source_ip', '_dest_ip')
+
+    @staticmethod
+    def layer_name():
+        """
+        :return: str
+        """
+        return 'ip6'
+
+    def __init__(self):
+        super(PCAPIP6, self).__init__()
+        self.version = 6
+        """ :type: int """
+        self.traffic_class = 0
+        """ :type: int """
+        self.flow_label = 0
+        """ :type: int """
+        self.payload_length = 0
+        """ :type: int """
+        self.protocol = 0
+        """ :type: int """
+        self.hop_limit = 0
+        """ :type: int """
+        self._source_ip = ''
+        self._dest_ip = ''
+
+    @property
+    def source_ip(self):
+        """ :rtype: str """
+        return socket.inet_ntop(socket.AF_INET6, self._source_ip)
+
+    @property
+    def dest_ip(self):
+        """ :rtype: str """
+        return socket.inet_ntop(socket.AF_INET6, self._dest_ip)
+
+    def to_str(self):
+        return 'ver[' + str(self.version) + '] ' + \
+               'proto[' + str(self.protocol) + '] ' + 's_ip[' + \
+               self.source_ip + '] ' + \
+               'd_ip[' + self.dest_ip + ']'
+
+    def parse_layer(self, packet_data):
+        """
+        :type packet_data: memoryview | str | list[int]
+        :return: memoryview | list[int]
+
+        IPv6 fixed header:
+        total 0:  4 bytes  - Version (4 bits), Traffic Class (8 bits),
+                             Flow Label (20 bits)
+        total 4:  2 bytes  - Payload Length
+        total 6:  1 byte   - Next Header
+        total 7:  1 byte   - Hop Limit
+        total 8:  16 bytes - Source IP
+        total 24: 16 bytes - Destination IP
+        40 -> : Extension headers (skipped) and then the payload.  The
+                protocol is the Next Header value of the last one.
+        """
+        buf = as_buffer(packet_data)
+
+        if len(buf) < IP6_HEADER.size:
+            raise PacketParsingException(
+                'IPv6 layer data must at least be 40 bytes, '
+                'but packet size is [' +
+                str(len(buf)) + ']', fatal=True)
+
+        (version_class_flow, self.payload_length, self.protocol,
+         self.hop_limit, self._source_ip,
+         self._dest_ip) = IP6_HEADER.unpack_from(buf)
+        self.version = version_class_flow >> 28
+        self.traffic_class = (version_class_flow >> 20) & 0xff
+        self.flow_label = version_class_flow & 0xfffff
+
+        if self.version != 6:
+            raise PacketParsingException(
+                'IPv6 version must be 6, but it was [' +
+                str(self.version) + ']', fatal=True)
+
+        offset = IP6_HEADER.size
+        while self.protocol in (IP6_EXT_HOP_BY_HOP, IP6_EXT_ROUTING,
+                                IP6_EXT_FRAGMENT, IP6_EXT_DEST_OPTIONS):
+            if len(buf) < offset + 8:
+                raise PacketParsingException(
+                    'IPv6 extension header at [' + str(offset) +
+                    '] runs past the packet size [' + str(len(buf)) + ']',
+                    fatal=True)
+            header = self.protocol
+            self.protocol, ext_length = IP6_EXT_HEADER.unpack_from(buf,
+                                                                   offset)
+            if header == IP6_EXT_FRAGMENT:
+                offset += 8
+            else:
+                offset += (ext_length + 1) * 8
+
+        self.next_parse_recommendation = IP_PROTOCOL_PARSERS.get(
+            self.protocol, None)
+        if self.next_parse_recommendation is None:
+            raise PacketParsingException(
+                "IPv6 protocol [" +
+                str(self.protocol) + "] unknown", fatal=False)
+
+        return _payload(packet_data, buf, offset)
 
 
 class PCAPARP(PCAPEncapsulatedLayer):
+    __slots__ = ('hw_type', 'proto_type', 'hw_addr_length',
+                 'proto_addr_length', 'operation',
+                 '_sender_hw_addr', '_sender_proto_addr',
+                 '_target_hw_addr', '_target_proto_addr')
 
     @staticmethod
     def layer_name():
@@ -506,22 +873,58 @@ class PCAPARP(PCAPEncapsulatedLayer):
         """ :type: int """
         self.operation = 0
         """ :type: int """
-        self.sender_hw_addr_raw = ''
-        """ :type: list[int] """
-        self.sender_hw_addr_ether = ''
-        """ :type: str """
-        self.sender_proto_addr_raw = ''
-        """ :type: list[int] """
-        self.sender_ip_addr = ''
-        """ :type: str """
-        self.target_hw_addr_raw = ''
-        """ :type: list[int] """
-        self.target_hw_addr_ether = ''
-        """ :type: str """
-        self.target_proto_addr_raw = ''
-        """ :type: list[int] """
-        self.target_ip_addr = ''
-        """ :type: str """
+        self._sender_hw_addr = ''
+        self._sender_proto_addr = ''
+        self._target_hw_addr = ''
+        self._target_proto_addr = ''
+
+    @property
+    def sender_hw_addr_raw(self):
+        """ :rtype: list[int] """
+        return _byte_list(self._sender_hw_addr)
+
+    @property
+    def sender_proto_addr_raw(self):
+        """ :rtype: list[int] """
+        return _byte_list(self._sender_proto_addr)
+
+    @property
+    def target_hw_addr_raw(self):
+        """ :rtype: list[int] """
+        return _byte_list(self._target_hw_addr)
+
+    @property
+    def target_proto_addr_raw(self):
+        """ :rtype: list[int] """
+        return _byte_list(self._target_proto_addr)
+
+    @property
+    def sender_hw_addr_ether(self):
+        """ :rtype: str """
+        if self.hw_type != ARP_PROTOCOL_HW_TYPE_EHTERNET:
+            return ''
+        return PCAPPacket.bytes_to_mac_address(self._sender_hw_addr)
+
+    @property
+    def target_hw_addr_ether(self):
+        """ :rtype: str """
+        if self.hw_type != ARP_PROTOCOL_HW_TYPE_EHTERNET:
+            return ''
+        return PCAPPacket.bytes_to_mac_address(self._target_hw_addr)
+
+    @property
+    def sender_ip_addr(self):
+        """ :rtype: str """
+        if self.proto_type != ETHERNET_PROTOCOL_TYPE_IP4:
+            return ''
+        return PCAPPacket.bytes_to_ip4(self._sender_proto_addr)
+
+    @property
+    def target_ip_addr(self):
+        """ :rtype: str """
+        if self.proto_type != ETHERNET_PROTOCOL_TYPE_IP4:
+            return ''
+        return PCAPPacket.bytes_to_ip4(self._target_proto_addr)
 
     def to_str(self):
         return 'hw_type[' + str(self.hw_type) + '] ' + 'p_type[' + \
@@ -534,8 +937,8 @@ class PCAPARP(PCAPEncapsulatedLayer):
 
     def parse_layer(self, packet_data):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_data: memoryview | str | list[int]
+        :return: memoryview | list[int]
 
         If IP, the packet will look like this with word, word offset, and
         total offset followed by size of field):
@@ -551,76 +954,63 @@ class PCAPARP(PCAPEncapsulatedLayer):
         word 7, 0: total (24):  PROTO-ADDR-LENGTH bytes - Target Protocol
                                 address
         """
+        buf = as_buffer(packet_data)
+
         # First, check length of packet to make sure it is at least long
         # enough for the header
-        if len(packet_data) < 12:
+        if len(buf) < 12:
             raise PacketParsingException(
                 'ARP layer data must at least be 12 bytes, '
                 'but packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
+                str(len(buf)) + ']', fatal=True)
 
-        self.hw_type = PCAPPacket.char8_to_int16(packet_data[0],
-                                                 packet_data[1])
-        self.proto_type = PCAPPacket.char8_to_int16(packet_data[2],
-                                                    packet_data[3])
-        self.hw_addr_length = packet_data[4]
-        self.proto_addr_length = packet_data[5]
-        self.operation = PCAPPacket.char8_to_int16(packet_data[6],
-                                                   packet_data[7])
+        (self.hw_type, self.proto_type, self.hw_addr_length,
+         self.proto_addr_length, self.operation) = ARP_HEADER.unpack_from(buf)
 
         # Sanity check on packet length now that we know the sizes of the
         # HW and Protocol addresses
-        expected_size = (8 + (2 * self.hw_addr_length) +
+        expected_size = (ARP_HEADER.size + (2 * self.hw_addr_length) +
                          (2 * self.proto_addr_length))
-        if len(packet_data) < expected_size:
+        if len(buf) < expected_size:
             raise PacketParsingException(
                 'ARP packet size is expected to be [' + str(expected_size) +
                 '] based on set HW and Proto address lengths, '
                 'but the real packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
+                str(len(buf)) + ']', fatal=True)
 
-        sender_hw_addr_base = 8
+        sender_hw_addr_base = ARP_HEADER.size
         sender_proto_addr_base = sender_hw_addr_base + self.hw_addr_length
         target_hw_addr_base = sender_proto_addr_base + self.proto_addr_length
         target_proto_addr_base = target_hw_addr_base + self.hw_addr_length
         target_proto_addr_finish = \
             target_proto_addr_base + self.proto_addr_length
 
-        self.sender_hw_addr_raw = \
-            packet_data[sender_hw_addr_base:sender_proto_addr_base]
-        self.sender_proto_addr_raw = \
-            packet_data[sender_proto_addr_base:target_hw_addr_base]
-        self.target_hw_addr_raw = \
-            packet_data[target_hw_addr_base:target_proto_addr_base]
-        self.target_proto_addr_raw = \
-            packet_data[target_proto_addr_base:target_proto_addr_finish]
-
-        if self.hw_type == ARP_PROTOCOL_HW_TYPE_EHTERNET:
-            self.sender_hw_addr_ether = \
-                PCAPPacket.char8_to_mac_address(*self.sender_hw_addr_raw)
-            self.target_hw_addr_ether = \
-                PCAPPacket.char8_to_mac_address(*self.target_hw_addr_raw)
-
-        if self.proto_type == ETHERNET_PROTOCOL_TYPE_IP4:
-            self.sender_ip_addr = \
-                PCAPPacket.char8_to_ip4(*self.sender_proto_addr_raw)
-            self.target_ip_addr = \
-                PCAPPacket.char8_to_ip4(*self.target_proto_addr_raw)
+        self._sender_hw_addr = \
+            buf[sender_hw_addr_base:sender_proto_addr_base].tobytes()
+        self._sender_proto_addr = \
+            buf[sender_proto_addr_base:target_hw_addr_base].tobytes()
+        self._target_hw_addr = \
+            buf[target_hw_addr_base:target_proto_addr_base].tobytes()
+        self._target_proto_addr = \
+            buf[target_proto_addr_base:target_proto_addr_finish].tobytes()
 
         self.next_parse_recommendation = None
 
-        if len(packet_data) > target_proto_addr_finish:
+        if len(buf) > target_proto_addr_finish:
             raise PacketParsingException(
                 'ARP packet has junk data at end of packet [' +
                 ', '.join(['0x{0:02x}'.format(i)
-                           for i in packet_data[target_proto_addr_finish:]]),
+                           for i in bytearray(
+                               buf[target_proto_addr_finish:])]),
                 fatal=False)
 
         # Should be empty, but just in case...
-        return []
+        return _payload(packet_data, buf, len(buf))
 
 
 class PCAPTCP(PCAPEncapsulatedLayer):
+    __slots__ = ('source_port', 'dest_port', 'seq', 'ack', 'data_offset',
+                 'flags', 'window_size')
 
     def is_flag_set(self, flag):
         return self.flags & flag != 0
@@ -660,8 +1050,8 @@ class PCAPTCP(PCAPEncapsulatedLayer):
 
     def parse_layer(self, packet_data):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_data: memoryview | str | list[int]
+        :return: memoryview | list[int]
 
         If TCP, the packet will look like this:
         word 1, 0: total 0:  2 bytes - Source port
@@ -677,27 +1067,19 @@ class PCAPTCP(PCAPEncapsulatedLayer):
         word 6-20: total 20-160: 0-40 bytes - Options
         20 - 60: Data
         """
+        buf = as_buffer(packet_data)
+
         # First, check length of packet to make sure it is at least
         # long enough for the header
-        if len(packet_data) < 20:
+        if len(buf) < 20:
             raise PacketParsingException(
                 'TCP layer data must at least be 20 bytes, '
                 'but packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
-
-        self.source_port = PCAPPacket.char8_to_int16(packet_data[0],
-                                                     packet_data[1])
-        self.dest_port = PCAPPacket.char8_to_int16(packet_data[2],
-                                                   packet_data[3])
-        self.seq = PCAPPacket.char8_to_int32(packet_data[4],
-                                             packet_data[5],
-                                             packet_data[6],
-                                             packet_data[7])
-        self.ack = PCAPPacket.char8_to_int32(packet_data[8],
-                                             packet_data[9],
-                                             packet_data[10],
-                                             packet_data[11])
-        self.data_offset = (packet_data[12] & 0xF0) >> 4
+                str(len(buf)) + ']', fatal=True)
+
+        (self.source_port, self.dest_port, self.seq, self.ack,
+         offset_ns, flags, self.window_size) = TCP_HEADER.unpack_from(buf)
+        self.data_offset = (offset_ns & 0xF0) >> 4
 
         # Sanity check on data offset
         if self.data_offset < 5:
@@ -705,15 +1087,13 @@ class PCAPTCP(PCAPEncapsulatedLayer):
                 'TCP data offset field must be at least 5, but it was [' +
                 str(self.data_offset), fatal=True)
 
-        if self.data_offset > len(packet_data):
+        if (self.data_offset * 4) > len(buf):
             raise PacketParsingException(
                 'TCP data offset field specifies length [' +
                 str(self.data_offset) + '] longer than the packet size [' +
-                str(len(packet_data)) + ']!', fatal=True)
+                str(len(buf)) + ']!', fatal=True)
 
-        self.flags = ((packet_data[12] & 0x1) * 0xFF) + packet_data[13]
-        self.window_size = PCAPPacket.char8_to_int16(packet_data[14],
-                                                     packet_data[15])
+        self.flags = ((offset_ns & 0x1) << 8) + flags
 
         # TCP is the last parsed packet in our stack.
         # Can add Layer 5-7 here (HTTP, SOAP, etc.)
@@ -721,10 +1101,11 @@ class PCAPTCP(PCAPEncapsulatedLayer):
 
         # Remember, header length is in 4-octet words, so multiply
         # by 4 to get the data's starting byte
-        return packet_data[(self.data_offset * 4):]
+        return _payload(packet_data, buf, self.data_offset * 4)
 
 
 class PCAPUDP(PCAPEncapsulatedLayer):
+    __slots__ = ('source_port', 'dest_port', 'length')
 
     @staticmethod
     def layer_name():
@@ -749,8 +1130,8 @@ class PCAPUDP(PCAPEncapsulatedLayer):
 
     def parse_layer(self, packet_data):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_data: memoryview | str | list[int]
+        :return: memoryview | list[int]
 
         If UDP, the packet will look like this:
         word 1, 0: total 0:  2 bytes - Source port
@@ -759,30 +1140,29 @@ class PCAPUDP(PCAPEncapsulatedLayer):
         word 2, 2: total 6:  2 bytes - Checksum
         8 -> : Data
         """
+        buf = as_buffer(packet_data)
+
         # First, check length of packet to make sure it is at least long
         # enough for the header
-        if len(packet_data) < 8:
+        if len(buf) < 8:
             raise PacketParsingException(
                 'UDP layer data must at least be 8 bytes, '
                 'but packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
+                str(len(buf)) + ']', fatal=True)
 
-        self.source_port = PCAPPacket.char8_to_int16(packet_data[0],
-                                                     packet_data[1])
-        self.dest_port = PCAPPacket.char8_to_int16(packet_data[2],
-                                                   packet_data[3])
-        self.length = PCAPPacket.char8_to_int16(packet_data[4],
-                                                packet_data[5])
+        self.source_port, self.dest_port, self.length = \
+            UDP_HEADER.unpack_from(buf)
 
-        # UDP is the last parsing step in the standard TCP/IP stack
-        self.next_parse_recommendation = None
+        # UDP is the last parsing step in the standard TCP/IP stack,
+        # unless it is carrying a tunnel
+        self.next_parse_recommendation = UDP_PORT_PARSERS.get(
+            self.dest_port, None)
 
-        # Remember, header length is in 4-octet words, so multiply by
-        # 4 to get the data's starting byte
-        return packet_data[8:]
+        return _payload(packet_data, buf, 8)
 
 
 class PCAPICMP(PCAPEncapsulatedLayer):
+    __slots__ = ('type', 'code', '_header_data')
 
     @staticmethod
     def layer_name():
@@ -797,8 +1177,12 @@ class PCAPICMP(PCAPEncapsulatedLayer):
         """ :type: int """
         self.code = 0
         """ :type: int """
-        self.header_data = []
-        """ :type: list[int] """
+        self._header_data = ''
+
+    @property
+    def header_data(self):
+        """ :rtype: list[int] """
+        return _byte_list(self._header_data)
 
     def to_str(self):
         return 'type[' + str(self.type) + '] ' + 'code[' + \
@@ -807,8 +1191,8 @@ class PCAPICMP(PCAPEncapsulatedLayer):
 
     def parse_layer(self, packet_data):
         """
-        :type packet_data: list[int]
-        :return: list[int]
+        :type packet_data: memoryview | str | list[int]
+        :return: memoryview | list[int]
 
         If UDP, the packet will look like this:
         word 1, 0: total 0: 1 byte  - Type
@@ -817,21 +1201,205 @@ class PCAPICMP(PCAPEncapsulatedLayer):
         word 2, 0: total 4: 4 bytes - Rest of header
         8 -> : Data
         """
+        buf = as_buffer(packet_data)
+
         # First, check length of packet to make sure it is at least
         # long enough for the header
-        if len(packet_data) < 8:
+        if len(buf) < 8:
             raise PacketParsingException(
                 'ICMP layer data must at least be 8 bytes, '
                 'but packet size is [' +
-                str(len(packet_data)) + ']', fatal=True)
+                str(len(buf)) + ']', fatal=True)
 
-        self.type = packet_data[0]
-        self.code = packet_data[1]
-        self.header_data = packet_data[4:8]
+        self.type, self.code, self._header_data = \
+            ICMP_HEADER.unpack_from(buf)
 
         # ICMP is the last parsing step in the standard TCP/IP stack
         self.next_parse_recommendation = None
 
-        # Remember, header length is in 4-octet words, so multiply by
-        # 4 to get the data's starting byte
-        return packet_data[8:]
+        return _payload(packet_data, buf, 8)
+
+
+# ICMPv6 has the same header layout as ICMP, but types of its own (see the
+# ICMP6_PROTOCOL_TYPE_* constants), so it is kept apart as the 'icmp6' layer
+class PCAPICMP6(PCAPICMP):
+    __slots__ = ()
+
+    @staticmethod
+    def layer_name():
+        """
+        :return: str
+        """
+        return 'icmp6'
+
+
+class PCAPGRE(PCAPEncapsulatedLayer):
+    __slots__ = ('flags', 'version', 'protocol', 'key', 'sequence')
+
+    tunnel = True
+
+    @staticmethod
+    def layer_name():
+        """
+        :return: str
+        """
+        return 'gre'
+
+    def __init__(self):
+        super(PCAPGRE, self).__init__()
+        self.flags = 0
+        """ :type: int """
+        self.version = 0
+        """ :type: int """
+        self.protocol = 0
+        """ :type: int """
+        self.key = None
+        """ :type: int """
+        self.sequence = None
+        """ :type: int """
+
+    def to_str(self):
+        return 'flags[0x' + '{0:04x}'.format(self.flags) + '] ' + \
+               'proto[0x' + '{0:04x}'.format(self.protocol) + '] ' + \
+               'key[' + str(self.key) + ']'
+
+    def parse_layer(self, packet_data):
+        """
+        :type packet_data: memoryview | str | list[int]
+        :return: memoryview | list[int]
+
+        GRE header (RFC 2784/2890):
+        total 0: 2 bytes - Checksum, Key and Sequence present flags,
+                           Version (low 3 bits, must be 0)
+        total 2: 2 bytes - Protocol (an Ethernet type, 0x6558 for
+                           bridged Ethernet frames)
+        4 bytes - Checksum and reserved (if the checksum flag is set)
+        4 bytes - Key (if the key flag is set)
+        4 bytes - Sequence number (if the sequence flag is set)
+        """
+        buf = as_buffer(packet_data)
+
+        # The outer layers have already been decoded, so a truncated GRE
+        # header only stops the parsing rather than failing the packet
+        if len(buf) < GRE_HEADER.size:
+            raise PacketParsingException(
+                'GRE layer data must at least be 4 bytes, '
+                'but packet size is [' +
+                str(len(buf)) + ']', fatal=False)
+
+        flags_version, self.protocol = GRE_HEADER.unpack_from(buf)
+        self.flags = flags_version & 0xfff8
+        self.version = flags_version & 0x7
+        if self.version != 0:
+            raise PacketParsingException(
+                'GRE version [' + str(self.version) + '] unsupported',
+                fatal=False)
+
+        offset = GRE_HEADER.size
+        optional = [f for f in (GRE_FLAG_CHECKSUM, GRE_FLAG_KEY,
+                                GRE_FLAG_SEQUENCE) if self.flags & f]
+        if len(buf) < offset + 4 * len(optional):
+            raise PacketParsingException(
+                'GRE header with flags [0x' +
+                '{0:04x}'.format(self.flags) +
+                '] is longer than the packet size [' + str(len(buf)) + ']',
+                fatal=False)
+        for flag in optional:
+            value = struct.unpack_from('!I', buf, offset)[0]
+            if flag == GRE_FLAG_KEY:
+                self.key = value
+            elif flag == GRE_FLAG_SEQUENCE:
+                self.sequence = value
+            offset += 4
+
+        if self.protocol == ETHERNET_PROTOCOL_TYPE_TEB:
+            self.next_parse_recommendation = PCAPEthernet
+        else:
+            self.next_parse_recommendation = ETHER_TYPE_PARSERS.get(
+                self.protocol, None)
+        if self.next_parse_recommendation is None:
+            raise PacketParsingException(
+                "No known handler for GRE protocol: " +
+                str(self.protocol), fatal=False)
+
+        return _payload(packet_data, buf, offset)
+
+
+class PCAPVXLAN(PCAPEncapsulatedLayer):
+    __slots__ = ('flags', 'vni')
+
+    tunnel = True
+
+    @staticmethod
+    def layer_name():
+        """
+        :return: str
+        """
+        return 'vxlan'
+
+    def __init__(self):
+        super(PCAPVXLAN, self).__init__()
+        self.flags = 0
+        """ :type: int """
+        self.vni = 0
+        """ :type: int """
+
+    def to_str(self):
+        return 'flags[0x' + '{0:02x}'.format(self.flags) + '] ' + \
+               'vni[' + str(self.vni) + ']'
+
+    def parse_layer(self, packet_data):
+        """
+        :type packet_data: memoryview | str | list[int]
+        :return: memoryview | list[int]
+
+        VXLAN header (RFC 7348), carried over UDP:
+        total 0: 1 byte  - Flags (0x08 if the VNI is valid)
+        total 1: 3 bytes - Reserved
+        total 4: 3 bytes - VXLAN Network Identifier
+        total 7: 1 byte  - Reserved
+        8 -> : Encapsulated Ethernet frame
+        """
+        buf = as_buffer(packet_data)
+
+        # VXLAN is only guessed at from the UDP port, so a datagram which
+        # turns out not to be VXLAN doesn't make the whole packet fail
+        if len(buf) < VXLAN_HEADER.size:
+            raise PacketParsingException(
+                'VXLAN layer data must at least be 8 bytes, '
+                'but packet size is [' +
+                str(len(buf)) + ']', fatal=False)
+
+        self.flags, vni_reserved = VXLAN_HEADER.unpack_from(buf)
+        self.vni = vni_reserved >> 8
+        if not self.flags & VXLAN_FLAG_VNI:
+            raise PacketParsingException(
+                'VXLAN header flags [0x' + '{0:02x}'.format(self.flags) +
+                '] have no valid VNI', fatal=False)
+
+        self.next_parse_recommendation = PCAPEthernet
+
+        return _payload(packet_data, buf, VXLAN_HEADER.size)
+
+
+# The parsers used for each protocol found in the packet, by the field
+# identifying it in the layer below.  Parsers for more protocols can be
+# registered here, and are then used at every level of encapsulation.
+ETHER_TYPE_PARSERS = {ETHERNET_PROTOCOL_TYPE_IP4: PCAPIP4,
+                      ETHERNET_PROTOCOL_TYPE_IP6: PCAPIP6,
+                      ETHERNET_PROTOCOL_TYPE_ARP: PCAPARP,
+                      ETHERNET_PROTOCOL_TYPE_VLAN: PCAPVLAN,
+                      ETHERNET_PROTOCOL_TYPE_QINQ: PCAPVLAN}
+""" :type: dict[int, class] """
+
+IP_PROTOCOL_PARSERS = {IP4_PROTOCOL_TCP: PCAPTCP,
+                       IP4_PROTOCOL_UDP: PCAPUDP,
+                       IP4_PROTOCOL_ICMP: PCAPICMP,
+                       IP6_PROTOCOL_ICMP6: PCAPICMP6,
+                       IP_PROTOCOL_GRE: PCAPGRE}
+""" :type: dict[int, class] """
+
+# By UDP destination port
+UDP_PORT_PARSERS = {VXLAN_PORT: PCAPVXLAN,
+                    VXLAN_LINUX_PORT: PCAPVXLAN}
+""" :type: dict[int, class] """
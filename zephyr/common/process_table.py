@@ -0,0 +1,332 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import platform
+import pwd
+import select
+import threading
+import time
+
+PROC_DIR = '/proc'
+
+# pidfd_open(2) has the same syscall number on all architectures which
+# support it (Linux 5.3+)
+SYS_PIDFD_OPEN = 434
+PIDFD_SUPPORTED_ARCHS = ['x86_64', 'aarch64', 'arm64', 'ppc64le', 's390x']
+
+# Polling interval when pidfd isn't available
+WAIT_POLL_INTERVAL = 0.1
+
+_libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+
+class ProcessInfo(object):
+    def __init__(self, pid, ppid, uid, state, comm, cmdline):
+        """
+        A single entry in the process table, as read from /proc/<pid>.
+        :type pid: int
+        :type ppid: int
+        :type uid: int
+        :type state: str
+        :type comm: str
+        :type cmdline: list[str]
+        """
+        self.pid = pid
+        self.ppid = ppid
+        self.uid = uid
+        self.state = state
+        self.comm = comm
+        self.cmdline = cmdline
+
+    @property
+    def user(self):
+        try:
+            return pwd.getpwuid(self.uid).pw_name
+        except KeyError:
+            return str(self.uid)
+
+    def command(self):
+        """
+        The command line as 'ps -f' would print it.
+        :return: str
+        """
+        if self.cmdline:
+            return ' '.join(self.cmdline)
+        return '[' + self.comm + ']'
+
+    def matches(self, name):
+        """
+        Returns True if the name appears in the process' user, command name
+        or command line, which is what grepping 'ps -aef' output for a
+        name would match.
+        :type name: str
+        :return: bool
+        """
+        return (name in self.comm or name in self.command() or
+                name in self.user)
+
+    def is_zombie(self):
+        return self.state == 'Z'
+
+    def __repr__(self):
+        return ('ProcessInfo(pid=' + str(self.pid) + ', ppid=' +
+                str(self.ppid) + ', cmd=' + self.command() + ')')
+
+
+def read_process(pid):
+    """
+    Reads a single process' info from /proc, or returns None if the
+    process has gone away.
+    :type pid: int
+    :return: ProcessInfo
+    """
+    base = PROC_DIR + '/' + str(pid)
+    try:
+        with open(base + '/stat') as f:
+            stat = f.read()
+        with open(base + '/cmdline') as f:
+            cmdline = f.read()
+        uid = os.stat(base).st_uid
+    except (IOError, OSError):
+        return None
+
+    # The comm field is in parens and may itself contain spaces or
+    # parens, so split around the last ')'
+    comm_start = stat.find('(')
+    comm_end = stat.rfind(')')
+    fields = stat[comm_end + 2:].split()
+    return ProcessInfo(pid=pid,
+                       ppid=int(fields[1]),
+                       uid=uid,
+                       state=fields[0],
+                       comm=stat[comm_start + 1:comm_end],
+                       cmdline=[a for a in cmdline.split('\0') if a])
+
+
+def pid_exists(pid):
+    """
+    Returns True if a (non-zombie) process with the given PID exists.
+    :type pid: int | str
+    :return: bool
+    """
+    try:
+        pid = int(pid)
+    except ValueError:
+        return False
+    if pid <= 0:
+        return False
+    try:
+        with open(PROC_DIR + '/' + str(pid) + '/stat') as f:
+            stat = f.read()
+    except (IOError, OSError):
+        return False
+    return stat[stat.rfind(')') + 2:].split()[0] != 'Z'
+
+
+def pidfd_open(pid):
+    """
+    Returns a pidfd for the given process, or None if pidfds aren't
+    supported on this system.  Raises OSError(ESRCH) if the process
+    doesn't exist.
+    :type pid: int
+    :return: int
+    """
+    if platform.machine() not in PIDFD_SUPPORTED_ARCHS:
+        return None
+    fd = _libc.syscall(SYS_PIDFD_OPEN, ctypes.c_int(pid), ctypes.c_uint(0))
+    if fd < 0:
+        err = ctypes.get_errno()
+        if err == errno.ESRCH:
+            raise OSError(err, os.strerror(err))
+        return None
+    return fd
+
+
+def wait_for_exit(pid, timeout=None):
+    """
+    Wait for a process (which need not be a child of this one) to exit.
+    Uses a pidfd where the kernel supports it, so the wait costs a single
+    poll() rather than repeatedly checking the process table.  Returns
+    True if the process exited within the timeout.
+    :type pid: int | str
+    :type timeout: float
+    :return: bool
+    """
+    pid = int(pid)
+    deadline = time.time() + timeout if timeout is not None else None
+    try:
+        fd = pidfd_open(pid)
+    except OSError:
+        return True
+
+    if fd is not None:
+        try:
+            poller = select.poll()
+            poller.register(fd, select.POLLIN)
+            while True:
+                remaining = (None if deadline is None
+                             else max(0, deadline - time.time()))
+                try:
+                    if poller.poll(None if remaining is None
+                                   else int(remaining * 1000)):
+                        break
+                except select.error as e:
+                    if e.args[0] != errno.EINTR:
+                        raise
+                    continue
+                if remaining is not None and time.time() >= deadline:
+                    break
+        finally:
+            os.close(fd)
+        # The pidfd also reports readable once a child of ours is a
+        # zombie, which pid_exists() treats as stopped
+        return not pid_exists(pid)
+
+    while pid_exists(pid):
+        if deadline is not None and time.time() >= deadline:
+            return False
+        time.sleep(WAIT_POLL_INTERVAL)
+    return True
+
+
+class ProcessTable(object):
+    def __init__(self, cache_ttl=0.0):
+        """
+        In-process view of the system process table read directly from
+        /proc.  If cache_ttl is set, a snapshot is reused for that many
+        seconds, which suits code making several queries in a row.
+        :type cache_ttl: float
+        """
+        self.cache_ttl = cache_ttl
+        self.lock = threading.Lock()
+        self.cached_snapshot = None
+        """ :type: dict[int, ProcessInfo]"""
+        self.cached_time = 0
+
+    def snapshot(self, refresh=False):
+        """
+        Returns a map of PID to ProcessInfo for all (non-zombie) processes.
+        :type refresh: bool
+        :return: dict[int, ProcessInfo]
+        """
+        with self.lock:
+            if (not refresh and self.cache_ttl > 0 and
+                    self.cached_snapshot is not None and
+                    time.time() - self.cached_time < self.cache_ttl):
+                return self.cached_snapshot
+
+        procs = {}
+        for entry in os.listdir(PROC_DIR):
+            if not entry.isdigit():
+                continue
+            info = read_process(int(entry))
+            if info is not None and not info.is_zombie():
+                procs[info.pid] = info
+
+        with self.lock:
+            self.cached_snapshot = procs
+            self.cached_time = time.time()
+        return procs
+
+    def invalidate(self):
+        with self.lock:
+            self.cached_snapshot = None
+
+    def pids(self):
+        """
+        :return: list[int]
+        """
+        return sorted(self.snapshot().iterkeys())
+
+    def find(self, name):
+        """
+        Returns the processes matching the given name (see
+        ProcessInfo.matches), sorted by PID.
+        :type name: str
+        :return: list[ProcessInfo]
+        """
+        return sorted((p for p in self.snapshot().itervalues()
+                       if p.matches(name)),
+                      key=lambda p: p.pid)
+
+    def get(self, pid):
+        """
+        :type pid: int | str
+        :return: ProcessInfo
+        """
+        return self.snapshot().get(int(pid), None)
+
+    def children(self, pid):
+        """
+        Returns the direct children of the given process, sorted by PID.
+        :type pid: int | str
+        :return: list[ProcessInfo]
+        """
+        pid = int(pid)
+        return sorted((p for p in self.snapshot().itervalues()
+                       if p.ppid == pid),
+                      key=lambda p: p.pid)
+
+    def descendants(self, pid):
+        """
+        Returns all processes under the given process, breadth-first.
+        :type pid: int | str
+        :return: list[ProcessInfo]
+        """
+        procs = self.snapshot()
+        by_parent = {}
+        for p in procs.itervalues():
+            by_parent.setdefault(p.ppid, []).append(p)
+
+        ret = []
+        queue = [int(pid)]
+        while queue:
+            for child in sorted(by_parent.get(queue.pop(0), []),
+                                key=lambda p: p.pid):
+                ret.append(child)
+                queue.append(child.pid)
+        return ret
+
+    def ancestors(self, pid):
+        """
+        Returns the chain of parents of the given process, nearest first.
+        :type pid: int | str
+        :return: list[ProcessInfo]
+        """
+        procs = self.snapshot()
+        ret = []
+        proc = procs.get(int(pid), None)
+        while proc is not None and proc.ppid in procs:
+            proc = procs[proc.ppid]
+            ret.append(proc)
+        return ret
+
+    def is_running(self, pid):
+        """
+        :type pid: int | str
+        :return: bool
+        """
+        if self.cache_ttl > 0:
+            try:
+                return int(pid) in self.snapshot()
+            except ValueError:
+                return False
+        return pid_exists(pid)
+
+
+PROCESS_TABLE = ProcessTable()
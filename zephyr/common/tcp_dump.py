@@ -18,13 +18,36 @@ from fcntl import fcntl
 import multiprocessing
 import os
 import Queue
+import select
 import threading
 import time
+from zephyr.common import bpf
+from zephyr.common.capture_buffer import CaptureBuffer
+from zephyr.common.capture_service import CaptureService
+from zephyr.common.capture_service import NativeCapture
 from zephyr.common.cli import LinuxCLI
+from zephyr.common.cli import NetNSCLI
+from zephyr.common.packet_capture import *
+from zephyr.common import pcap
+from zephyr.common.pcap_file import *
 from zephyr.common.pcap_packet import *
 
 TCPDUMP_LISTEN_START_TIMEOUT = 10
 
+# How often start_capture checks for tcpdump failing to start while it
+# waits for it to be ready, and the reader checks for the capture being
+# stopped while it waits for packets
+TCPDUMP_FLAG_CHECK_INTERVAL = 0.05
+
+CAPTURE_ENGINE_AUTO = 'auto'
+CAPTURE_ENGINE_NATIVE = 'native'
+CAPTURE_ENGINE_TCPDUMP = 'tcpdump'
+
+# Which backend start_capture uses.  'auto' captures in-process through an
+# AF_PACKET socket whenever it can (i.e. when running as root with a
+# filter which compiles to BPF), and runs tcpdump otherwise.
+CAPTURE_ENGINE = CAPTURE_ENGINE_AUTO
+
 
 def sig_handler():
     with open('tcpdump.out', 'a') as f:
@@ -32,17 +55,13 @@ def sig_handler():
     raise IOError("I/O error")
 
 
-def parse_line_to_byte_array(line):
-    byte_data = []
-    data = [l.strip() for l in line.split(':', 2)]
-    if len(data) == 2:
-        for octet_pair in data[1].split():
-            lbyte = int(octet_pair[0:2], 16)
-            byte_data.append(lbyte)
-            if len(octet_pair) > 2:
-                hbyte = int(octet_pair[2:4], 16)
-                byte_data.append(hbyte)
-    return byte_data
+def dump_file_name(save_dump_filename=None):
+    """
+    :type save_dump_filename: str
+    :return: str
+    """
+    return (save_dump_filename if save_dump_filename is not None
+            else 'tcp.out.' + str(time.time()))
 
 
 def tcpdump_start(kwarg_map):
@@ -62,17 +81,26 @@ class TCPDump(object):
         """ :type: int"""
 
         self.data_queue = None
+        """ :type: CaptureBuffer"""
+        self.subprocess_data_queue = None
         self.subprocess_info_queue = None
+        self.forward_thread = None
         self.tcpdump_ready = None
         self.tcpdump_error = None
         self.tcpdump_stop = None
         self.tcpdump_finished = None
 
+        self.packet_socket = None
+        """ :type: PacketSocket"""
+        self.capture_service = None
+        """ :type: CaptureService"""
+
     def start_capture(self, cli=LinuxCLI(), interface='any',
                       count=0, packet_type='', pcap_filter=None,
                       max_size=0, timeout=None, callback=None,
                       callback_args=None, blocking=False,
-                      save_dump_file=False, save_dump_filename=None):
+                      save_dump_file=False, save_dump_filename=None,
+                      capture_service=None, capture_buffer=None):
         """
         Capture <count> packets using tcpdump and add them to a Queue
         of PCAPPackets. Use wait_for_packets to retrieve the packets
@@ -86,9 +114,24 @@ class TCPDump(object):
         will limit the blocking call to timeout seconds.  This time
         limit only applies to the execution of tcpdump if blocking is
         set to True.  The optional save_dump_file parameter can be set
-        to true to save the temporary packet capture file to the given
+        to true to save the captured packets as a libpcap file (which
+        tcpdump, wireshark or PCAPFileReader can read) with the given
         save file name (use tcp.out.<timestamp> if name not provided)
 
+        Depending on CAPTURE_ENGINE, packets are either captured natively
+        (through a BPF-filtered AF_PACKET socket opened in the cli's
+        network namespace, read by a thread in this process) or with a
+        tcpdump subprocess.  Captures which need tcpdump's packet type
+        interpretation or a filter that can't be compiled to BPF always
+        use tcpdump.  Native captures are read by the given capture
+        service (so one thread can serve all of a host's captures) if
+        there is one, or by a thread of their own otherwise.
+
+        Captured packets are held in a bounded capture buffer until they
+        are retrieved.  One with the default bounds and policy is used
+        unless a capture buffer is given, and its drop counts are
+        reported with the packets wait_for_packets returns.
+
         :type cli: LinuxCLI
         :type interface: str
         :type count: int
@@ -101,14 +144,31 @@ class TCPDump(object):
         :type blocking: bool
         :type save_dump_file: bool
         :type save_dump_filename: str
+        :type capture_service: CaptureService
+        :type capture_buffer: CaptureBuffer
         :return:
         """
         # Don't run twice in a row
         if self.process is not None:
             raise SubprocessFailedException('tcpdump process already started')
 
+        self.data_queue = (capture_buffer if capture_buffer is not None
+                           else CaptureBuffer())
+
+        packet_socket = self.open_native_capture(
+            cli=cli, interface=interface, packet_type=packet_type,
+            pcap_filter=pcap_filter, max_size=max_size)
+        if packet_socket is not None:
+            self.start_native_capture(
+                packet_socket=packet_socket, count=count, callback=callback,
+                callback_args=callback_args, timeout=timeout,
+                blocking=blocking, save_dump_file=save_dump_file,
+                save_dump_filename=save_dump_filename,
+                capture_service=capture_service)
+            return
+
         # Set up synchronization queues and events
-        self.data_queue = multiprocessing.Queue()
+        self.subprocess_data_queue = multiprocessing.Queue()
         self.subprocess_info_queue = multiprocessing.Queue()
 
         self.tcpdump_ready = multiprocessing.Event()
@@ -130,7 +190,7 @@ class TCPDump(object):
                      'max_size': max_size,
                      'flag_set': (self.tcpdump_ready, self.tcpdump_error,
                                   self.tcpdump_stop, self.tcpdump_finished),
-                     'packet_queues': (self.data_queue,
+                     'packet_queues': (self.subprocess_data_queue,
                                        self.subprocess_info_queue),
                      'callback': callback,
                      'callback_args': callback_args,
@@ -140,6 +200,15 @@ class TCPDump(object):
         self.process = multiprocessing.Process(target=tcpdump_start,
                                                args=(kwarg_map,))
         self.process.start()
+
+        # Move packets into the capture buffer as they come in, so they
+        # don't pile up unbounded in the queue from the tcpdump process
+        self.forward_thread = threading.Thread(
+            target=TCPDump.forward_packets,
+            args=(self.subprocess_data_queue, self.data_queue,
+                  self.process))
+        self.forward_thread.daemon = True
+        self.forward_thread.start()
         deadline_time = time.time() + TCPDUMP_LISTEN_START_TIMEOUT
         while not self.tcpdump_ready.is_set():
             if time.time() > deadline_time:
@@ -156,7 +225,15 @@ class TCPDump(object):
                         'stdout [' + error_info['stdout'] + '] ' +
                         'stderr [' + error_info['stderr'] + '] }')
                 raise SubprocessFailedException('tcpdump error UNKNOWN')
-            time.sleep(0)
+            if not self.process.is_alive():
+                raise SubprocessFailedException(
+                    'tcpdump capture process exited before listening')
+
+            # Returns as soon as tcpdump is listening; the error flag is
+            # checked between waits
+            self.tcpdump_ready.wait(
+                min(TCPDUMP_FLAG_CHECK_INTERVAL,
+                    max(0, deadline_time - time.time())))
 
         if blocking is True:
             self.process.join(timeout)
@@ -164,36 +241,176 @@ class TCPDump(object):
                 raise SubprocessTimeoutException('tcpdump failed to receive '
                                                  'packets within timeout')
 
+    @staticmethod
+    def open_native_capture(cli, interface, packet_type, pcap_filter,
+                            max_size):
+        """
+        Open a packet socket for the capture if it can be done natively,
+        or return None if tcpdump should be used instead.
+        :type cli: LinuxCLI
+        :type interface: str
+        :type packet_type: str
+        :type pcap_filter: pcap_rule
+        :type max_size: int
+        :return: PacketSocket
+        """
+        if CAPTURE_ENGINE == CAPTURE_ENGINE_TCPDUMP:
+            return None
+
+        netns_name = cli.name if isinstance(cli, NetNSCLI) else None
+        if type(cli) not in (LinuxCLI, NetNSCLI):
+            reason = 'commands are not run on the local host'
+        elif packet_type != '':
+            reason = 'packet type interpretation needs tcpdump'
+        elif not native_capture_available(netns_name):
+            reason = 'AF_PACKET sockets are not available'
+        else:
+            snaplen = max_size if max_size != 0 else DEFAULT_SNAPLEN
+            try:
+                return PacketSocket(
+                    interface=interface, netns_name=netns_name,
+                    bpf_program=bpf.compile_rule(pcap_filter, snaplen),
+                    snaplen=snaplen).open()
+            except (FilterCompileException, SocketException) as e:
+                reason = e.info
+
+        if CAPTURE_ENGINE == CAPTURE_ENGINE_NATIVE:
+            raise ArgMismatchException(
+                'Cannot capture natively on ' + interface + ': ' + reason)
+        return None
+
+    def start_native_capture(self, packet_socket, count=0, callback=None,
+                             callback_args=None, timeout=None,
+                             blocking=False, save_dump_file=False,
+                             save_dump_filename=None, capture_service=None):
+        """
+        Start reading packets from an open packet socket in a thread (or
+        with the capture service's thread, if given).  The socket is
+        already bound and filtering, so the capture is ready as soon as
+        this returns.
+        :type packet_socket: PacketSocket
+        :type count: int
+        :type callback: callable
+        :type callback_args: list[T]
+        :type timeout: int
+        :type blocking: bool
+        :type save_dump_file: bool
+        :type save_dump_filename: str
+        :type capture_service: CaptureService
+        """
+        self.packet_socket = packet_socket
+        self.capture_service = capture_service
+        if self.data_queue is None:
+            self.data_queue = CaptureBuffer()
+        self.subprocess_info_queue = Queue.Queue()
+
+        self.tcpdump_ready = threading.Event()
+        self.tcpdump_error = threading.Event()
+        self.tcpdump_stop = threading.Event()
+        self.tcpdump_finished = threading.Event()
+        self.tcpdump_ready.set()
+        self.tcpdump_pid = None
+
+        dump_writer = None
+        if save_dump_file is True:
+            dump_writer = PCAPFileWriter(
+                dump_file_name(save_dump_filename),
+                snaplen=packet_socket.snaplen).open()
+
+        capture = NativeCapture(
+            packet_socket=packet_socket,
+            flag_set=(self.tcpdump_ready, self.tcpdump_error,
+                      self.tcpdump_stop, self.tcpdump_finished),
+            count=count, packet_queue=self.data_queue, callback=callback,
+            callback_args=callback_args, dump_writer=dump_writer)
+        if capture_service is not None:
+            # The capture itself stands in for the reader thread
+            self.process = capture
+            capture_service.add(capture)
+        else:
+            self.process = threading.Thread(target=capture.run)
+            self.process.daemon = True
+            self.process.start()
+
+        if blocking is True:
+            self.process.join(timeout)
+            if self.process.is_alive():
+                raise SubprocessTimeoutException('capture failed to receive '
+                                                 'packets within timeout')
+
     def wait_for_packets(self, count=1, timeout=None):
-        ret = []
-        start_time = time.time()
+        """
+        Wait for and return the next count captured packets (or whatever
+        is buffered if count is 0), along with the capture's drop counts.
+        Raises SubprocessTimeoutException if they don't all arrive within
+        timeout seconds (if set).
+        :type count: int
+        :type timeout: float
+        :return: CapturedPackets
+        """
+        return self.wait_for_matching_packets(count=count, timeout=timeout)
 
+    def wait_for_matching_packets(self, predicate=None, count=1,
+                                  timeout=None):
+        """
+        Like wait_for_packets, but only returns captured packets which
+        match the predicate, which is either a callable taking a
+        PCAPPacket and returning a bool, or a pcap Rule.  Packets which
+        don't match are discarded as they are read, and this returns as
+        soon as count packets have matched.  While it waits, packets which
+        don't match are kept out of the capture buffer as they arrive, so
+        they can't fill it up and cause later matches to be dropped.
+        :type predicate: callable | pcap.Rule
+        :type count: int
+        :type timeout: float
+        :return: CapturedPackets
+        """
+        if predicate is None:
+            matches = None
+        elif isinstance(predicate, pcap.Rule):
+            matches = bpf.rule_predicate(predicate)
+        else:
+            matches = predicate
+
+        ret = []
         if count == 0:
             # 0 count means just return waiting buffer, or empty list
             # if nothing is present
             try:
                 while True:
                     item = self.data_queue.get_nowait()
-                    ret.append(item)
+                    if matches is None or matches(item):
+                        ret.append(item)
             except Queue.Empty:
                 pass
-            return ret
+            return self.data_queue.result(ret)
 
-        while len(ret) < count:
-            try:
-                item = self.data_queue.get_nowait()
-            except Queue.Empty:
-                if timeout is not None:
-                    if time.time() > start_time + timeout:
-                        raise SubprocessTimeoutException(
-                            (('Only ' + str(len(ret)) + '/')
-                             if len(ret) != 0 else '0/') +
-                            str(count) + ' packets received within timeout')
-                time.sleep(0)
-            else:
-                ret.append(item)
+        old_matches = None
+        if matches is not None:
+            old_matches = self.data_queue.set_admission_filter(matches)
+        try:
+            deadline = (time.time() + timeout if timeout is not None
+                        else None)
+            while len(ret) < count:
+                try:
+                    if deadline is None:
+                        item = self.data_queue.get()
+                    else:
+                        item = self.data_queue.get(
+                            timeout=max(0, deadline - time.time()))
+                except Queue.Empty:
+                    raise SubprocessTimeoutException(
+                        (('Only ' + str(len(ret)) + '/')
+                         if len(ret) != 0 else '0/') +
+                        str(count) + ' packets received within timeout')
+                # Packets may have been let in before the filter was set
+                if matches is None or matches(item):
+                    ret.append(item)
+        finally:
+            if matches is not None:
+                self.data_queue.set_admission_filter(old_matches)
 
-        return ret
+        return self.data_queue.result(ret)
 
     def stop_capture(self):
         """
@@ -208,11 +425,41 @@ class TCPDump(object):
         if self.process is None:
             return None
 
+        if self.capture_service is not None:
+            self.capture_service.stop(self.process)
+        elif self.packet_socket is not None:
+            self.packet_socket.wakeup()
+
         self.process.join(5)
         ret = self.process
         self.process = None
+
+        if self.forward_thread is not None:
+            self.forward_thread.join(5)
+            self.forward_thread = None
+
+        if self.packet_socket is not None:
+            self.packet_socket.close()
+            self.packet_socket = None
+        self.capture_service = None
         return ret
 
+    @staticmethod
+    def forward_packets(source, dest, process):
+        """
+        Move packets from the tcpdump process' queue to the capture buffer
+        until the process has exited and the queue is empty.
+        :type source: multiprocessing.Queue
+        :type dest: CaptureBuffer
+        :type process: multiprocessing.Process
+        """
+        while True:
+            try:
+                dest.put(source.get(timeout=TCPDUMP_FLAG_CHECK_INTERVAL))
+            except Queue.Empty:
+                if not process.is_alive():
+                    return
+
     @staticmethod
     def read_packet(cli=LinuxCLI(), flag_set=None, interface='any',
                     count=1, packet_type='', pcap_filter=None, max_size=0,
@@ -240,7 +487,9 @@ class TCPDump(object):
             status_queue = Queue.Queue() \
                 if packet_queues is None else packet_queues[1]
 
-            cmd1 = ['tcpdump', '-n', '-xx', '-l']
+            # Have tcpdump write out each packet in pcap format as soon
+            # as it is captured
+            cmd1 = ['tcpdump', '-n', '-U', '-w', '-']
             cmd1 += ['-c', str(count)] \
                 if count > 0 else []
             cmd1 += ['-i', interface]
@@ -254,8 +503,7 @@ class TCPDump(object):
             cmd2 = ['tee', '-a', tmp_dump_filename]
 
             # FLAG STATE: ready[clear], stop[clear], finished[clear]
-            with open(name=tmp_dump_filename, mode='w') as f:
-                f.write("--START--\n")
+            open(tmp_dump_filename, 'wb').close()
 
             tcp_processes = cli.cmd_pipe(commands=[cmd1, cmd2],
                                          blocking=False)
@@ -269,134 +517,77 @@ class TCPDump(object):
             flags_se = fcntl(tcp_actual_process.stderr, F_GETFL)
             fcntl(tcp_actual_process.stderr, F_SETFL, flags_se | os.O_NONBLOCK)
 
+            # tcpdump only prints 'listening on' once the capture is
+            # activated and its filter installed, so the capture is ready
+            # as soon as that line appears
+            stderr_fd = tcp_actual_process.stderr.fileno()
             err_out = ''
             while not tcp_ready.is_set():
+                select.select([stderr_fd], [], [],
+                              TCPDUMP_LISTEN_START_TIMEOUT)
                 try:
-                    line = os.read(tcp_actual_process.stderr.fileno(), 256)
-                    if line.find('listening on') != -1:
-                        # TODO(micucci): Replace sleep after TCPDump s
-                        # starts with a real check # This is dangerous,
-                        # and might not actually be enough to signal the
-                        # tcpdump is actually running.  Instead, let's
-                        # create a Cython module that passes calls through
-                        # to libpcap (there are 0 good libpcap implementations
-                        # for Python that are maintained, documented,
-                        # and simple).
-                        time.sleep(1)
-                        tcp_ready.set()
-                    else:
-                        err_out += line
-                        if tcp_piped_process.poll() is not None:
-                            out, err = tcp_piped_process.communicate()
-                            status_queue.put(
-                                {'error': 'tcpdump exited abnormally',
-                                 'returncode': tcp_piped_process.returncode,
-                                 'stdout': out,
-                                 'stderr': err_out})
-                            tcp_error.set()
-
-                            raise SubprocessFailedException(
-                                'tcpdump exited abnormally with status: ' +
-                                str(tcp_piped_process.returncode) +
-                                ', out: ' + out +
-                                ', err: ' + err +
-                                ', err_out: ' + err_out)
-                        time.sleep(0)
-
+                    line = os.read(stderr_fd, 256)
                 except OSError:
-                    pass
-
-            # FLAG STATE: ready[set], stop[clear], finished[clear]
-            # tcpdump return output format:
-            # hh:mm:ss.tick L3Proto <Proto-specific fields>\n
-            # \t0x<addr>:  FFFF FFFF FFFF FFFF FFFF FFFF FFFF FFFF\n
-            # \t0x<addr>:  FFFF FFFF FFFF FFFF FFFF FFFF FFFF FFFF\n
-            # (eight quads of hexadecimal numbers representing 16
-            # bytes or 4 32-bit words)
-            #
-            # hh:mm:ss.tick L3Proto <Proto-specific fields>\n
-            # \t0x<addr>:  FFFF FFFF FFFF FFFF FFFF FFFF FFFF FFFF\n
-            # \t0x<addr>:  FFFF FFFF FFFF FFFF FFFF FFFF FFFF FFFF\n
-            # (Next packet)
-
-            packet_data = []
-            timestamp = ''
-            with open(tmp_dump_filename, 'r+') as f:
-                # Prepare for the first packet by reading the file
-                # until the first packet's lines arrive (or until
-                # stopped by a stop_capture call)
-                if f.readline().rstrip() != '--START--':
+                    continue
+
+                err_out += line
+                if err_out.find('listening on') != -1:
+                    tcp_ready.set()
+                elif line == '':
+                    # stderr was closed, so tcpdump has exited
+                    out, err = tcp_piped_process.communicate()
                     status_queue.put(
-                        {'error': 'Expected --START-- tag at '
-                                  'beginning of dumpfile',
+                        {'error': 'tcpdump exited abnormally',
                          'returncode': tcp_piped_process.returncode,
-                         'stdout': '',
-                         'stderr': ''})
+                         'stdout': out,
+                         'stderr': err_out})
                     tcp_error.set()
-                    raise ArgMismatchException(
-                        'Expected --START-- tag at beginning of dumpfile')
 
-                while True:
-                    # Read the lines and either append data,
-                    # start a new packet, or finish
-                    line = f.readline()
-                    if line == '':
-                        # EOF
-
-                        # Is the tcpdump process finished or
-                        # signaled to finish?
-                        if tcp_piped_process.poll() is not None \
-                                or tcp_stop.is_set():
-                            # If we finished with packet data buffered up,
-                            # append that packet to the queue
-                            if len(packet_data) > 0:
-                                # Create and parse the packet and push it
-                                # onto the return list, calling
-                                # the callback function if one is set.
-                                packet = PCAPPacket(packet_data, timestamp)
-                                packet_queue.put(packet)
-                                if callback is not None:
-                                    callback(packet,
-                                             *(callback_args
-                                               if callback_args is not None
-                                               else ()))
-
-                            # Stop packet collection and exit
-                            break
-
-                        # Otherwise, we need to wait for data
-                        time.sleep(0)
-
-                    elif line.startswith('\t'):
-                        # Normal packet data: buffer into current packet
-                        packet_data += parse_line_to_byte_array(line)
-                    else:
-                        # We hit the end of the packet and will start
-                        # a new packet Only run if we had packet data
-                        # buffered
-                        if len(packet_data) > 0:
-                            # Create and parse the packet and push it onto
-                            # the return list, calling the callback function
-                            # if one is set.
-                            packet = PCAPPacket(packet_data, timestamp)
-                            packet_queue.put(packet)
-                            if callback is not None:
-                                callback(packet,
-                                         *(callback_args
-                                           if callback_args is not None
-                                           else []))
-                            packet_data = []
-
-                        # Start the new packet by reading the timestamp
-                        timestamp = line.split(' ', 2)[0]
+                    raise SubprocessFailedException(
+                        'tcpdump exited abnormally with status: ' +
+                        str(tcp_piped_process.returncode) +
+                        ', out: ' + out +
+                        ', err: ' + err +
+                        ', err_out: ' + err_out)
+
+            # FLAG STATE: ready[set], stop[clear], finished[clear]
+            # tee copies the pcap stream tcpdump is writing to its stdout
+            # as well as the dump file, so decode each packet from there as
+            # soon as it's complete (or until stopped by a stop_capture
+            # call)
+            stdout_fd = tcp_piped_process.stdout.fileno()
+            flags_so = fcntl(stdout_fd, F_GETFL)
+            fcntl(stdout_fd, F_SETFL, flags_so | os.O_NONBLOCK)
+            stream = PCAPStreamReader(tcp_piped_process.stdout)
+            while True:
+                # Check for the end before reading, so anything tcpdump
+                # wrote before it exited is still picked up
+                finished = (tcp_piped_process.poll() is not None or
+                            tcp_stop.is_set())
+                packet = stream.read_packet()
+                if packet is None:
+                    if finished:
+                        break
+
+                    # Otherwise, we need to wait for data
+                    select.select([stdout_fd], [], [],
+                                  TCPDUMP_FLAG_CHECK_INTERVAL)
+                    continue
+
+                # Push the packet onto the return list, calling the
+                # callback function if one is set.
+                packet_queue.put(packet)
+                if callback is not None:
+                    callback(packet,
+                             *(callback_args
+                               if callback_args is not None
+                               else ()))
         finally:
             # Save the tcpdump output (if requested), and delete the
             # temporary file
             if save_dump_file is True:
-                LinuxCLI().copy_file(
-                    tmp_dump_filename,
-                    save_dump_filename if save_dump_filename is not None
-                    else 'tcp.out.' + str(time.time()))
+                LinuxCLI().copy_file(tmp_dump_filename,
+                                     dump_file_name(save_dump_filename))
             LinuxCLI().rm(tmp_dump_filename)
             tcp_processes.terminate()
 
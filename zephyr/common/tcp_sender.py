@@ -12,12 +12,34 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from zephyr.common.cli import CommandStatus
 from zephyr.common.cli import LinuxCLI
+from zephyr.common.cli import NetNSCLI
 from zephyr.common.exceptions import ArgMismatchException
+from zephyr.common.exceptions import SocketException
 from zephyr.common.exceptions import SubprocessFailedException
+from zephyr.common.packet_capture import native_capture_available
+from zephyr.common.packet_generator import *
 
+import binascii
 import multiprocessing
 
+SEND_ENGINE_AUTO = 'auto'
+SEND_ENGINE_NATIVE = 'native'
+SEND_ENGINE_MZ = 'mz'
+
+# Which backend send_packet uses.  'auto' builds and sends the packets
+# in-process through a raw socket whenever it can (i.e. when running as
+# root with options it knows how to build), and runs mz otherwise.
+SEND_ENGINE = SEND_ENGINE_AUTO
+
+# The mz packet options which can be built natively, by packet type
+NATIVE_PACKET_OPTIONS = {'arp': ('smac', 'tmac', 'sip', 'tip'),
+                         'icmp': ('id', 'seq'),
+                         'tcp': ('flags', 'seq', 'ack', 'win'),
+                         'udp': (),
+                         'ip': ('len', 'proto', 'ttl', 'tos', 'id')}
+
 
 def send_packet(tcp_event, **kwargs):
     TCPSender.send_packet(tcp_ready=tcp_event, **kwargs)
@@ -65,6 +87,9 @@ class TCPSender(object):
                     dest_mac=None, packet_options=None, count=None,
                     delay=None, byte_data=None, payload=None, timeout=None):
         """
+        Send [count] packets, built as mz would build them from the
+        given options.  They are sent from this process when possible
+        (see SEND_ENGINE), and with mz otherwise.
         :type cli: LinuxCLI
         :type tcp_ready: multiprocessing.Event
         :type interface: str
@@ -77,12 +102,36 @@ class TCPSender(object):
         :type dest_mac: str|None
         :type packet_options: dict[str, str]|None
         :type count: int|None
-        :type delay: int|None
+        :type delay: int|None Microseconds between packets, as for mz
         :type byte_data: str|None
         :type payload: str|None
         :type timeout: int|None
         :return: CommandStatus
         """
+        # Options are consumed as they are turned into mz arguments, so
+        # work on a copy rather than the caller's map
+        packet_options = (dict(packet_options)
+                          if packet_options is not None else {})
+
+        if packet_type is None and byte_data is None:
+            raise ArgMismatchException(
+                'The "byte_data" parameter is required if "packet_type" '
+                'is not present')
+        if (packet_type in ('arp', 'icmp') and
+                'command' not in packet_options):
+            raise ArgMismatchException('arp and icmp packets need a '
+                                       'command or type')
+
+        out = TCPSender.send_native(
+            cli, interface=interface, packet_type=packet_type,
+            source_port=source_port, dest_port=dest_port,
+            source_ip=source_ip, dest_ip=dest_ip, source_mac=source_mac,
+            dest_mac=dest_mac, packet_options=packet_options, count=count,
+            delay=delay, byte_data=byte_data, payload=payload)
+        if out is not None:
+            if tcp_ready is not None:
+                tcp_ready.set()
+            return out
 
         count_str = '-c %(c)d' % {'c': count} \
             if count is not None else ''
@@ -94,10 +143,6 @@ class TCPSender(object):
 
         # Bytes-only mode, only -a, -b, -c, and -p are supported by mz
         if packet_type is None:
-            if byte_data is None:
-                raise ArgMismatchException(
-                    'The "byte_data" parameter is required if "packet_type" '
-                    'is not present')
             full_cmd_str = 'mz %(iface)s %(arglist)s "%(bytes)s"' % \
                            {'iface': interface,
                             'arglist': arg_str,
@@ -122,17 +167,13 @@ class TCPSender(object):
         pkt_bldr_arg_str = ' '.join((src_ip_str, dest_ip_str, delay_str,
                                      payload_str))
 
-        if packet_type is 'arp' or packet_type is 'icmp':
-            if 'command' not in packet_options:
-                raise ArgMismatchException('arp and icmp packets need a '
-                                           'command or type')
+        if packet_type == 'arp' or packet_type == 'icmp':
             cmd_opt = packet_options.pop('command')
             opt_list = ', '.join(
                 '%(k)s=%(v)s' % {'k': k, 'v': v}
-                for k, v in packet_options.iteritems()) \
-                if packet_options is not None else ''
+                for k, v in packet_options.iteritems())
             cmd_str = cmd_opt + (', ' + opt_list if opt_list != '' else '')
-        elif packet_type is 'tcp' or packet_type is 'udp':
+        elif packet_type == 'tcp' or packet_type == 'udp':
             source_port_str = 'sp=%(sp)d' % {'sp': source_port} \
                 if source_port is not None else ''
             dest_port_str = 'dp=%(dp)d' % {'dp': dest_port} \
@@ -141,8 +182,7 @@ class TCPSender(object):
         else:
             cmd_str = ', '.join(
                 '%(k)s=%(v)s' % {'k': k, 'v': v}
-                for k, v in packet_options.iteritems()) \
-                if packet_options is not None else ''
+                for k, v in packet_options.iteritems())
 
         full_cmd_str = \
             ('mz %(iface)s %(arglist)s %(extra_args)s %(pkttype)s "%(cmd)s"' %
@@ -158,3 +198,145 @@ class TCPSender(object):
             tcp_ready.set()
         cli.log_cmd = prev
         return out
+
+    @staticmethod
+    def send_native(cli, interface, packet_type, source_port, dest_port,
+                    source_ip, dest_ip, source_mac, dest_mac, packet_options,
+                    count, delay, byte_data, payload):
+        """
+        Build and send the packets in-process if it can be done natively,
+        or return None if mz should be used instead.
+        :return: CommandStatus
+        """
+        if SEND_ENGINE == SEND_ENGINE_MZ:
+            return None
+
+        netns_name = cli.name if isinstance(cli, NetNSCLI) else None
+        options = dict(packet_options)
+        command = options.pop('command', None)
+        if type(cli) not in (LinuxCLI, NetNSCLI) or cli.debug:
+            reason = 'commands are not run on the local host'
+        elif packet_type is not None and (
+                packet_type not in NATIVE_PACKET_OPTIONS or
+                any(k not in NATIVE_PACKET_OPTIONS[packet_type]
+                    for k in options)):
+            reason = ('cannot build ' + str(packet_type) +
+                      ' packets with options: ' + str(packet_options))
+        elif count == 0:
+            reason = 'sending until stopped needs mz'
+        elif interface == 'any':
+            reason = 'an interface is needed to send on'
+        elif not native_capture_available(netns_name):
+            reason = 'raw sockets are not available'
+        else:
+            # IP packets without set MAC addresses are sent through the
+            # kernel's routing, so it resolves the next hop
+            link_layer = (packet_type in (None, 'arp') or
+                          source_mac is not None or dest_mac is not None)
+            sender = PacketSender(interface, netns_name=netns_name,
+                                  link_layer=link_layer)
+            try:
+                with sender:
+                    packet = TCPSender.build_native_packet(
+                        sender, packet_type, source_port, dest_port,
+                        source_ip, dest_ip, source_mac, dest_mac, command,
+                        options, byte_data, payload)
+                    sender.send(packet,
+                                count=count if count is not None else 1,
+                                interval=(delay / 1000000.0
+                                          if delay is not None else 0))
+                return CommandStatus(
+                    command='native send of ' + str(packet_type) +
+                            ' packet on ' + interface)
+            except (ArgMismatchException, SocketException) as e:
+                reason = e.info
+
+        if SEND_ENGINE == SEND_ENGINE_NATIVE:
+            raise ArgMismatchException(
+                'Cannot send natively on ' + interface + ': ' + reason)
+        return None
+
+    @staticmethod
+    def build_native_packet(sender, packet_type, source_port, dest_port,
+                            source_ip, dest_ip, source_mac, dest_mac,
+                            command, options, byte_data, payload):
+        """
+        Build the packet mz would send for the given options, using the
+        sender's interface addresses as the defaults for its source.
+        Raises ArgMismatchException for options which can't be built.
+        :type sender: PacketSender
+        :return: str
+        """
+        if packet_type is None:
+            try:
+                data = binascii.unhexlify(''.join(
+                    c for c in byte_data if c not in ': -'))
+            except TypeError:
+                raise ArgMismatchException(
+                    'Invalid byte data: ' + str(byte_data))
+            # With MAC addresses given, mz adds them in front of the bytes
+            if source_mac is not None or dest_mac is not None:
+                data = (mac_to_bytes(dest_mac or MAC_BROADCAST) +
+                        mac_to_bytes(source_mac or sender.mac) + data)
+            return data
+
+        ethernet = GenEthernet(dest_mac=dest_mac or MAC_BROADCAST,
+                               source_mac=source_mac or sender.mac)
+
+        if packet_type == 'arp':
+            if command not in ('request', 'reply'):
+                raise ArgMismatchException(
+                    'Unknown arp command: ' + str(command))
+            request = command == 'request'
+            arp = GenARP(
+                operation=(ARP_PROTOCOL_OPERATION_REQUEST if request
+                           else ARP_PROTOCOL_OPERATION_REPLY),
+                sender_mac=options.get('smac', sender.mac),
+                sender_ip=options.get('sip', source_ip or sender.ip),
+                target_mac=options.get('tmac',
+                                       MAC_ZERO if request
+                                       else MAC_BROADCAST),
+                target_ip=options.get('tip', dest_ip))
+            if not request and dest_mac is None and 'tmac' in options:
+                ethernet.dest_mac = options['tmac']
+            return build_packet([ethernet, arp])
+
+        ip = GenIP4(source_ip=source_ip or sender.ip, dest_ip=dest_ip)
+        data = payload if payload is not None else ''
+        if packet_type == 'icmp':
+            if command != 'ping':
+                raise ArgMismatchException(
+                    'Unknown icmp command: ' + str(command))
+            layers = [ip, GenICMP(id=int(options.get('id', 0)),
+                                  seq=int(options.get('seq', 0)))]
+        elif packet_type == 'tcp':
+            flags = 0
+            for flag in options.get('flags', 'syn').split('|'):
+                flag_value = TCP_FLAGS.get(flag.strip().lower(), None)
+                if flag_value is None:
+                    raise ArgMismatchException(
+                        'Unknown TCP flag: ' + flag)
+                flags |= flag_value
+            layers = [ip, GenTCP(source_port=source_port or 0,
+                                 dest_port=dest_port or 0,
+                                 seq=int(options.get('seq', 0)),
+                                 ack=int(options.get('ack', 0)),
+                                 flags=flags,
+                                 window_size=int(options.get('win',
+                                                             65535)))]
+        elif packet_type == 'udp':
+            layers = [ip, GenUDP(source_port=source_port or 0,
+                                 dest_port=dest_port or 0)]
+        else:
+            ip.protocol = int(options.get('proto', 0))
+            ip.ttl = int(options.get('ttl', ip.ttl))
+            ip.tos = int(options.get('tos', 0))
+            ip.id = int(options.get('id', 0))
+            if 'len' in options:
+                # mz pads the payload out to the requested total length
+                data = data.ljust(int(options['len']) - 20, '\0')
+            layers = [ip]
+
+        if sender.link_layer:
+            layers.insert(0, ethernet)
+        return build_packet(layers, data)
@@ -0,0 +1,654 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import heapq
+import math
+import random
+import select
+import socket
+import struct
+import threading
+import time
+
+from zephyr.common.exceptions import *
+from zephyr.common import netns
+from zephyr.common.zephyr_constants import DEFAULT_TRAFFIC_PORT
+
+# Every generated message starts with this header: a magic number, the
+# whole message's length, the flow ID, the sequence number within the
+# flow, and the time it was sent (seconds since the epoch).
+TRAFFIC_MAGIC = 0x5a545247
+TRAFFIC_HEADER = struct.Struct('!IIIQd')
+
+MAX_UDP_MESSAGE = 65507
+SINK_POLL_INTERVAL = 0.1
+SINK_RECV_SIZE = 65536
+
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_values, pct):
+    """
+    Returns the nearest-rank percentile of an already sorted list, or
+    None if it is empty.
+    :type sorted_values: list[float]
+    :type pct: float
+    :return: float
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, int(math.ceil(pct * len(sorted_values) / 100.0)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _open_socket(netns_name, open_fn):
+    if netns_name is None:
+        return open_fn()
+    with netns.in_netns(netns_name):
+        return open_fn()
+
+
+class FlowSpec(object):
+    def __init__(self, dest_ip, dest_port=DEFAULT_TRAFFIC_PORT,
+                 dest_port_count=1, protocol='udp', source_port=0,
+                 size=64, rate_pps=None, rate_bps=None, duration=None,
+                 count=None, flow_id=None):
+        """
+        A flow of messages to send to a TrafficSink.  Messages go
+        round-robin to the dest_port_count ports starting at dest_port
+        (one connection per port for TCP), from the given source port
+        (or an ephemeral one if 0).  The message size is either fixed or
+        a (min, max) range to pick each size from.  The flow is sent at
+        rate_pps messages or rate_bps bits (of message data) per second,
+        or as fast as possible if neither is given, until either count
+        messages have been sent or the duration (in seconds) has passed.
+        :type dest_ip: str
+        :type dest_port: int
+        :type dest_port_count: int
+        :type protocol: str
+        :type source_port: int
+        :type size: int | (int, int)
+        :type rate_pps: float
+        :type rate_bps: float
+        :type duration: float
+        :type count: int
+        :type flow_id: int
+        """
+        if protocol not in ('udp', 'tcp'):
+            raise ArgMismatchException(
+                'Unsupported traffic protocol: ' + str(protocol))
+        if duration is None and count is None:
+            raise ArgMismatchException(
+                'A flow needs a duration or a message count')
+        if rate_pps is not None and rate_bps is not None:
+            raise ArgMismatchException(
+                'Only one of rate_pps and rate_bps can be set')
+
+        self.dest_ip = dest_ip
+        self.dest_port = dest_port
+        self.dest_port_count = dest_port_count
+        self.protocol = protocol
+        self.source_port = source_port
+        self.min_size, self.max_size = (size if isinstance(size, tuple)
+                                        else (size, size))
+        if self.min_size < TRAFFIC_HEADER.size:
+            raise ArgMismatchException(
+                'Messages must be at least ' + str(TRAFFIC_HEADER.size) +
+                ' bytes')
+        if protocol == 'udp' and self.max_size > MAX_UDP_MESSAGE:
+            raise ArgMismatchException(
+                'UDP messages can be at most ' + str(MAX_UDP_MESSAGE) +
+                ' bytes')
+        self.rate_pps = rate_pps
+        self.rate_bps = rate_bps
+        self.duration = duration
+        self.count = count
+        self.flow_id = flow_id
+
+    def dest_ports(self):
+        """
+        :return: list[int]
+        """
+        return range(self.dest_port, self.dest_port + self.dest_port_count)
+
+    def next_size(self):
+        """
+        :return: int
+        """
+        if self.min_size == self.max_size:
+            return self.min_size
+        return random.randint(self.min_size, self.max_size)
+
+    def interval(self, size):
+        """
+        Returns the time to wait after sending a message of the given
+        size to keep to the flow's rate.
+        :type size: int
+        :return: float
+        """
+        if self.rate_pps:
+            return 1.0 / self.rate_pps
+        if self.rate_bps:
+            return size * 8.0 / self.rate_bps
+        return 0
+
+    def to_str(self):
+        return (self.protocol + ' flow[' + str(self.flow_id) + '] to ' +
+                self.dest_ip + ':' + str(self.dest_port) +
+                ('-' + str(self.dest_port + self.dest_port_count - 1)
+                 if self.dest_port_count > 1 else ''))
+
+
+class FlowSendStats(object):
+    def __init__(self, flow):
+        """
+        :type flow: FlowSpec
+        """
+        self.flow = flow
+        self.packets = 0
+        self.bytes = 0
+        self.start_time = None
+        self.end_time = None
+        self.errors = 0
+
+
+class _FlowSender(object):
+    def __init__(self, flow, netns_name):
+        self.flow = flow
+        self.stats = FlowSendStats(flow)
+        self.ports = flow.dest_ports()
+        self.socks = []
+        """ :type: list[socket.socket]"""
+        self.deadline = None
+        self.padding = '\0' * flow.max_size
+
+        def open_udp():
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            if flow.source_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind(('', flow.source_port))
+            return sock
+
+        def open_tcp(port):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if flow.source_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind(('', flow.source_port))
+            sock.connect((flow.dest_ip, port))
+            return sock
+
+        try:
+            if flow.protocol == 'udp':
+                self.socks.append(_open_socket(netns_name, open_udp))
+            else:
+                for port in self.ports:
+                    self.socks.append(
+                        _open_socket(netns_name, lambda: open_tcp(port)))
+        except socket.error as e:
+            self.close()
+            raise SocketException('Failed to open ' + flow.to_str() +
+                                  ': ' + str(e))
+
+    def done(self, now):
+        return ((self.flow.count is not None and
+                 self.stats.packets >= self.flow.count) or
+                (self.deadline is not None and now >= self.deadline))
+
+    def send(self, now):
+        """
+        Send the flow's next message and return when the one after it
+        is due.
+        """
+        seq = self.stats.packets
+        size = self.flow.next_size()
+        message = TRAFFIC_HEADER.pack(
+            TRAFFIC_MAGIC, size, self.flow.flow_id, seq,
+            time.time()) + self.padding[:size - TRAFFIC_HEADER.size]
+        index = seq % len(self.ports)
+        try:
+            if self.flow.protocol == 'udp':
+                self.socks[0].sendto(message,
+                                     (self.flow.dest_ip, self.ports[index]))
+            else:
+                self.socks[index].sendall(message)
+        except socket.error:
+            # Count the message as sent (and so lost), as a datapath
+            # dropping it would
+            self.stats.errors += 1
+        self.stats.packets += 1
+        self.stats.bytes += size
+        return now + self.flow.interval(size)
+
+    def close(self):
+        for sock in self.socks:
+            sock.close()
+        self.socks = []
+
+
+class TrafficGenerator(object):
+    def __init__(self, flows, netns_name=None):
+        """
+        Sends any number of flows concurrently from a single thread, each
+        paced to its own rate.  Sockets are opened in the given network
+        namespace (e.g. a VM's), so the traffic leaves through that
+        namespace's interfaces and routes.
+        :type flows: list[FlowSpec]
+        :type netns_name: str
+        """
+        self.flows = flows
+        self.netns_name = netns_name
+        for i, flow in enumerate(flows):
+            if flow.flow_id is None:
+                flow.flow_id = i
+
+    def run(self):
+        """
+        Send all flows to completion and return what was sent.
+        :return: list[FlowSendStats]
+        """
+        senders = []
+        try:
+            for flow in self.flows:
+                senders.append(_FlowSender(flow, self.netns_name))
+
+            start = time.time()
+            schedule = []
+            for i, sender in enumerate(senders):
+                sender.stats.start_time = start
+                if sender.flow.duration is not None:
+                    sender.deadline = start + sender.flow.duration
+                schedule.append((start, i))
+            heapq.heapify(schedule)
+
+            while schedule:
+                due, i = heapq.heappop(schedule)
+                now = time.time()
+                if due > now:
+                    time.sleep(due - now)
+                    now = due
+                sender = senders[i]
+                if sender.done(now):
+                    sender.stats.end_time = now
+                    continue
+                # Keep to the schedule rather than to the actual send
+                # times, so short sleeps don't lower the rate
+                heapq.heappush(schedule, (sender.send(due), i))
+        finally:
+            for sender in senders:
+                sender.close()
+        return [sender.stats for sender in senders]
+
+
+class FlowReceiveStats(object):
+    def __init__(self, flow_id):
+        """
+        What a sink received of one flow.  Latencies are one-way, and so
+        only meaningful when the sender and sink share a clock (e.g. VMs
+        in network namespaces on the same machine).
+        :type flow_id: int
+        """
+        self.flow_id = flow_id
+        self.packets = 0
+        self.bytes = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.max_seq = -1
+        self.first_time = None
+        self.last_time = None
+        self.latencies = []
+        """ :type: list[float]"""
+        self.seen = bytearray()
+
+    def update(self, seq, size, sent_time, now):
+        if seq < len(self.seen) and self.seen[seq]:
+            self.duplicates += 1
+            return
+        if seq >= len(self.seen):
+            self.seen.extend('\0' * max(seq + 1 - len(self.seen),
+                                        len(self.seen)))
+        self.seen[seq] = 1
+        if seq < self.max_seq:
+            self.reordered += 1
+        else:
+            self.max_seq = seq
+        if self.first_time is None:
+            self.first_time = now
+        self.last_time = now
+        self.packets += 1
+        self.bytes += size
+        self.latencies.append(now - sent_time)
+
+
+class TrafficSink(object):
+    def __init__(self, port=DEFAULT_TRAFFIC_PORT, port_count=1,
+                 protocol='udp', ip_addr='', netns_name=None):
+        """
+        Receives generated traffic on port_count ports starting at port,
+        in the given network namespace, and keeps per-flow counts from a
+        single epoll thread.
+        :type port: int
+        :type port_count: int
+        :type protocol: str
+        :type ip_addr: str
+        :type netns_name: str
+        """
+        if protocol not in ('udp', 'tcp'):
+            raise ArgMismatchException(
+                'Unsupported traffic protocol: ' + str(protocol))
+        self.port = port
+        self.port_count = port_count
+        self.protocol = protocol
+        self.ip_addr = ip_addr
+        self.netns_name = netns_name
+        self.lock = threading.Lock()
+        self.flows = {}
+        """ :type: dict[int, FlowReceiveStats]"""
+        self.bad_messages = 0
+        self.listeners = {}
+        """ :type: dict[int, socket.socket]"""
+        self.conns = {}
+        """ :type: dict[int, (socket.socket, str)]"""
+        self.stop_event = threading.Event()
+        self.thread = None
+        """ :type: threading.Thread"""
+
+    def start(self):
+        """
+        :return: TrafficSink
+        """
+        def open_listener(port):
+            if self.protocol == 'udp':
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                4 * 1024 * 1024)
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((self.ip_addr, port))
+            if self.protocol == 'tcp':
+                sock.listen(16)
+            sock.setblocking(0)
+            return sock
+
+        try:
+            for port in xrange(self.port, self.port + self.port_count):
+                sock = _open_socket(self.netns_name,
+                                    lambda: open_listener(port))
+                self.listeners[sock.fileno()] = sock
+        except socket.error as e:
+            self.close()
+            raise SocketException(
+                'Failed to start traffic sink on port ' + str(self.port) +
+                ': ' + str(e))
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self.run, name='traffic-sink-' + str(self.port))
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def run(self):
+        epoll = select.epoll()
+        try:
+            for fd in self.listeners:
+                epoll.register(fd, select.EPOLLIN)
+            while not self.stop_event.is_set():
+                try:
+                    events = epoll.poll(SINK_POLL_INTERVAL)
+                except IOError as e:
+                    if e.errno != errno.EINTR:
+                        raise
+                    continue
+                for fd, _ in events:
+                    if fd in self.listeners:
+                        if self.protocol == 'udp':
+                            self.read_datagrams(self.listeners[fd])
+                        else:
+                            self.accept(epoll, self.listeners[fd])
+                    elif fd in self.conns:
+                        self.read_stream(epoll, fd)
+        finally:
+            epoll.close()
+            self.close()
+
+    def read_datagrams(self, sock):
+        while True:
+            try:
+                data = sock.recv(SINK_RECV_SIZE)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            self.record(data, time.time())
+
+    def accept(self, epoll, listener):
+        try:
+            conn, _ = listener.accept()
+        except socket.error:
+            return
+        conn.setblocking(0)
+        self.conns[conn.fileno()] = (conn, '')
+        epoll.register(conn.fileno(), select.EPOLLIN)
+
+    def read_stream(self, epoll, fd):
+        conn, buf = self.conns[fd]
+        try:
+            data = conn.recv(SINK_RECV_SIZE)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = ''
+        if not data:
+            epoll.unregister(fd)
+            conn.close()
+            del self.conns[fd]
+            return
+
+        now = time.time()
+        buf += data
+        pos = 0
+        while len(buf) - pos >= TRAFFIC_HEADER.size:
+            length = TRAFFIC_HEADER.unpack_from(buf, pos)[1]
+            if length < TRAFFIC_HEADER.size:
+                # Lost the message framing; nothing more can be read
+                self.bad_messages += 1
+                buf = ''
+                pos = 0
+                break
+            if len(buf) - pos < length:
+                break
+            self.record(buffer(buf, pos, length), now)
+            pos += length
+        self.conns[fd] = (conn, buf[pos:])
+
+    def record(self, message, now):
+        if len(message) < TRAFFIC_HEADER.size:
+            self.bad_messages += 1
+            return
+        magic, size, flow_id, seq, sent_time = \
+            TRAFFIC_HEADER.unpack_from(message)
+        if magic != TRAFFIC_MAGIC or size != len(message):
+            self.bad_messages += 1
+            return
+        with self.lock:
+            stats = self.flows.get(flow_id, None)
+            if stats is None:
+                stats = self.flows[flow_id] = FlowReceiveStats(flow_id)
+            stats.update(seq, size, sent_time, now)
+
+    def stats(self, reset=False):
+        """
+        Returns the per-flow counts so far, optionally starting new ones
+        (e.g. before reusing flow IDs in another run).
+        :type reset: bool
+        :return: dict[int, FlowReceiveStats]
+        """
+        with self.lock:
+            flows = self.flows
+            if reset:
+                self.flows = {}
+                self.bad_messages = 0
+            return dict(flows)
+
+    def stop(self, timeout=5):
+        """
+        Stop receiving and return the per-flow counts.
+        :type timeout: float
+        :return: dict[int, FlowReceiveStats]
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        return self.stats()
+
+    def close(self):
+        for conn, _ in self.conns.itervalues():
+            conn.close()
+        for sock in self.listeners.itervalues():
+            sock.close()
+        self.conns = {}
+        self.listeners = {}
+
+
+class FlowReport(object):
+    def __init__(self, sent, received=None):
+        """
+        Compares what was sent of a flow against what a sink received of
+        it.  Throughput is over the time the sink was receiving the flow.
+        :type sent: FlowSendStats
+        :type received: FlowReceiveStats
+        """
+        self.flow = sent.flow
+        self.flow_id = sent.flow.flow_id
+        self.sent_packets = sent.packets
+        self.sent_bytes = sent.bytes
+        self.send_errors = sent.errors
+        self.send_duration = ((sent.end_time - sent.start_time)
+                              if sent.end_time is not None else 0)
+        if received is None:
+            received = FlowReceiveStats(self.flow_id)
+        self.received_packets = received.packets
+        self.received_bytes = received.bytes
+        self.duplicate_packets = received.duplicates
+        self.reordered_packets = received.reordered
+        self.lost_packets = max(0, self.sent_packets - self.received_packets)
+        self.loss_ratio = (float(self.lost_packets) / self.sent_packets
+                           if self.sent_packets else 0.0)
+
+        duration = ((received.last_time - received.first_time)
+                    if received.packets > 1 else self.send_duration)
+        self.throughput_pps = (self.received_packets / duration
+                               if duration > 0 else 0.0)
+        self.throughput_bps = (self.received_bytes * 8 / duration
+                               if duration > 0 else 0.0)
+
+        latencies = sorted(received.latencies)
+        self.latency_min = latencies[0] if latencies else None
+        self.latency_max = latencies[-1] if latencies else None
+        self.latency_mean = (sum(latencies) / len(latencies)
+                             if latencies else None)
+        self.latency = {p: percentile(latencies, p)
+                        for p in LATENCY_PERCENTILES}
+        """ :type: dict[int, float]"""
+
+    def to_dict(self):
+        """
+        :return: dict[str, any]
+        """
+        return {'flow_id': self.flow_id,
+                'protocol': self.flow.protocol,
+                'dest_ip': self.flow.dest_ip,
+                'dest_port': self.flow.dest_port,
+                'sent_packets': self.sent_packets,
+                'sent_bytes': self.sent_bytes,
+                'send_errors': self.send_errors,
+                'received_packets': self.received_packets,
+                'received_bytes': self.received_bytes,
+                'lost_packets': self.lost_packets,
+                'loss_ratio': self.loss_ratio,
+                'duplicate_packets': self.duplicate_packets,
+                'reordered_packets': self.reordered_packets,
+                'throughput_pps': self.throughput_pps,
+                'throughput_bps': self.throughput_bps,
+                'latency_min': self.latency_min,
+                'latency_mean': self.latency_mean,
+                'latency_max': self.latency_max,
+                'latency': dict(self.latency)}
+
+    def to_str(self):
+        return (self.flow.to_str() + ': sent[' + str(self.sent_packets) +
+                '] received[' + str(self.received_packets) + '] lost[' +
+                str(self.lost_packets) + '] reordered[' +
+                str(self.reordered_packets) + '] pps[' +
+                '%.1f' % self.throughput_pps + '] bps[' +
+                '%.1f' % self.throughput_bps + '] latency_p50[' +
+                str(self.latency[50]) + '] latency_p99[' +
+                str(self.latency[99]) + ']')
+
+
+class TrafficReport(object):
+    def __init__(self, sent, received=None):
+        """
+        The per-flow and overall results of a traffic run.
+        :type sent: list[FlowSendStats]
+        :type received: dict[int, FlowReceiveStats]
+        """
+        received = received if received is not None else {}
+        self.flows = [FlowReport(s, received.get(s.flow.flow_id, None))
+                      for s in sent]
+        """ :type: list[FlowReport]"""
+
+    def flow(self, flow_id):
+        """
+        :type flow_id: int
+        :return: FlowReport
+        """
+        for f in self.flows:
+            if f.flow_id == flow_id:
+                return f
+        raise ObjectNotFoundException('No such flow in report: ' +
+                                      str(flow_id))
+
+    def sent_packets(self):
+        return sum(f.sent_packets for f in self.flows)
+
+    def received_packets(self):
+        return sum(f.received_packets for f in self.flows)
+
+    def lost_packets(self):
+        return sum(f.lost_packets for f in self.flows)
+
+    def loss_ratio(self):
+        sent = self.sent_packets()
+        return float(self.lost_packets()) / sent if sent else 0.0
+
+    def throughput_bps(self):
+        return sum(f.throughput_bps for f in self.flows)
+
+    def to_dict(self):
+        """
+        :return: dict[str, any]
+        """
+        return {'sent_packets': self.sent_packets(),
+                'received_packets': self.received_packets(),
+                'lost_packets': self.lost_packets(),
+                'loss_ratio': self.loss_ratio(),
+                'throughput_bps': self.throughput_bps(),
+                'flows': [f.to_dict() for f in self.flows]}
+
+    def to_str(self):
+        return '\n'.join(f.to_str() for f in self.flows)
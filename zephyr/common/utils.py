@@ -12,11 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent import futures
 import importlib
 import json
 import os
 import pycurl
 from StringIO import StringIO
+import sys
 import unittest
 
 import xmlrunner
@@ -89,6 +91,35 @@ def curl_delete(url):
     return body
 
 
+def run_concurrently(funcs, max_threads=None):
+    """
+    Call each of the functions on a pool of up to max_threads threads (by
+    default, one per function), and wait for them all.  Returns the
+    functions' futures, all done, in the order the functions were given.
+    Each future's result() returns its function's result, or raises what
+    it raised.
+    :type funcs: list[callable]
+    :type max_threads: int
+    :rtype: list[futures.Future]
+    """
+    if not funcs:
+        return []
+    with futures.ThreadPoolExecutor(
+            max_workers=max_threads or len(funcs)) as executor:
+        return [executor.submit(func) for func in funcs]
+
+
+def reraise(exc_info):
+    """
+    Raise an exception caught elsewhere with its original traceback.
+    :type exc_info: tuple
+    """
+    if sys.version_info[0] >= 3:
+        raise exc_info[1].with_traceback(exc_info[2])
+    # Python 2's three argument raise is a syntax error for Python 3
+    exec('raise exc_info[0], exc_info[1], exc_info[2]')
+
+
 def run_unit_test(test_case_name):
     suite = unittest.TestLoader().loadTestsFromTestCase(test_case_name)
     xml_output = False
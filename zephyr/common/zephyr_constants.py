@@ -44,3 +44,4 @@ class ZephyrInit(object):
 
 
 DEFAULT_ECHO_PORT = 5080
+DEFAULT_TRAFFIC_PORT = 5090
@@ -0,0 +1,205 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import struct
+import time
+import unittest
+
+from zephyr.common import bpf
+from zephyr.common.packet_capture import native_capture_available
+from zephyr.common.packet_capture import PacketSocket
+from zephyr.common import pcap
+from zephyr.common.pcap_packet import PCAPPacket
+from zephyr.common.utils import run_unit_test
+
+
+def send_and_capture(pcap_filter, sends):
+    """
+    Sends UDP datagrams over loopback and returns the (source port,
+    dest port, payload length) of each one the compiled filter let
+    through.
+    :type pcap_filter: pcap.Rule
+    :type sends: list[(int, int, int)]
+    :return: list[(int, int, int)]
+    """
+    ps = PacketSocket(interface='lo',
+                      bpf_program=bpf.compile_rule(pcap_filter)).open()
+    try:
+        for sport, dport, size in sends:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind(('127.0.0.1', sport))
+            s.sendto('x' * size, ('127.0.0.1', dport))
+            s.close()
+
+        frames = []
+        deadline = time.time() + 0.5
+        while time.time() < deadline:
+            frames += ps.read(0.05)
+    finally:
+        ps.close()
+
+    ret = []
+    for data, _, _ in frames:
+        packet = PCAPPacket(data, '')
+        ret.append((packet['udp'].source_port, packet['udp'].dest_port,
+                    packet['udp'].length - 8))
+    return ret
+
+
+def frame(ether_type, payload, ihl=5, proto=17, frag=0, sport=6015,
+          dport=6055, src='10.0.0.1', dst='10.0.0.2'):
+    """
+    Builds an Ethernet frame carrying an IPv4 (or other) packet.
+    :return: str
+    """
+    ether = ('\x02\x00\x00\x00\x00\x02\x02\x00\x00\x00\x00\x01' +
+             struct.pack('!H', ether_type))
+    if ether_type != 0x0800:
+        return ether + payload
+    ports = struct.pack('!HH', sport, dport)
+    ip = struct.pack('!BBHHHBBH4s4s', 0x40 | ihl, 0, 0, 0, frag, 64, proto,
+                     0, socket.inet_aton(src), socket.inet_aton(dst))
+    return ether + ip + '\0' * ((ihl - 5) * 4) + ports + payload
+
+
+class BPFTest(unittest.TestCase):
+    def test_compile_accept_all(self):
+        self.assertEqual([(bpf.BPF_RET | bpf.BPF_K, 0, 0, 1500),
+                          (bpf.BPF_RET | bpf.BPF_K, 0, 0, 0)],
+                         [i for i in bpf.compile_rule(None, 1500)
+                          if i[0] == bpf.BPF_RET | bpf.BPF_K])
+        self.assertEqual(bpf.compile_rule(None),
+                         bpf.compile_rule(pcap.Null()))
+
+    def test_compile_jump_offsets(self):
+        program = bpf.compile_rule(pcap.Or([pcap.Host('10.0.0.1'),
+                                            pcap.Port(80, proto='tcp')]))
+        for i, (code, jt, jf, k) in enumerate(program):
+            if code & 0x07 == bpf.BPF_JMP:
+                # All jumps are forward and stay inside the program
+                self.assertTrue(i + 1 + max(jt, jf) < len(program))
+
+    def test_compile_unsupported(self):
+        self.assertRaises(bpf.FilterCompileException,
+                          bpf.compile_rule, pcap.Simple('tcp[13] & 2 != 0'))
+        self.assertRaises(bpf.FilterCompileException,
+                          bpf.compile_rule,
+                          pcap.Equal('ip[2:2]', 1500))
+        self.assertRaises(bpf.FilterCompileException,
+                          bpf.compile_rule, pcap.EtherProto('stp'))
+        self.assertRaises(bpf.FilterCompileException,
+                          bpf.compile_rule, pcap.Broadcast(proto='ip'))
+        self.assertRaises(bpf.FilterCompileException,
+                          bpf.compile_rule,
+                          pcap.Port(80, proto='icmp'))
+
+    def test_python_predicate_matches_bpf(self):
+        frames = [frame(0x0800, 'x' * 10),
+                  frame(0x0800, 'x' * 200, ihl=7, dport=80),
+                  frame(0x0800, '', proto=6, sport=80, src='10.1.2.3'),
+                  frame(0x0800, 'x', frag=3, dst='224.0.0.1'),
+                  frame(0x0806, '\0' * 14 + socket.inet_aton('10.0.0.1')),
+                  frame(0x86dd, 'x' * 40),
+                  # Truncated frames
+                  frame(0x0800, '')[:30],
+                  frame(0x0800, '', ihl=15)]
+        rules = [None,
+                 pcap.Port(6055),
+                 pcap.Port(80, proto='tcp', source=True),
+                 pcap.PortRange(6000, 6100, dest=True),
+                 pcap.Host('10.0.0.1'),
+                 pcap.Net('10.1.0.0/16', source=True),
+                 pcap.Multicast(proto='ip'),
+                 pcap.EtherProto('ip6'),
+                 pcap.Or([pcap.TCPProto(), pcap.Not(pcap.UDPProto())]),
+                 pcap.And([pcap.IPProto('udp'),
+                           pcap.GreaterThanEqual('len', 60)])]
+        for rule in rules:
+            program = bpf.compile_rule(rule)
+            matches = bpf.compile_frame_predicate(rule)
+            for data in frames:
+                self.assertEqual(bpf.run_filter(program, data) > 0,
+                                 matches(data),
+                                 (rule.to_str() if rule else '') + ': ' +
+                                 repr(data))
+
+        matches = bpf.rule_predicate(pcap.Port(6055))
+        self.assertTrue(matches(PCAPPacket(frames[0], '')))
+        self.assertFalse(matches(PCAPPacket(frames[1], '')))
+
+    def test_compile_cache(self):
+        bpf.clear_compile_cache()
+        first = bpf.compile_frame_predicate(pcap.Port(6055, proto='udp'))
+        self.assertIs(first, bpf.compile_frame_predicate(
+            pcap.Port(6055, proto='udp')))
+        self.assertIsNot(first, bpf.compile_frame_predicate(
+            pcap.Port(6056, proto='udp')))
+
+        program = bpf.compile_rule(pcap.Port(6055), 1500)
+        self.assertEqual(program, bpf.compile_rule(pcap.Port(6055), 1500))
+        self.assertNotEqual(program, bpf.compile_rule(pcap.Port(6055)))
+        # The cached program can't be changed through a returned copy
+        program.pop()
+        self.assertNotEqual(program, bpf.compile_rule(pcap.Port(6055), 1500))
+
+    def test_filter_ports(self):
+        if not native_capture_available():
+            self.skipTest('AF_PACKET capture not available')
+
+        sends = [(6015, 6055, 10), (6016, 6055, 10), (6015, 6056, 10),
+                 (8100, 80, 10), (8600, 80, 10)]
+
+        self.assertEqual(
+            [(6015, 6055, 10)],
+            send_and_capture(pcap.And([pcap.Port(6015, proto='udp',
+                                                 source=True),
+                                       pcap.Port(6055, proto='udp',
+                                                 dest=True)]),
+                             sends))
+        self.assertEqual(
+            [(6015, 6055, 10), (6016, 6055, 10)],
+            send_and_capture(pcap.Port(6055, dest=True), sends))
+        self.assertEqual(
+            [(8100, 80, 10)],
+            send_and_capture(pcap.PortRange(8000, 8500, proto='udp',
+                                            source=True), sends))
+        self.assertEqual(
+            [(6015, 6055, 10), (6016, 6055, 10), (6015, 6056, 10)],
+            send_and_capture(pcap.And([
+                pcap.Host('localhost', proto='ip', source=True, dest=True),
+                pcap.UDPProto(),
+                pcap.Not(pcap.Port(80))]), sends))
+        self.assertEqual(
+            [], send_and_capture(pcap.Port(6055, proto='tcp'), sends))
+
+    def test_filter_len(self):
+        if not native_capture_available():
+            self.skipTest('AF_PACKET capture not available')
+
+        # Frame length is the 42 bytes of headers plus the payload
+        sends = [(6015, 6055, 10), (6015, 6055, 1500), (6015, 6055, 100)]
+        self.assertEqual(
+            [(6015, 6055, 10), (6015, 6055, 100)],
+            send_and_capture(pcap.And([pcap.Port(6055),
+                                       pcap.LessThanEqual('len', 142)]),
+                             sends))
+        self.assertEqual(
+            [(6015, 6055, 1500)],
+            send_and_capture(pcap.And([pcap.Port(6055),
+                                       pcap.GreaterThan('len', 142)]),
+                             sends))
+
+run_unit_test(BPFTest)
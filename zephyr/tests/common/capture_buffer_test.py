@@ -0,0 +1,149 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import Queue
+import socket
+import threading
+import time
+import unittest
+
+from zephyr.common.capture_buffer import *
+from zephyr.common.cli import LinuxCLI
+from zephyr.common import packet_capture
+from zephyr.common import pcap
+from zephyr.common.pcap_packet import PCAPPacket
+from zephyr.common.tcp_dump import TCPDump
+from zephyr.common.utils import run_unit_test
+
+
+def packets(sizes):
+    return [PCAPPacket(chr(ord('a') + i) * size, str(i))
+            for i, size in enumerate(sizes)]
+
+
+class CaptureBufferTest(unittest.TestCase):
+    def test_keep_first(self):
+        buf = CaptureBuffer(max_packets=3)
+        for p in packets([10] * 5):
+            buf.put(p)
+        self.assertEqual(3, len(buf))
+        self.assertEqual(['0', '1', '2'],
+                         [buf.get_nowait().timestamp for _ in range(3)])
+        ret = buf.result([])
+        self.assertEqual(2, ret.dropped_packets)
+        self.assertEqual(20, ret.dropped_bytes)
+        self.assertNotEqual('', ret.drop_summary())
+
+    def test_keep_last(self):
+        buf = CaptureBuffer(max_packets=0, max_bytes=25,
+                            policy=BUFFER_KEEP_LAST)
+        for p in packets([10, 10, 10, 20]):
+            buf.put(p)
+        # The last packet needs room for 20 bytes, leaving only itself
+        self.assertEqual(['3'], [buf.get_nowait().timestamp])
+        self.assertEqual(3, buf.result([]).dropped_packets)
+        self.assertEqual(30, buf.result([]).dropped_bytes)
+
+        # A packet bigger than the whole buffer is never kept
+        buf.put(packets([30])[0])
+        self.assertEqual(0, len(buf))
+        self.assertEqual(4, buf.result([]).dropped_packets)
+
+    def test_get_timeout(self):
+        buf = CaptureBuffer()
+        self.assertRaises(Queue.Empty, buf.get_nowait)
+        start = time.time()
+        self.assertRaises(Queue.Empty, buf.get, True, 0.2)
+        self.assertTrue(time.time() - start >= 0.2)
+
+        ret = buf.result(packets([1, 2]))
+        self.assertEqual(2, len(ret))
+        self.assertEqual('', ret.drop_summary())
+
+        self.assertRaises(ArgMismatchException, CaptureBuffer,
+                          policy='keep-some')
+
+    def test_admission_filter(self):
+        buf = CaptureBuffer(max_packets=2)
+        for p in packets([10, 20, 10]):
+            buf.put(p)
+        self.assertEqual(2, len(buf))
+
+        # Buffered packets which don't match are discarded, and later
+        # ones are kept out, without taking up room or counting as drops
+        def is_small(p):
+            return len(p.packet_data) == 10
+        self.assertEqual(None, buf.set_admission_filter(is_small))
+        self.assertEqual(1, len(buf))
+        for p in packets([20, 20, 10, 20]):
+            buf.put(p)
+        self.assertEqual(['0', '2'],
+                         [buf.get_nowait().timestamp for _ in range(2)])
+        self.assertEqual(1, buf.result([]).dropped_packets)
+
+        # A failing predicate lets packets in for the reader to see
+        buf.set_admission_filter(lambda p: p.no_such_field)
+        buf.put(packets([5])[0])
+        self.assertEqual(1, len(buf))
+        buf.set_admission_filter(None)
+        self.assertEqual(None, buf.admit)
+
+    def test_wait_for_matching_packets(self):
+        tcpd = TCPDump()
+        tcpd.data_queue = CaptureBuffer(max_packets=2)
+        tcpd.data_queue.put(packets([20])[0])
+
+        def send():
+            time.sleep(0.2)
+            for p in packets([20, 20, 20, 10, 10]):
+                tcpd.data_queue.put(p)
+        sender = threading.Thread(target=send)
+        sender.start()
+
+        # Non-matching traffic doesn't fill the buffer ahead of the
+        # matching packets
+        ret = tcpd.wait_for_matching_packets(
+            lambda p: len(p.packet_data) == 10, count=2, timeout=3)
+        sender.join()
+        self.assertEqual(['3', '4'], [p.timestamp for p in ret])
+        self.assertEqual(0, ret.dropped_packets)
+
+        # Every packet is buffered again once the wait is over
+        tcpd.data_queue.put(packets([20])[0])
+        self.assertEqual(1, len(tcpd.data_queue))
+        self.assertEqual(None, tcpd.data_queue.admit)
+
+    def test_native_capture_drops(self):
+        if not packet_capture.native_capture_available():
+            self.skipTest('AF_PACKET capture not available')
+
+        tcpd = TCPDump()
+        tcpd.start_capture(cli=LinuxCLI(priv=False), interface='lo',
+                           pcap_filter=pcap.Port(6055, proto='udp'),
+                           capture_buffer=CaptureBuffer(max_packets=2))
+        try:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            for _ in range(5):
+                s.sendto('zephyr', ('127.0.0.1', 6055))
+            s.close()
+            time.sleep(0.5)
+        finally:
+            tcpd.stop_capture()
+
+        ret = tcpd.wait_for_packets(count=0)
+        self.assertEqual(2, len(ret))
+        self.assertEqual(3, ret.dropped_packets)
+        self.assertEqual(0, ret.kernel_dropped_packets)
+
+run_unit_test(CaptureBufferTest)
@@ -0,0 +1,157 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import socket
+import time
+import unittest
+
+from zephyr.common.capture_service import CaptureService
+from zephyr.common.cli import LinuxCLI
+from zephyr.common import packet_capture
+from zephyr.common import pcap
+from zephyr.common.tcp_dump import TCPDump
+from zephyr.common.utils import run_unit_test
+
+
+def send_udp(ports):
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for port in ports:
+        s.sendto('zephyr', ('127.0.0.1', port))
+    s.close()
+
+
+class CaptureServiceTest(unittest.TestCase):
+    def setUp(self):
+        if not packet_capture.native_capture_available():
+            self.skipTest('AF_PACKET capture not available')
+
+    def start_captures(self, service, ports, count=0, callback=None):
+        captures = []
+        for port in ports:
+            tcpd = TCPDump()
+            tcpd.start_capture(cli=LinuxCLI(priv=False), interface='lo',
+                               count=count,
+                               pcap_filter=pcap.Port(port, proto='udp'),
+                               callback=callback, capture_service=service)
+            captures.append(tcpd)
+        return captures
+
+    def test_route_to_capture_queues(self):
+        service = CaptureService('test')
+        captures = self.start_captures(service, [6055, 6056, 6057])
+        try:
+            self.assertEqual(3, service.active_count())
+            thread = service.thread
+            self.assertIsNotNone(thread)
+
+            send_udp([6055, 6056, 6056, 6057, 6057, 6057])
+            for i, tcpd in enumerate(captures):
+                ret = tcpd.wait_for_packets(count=i + 1, timeout=3)
+                self.assertEqual([6055 + i] * (i + 1),
+                                 [p['udp'].dest_port for p in ret])
+        finally:
+            for tcpd in captures:
+                tcpd.stop_capture()
+
+        # The service thread exits once its last capture is stopped
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(0, service.active_count())
+        self.assertIsNone(service.thread)
+
+    def test_stop_flushes_and_count_finishes(self):
+        service = CaptureService('test')
+        counted = self.start_captures(service, [6055], count=2)[0]
+        open_ended = self.start_captures(service, [6056])[0]
+        try:
+            send_udp([6055, 6055, 6055, 6056])
+
+            # The counted capture finishes by itself
+            counted.process.join(3)
+            self.assertTrue(counted.tcpdump_finished.is_set())
+            self.assertEqual(2, len(counted.wait_for_packets(count=0)))
+
+            # Packets sent just before stopping are still delivered
+            open_ended.stop_capture()
+            self.assertEqual(1, len(open_ended.wait_for_packets(count=0)))
+
+            # The capture can be restarted on the same service
+            open_ended.start_capture(
+                cli=LinuxCLI(priv=False), interface='lo',
+                pcap_filter=pcap.Port(6056, proto='udp'),
+                capture_service=service)
+            send_udp([6056])
+            self.assertEqual(1, len(open_ended.wait_for_packets(
+                count=1, timeout=3)))
+        finally:
+            counted.stop_capture()
+            open_ended.stop_capture()
+
+    def test_failing_capture(self):
+        def fail(packet):
+            raise ValueError('bad callback')
+
+        service = CaptureService('test')
+        failing = self.start_captures(service, [6071], callback=fail)[0]
+        working = self.start_captures(service, [6072])[0]
+        try:
+            thread = service.thread
+            send_udp([6071])
+            failing.process.join(3)
+            self.assertTrue(failing.tcpdump_finished.is_set())
+
+            # Only the failing capture is finished, and the others are
+            # still served by the same thread
+            send_udp([6072])
+            self.assertEqual(1, len(working.wait_for_packets(
+                count=1, timeout=3)))
+            self.assertTrue(thread.is_alive())
+            self.assertIs(thread, service.thread)
+            self.assertEqual(1, service.active_count())
+
+            start = time.time()
+            failing.stop_capture()
+            self.assertTrue(time.time() - start < 1)
+        finally:
+            failing.stop_capture()
+            working.stop_capture()
+        thread.join(2)
+        self.assertIsNone(service.thread)
+
+    def test_failing_service_thread(self):
+        service = CaptureService('test')
+        captures = self.start_captures(service, [6073, 6074])
+        try:
+            # If the thread itself dies, its captures are finished and the
+            # next capture added gets a new thread
+            thread = service.thread
+            service.epoll.close()
+            os.write(service.wake_pipe[1], 'x')
+            thread.join(3)
+            self.assertFalse(thread.is_alive())
+            self.assertIsNone(service.thread)
+            self.assertTrue(all(c.tcpdump_finished.is_set()
+                                for c in captures))
+
+            captures += self.start_captures(service, [6075])
+            self.assertIsNot(thread, service.thread)
+            send_udp([6075])
+            self.assertEqual(1, len(captures[-1].wait_for_packets(
+                count=1, timeout=3)))
+        finally:
+            for tcpd in captures:
+                tcpd.stop_capture()
+
+run_unit_test(CaptureServiceTest)
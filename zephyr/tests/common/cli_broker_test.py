@@ -0,0 +1,90 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+
+from zephyr.common import cli
+from zephyr.common.cli_broker import CommandBroker
+from zephyr.common.exceptions import *
+from zephyr.common.utils import run_unit_test
+
+
+class CLIBrokerTest(unittest.TestCase):
+    def setUp(self):
+        self.broker = CommandBroker(
+            socket_path='/tmp/zephyr-cli-broker-test.' +
+                        str(os.getpid()) + '.sock',
+            priv=False)
+        self.broker.start()
+
+    def tearDown(self):
+        cli.COMMAND_BROKER = None
+        self.broker.stop()
+
+    def test_execute(self):
+        ret = self.broker.execute('echo test1; echo test2 1>&2; exit 3')
+        self.assertEqual(3, ret['ret_code'])
+        self.assertEqual('test1\n', ret['stdout'])
+        self.assertEqual('test2\n', ret['stderr'])
+
+    def test_execute_batch(self):
+        ret = self.broker.execute_batch(['echo a', 'false', 'echo c'])
+        self.assertEqual(3, len(ret))
+        self.assertEqual('a\n', ret[0]['stdout'])
+        self.assertEqual(1, ret[1]['ret_code'])
+        self.assertEqual('c\n', ret[2]['stdout'])
+
+    def test_execute_pipe(self):
+        ret = self.broker.execute([['echo', 'foo\nbar\nbaz'],
+                                   ['grep', '-c', 'ba']])
+        self.assertEqual(0, ret['ret_code'])
+        self.assertEqual('2\n', ret['stdout'])
+
+    def test_execute_env(self):
+        ret = self.broker.execute('echo $ZEPHYR_BROKER_TEST',
+                                  env={'ZEPHYR_BROKER_TEST': 'val'})
+        self.assertEqual('val\n', ret['stdout'])
+
+    def test_linux_cli_routing(self):
+        cli.COMMAND_BROKER = self.broker
+        lcli = cli.LinuxCLI()
+
+        ret = lcli.cmd('echo test')
+        self.assertIsNone(ret.process)
+        self.assertEqual(0, ret.ret_code)
+        self.assertEqual('test\n', ret.stdout)
+        self.assertFalse(ret.command.startswith('sudo'))
+
+        ret = lcli.cmd_pipe([['echo', 'foo\nbar'], ['grep', 'bar']])
+        self.assertEqual('bar\n', ret.stdout)
+
+        self.assertRaises(SubprocessFailedException,
+                          lcli.cmd, 'false', verify=True)
+        self.assertRaises(SubprocessTimeoutException,
+                          lcli.cmd, 'sleep 5', timeout=1)
+
+        # Non-blocking commands still run locally
+        ret = lcli.cmd('echo test', blocking=False)
+        self.assertIsNotNone(ret.process)
+        ret.process.communicate()
+
+    def test_restart(self):
+        self.broker.stop()
+        self.assertFalse(self.broker.is_running())
+        self.broker.start()
+        self.assertTrue(self.broker.is_running())
+        self.assertEqual('x\n', self.broker.execute('echo x')['stdout'])
+
+run_unit_test(CLIBrokerTest)
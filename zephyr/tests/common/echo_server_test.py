@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import socket
+import threading
+import time
 import unittest
 
 from zephyr.common.echo_server import *
@@ -29,8 +32,6 @@ class EchoServerTest(unittest.TestCase):
         finally:
             es.stop()
 
-    # TODO(micucci): Get UDP working
-    @unittest.skip("UDP is still not working right")
     def test_echo_udp(self):
         es = EchoServer(protocol='udp')
         try:
@@ -65,16 +66,14 @@ class EchoServerTest(unittest.TestCase):
         finally:
             es.stop()
 
-    # TODO(micucci): Get UDP working
-    @unittest.skip("UDP is still not working right")
     def test_multiple_pings_udp(self):
         es = EchoServer(protocol='udp')
         try:
             es.start()
-            ret = es.send(es.ip_addr, es.port)
+            ret = es.send(es.ip_addr, es.port, protocol='udp')
             self.assertEqual('ping:pong', ret)
 
-            ret2 = es.send(es.ip_addr, es.port, 'ping2')
+            ret2 = es.send(es.ip_addr, es.port, 'ping2', protocol='udp')
             self.assertEqual('ping2:pong', ret2)
 
         finally:
@@ -91,19 +90,54 @@ class EchoServerTest(unittest.TestCase):
         finally:
             es.stop()
 
-    # TODO(micucci): Get UDP working
-    @unittest.skip("UDP is still not working right")
     def test_long_data_udp(self):
         es = EchoServer(protocol='udp')
         try:
             es.start()
             data = 300 * '0123456789'
-            ret = es.send(es.ip_addr, es.port, echo_request=data)
+            ret = es.send(es.ip_addr, es.port, echo_request=data,
+                          protocol='udp')
             self.assertEqual(data + ':pong', ret)
 
         finally:
             es.stop()
 
+    def test_concurrent_clients(self):
+        es = EchoServer(port=5081)
+        try:
+            es.start()
+            # Clients holding connections open don't block the others
+            idle = [socket.create_connection((es.ip_addr, es.port))
+                    for _ in range(20)]
+            replies = []
+
+            def client(i):
+                replies.append(EchoServer.send(
+                    es.ip_addr, es.port, 'ping' + str(i)))
+
+            threads = [threading.Thread(target=client, args=(i,))
+                       for i in range(50)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(10)
+            self.assertEqual(sorted('ping' + str(i) + ':pong'
+                                    for i in range(50)), sorted(replies))
+            for s in idle:
+                s.close()
+        finally:
+            es.stop()
+
+    def test_idle_server_sleeps(self):
+        es = EchoServer(port=5082)
+        try:
+            es.start()
+            cpu = time.clock()
+            time.sleep(0.5)
+            self.assertTrue(time.clock() - cpu < 0.1)
+        finally:
+            es.stop()
+
     def test_multiple_restarts(self):
         es = EchoServer()
         try:
@@ -123,4 +157,60 @@ class EchoServerTest(unittest.TestCase):
         finally:
             es.stop()
 
+    def test_service_listeners(self):
+        service = EchoService()
+        try:
+            service.start()
+            service.add_listener('127.0.0.1', 5083, 'a')
+            service.add_listener('127.0.0.2', 5083, 'b')
+            service.add_listener('127.0.0.1', 5084, 'c', protocol='udp')
+            self.assertEqual('x:a', EchoServer.send('127.0.0.1', 5083, 'x'))
+            self.assertEqual('x:b', EchoServer.send('127.0.0.2', 5083, 'x'))
+            self.assertEqual('x:c', EchoServer.send('127.0.0.1', 5084, 'x',
+                                                    protocol='udp'))
+
+            # Replacing a listener changes its reply
+            service.add_listener('127.0.0.1', 5083, 'd')
+            self.assertEqual('x:d', EchoServer.send('127.0.0.1', 5083, 'x'))
+            self.assertEqual(3, len(service.list_listeners()))
+
+            self.assertEqual(1, service.remove_listener('127.0.0.2', 5083))
+            self.assertRaises(socket.error, EchoServer.send,
+                              '127.0.0.2', 5083)
+            self.assertEqual('x:d', EchoServer.send('127.0.0.1', 5083, 'x'))
+            # Without an exact address match, all on the port go
+            self.assertEqual(1, service.remove_listener('', 5084))
+            self.assertEqual(1, len(service.list_listeners()))
+        finally:
+            service.stop()
+
+    def test_service_control(self):
+        path = '/tmp/zephyr-echo-test.ctl'
+        service = EchoService(control_path=path)
+        try:
+            service.start()
+            client = EchoServiceClient(path)
+            self.assertTrue(client.is_running())
+            client.start_listener('127.0.0.1', 5085, 'ctl')
+            client.start_listener('127.0.0.1', 5086, 'ctl-udp', 'udp')
+            self.assertEqual('x:ctl', EchoServer.send('127.0.0.1', 5085, 'x'))
+            self.assertEqual('x:ctl-udp',
+                             EchoServer.send('127.0.0.1', 5086, 'x',
+                                             protocol='udp'))
+            self.assertEqual([1], [l['requests']
+                                   for l in client.list_listeners()
+                                   if l['port'] == 5085])
+            self.assertEqual(1, client.stop_listener('127.0.0.1', 5085))
+            self.assertRaises(exceptions.SubprocessFailedException,
+                              client.start_listener, port=5087,
+                              protocol='sctp')
+
+            client.shutdown()
+            service.thread.join(5)
+            self.assertFalse(client.is_running())
+            self.assertRaises(exceptions.SocketException,
+                              client.list_listeners)
+        finally:
+            service.stop()
+
 run_unit_test(EchoServerTest)
@@ -0,0 +1,121 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import struct
+import unittest
+
+from zephyr.common.flow_stats import *
+from zephyr.common.pcap_packet import *
+from zephyr.common.utils import run_unit_test
+
+SYN = TCP_PROTOCOL_FLAG_SYN
+ACK = TCP_PROTOCOL_FLAG_ACK
+FIN = TCP_PROTOCOL_FLAG_FINAL
+
+
+def ip_frame(proto, source_ip, dest_ip, l4, vlan=None):
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(l4), 0, 0, 64,
+                     proto, 0, socket.inet_aton(source_ip),
+                     socket.inet_aton(dest_ip))
+    tag = struct.pack('!HH', 0x8100, vlan) if vlan is not None else ''
+    return ('\x02\x00\x00\x00\x00\x02\x02\x00\x00\x00\x00\x01' + tag +
+            '\x08\x00' + ip + l4)
+
+
+def udp(source_ip, dest_ip, source_port, dest_port, payload='x',
+        timestamp='10:00:00.000000', vlan=None):
+    l4 = struct.pack('!HHHH', source_port, dest_port, 8 + len(payload),
+                     0) + payload
+    return PCAPPacket(ip_frame(IP4_PROTOCOL_UDP, source_ip, dest_ip, l4,
+                               vlan), timestamp)
+
+
+def tcp(source_port, dest_port, seq, flags, payload=''):
+    l4 = struct.pack('!HHIIBBHHH', source_port, dest_port, seq, 0, 5 << 4,
+                     flags, 1024, 0, 0) + payload
+    return PCAPPacket(ip_frame(IP4_PROTOCOL_TCP, '10.0.0.1', '10.0.0.2',
+                               l4), '10:00:00.000000')
+
+
+class FlowStatsTest(unittest.TestCase):
+    def test_udp_flows(self):
+        table = FlowTable([
+            udp('10.0.0.1', '10.0.0.10', 5000, 80, timestamp='10:00:00.0'),
+            udp('10.0.0.1', '10.0.0.10', 5000, 80, timestamp='10:00:00.5'),
+            udp('10.0.0.1', '10.0.0.10', 5000, 80, payload='xyz',
+                timestamp='10:00:01.5', vlan=10),
+            udp('10.0.0.1', '10.0.0.11', 5001, 80),
+            udp('10.0.0.10', '10.0.0.1', 80, 5000),
+            PCAPPacket('\x00' * 14 + '\x08\x06' + '\x00' * 28, '')])
+
+        self.assertEqual(3, len(table))
+        self.assertEqual(1, table.other_packets)
+        flow = table.get(source_ip='10.0.0.1', dest_ip='10.0.0.10')
+        self.assertEqual(FlowKey(IP4_PROTOCOL_UDP, '10.0.0.1', 5000,
+                                 '10.0.0.10', 80), flow.key)
+        self.assertEqual(3, flow.packets)
+        self.assertEqual(5, flow.payload_bytes)
+        self.assertAlmostEqual(1.5, flow.duration())
+        self.assertAlmostEqual(0.75, flow.gap_mean)
+        self.assertAlmostEqual(0.5, flow.gap_min)
+        self.assertAlmostEqual(1.0, flow.gap_max)
+        self.assertAlmostEqual(0.125 ** 0.5, flow.gap_stddev())
+
+        self.assertEqual(1, table.get(**reverse_key(flow.key)._asdict())
+                         .packets)
+        self.assertEqual({'10.0.0.10': 3, '10.0.0.11': 1},
+                         table.packets_by('dest_ip', proto='udp',
+                                          dest_port=80))
+        self.assertEqual(4, table.total_packets(source_ip='10.0.0.1'))
+        self.assertRaises(ObjectNotFoundException, table.get, proto='udp')
+        self.assertRaises(ObjectNotFoundException, table.get, proto='tcp')
+        self.assertRaises(ArgMismatchException, table.packets_by, 'ip')
+
+    def test_tcp_flags_and_retransmissions(self):
+        table = FlowTable()
+        for packet in [tcp(5000, 80, 100, SYN),
+                       tcp(5000, 80, 100, SYN),
+                       tcp(5000, 80, 101, ACK),
+                       tcp(5000, 80, 101, ACK, payload='a' * 10),
+                       tcp(5000, 80, 111, ACK, payload='b' * 10),
+                       tcp(5000, 80, 101, ACK, payload='a' * 10),
+                       tcp(5000, 80, 121, FIN | ACK)]:
+            table.add(packet)
+
+        flow = table.get(proto='tcp')
+        self.assertEqual(7, flow.packets)
+        self.assertEqual(2, flow.syn_packets)
+        self.assertEqual(1, flow.fin_packets)
+        self.assertEqual(2, flow.retransmissions)
+        self.assertEqual(30, flow.payload_bytes)
+        self.assertTrue(flow.has_flags(SYN, ACK, FIN | ACK))
+        self.assertFalse(flow.has_flags(FIN | ACK, SYN))
+
+        # Sequence numbers wrap around
+        table = FlowTable([tcp(5000, 80, 0xfffffffa, ACK, payload='a' * 10),
+                           tcp(5000, 80, 4, ACK, payload='b' * 10)])
+        self.assertEqual(0, table.total_retransmissions())
+
+    def test_one_pass(self):
+        def packets():
+            for i in xrange(100000):
+                yield udp('10.0.0.1', '10.0.1.' + str(i % 4), 5000, 80)
+
+        table = FlowTable(packets())
+        self.assertEqual(4, len(table))
+        self.assertEqual(100000, table.total_packets(dest_port=80))
+        self.assertEqual(25000, table.packets_by('dest_ip')['10.0.1.3'])
+
+run_unit_test(FlowStatsTest)
@@ -0,0 +1,107 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from zephyr.common.cli import LinuxCLI
+from zephyr.common.cli import NetNSCLI
+from zephyr.common.exceptions import *
+from zephyr.common.ip import IP
+from zephyr.common.ip_batch import IPBatchTransaction
+from zephyr.common.utils import run_unit_test
+
+
+def unpriv_cli(netns_name):
+    return (NetNSCLI(netns_name, priv=False) if netns_name is not None
+            else LinuxCLI(priv=False))
+
+
+class IPBatchTest(unittest.TestCase):
+    def setUp(self):
+        LinuxCLI(priv=False).cmd('ip netns add zephyr-batch-test1')
+        LinuxCLI(priv=False).cmd('ip netns add zephyr-batch-test2')
+        self.cli1 = unpriv_cli('zephyr-batch-test1')
+        self.cli2 = unpriv_cli('zephyr-batch-test2')
+
+    def tearDown(self):
+        LinuxCLI(priv=False).cmd('ip netns del zephyr-batch-test1')
+        LinuxCLI(priv=False).cmd('ip netns del zephyr-batch-test2')
+
+    def test_batch(self):
+        tx = IPBatchTransaction(cli_factory=unpriv_cli)
+        tx.link_add_bridge('zephyr-batch-test1', 'br0')
+        tx.addr_add('zephyr-batch-test1', 'br0', IP('10.0.0.1', '24'))
+        tx.link_set('zephyr-batch-test1', 'br0', up=True)
+        tx.link_add_veth('zephyr-batch-test1', 'veth0', 'eth0',
+                         peer_netns_name='zephyr-batch-test2')
+        tx.link_set('zephyr-batch-test1', 'veth0', master='br0', up=True)
+        tx.link_set('zephyr-batch-test2', 'eth0', up=True)
+        tx.addr_add('zephyr-batch-test2', 'eth0', IP('10.0.0.2', '24'))
+        tx.route_add('zephyr-batch-test2', 'default', '10.0.0.1')
+        self.assertEqual(8, len(tx))
+        self.assertEqual(2, len(tx.segments))
+        tx.commit()
+        self.assertEqual(0, len(tx))
+
+        self.assertTrue('master br0' in
+                        self.cli1.cmd('ip link show veth0').stdout)
+        self.assertTrue('10.0.0.2/24' in
+                        self.cli2.cmd('ip a show eth0').stdout)
+        self.assertTrue('default via 10.0.0.1' in
+                        self.cli2.cmd('ip r').stdout)
+
+    def test_errors_map_to_owner(self):
+        tx = IPBatchTransaction(cli_factory=unpriv_cli)
+        tx.link_add_bridge('zephyr-batch-test1', 'br0', owner='bridge')
+        tx.link_set('zephyr-batch-test1', 'nodev', up=True, owner='no-dev')
+        tx.link_set('zephyr-batch-test1', 'br0', up=True, owner='bridge')
+        tx.link_add_bridge('zephyr-batch-test1', 'br0', owner='dup-br')
+        try:
+            tx.commit()
+            self.fail('Expected IPBatchException')
+        except IPBatchException as e:
+            self.assertEqual(['no-dev', 'dup-br'],
+                             [owner for owner, _, _ in e.errors])
+            self.assertEqual('ip link set dev nodev up', e.errors[0][1])
+
+        # The commands which didn't fail were still applied
+        self.assertTrue('UP' in self.cli1.cmd('ip link show br0').stdout)
+
+    def test_iptables_payload(self):
+        tx = IPBatchTransaction(cli_factory=unpriv_cli)
+        tx.iptables('zephyr-batch-test1', 'nat',
+                    '-A POSTROUTING -o eth0 -j MASQUERADE', owner='r1')
+        tx.iptables('zephyr-batch-test1', 'filter',
+                    '-A FORWARD -i eth1 -o eth0 -j ACCEPT', owner='r1')
+        tx.iptables('zephyr-batch-test1', 'nat',
+                    '-A POSTROUTING -o eth2 -j MASQUERADE', owner='r2')
+        self.assertEqual(3, len(tx))
+
+        payloads = []
+        tx._exec = lambda ns, cmd, lines: (
+            payloads.append((ns, cmd, lines)) or
+            LinuxCLI(priv=False).cmd('true'))
+        tx.commit()
+        self.assertEqual(
+            [('zephyr-batch-test1', 'iptables-restore --noflush < ',
+              ['*nat',
+               '-A POSTROUTING -o eth0 -j MASQUERADE',
+               '-A POSTROUTING -o eth2 -j MASQUERADE',
+               'COMMIT',
+               '*filter',
+               '-A FORWARD -i eth1 -o eth0 -j ACCEPT',
+               'COMMIT'])],
+            payloads)
+
+run_unit_test(IPBatchTest)
@@ -0,0 +1,70 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+from zephyr.common.exceptions import ArgMismatchException
+from zephyr.common.latency import *
+from zephyr.common.utils import run_unit_test
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(None, histogram.percentile(50))
+        self.assertEqual('no samples', histogram.to_str())
+
+        # 1ms to 100ms, one each
+        for i in xrange(1, 101):
+            histogram.record(i / 1000.0)
+        self.assertEqual(100, histogram.count)
+        self.assertEqual(0.001, histogram.min)
+        self.assertEqual(0.1, histogram.max)
+        self.assertAlmostEqual(0.0505, histogram.mean())
+        for pct in (1, 50, 90, 99):
+            self.assertTrue(abs(histogram.percentile(pct) - pct / 1000.0) <
+                            pct / 1000.0 * 0.01)
+        self.assertEqual(0.1, histogram.percentile(100))
+
+        # Small values are kept exactly, and buckets stay few
+        self.assertEqual(5, LatencyHistogram.bucket_top(
+            LatencyHistogram.bucket_of(5)))
+        self.assertTrue(len(histogram.buckets) <= 100)
+        self.assertRaises(ArgMismatchException, histogram.record, -1)
+
+    def test_merge_and_dict(self):
+        first = LatencyHistogram()
+        first.record(0.002)
+        second = LatencyHistogram()
+        for _ in xrange(3):
+            second.record(0.0001)
+        first.merge(second)
+        self.assertEqual(4, first.count)
+        self.assertEqual(0.0001, first.min)
+        self.assertEqual(0.0001, first.percentile(75))
+
+        report = LatencyReport('connect')
+        report.first_packet = first
+        report.sent = 5
+        report.add_error('ECONNREFUSED')
+        copy = LatencyReport.from_dict(json.loads(json.dumps(
+            report.to_dict())))
+        self.assertEqual('connect', copy.mode)
+        self.assertEqual(first.buckets, copy.first_packet.buckets)
+        self.assertEqual(0.002, copy.first_packet.percentile(100))
+        self.assertEqual({'ECONNREFUSED': 1}, copy.errors)
+        self.assertEqual(1, copy.failures)
+
+run_unit_test(LatencyHistogramTest)
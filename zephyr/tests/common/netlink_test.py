@@ -0,0 +1,103 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import unittest
+
+from zephyr.common.cli import LinuxCLI
+from zephyr.common.cli import NetNSCLI
+from zephyr.common.exceptions import *
+from zephyr.common.ip import IP
+from zephyr.common import netlink
+from zephyr.common.netlink import NetlinkTransaction
+from zephyr.common.utils import run_unit_test
+
+
+class NetlinkTest(unittest.TestCase):
+    def setUp(self):
+        if not netlink.netlink_available():
+            self.skipTest('netlink configuration requires root')
+        LinuxCLI(priv=False).cmd('ip netns add zephyr-nl-test1')
+        LinuxCLI(priv=False).cmd('ip netns add zephyr-nl-test2')
+        self.cli1 = NetNSCLI('zephyr-nl-test1', priv=False)
+        self.cli2 = NetNSCLI('zephyr-nl-test2', priv=False)
+
+    def tearDown(self):
+        LinuxCLI(priv=False).cmd('ip netns del zephyr-nl-test1')
+        LinuxCLI(priv=False).cmd('ip netns del zephyr-nl-test2')
+
+    def test_bridge_veth_addr_route(self):
+        tx = NetlinkTransaction()
+        tx.link_add_bridge('zephyr-nl-test1', 'br0', stp=True)
+        tx.link_set('zephyr-nl-test1', 'br0', mac='aa:bb:cc:00:00:01')
+        tx.addr_add('zephyr-nl-test1', 'br0', IP('10.0.0.1', '24'))
+        tx.link_set('zephyr-nl-test1', 'br0', up=True)
+        tx.link_add_veth('zephyr-nl-test1', 'veth0', 'eth0',
+                         peer_netns_name='zephyr-nl-test2')
+        tx.link_set('zephyr-nl-test1', 'veth0', master='br0', up=True)
+        tx.link_set('zephyr-nl-test2', 'eth0', up=True)
+        tx.addr_add('zephyr-nl-test2', 'eth0', IP('10.0.0.2', '24'))
+        tx.route_add('zephyr-nl-test2', 'default', '10.0.0.1')
+        tx.route_add('zephyr-nl-test2', IP('192.168.5.0', '24'),
+                     dev='eth0')
+        tx.addr_add('zephyr-nl-test2', 'lo', IP('127.0.0.1', '8'),
+                    replace=True)
+        tx.link_set('zephyr-nl-test2', 'lo', up=True)
+        tx.commit()
+        self.assertEqual(0, len(tx))
+
+        out = self.cli1.cmd('ip -d link show br0').stdout
+        self.assertTrue('aa:bb:cc:00:00:01' in out)
+        self.assertTrue('stp_state 1' in out)
+        self.assertTrue('10.0.0.1/24' in self.cli1.cmd('ip a').stdout)
+        self.assertTrue('master br0' in
+                        self.cli1.cmd('ip link show veth0').stdout)
+
+        self.assertTrue('10.0.0.2/24' in
+                        self.cli2.cmd('ip a show eth0').stdout)
+        routes = self.cli2.cmd('ip r').stdout
+        self.assertTrue('default via 10.0.0.1 dev eth0' in routes)
+        self.assertTrue('192.168.5.0/24 dev eth0' in routes)
+
+        tx.link_del('zephyr-nl-test1', 'veth0')
+        tx.link_del('zephyr-nl-test1', 'br0')
+        tx.commit()
+        self.assertFalse('eth0' in self.cli2.cmd('ip l').stdout)
+        self.assertFalse('br0' in self.cli1.cmd('ip l').stdout)
+
+    def test_errors_map_to_owner(self):
+        tx = NetlinkTransaction()
+        tx.link_add_bridge('zephyr-nl-test1', 'br0', owner='bridge-owner')
+        tx.addr_add('zephyr-nl-test1', 'br0', IP('10.0.0.1', '24'))
+        tx.commit()
+
+        tx.addr_add('zephyr-nl-test1', 'br0', IP('10.0.0.1', '24'),
+                    owner='dup-addr')
+        tx.link_set('zephyr-nl-test1', 'br0', up=True)
+        tx.addr_add('zephyr-nl-test1', 'nodev', IP('10.0.1.1', '24'),
+                    owner='no-dev')
+        try:
+            tx.commit()
+            self.fail('Expected NetlinkException')
+        except NetlinkException as e:
+            self.assertEqual(2, len(e.errors))
+            self.assertEqual(('dup-addr', errno.EEXIST),
+                             (e.errors[0][0], e.errors[0][2]))
+            self.assertEqual(('no-dev', errno.ENODEV),
+                             (e.errors[1][0], e.errors[1][2]))
+
+        # The requests which didn't fail were still applied
+        self.assertTrue('UP' in self.cli1.cmd('ip link show br0').stdout)
+
+run_unit_test(NetlinkTest)
@@ -0,0 +1,205 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import socket
+import time
+import unittest
+
+from zephyr.common.echo_server import EchoServer
+from zephyr.common.echo_server import TERMINATION_STRING
+from zephyr.common import exceptions
+from zephyr.common.netns_agent import *
+from zephyr.common.utils import run_unit_test
+
+CONTROL_PATH = '/tmp/zephyr-agent-test.ctl'
+
+
+class NetNSAgentTest(unittest.TestCase):
+    def test_ping(self):
+        if os.geteuid() != 0:
+            self.skipTest('raw sockets not available')
+        result = ping('127.0.0.1', count=3)
+        self.assertEqual(3, result['sent'])
+        self.assertEqual(3, result['received'])
+        self.assertTrue(all(rtt < PING_TIMEOUT for rtt in result['rtts']))
+
+        # Bound to an interface or to a source address
+        result = ping('127.0.0.1', iface='lo', count=1, timeout=0.5)
+        self.assertEqual(1, result['received'])
+        result = ping('127.0.0.2', iface='127.0.0.1', count=1, timeout=0.5)
+        self.assertEqual(1, result['received'])
+
+    def test_probe(self):
+        server = EchoServer(ip_addr='127.0.0.1', port=5088)
+        server.start()
+        try:
+            result = probe('127.0.0.1', 5088)
+            self.assertTrue(result['open'])
+            self.assertEqual(None, result['reply'])
+            result = probe('127.0.0.1', 5088,
+                           payload='ping' + TERMINATION_STRING)
+            self.assertEqual('ping:pong' + TERMINATION_STRING,
+                             result['reply'])
+        finally:
+            server.stop()
+
+        result = probe('127.0.0.1', 5088)
+        self.assertFalse(result['open'])
+        self.assertEqual('ECONNREFUSED', result['error'])
+        result = probe('127.0.0.1', 5088, protocol='udp', timeout=0.5)
+        self.assertFalse(result['open'])
+        self.assertRaises(exceptions.ArgMismatchException, probe,
+                          '127.0.0.1', 5088, protocol='sctp')
+
+    def test_send_echo_requests(self):
+        server = EchoServer(ip_addr='127.0.0.1', port=5091, echo_data='a')
+        server.start()
+        try:
+            start = time.time()
+            result = send_echo_requests('127.0.0.1', 5091, count=500,
+                                        concurrency=50)
+            self.assertTrue(time.time() - start < 2)
+            self.assertEqual(500, server.requests())
+        finally:
+            server.stop()
+        self.assertEqual({'a': 500}, result.replies)
+        self.assertEqual(0, result.unanswered())
+        self.assertEqual(0, result.mismatches)
+        self.assertTrue(all(l is not None for l in result.latencies))
+
+        result = send_echo_requests('127.0.0.1', 5091, count=5,
+                                    concurrency=2)
+        self.assertEqual({'ECONNREFUSED': 5}, result.errors)
+        self.assertEqual([None] * 5, result.latencies)
+
+        # Connections which are never answered time out together
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 5092))
+        sock.listen(10)
+        try:
+            start = time.time()
+            result = send_echo_requests('127.0.0.1', 5092, count=4,
+                                        concurrency=4, timeout=0.5)
+            self.assertTrue(time.time() - start < 1)
+        finally:
+            sock.close()
+        self.assertEqual(4, result.timeouts)
+        self.assertEqual(4, result.unanswered())
+
+    def test_measure_latency(self):
+        server = EchoServer(ip_addr='127.0.0.1', port=5093)
+        server.start()
+        try:
+            report = measure_latency('127.0.0.1', 5093, count=50)
+            # One handshake, then every probe over the same connection
+            self.assertEqual(50, server.requests())
+            self.assertEqual(1, report.first_packet.count)
+            self.assertEqual(50, report.steady.count)
+            self.assertEqual(0, report.failures)
+            self.assertTrue(report.steady.percentile(99) < 0.1)
+
+            report = measure_latency('127.0.0.1', 5093, count=10,
+                                     mode='connect')
+            self.assertEqual(10, report.first_packet.count)
+            self.assertEqual(10, report.steady.count)
+        finally:
+            server.stop()
+
+        server = EchoServer(ip_addr='127.0.0.1', port=5093, protocol='udp')
+        server.start()
+        try:
+            report = measure_latency('127.0.0.1', 5093, count=10,
+                                     protocol='udp')
+            self.assertEqual(1, report.first_packet.count)
+            self.assertEqual(9, report.steady.count)
+        finally:
+            server.stop()
+
+        report = measure_latency('127.0.0.1', 5093, count=3)
+        self.assertEqual({'ECONNREFUSED': 3}, report.errors)
+        self.assertRaises(exceptions.ArgMismatchException, measure_latency,
+                          '127.0.0.1', 5093, mode='flood')
+
+    def test_measure_throughput(self):
+        server = EchoServer(ip_addr='127.0.0.1', port=5094)
+        server.start()
+        try:
+            size = 20 * 1024 * 1024 + 3
+            upload = measure_throughput('127.0.0.1', 5094, size=size)
+            self.assertEqual(size, upload.bytes)
+            self.assertTrue(upload.goodput_bps() > 0)
+            self.assertEqual(0, upload.retransmits)
+
+            download = measure_throughput('127.0.0.1', 5094,
+                                          direction='download', size=size)
+            self.assertEqual(size, download.bytes)
+            self.assertEqual(0, download.retransmits)
+
+            start = time.time()
+            timed = measure_throughput('127.0.0.1', 5094,
+                                       direction='download', duration=0.3)
+            self.assertTrue(0.3 <= time.time() - start < 2)
+            self.assertTrue(timed.bytes > 0)
+
+            # Echo requests are still answered after bulk transfers
+            self.assertEqual('ping:pong', EchoServer.send('127.0.0.1', 5094))
+        finally:
+            server.stop()
+        self.assertRaises(exceptions.ArgMismatchException,
+                          measure_throughput, '127.0.0.1', 5094)
+
+    def test_agent(self):
+        agent = NetNSAgent(control_path=CONTROL_PATH)
+        agent.start()
+        try:
+            client = NetNSAgentClient(CONTROL_PATH)
+            client.start_listener('127.0.0.1', 5089, 'agent')
+
+            # Echo requests (to the agent's own listener, which has to be
+            # answered while the request waits) cost a control message
+            count = 200
+            start = time.time()
+            for i in xrange(count):
+                self.assertEqual(
+                    'req' + str(i) + ':agent',
+                    client.send_echo_request('127.0.0.1', 5089,
+                                             'req' + str(i)))
+            self.assertTrue((time.time() - start) / count < 0.01)
+
+            result = client.send_echo_requests('127.0.0.1', 5089, count=20)
+            self.assertEqual({'agent': 20}, result.replies)
+            self.assertEqual(20, len(result.latencies))
+            report = client.measure_latency('127.0.0.1', 5089, count=20)
+            self.assertEqual(20, report.steady.count)
+            report = client.measure_throughput('127.0.0.1', 5089,
+                                               size=1000000)
+            self.assertEqual(1000000, report.bytes)
+
+            result = client.probe('127.0.0.1', 5089)
+            self.assertTrue(result['open'])
+            client.stop_listener('127.0.0.1', 5089)
+            self.assertFalse(client.probe('127.0.0.1', 5089)['open'])
+
+            self.assertRaises(exceptions.SubprocessFailedException,
+                              client.send_echo_request, '127.0.0.1', 5089,
+                              timeout=1)
+            if os.geteuid() == 0:
+                self.assertEqual(
+                    1, client.ping('127.0.0.1', timeout=1)['received'])
+        finally:
+            agent.stop()
+        self.assertFalse(os.path.exists(CONTROL_PATH))
+
+run_unit_test(NetNSAgentTest)
@@ -0,0 +1,96 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import socket
+import unittest
+
+from zephyr.common import cli
+from zephyr.common.cli_broker import CommandBroker
+from zephyr.common.cli import LinuxCLI
+from zephyr.common.cli import NetNSCLI
+from zephyr.common import netns
+from zephyr.common.utils import run_unit_test
+
+
+class NetNSTest(unittest.TestCase):
+    def setUp(self):
+        LinuxCLI(priv=False).cmd('ip netns add zephyr-ns-test')
+
+    def tearDown(self):
+        LinuxCLI(priv=False).cmd('ip netns del zephyr-ns-test')
+        netns.NETNS_CACHE.close('zephyr-ns-test')
+
+    def test_setns_cmd(self):
+        if not netns.setns_available('zephyr-ns-test'):
+            self.skipTest('setns() not available')
+        nscli = NetNSCLI('zephyr-ns-test', priv=False)
+        self.assertEqual('zephyr-ns-test', nscli.setns_target())
+
+        ret = nscli.cmd('ip -o link show')
+        self.assertFalse(ret.command.startswith('ip netns exec'))
+        self.assertEqual(0, ret.ret_code)
+        self.assertEqual(1, len(ret.stdout.splitlines()))
+        self.assertTrue(': lo:' in ret.stdout)
+
+        ret = nscli.cmd_pipe([['ip', '-o', 'link', 'show'],
+                              ['grep', '-c', 'lo']])
+        self.assertEqual('1', ret.stdout.strip())
+
+    def test_setns_fallback(self):
+        cli.USE_SETNS = False
+        try:
+            nscli = NetNSCLI('zephyr-ns-test', priv=False)
+            self.assertIsNone(nscli.setns_target())
+            ret = nscli.cmd('ip -o link show')
+            self.assertTrue(ret.command.startswith('ip netns exec'))
+            self.assertEqual(1, len(ret.stdout.splitlines()))
+        finally:
+            cli.USE_SETNS = True
+
+    def test_missing_ns(self):
+        nscli = NetNSCLI('zephyr-ns-test-missing', priv=False)
+        self.assertIsNone(nscli.setns_target())
+        self.assertNotEqual(0, nscli.cmd('ip link').ret_code)
+
+    def test_broker_setns(self):
+        broker = CommandBroker(
+            socket_path='/tmp/zephyr-ns-test.' + str(os.getpid()) + '.sock',
+            priv=False)
+        broker.start()
+        try:
+            ret = broker.execute('ip -o link show',
+                                 netns_name='zephyr-ns-test')
+            self.assertEqual(0, ret['ret_code'])
+            self.assertEqual(1, len(ret['stdout'].splitlines()))
+            ret = broker.execute('true', netns_name='zephyr-ns-test-missing')
+            self.assertNotEqual(0, ret['ret_code'])
+        finally:
+            broker.stop()
+
+    def test_in_netns(self):
+        if not netns.setns_available('zephyr-ns-test'):
+            self.skipTest('setns() not available')
+        with netns.in_netns('zephyr-ns-test'):
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # lo is down in a fresh namespace, so even loopback is unreachable
+        try:
+            self.assertRaises(socket.error, s.sendto, 'x', ('127.0.0.1', 9))
+        finally:
+            s.close()
+
+        ret = LinuxCLI(priv=False).cmd('ip -o link show')
+        self.assertTrue(len(ret.stdout.splitlines()) >= 1)
+
+run_unit_test(NetNSTest)
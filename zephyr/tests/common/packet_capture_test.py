@@ -0,0 +1,163 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import time
+import unittest
+
+from zephyr.common.cli import LinuxCLI
+from zephyr.common.cli import NetNSCLI
+from zephyr.common import netns
+from zephyr.common import packet_capture
+from zephyr.common.packet_capture import PacketSocket
+from zephyr.common import pcap
+from zephyr.common import tcp_dump
+from zephyr.common.tcp_dump import TCPDump
+from zephyr.common.utils import run_unit_test
+
+
+def send_udp(count, dest_port=6055, netns_name=None):
+    if netns_name is not None:
+        with netns.in_netns(netns_name):
+            return send_udp(count, dest_port)
+
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for _ in range(count):
+        s.sendto('zephyr', ('127.0.0.1', dest_port))
+    s.close()
+
+
+class PacketCaptureTest(unittest.TestCase):
+    def setUp(self):
+        if not packet_capture.native_capture_available():
+            self.skipTest('AF_PACKET capture not available')
+
+    def read_frames(self, ps, count, timeout=2):
+        frames = []
+        deadline = time.time() + timeout
+        while len(frames) < count and time.time() < deadline:
+            frames += ps.read(0.1)
+        return frames
+
+    def test_ring_capture(self):
+        ps = PacketSocket(interface='lo').open()
+        try:
+            self.assertIsNotNone(ps.ring)
+            send_udp(3)
+            frames = self.read_frames(ps, 3)
+            self.assertTrue(len(frames) >= 3)
+            self.assertTrue(any(f[0].endswith('zephyr') for f in frames))
+        finally:
+            ps.close()
+
+    def test_socket_capture(self):
+        ps = PacketSocket(interface='lo', use_ring=False).open()
+        try:
+            self.assertIsNone(ps.ring)
+            send_udp(3)
+            frames = self.read_frames(ps, 3)
+            self.assertTrue(len(frames) >= 3)
+        finally:
+            ps.close()
+
+    def test_bad_interface(self):
+        self.assertRaises(packet_capture.SocketException,
+                          PacketSocket(interface='zephyr-no-iface').open)
+
+    def test_native_tcpdump_capture(self):
+        tcp_dump.CAPTURE_ENGINE = tcp_dump.CAPTURE_ENGINE_NATIVE
+        tcpd = TCPDump()
+        try:
+            tcpd.start_capture(
+                cli=LinuxCLI(priv=False), interface='lo', count=2,
+                pcap_filter=pcap.And([pcap.UDPProto(),
+                                      pcap.Port(6055, dest=True)]))
+            self.assertIsNotNone(tcpd.packet_socket)
+            send_udp(1, dest_port=6056)
+            send_udp(3)
+
+            ret = tcpd.wait_for_packets(count=2, timeout=3)
+            self.assertEqual(2, len(ret))
+            self.assertEqual(6055, ret[0]['udp'].dest_port)
+            self.assertEqual('127.0.0.1', ret[0]['ip'].dest_ip)
+
+            # The capture finishes by itself once count packets arrive
+            tcpd.process.join(2)
+            self.assertTrue(tcpd.tcpdump_finished.is_set())
+        finally:
+            tcpd.stop_capture()
+            tcp_dump.CAPTURE_ENGINE = tcp_dump.CAPTURE_ENGINE_AUTO
+
+    def test_wait_for_matching_packets(self):
+        tcpd = TCPDump()
+        try:
+            tcpd.start_capture(cli=LinuxCLI(priv=False), interface='lo',
+                               pcap_filter=pcap.UDPProto())
+            for port in (6055, 6056, 6055, 6057, 6056):
+                send_udp(1, dest_port=port)
+
+            ret = tcpd.wait_for_matching_packets(
+                pcap.Port(6056, dest=True), count=2, timeout=3)
+            self.assertEqual([6056, 6056],
+                             [p['udp'].dest_port for p in ret])
+
+            # The non-matching packets ahead of those were discarded
+            send_udp(1, dest_port=6058)
+            ret = tcpd.wait_for_matching_packets(
+                lambda p: p['udp'].dest_port != 6056, count=1, timeout=3)
+            self.assertEqual(6058, ret[0]['udp'].dest_port)
+
+            start_time = time.time()
+            self.assertRaises(packet_capture.SubprocessTimeoutException,
+                              tcpd.wait_for_packets, count=1, timeout=0.2)
+            self.assertTrue(time.time() - start_time < 1)
+        finally:
+            tcpd.stop_capture()
+
+    def test_native_capture_in_netns(self):
+        LinuxCLI(priv=False).cmd('ip netns add zephyr-pcap-test')
+        nscli = NetNSCLI('zephyr-pcap-test', priv=False)
+        nscli.cmd('ip link set dev lo up')
+        tcp_dump.CAPTURE_ENGINE = tcp_dump.CAPTURE_ENGINE_NATIVE
+        tcpd = TCPDump()
+        try:
+            if not packet_capture.native_capture_available(
+                    'zephyr-pcap-test'):
+                self.skipTest('setns() not available')
+            tcpd.start_capture(cli=nscli, interface='lo',
+                               pcap_filter=pcap.Port(6055, proto='udp'))
+            send_udp(2, netns_name='zephyr-pcap-test')
+
+            # Traffic on the host's loopback isn't seen in the namespace
+            send_udp(2)
+            time.sleep(0.2)
+            tcpd.stop_capture()
+            self.assertEqual(2, len(tcpd.wait_for_packets(count=0)))
+        finally:
+            tcpd.stop_capture()
+            tcp_dump.CAPTURE_ENGINE = tcp_dump.CAPTURE_ENGINE_AUTO
+            LinuxCLI(priv=False).cmd('ip netns del zephyr-pcap-test')
+            netns.NETNS_CACHE.close('zephyr-pcap-test')
+
+    def test_native_unsupported_filter(self):
+        tcp_dump.CAPTURE_ENGINE = tcp_dump.CAPTURE_ENGINE_NATIVE
+        try:
+            self.assertRaises(
+                packet_capture.ArgMismatchException,
+                TCPDump().start_capture, cli=LinuxCLI(priv=False),
+                interface='lo', pcap_filter=pcap.Simple('tcp[13] = 2'))
+        finally:
+            tcp_dump.CAPTURE_ENGINE = tcp_dump.CAPTURE_ENGINE_AUTO
+
+run_unit_test(PacketCaptureTest)
@@ -0,0 +1,135 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import unittest
+
+from zephyr.common.cli import LinuxCLI
+from zephyr.common import packet_capture
+from zephyr.common.packet_generator import *
+from zephyr.common import pcap
+from zephyr.common import tcp_sender
+from zephyr.common.tcp_dump import TCPDump
+from zephyr.common.tcp_sender import TCPSender
+from zephyr.common.utils import run_unit_test
+
+
+def ether():
+    return GenEthernet(dest_mac='02:00:00:00:00:02',
+                       source_mac='02:00:00:00:00:01')
+
+
+class PacketGeneratorTest(unittest.TestCase):
+    def test_build_tcp(self):
+        frame = build_packet(
+            [ether(), GenIP4(source_ip='10.0.0.1', dest_ip='10.0.0.2'),
+             GenTCP(source_port=5000, dest_port=80, seq=7,
+                    flags=TCP_PROTOCOL_FLAG_SYN | TCP_PROTOCOL_FLAG_ACK)],
+            'hello')
+        packet = PCAPPacket(frame, '')
+        self.assertEqual('02:00:00:00:00:01', packet['ethernet'].source_mac)
+        self.assertEqual('10.0.0.2', packet['ip'].dest_ip)
+        self.assertEqual(IP4_PROTOCOL_TCP, packet['ip'].protocol)
+        self.assertEqual(5000, packet['tcp'].source_port)
+        self.assertEqual(7, packet['tcp'].seq)
+        self.assertEqual(TCP_PROTOCOL_FLAG_SYN | TCP_PROTOCOL_FLAG_ACK,
+                         packet['tcp'].flags)
+        self.assertTrue(frame.endswith('hello'))
+
+        # A correct checksum makes the header (and pseudo-header) sum to 0
+        ip = frame[14:]
+        self.assertEqual(0, checksum(ip[:20]))
+        self.assertEqual(0, checksum(ip[12:20] + '\0\x06' +
+                                     struct.pack('!H', len(ip) - 20) +
+                                     ip[20:]))
+
+    def test_build_udp_icmp_arp(self):
+        frame = build_packet(
+            [ether(), GenIP4(source_ip='10.0.0.1', dest_ip='10.0.0.2'),
+             GenUDP(source_port=5000, dest_port=6055)], 'x' * 11)
+        packet = PCAPPacket(frame, '')
+        self.assertEqual(19, packet['udp'].length)
+        self.assertEqual(39, len(frame) - 14)
+
+        frame = build_packet([ether(), GenIP4(dest_ip='10.0.0.2'),
+                              GenICMP(id=3, seq=9)], 'ping')
+        packet = PCAPPacket(frame, '')
+        self.assertEqual(ICMP_PROTOCOL_TYPE_ECHO_REQUEST,
+                         packet['icmp'].type)
+        self.assertEqual(0, checksum(frame[34:]))
+
+        frame = build_packet(
+            [ether(), GenARP(operation=ARP_PROTOCOL_OPERATION_REPLY,
+                             sender_mac='02:00:00:00:00:01',
+                             sender_ip='10.0.0.1',
+                             target_mac='02:00:00:00:00:02',
+                             target_ip='10.0.0.2')])
+        packet = PCAPPacket(frame, '')
+        self.assertEqual(ARP_PROTOCOL_OPERATION_REPLY,
+                         packet['arp'].operation)
+        self.assertEqual('10.0.0.1', packet['arp'].sender_ip_addr)
+        self.assertEqual('02:00:00:00:00:02',
+                         packet['arp'].target_hw_addr_ether)
+
+        self.assertRaises(ArgMismatchException, mac_to_bytes, '02:00')
+        self.assertRaises(ArgMismatchException, ip_to_bytes, '10.0.0')
+        self.assertEqual(MAC_BROADCAST,
+                         PCAPPacket.bytes_to_mac_address(
+                             mac_to_bytes('bcast')))
+
+    def test_native_send(self):
+        if not packet_capture.native_capture_available():
+            self.skipTest('raw sockets not available')
+
+        tcpd = TCPDump()
+        tcpd.start_capture(cli=LinuxCLI(priv=False), interface='lo',
+                           pcap_filter=pcap.Port(6056, proto='udp'))
+        try:
+            start = time.time()
+            out = TCPSender.send_packet(
+                LinuxCLI(), interface='lo', packet_type='udp',
+                source_ip='127.0.0.1', dest_ip='127.0.0.1',
+                source_mac='00:00:00:00:00:00',
+                dest_mac='00:00:00:00:00:00', source_port=5000,
+                dest_port=6056, count=5, delay=100000, payload='zephyr')
+            # Paced by the delay (in microseconds, as with mz)
+            self.assertTrue(time.time() - start >= 0.4)
+            self.assertTrue('native' in out.command)
+            packets = tcpd.wait_for_packets(count=5, timeout=3)
+        finally:
+            tcpd.stop_capture()
+
+        self.assertEqual(5, len(packets))
+        self.assertEqual(6056, packets[0]['udp'].dest_port)
+
+        # Sends without a per-packet process
+        with PacketSender('lo') as sender:
+            packet = build_packet(
+                [GenEthernet(), GenIP4(source_ip='127.0.0.1',
+                                       dest_ip='127.0.0.1'),
+                 GenUDP(source_port=5000, dest_port=6057)], 'zephyr')
+            start = time.time()
+            sender.send(packet, count=1000)
+            self.assertTrue(time.time() - start < 1)
+
+    def test_forced_native_engine(self):
+        tcp_sender.SEND_ENGINE = tcp_sender.SEND_ENGINE_NATIVE
+        try:
+            self.assertRaises(ArgMismatchException, TCPSender.send_packet,
+                              LinuxCLI(debug=True), interface='eth0',
+                              packet_type='tcp', dest_ip='10.0.0.2')
+        finally:
+            tcp_sender.SEND_ENGINE = tcp_sender.SEND_ENGINE_AUTO
+
+run_unit_test(PacketGeneratorTest)
@@ -0,0 +1,203 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import socket
+import struct
+import unittest
+
+from zephyr.common.cli import LinuxCLI
+from zephyr.common import packet_capture
+from zephyr.common import pcap
+from zephyr.common.pcap_file import *
+from zephyr.common.tcp_dump import TCPDump
+from zephyr.common.utils import run_unit_test
+
+DUMP_FILE = './.pcap_file_test.pcap'
+
+
+def udp_frame(source_ip, dest_ip, source_port, dest_port, payload='x'):
+    """
+    :return: str
+    """
+    udp = struct.pack('!HHHH', source_port, dest_port, 8 + len(payload), 0)
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(udp + payload),
+                     0, 0, 64, 17, 0, socket.inet_aton(source_ip),
+                     socket.inet_aton(dest_ip))
+    return ('\x02\x00\x00\x00\x00\x02' + '\x02\x00\x00\x00\x00\x01' +
+            '\x08\x00' + ip + udp + payload)
+
+
+def to_sll(frame):
+    return '\x00\x00\x00\x01\x00\x06' + frame[6:12] + '\x00\x00' + frame[12:]
+
+
+class PCAPFileTest(unittest.TestCase):
+    def write_dump(self, frames, linktype=LINKTYPE_ETHERNET):
+        with PCAPFileWriter(DUMP_FILE, linktype=linktype) as writer:
+            for i, frame in enumerate(frames):
+                writer.write_packet(frame, 1000 + i, i)
+
+    def test_write_and_read(self):
+        frames = [udp_frame('10.0.0.1', '10.0.0.2', 5000 + i, 80)
+                  for i in range(10)]
+        self.write_dump(frames)
+
+        packets = PCAPFileReader(DUMP_FILE).read_all()
+        self.assertEqual(10, len(packets))
+        self.assertEqual(frames, [p.packet_data for p in packets])
+        self.assertEqual('10.0.0.1', packets[0]['ip'].source_ip)
+        self.assertEqual(5009, packets[9]['udp'].source_port)
+        self.assertTrue(packets[3].timestamp.endswith('.000003'))
+
+    def test_read_filtered(self):
+        frames = [udp_frame('10.0.0.1', '10.0.0.2', 5000, 80),
+                  udp_frame('10.0.0.3', '10.0.0.2', 5001, 81),
+                  udp_frame('10.0.0.1', '10.0.0.4', 5002, 80)]
+        self.write_dump(frames)
+
+        reader = PCAPFileReader(DUMP_FILE,
+                                pcap_filter=pcap.Port(80, dest=True))
+        self.assertEqual([5000, 5002],
+                         [p['udp'].source_port for p in reader])
+
+        reader = PCAPFileReader(DUMP_FILE, pcap_filter=pcap.And([
+            pcap.Host('10.0.0.1', source=True),
+            pcap.Not(pcap.Host('10.0.0.4', dest=True))]))
+        self.assertEqual([5000], [p['udp'].source_port for p in reader])
+
+    def test_read_sll(self):
+        frames = [udp_frame('10.0.0.1', '10.0.0.2', 5000, 80),
+                  udp_frame('10.0.0.3', '10.0.0.2', 5001, 81)]
+        self.write_dump([to_sll(f) for f in frames],
+                        linktype=LINKTYPE_LINUX_SLL)
+
+        packets = PCAPFileReader(DUMP_FILE,
+                                 pcap_filter=pcap.Port(81)).read_all()
+        self.assertEqual(1, len(packets))
+        self.assertEqual(PCAPSLL, type(packets[0]['ethernet']))
+        self.assertEqual('02:00:00:00:00:01',
+                         packets[0]['ethernet'].source_mac)
+        self.assertEqual('10.0.0.3', packets[0]['ip'].source_ip)
+
+    def test_read_big_endian_nsec(self):
+        frame = udp_frame('10.0.0.1', '10.0.0.2', 5000, 80)
+        with open(DUMP_FILE, 'wb') as f:
+            f.write(struct.pack('>' + PCAP_FILE_HEADER, PCAP_MAGIC_NSEC,
+                                2, 4, 0, 0, 65535, LINKTYPE_ETHERNET))
+            f.write(struct.pack('>' + PCAP_RECORD_HEADER, 1000, 123456789,
+                                len(frame), len(frame)))
+            f.write(frame)
+            # A record cut short by the end of the capture is ignored
+            f.write(struct.pack('>' + PCAP_RECORD_HEADER, 1001, 0,
+                                len(frame), len(frame)))
+            f.write(frame[:10])
+
+        packets = PCAPFileReader(DUMP_FILE).read_all()
+        self.assertEqual(1, len(packets))
+        self.assertTrue(packets[0].timestamp.endswith('.123456'))
+        self.assertEqual(80, packets[0]['udp'].dest_port)
+
+    def test_read_pcapng(self):
+        frame = udp_frame('10.0.0.1', '10.0.0.2', 5000, 80)
+
+        def block(block_type, body):
+            body += '\0' * (-len(body) % 4)
+            return (struct.pack('<II', block_type, len(body) + 12) + body +
+                    struct.pack('<I', len(body) + 12))
+
+        with open(DUMP_FILE, 'wb') as f:
+            f.write(block(PCAPNG_BLOCK_SHB,
+                          struct.pack('<IHHq', PCAPNG_BYTE_ORDER_MAGIC,
+                                      1, 0, -1)))
+            # Interface with if_tsresol=9 (nanoseconds)
+            f.write(block(PCAPNG_BLOCK_IDB,
+                          struct.pack('<HHI', LINKTYPE_ETHERNET, 0, 0) +
+                          struct.pack('<HHB3x', PCAPNG_OPT_IF_TSRESOL, 1,
+                                      9) +
+                          struct.pack('<HH', PCAPNG_OPT_END, 0)))
+            ts = 1000 * 10 ** 9 + 5000
+            f.write(block(PCAPNG_BLOCK_EPB,
+                          struct.pack('<IIIII', 0, ts >> 32,
+                                      ts & 0xffffffff, len(frame),
+                                      len(frame)) + frame))
+            f.write(block(PCAPNG_BLOCK_SPB,
+                          struct.pack('<I', len(frame)) + frame))
+
+        packets = PCAPFileReader(DUMP_FILE).read_all()
+        self.assertEqual(2, len(packets))
+        self.assertTrue(packets[0].timestamp.endswith('.000005'))
+        self.assertEqual([frame, frame], [p.packet_data for p in packets])
+
+    def test_read_bad_file(self):
+        with open(DUMP_FILE, 'wb') as f:
+            f.write('--START--\n' + 'x' * 30)
+        self.assertRaises(PacketParsingException,
+                          PCAPFileReader(DUMP_FILE).read_all)
+        self.assertRaises(FileNotFoundException,
+                          PCAPFileReader(DUMP_FILE + '.none').read_all)
+
+        open(DUMP_FILE, 'wb').close()
+        self.assertEqual([], PCAPFileReader(DUMP_FILE).read_all())
+
+    def test_stream_reader(self):
+        frames = [udp_frame('10.0.0.1', '10.0.0.2', 5000 + i, 80)
+                  for i in range(3)]
+        self.write_dump(frames)
+        with open(DUMP_FILE, 'rb') as f:
+            data = f.read()
+
+        # Feed the stream a few bytes at a time, as a running tcpdump
+        # would write it
+        with open(DUMP_FILE + '.stream', 'wb') as out:
+            with open(DUMP_FILE + '.stream', 'rb') as f:
+                stream = PCAPStreamReader(f)
+                packets = []
+                for i in xrange(0, len(data), 7):
+                    out.write(data[i:i + 7])
+                    out.flush()
+                    packet = stream.read_packet()
+                    while packet is not None:
+                        packets.append(packet)
+                        packet = stream.read_packet()
+        os.remove(DUMP_FILE + '.stream')
+
+        self.assertEqual(frames, [p.packet_data for p in packets])
+        self.assertEqual(LINKTYPE_ETHERNET, stream.linktype)
+
+    def test_native_capture_dump_file(self):
+        if not packet_capture.native_capture_available():
+            self.skipTest('AF_PACKET capture not available')
+
+        tcpd = TCPDump()
+        tcpd.start_capture(interface='lo', count=3,
+                           pcap_filter=pcap.Port(6055, proto='udp'),
+                           save_dump_file=True,
+                           save_dump_filename=DUMP_FILE)
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for _ in range(3):
+            s.sendto('zephyr', ('127.0.0.1', 6055))
+        s.close()
+        captured = tcpd.wait_for_packets(count=3, timeout=5)
+        tcpd.stop_capture()
+
+        packets = PCAPFileReader(DUMP_FILE).read_all()
+        self.assertEqual([p.packet_data for p in captured],
+                         [p.packet_data for p in packets])
+        self.assertEqual(6055, packets[2]['udp'].dest_port)
+
+    def tearDown(self):
+        LinuxCLI().rm(DUMP_FILE)
+
+run_unit_test(PCAPFileTest)
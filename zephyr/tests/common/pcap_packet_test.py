@@ -12,11 +12,35 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import pickle
+import socket
+import struct
 import unittest
 from zephyr.common import pcap_packet
 from zephyr.common.utils import run_unit_test
 
 
+def ether(ether_type, payload, source='\x02\x00\x00\x00\x00\x01'):
+    return '\x02\x00\x00\x00\x00\x02' + source + \
+        struct.pack('!H', ether_type) + payload
+
+
+def ip4(proto, source_ip, dest_ip, payload):
+    return struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(payload), 0, 0,
+                       64, proto, 0, socket.inet_aton(source_ip),
+                       socket.inet_aton(dest_ip)) + payload
+
+
+def udp(source_port, dest_port, payload):
+    return struct.pack('!HHHH', source_port, dest_port, 8 + len(payload),
+                       0) + payload
+
+
+def tcp(source_port, dest_port):
+    return struct.pack('!HHIIBBHHH', source_port, dest_port, 1, 0, 5 << 4,
+                       0x02, 1024, 0, 0)
+
+
 class PCAPPacketTest(unittest.TestCase):
 
     def test_char8_to_int16(self):
@@ -584,6 +608,38 @@ class PCAPPacketTest(unittest.TestCase):
         self.assertEqual(
             None, pmap['tcp'].next_parse_recommendation)
 
+    def test_bytes_packet_lazy_parsing(self):
+        full_eii_packet_data = bytes(bytearray(
+            [0x52, 0x54, 0x00, 0x12, 0x35, 0x02, 0x08, 0x00,
+             0x27, 0xc6, 0x25, 0x01, 0x08, 0x00, 0x45, 0x10,
+             0x00, 0x20, 0x93, 0x06, 0x40, 0x00, 0x40, 0x11,
+             0x8f, 0x75, 0x0a, 0x00, 0x02, 0x0f, 0x0a, 0x00,
+             0x02, 0x02, 0x00, 0x16, 0x00, 0x1c, 0x00, 0x0c,
+             0x00, 0x00, 0xDE, 0xAD, 0xBE, 0xEF]))
+
+        packet = pcap_packet.PCAPPacket(full_eii_packet_data, '13:00')
+        self.assertFalse(packet.parsed)
+
+        # Accessing the layers parses the packet on demand
+        self.assertTrue('udp' in packet)
+        self.assertTrue(packet.parsed)
+        self.assertEqual('10.0.2.15', packet['ip'].source_ip)
+        self.assertEqual('08:00:27:c6:25:01', packet['ethernet'].source_mac)
+        self.assertEqual(28, packet['udp'].dest_port)
+
+        # Layers decode from views on the packet rather than copies
+        udp = pcap_packet.PCAPUDP()
+        payload = udp.parse_layer(
+            memoryview(full_eii_packet_data)[34:])
+        self.assertEqual(memoryview, type(payload))
+        self.assertEqual(b'\xde\xad\xbe\xef', payload.tobytes())
+
+        # Packets cross process boundaries as just their raw data
+        copy = pickle.loads(pickle.dumps(packet, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(full_eii_packet_data, copy.packet_data)
+        self.assertEqual('13:00', copy.timestamp)
+        self.assertEqual(22, copy['udp'].source_port)
+
     def test_full_packet_parsing_l2_bad_length(self):
         full_eii_packet_data = \
             [0x52, 0x54, 0x00, 0x12, 0x35, 0x02, 0x08, 0x00,
@@ -723,5 +779,116 @@ class PCAPPacketTest(unittest.TestCase):
         self.assertEqual(
             pcap_packet.PCAPIP4, pmap['ethernet'].next_parse_recommendation)
 
+    def test_vlan_decoding(self):
+        data = ether(pcap_packet.ETHERNET_PROTOCOL_TYPE_QINQ,
+                     struct.pack('!HHHH', 0x2064, 0x8100, 10, 0x0800) +
+                     ip4(17, '10.0.0.1', '10.0.0.2', udp(5000, 80, 'x')))
+        packet = pcap_packet.PCAPPacket(data, '13:00')
+
+        self.assertEqual(pcap_packet.ETHERNET_PROTOCOL_TYPE_QINQ,
+                         packet['ethernet'].type)
+        self.assertEqual(100, packet['vlan'].vlan_id)
+        self.assertEqual(1, packet['vlan'].priority)
+        self.assertEqual([100, 10], packet['vlan'].vlan_ids)
+        self.assertEqual(0x0800, packet['vlan'].type)
+        self.assertEqual('10.0.0.2', packet['ip'].dest_ip)
+        self.assertEqual(80, packet['udp'].dest_port)
+
+    def test_ip6_decoding(self):
+        source = socket.inet_pton(socket.AF_INET6, 'fd00::1')
+        dest = socket.inet_pton(socket.AF_INET6, 'fd00::2')
+        payload = udp(5000, 53, 'x')
+        # A hop-by-hop options header before the UDP header
+        data = ether(pcap_packet.ETHERNET_PROTOCOL_TYPE_IP6,
+                     struct.pack('!IHBB16s16s', 0x60000001,
+                                 8 + len(payload), 0, 64, source, dest) +
+                     struct.pack('!BB6x', 17, 0) + payload)
+        packet = pcap_packet.PCAPPacket(data, '13:00')
+
+        self.assertEqual('fd00::1', packet['ip6'].source_ip)
+        self.assertEqual('fd00::2', packet['ip6'].dest_ip)
+        self.assertEqual(17, packet['ip6'].protocol)
+        self.assertEqual(1, packet['ip6'].flow_label)
+        self.assertEqual(53, packet['udp'].dest_port)
+
+    def test_icmp6_decoding(self):
+        source = socket.inet_pton(socket.AF_INET6, 'fd00::1')
+        dest = socket.inet_pton(socket.AF_INET6, 'fd00::2')
+        payload = struct.pack('!BBHHH', 128, 0, 0, 1, 1)
+        data = ether(pcap_packet.ETHERNET_PROTOCOL_TYPE_IP6,
+                     struct.pack('!IHBB16s16s', 0x60000000, len(payload),
+                                 58, 64, source, dest) + payload)
+        packet = pcap_packet.PCAPPacket(data, '13:00')
+
+        # ICMPv6 is not mistaken for (IPv4) ICMP
+        self.assertEqual(pcap_packet.ICMP6_PROTOCOL_TYPE_ECHO_REQUEST,
+                         packet['icmp6'].type)
+        self.assertNotIn('icmp', packet.get_data())
+
+    def test_vxlan_decoding(self):
+        inner = ether(0x0800, ip4(6, '192.168.0.1', '192.168.0.2',
+                                  tcp(5000, 80)),
+                      source='\xaa\x00\x00\x00\x00\x01')
+        data = ether(0x0800, ip4(
+            17, '10.0.0.1', '10.0.0.2',
+            udp(40000, pcap_packet.VXLAN_PORT,
+                struct.pack('!B3xI', 0x08, 5001 << 8) + inner)))
+        packet = pcap_packet.PCAPPacket(data, '13:00')
+
+        self.assertEqual('10.0.0.1', packet['ip'].source_ip)
+        self.assertEqual(1, packet.tunnel_depth)
+        self.assertEqual(5001, packet['vxlan'].vni)
+        self.assertEqual('aa:00:00:00:00:01',
+                         packet['inner.ethernet'].source_mac)
+        self.assertEqual('192.168.0.1', packet['inner.ip'].source_ip)
+        self.assertEqual(80, packet['inner.tcp'].dest_port)
+        self.assertEqual('192.168.0.2', packet.innermost('ip').dest_ip)
+        self.assertEqual(pcap_packet.VXLAN_PORT,
+                         packet.innermost('udp').dest_port)
+        self.assertIsNone(packet.innermost('arp'))
+
+        # A short datagram to a VXLAN port which isn't VXLAN still parses
+        for port in (pcap_packet.VXLAN_PORT, pcap_packet.VXLAN_LINUX_PORT):
+            data = ether(0x0800, ip4(17, '10.0.0.1', '10.0.0.2',
+                                     udp(40000, port, 'abc')))
+            layers = pcap_packet.PCAPPacket(data, '13:00').parse()
+            self.assertEqual(port, layers['udp'].dest_port)
+            self.assertIn('vxlan', layers)
+
+    def test_gre_decoding(self):
+        inner = ether(0x0800, ip4(17, '192.168.0.1', '192.168.0.2',
+                                  udp(5000, 80, 'x')))
+        gre = struct.pack('!HHII', pcap_packet.GRE_FLAG_KEY |
+                          pcap_packet.GRE_FLAG_SEQUENCE,
+                          pcap_packet.ETHERNET_PROTOCOL_TYPE_TEB, 1234, 7)
+        data = ether(0x0800, ip4(47, '10.0.0.1', '10.0.0.2', gre + inner))
+        packet = pcap_packet.PCAPPacket(data, '13:00')
+
+        self.assertEqual(1234, packet['gre'].key)
+        self.assertEqual(7, packet['gre'].sequence)
+        self.assertEqual('10.0.0.2', packet['ip'].dest_ip)
+        self.assertEqual('192.168.0.2', packet['inner.ip'].dest_ip)
+        self.assertEqual(80, packet.innermost('udp').dest_port)
+
+        # GRE carrying IP directly, inside a VLAN tag
+        data = ether(0x8100, struct.pack('!HH', 20, 0x0800) + ip4(
+            47, '10.0.0.1', '10.0.0.2',
+            struct.pack('!HH', 0, 0x0800) +
+            ip4(1, '192.168.0.1', '192.168.0.2', '\x08' + '\0' * 7)))
+        packet = pcap_packet.PCAPPacket(data, '13:00')
+        self.assertEqual(20, packet['vlan'].vlan_id)
+        self.assertIsNone(packet['gre'].key)
+        self.assertEqual(8, packet['inner.icmp'].type)
+        self.assertEqual(['ethernet', 'vlan', 'ip', 'gre', 'inner.ip',
+                          'inner.icmp'],
+                         packet.extra_data['parse_types'])
+
+        # A truncated GRE header leaves the outer layers decoded
+        data = ether(0x0800, ip4(47, '10.0.0.1', '10.0.0.2',
+                                 struct.pack('!HH', 0x2000, 0x0800)))
+        packet = pcap_packet.PCAPPacket(data, '13:00')
+        self.assertEqual('10.0.0.2', packet.parse()['ip'].dest_ip)
+        self.assertEqual(1, len(packet.extra_data['parse_errors.gre']))
+
 
 run_unit_test(PCAPPacketTest)
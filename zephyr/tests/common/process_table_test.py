@@ -0,0 +1,86 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import time
+import unittest
+
+from zephyr.common.cli import LinuxCLI
+from zephyr.common import process_table
+from zephyr.common.process_table import ProcessTable
+from zephyr.common.utils import run_unit_test
+
+
+class ProcessTableTest(unittest.TestCase):
+    def test_snapshot(self):
+        table = ProcessTable()
+        me = table.get(os.getpid())
+        self.assertIsNotNone(me)
+        self.assertEqual(os.getppid(), me.ppid)
+        self.assertTrue(os.getpid() in table.pids())
+        self.assertTrue('python' in me.comm)
+        self.assertTrue(me.matches('process_table_test'))
+
+    def test_tree(self):
+        p = subprocess.Popen(['sh', '-c', 'sleep 30 & wait'])
+        try:
+            deadline = time.time() + 5
+            table = ProcessTable()
+            while not table.descendants(os.getpid())[1:]:
+                self.assertTrue(time.time() < deadline)
+                time.sleep(0.1)
+
+            children = table.children(os.getpid())
+            self.assertTrue(p.pid in [c.pid for c in children])
+            sleeper = table.children(p.pid)[0]
+            self.assertEqual(['sleep', '30'], sleeper.cmdline)
+            self.assertTrue(sleeper.pid in
+                            [c.pid for c in table.descendants(os.getpid())])
+            self.assertEqual([p.pid, os.getpid()],
+                             [a.pid for a in table.ancestors(sleeper.pid)][:2])
+
+            self.assertEqual([str(sleeper.pid)],
+                             LinuxCLI().get_parent_pids(p.pid))
+            self.assertTrue(str(sleeper.pid) in
+                            LinuxCLI().get_process_pids('sleep 30'))
+        finally:
+            p.kill()
+            p.wait()
+
+    def test_cache(self):
+        table = ProcessTable(cache_ttl=60)
+        snap = table.snapshot()
+        self.assertIs(snap, table.snapshot())
+        self.assertIsNot(snap, table.snapshot(refresh=True))
+        table.invalidate()
+        self.assertIsNot(snap, table.snapshot())
+
+    def test_wait_for_exit(self):
+        p = subprocess.Popen(['sleep', '30'])
+        try:
+            self.assertTrue(LinuxCLI().is_pid_running(p.pid))
+            self.assertFalse(process_table.wait_for_exit(p.pid, timeout=0.2))
+            p.terminate()
+            # The exited child stays a zombie until reaped, which counts
+            # as stopped
+            self.assertTrue(process_table.wait_for_exit(p.pid, timeout=5))
+            self.assertFalse(LinuxCLI().is_pid_running(p.pid))
+        finally:
+            p.wait()
+
+        self.assertTrue(process_table.wait_for_exit(p.pid, timeout=1))
+        self.assertFalse(process_table.pid_exists('not-a-pid'))
+
+run_unit_test(ProcessTableTest)
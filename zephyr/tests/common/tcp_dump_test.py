@@ -14,6 +14,7 @@
 
 import unittest
 from zephyr.common import pcap
+from zephyr.common import tcp_dump
 from zephyr.common.tcp_dump import *
 from zephyr.common.tcp_sender import TCPSender
 from zephyr.common.utils import run_unit_test
@@ -282,6 +283,36 @@ class TCPDumpTest(unittest.TestCase):
         finally:
             tcpd.stop_capture()
 
+    def test_tcpdump_ready_without_delay(self):
+        tcpd = TCPDump()
+        tcps = TCPSender()
+        old_engine = tcp_dump.CAPTURE_ENGINE
+        tcp_dump.CAPTURE_ENGINE = CAPTURE_ENGINE_TCPDUMP
+        try:
+            out = LinuxCLI().cmd(
+                'ip l | grep "LOOPBACK" | cut -f 2 -d " "| cut -f 1 -d ":"')\
+                .stdout
+            lo_iface = out.split()[0].rstrip()
+
+            start_time = time.time()
+            tcpd.start_capture(
+                interface=lo_iface, count=1,
+                pcap_filter=pcap.And(
+                    [pcap.Port(6015, proto='tcp', source=True),
+                     pcap.Port(6055, proto='tcp', dest=True)]))
+            self.assertTrue(time.time() - start_time < 1)
+
+            tcps.start_send(interface=lo_iface, packet_type='tcp', count=1,
+                            source_ip='127.0.0.1', dest_ip='127.0.0.1',
+                            dest_port=6055, source_port=6015)
+
+            ret = tcpd.wait_for_packets(count=1, timeout=3)
+            self.assertEqual(1, len(ret))
+
+        finally:
+            tcp_dump.CAPTURE_ENGINE = old_engine
+            tcpd.stop_capture()
+
     def tearDown(self):
         time.sleep(2)
         LinuxCLI().rm('tcp.callback.out')
@@ -0,0 +1,109 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import unittest
+
+from zephyr.common.traffic_generator import *
+from zephyr.common.utils import run_unit_test
+
+
+class TrafficGeneratorTest(unittest.TestCase):
+    def run_traffic(self, sink, flows, drain_time=0.5):
+        sent = TrafficGenerator(flows).run()
+        time.sleep(drain_time)
+        return TrafficReport(sent, sink.stop())
+
+    def test_udp_flows(self):
+        sink = TrafficSink(port=6070, port_count=2,
+                           ip_addr='127.0.0.1').start()
+        start = time.time()
+        report = self.run_traffic(sink, [
+            FlowSpec('127.0.0.1', dest_port=6070, dest_port_count=2,
+                     rate_pps=200, count=100),
+            FlowSpec('127.0.0.1', dest_port=6071, size=(64, 1000),
+                     rate_bps=400000, duration=0.5)])
+
+        # 100 messages at 200/s take half a second
+        self.assertTrue(time.time() - start >= 0.49)
+        first = report.flow(0)
+        self.assertEqual(100, first.sent_packets)
+        self.assertEqual(100, first.received_packets)
+        self.assertEqual(6400, first.received_bytes)
+        self.assertEqual(0, first.lost_packets)
+        self.assertEqual(0.0, first.loss_ratio)
+        self.assertEqual(0, first.duplicate_packets)
+        self.assertTrue(150 < first.throughput_pps < 250)
+        self.assertTrue(0 <= first.latency_min <= first.latency[50] <=
+                        first.latency[99] <= first.latency_max < 0.5)
+
+        second = report.flow(1)
+        self.assertTrue(second.sent_packets > 0)
+        self.assertEqual(second.sent_packets, second.received_packets)
+        # About 400kbit/s (of messages averaging 532 bytes) for 0.5s
+        self.assertTrue(15000 < second.sent_bytes < 35000)
+
+        self.assertEqual(0, report.lost_packets())
+        summary = report.to_dict()
+        self.assertEqual(report.sent_packets(), summary['sent_packets'])
+        self.assertEqual(100, summary['flows'][0]['received_packets'])
+        self.assertRaises(ObjectNotFoundException, report.flow, 2)
+
+    def test_tcp_flow(self):
+        sink = TrafficSink(port=6072, protocol='tcp',
+                           ip_addr='127.0.0.1').start()
+        report = self.run_traffic(sink, [
+            FlowSpec('127.0.0.1', dest_port=6072, protocol='tcp',
+                     size=(32, 3000), count=500)])
+        flow = report.flow(0)
+        self.assertEqual(500, flow.received_packets)
+        self.assertEqual(flow.sent_bytes, flow.received_bytes)
+        self.assertEqual(0, flow.reordered_packets)
+
+    def test_loss_and_reordering(self):
+        flow = FlowSpec('10.0.0.2', count=6)
+        flow.flow_id = 0
+        sent = FlowSendStats(flow)
+        sent.packets = 6
+        received = FlowReceiveStats(0)
+        for seq in [0, 2, 1, 2, 4]:
+            received.update(seq, 64, 0.0, 0.01 * (seq + 1))
+        report = TrafficReport([sent], {0: received})
+
+        flow_report = report.flow(0)
+        self.assertEqual(4, flow_report.received_packets)
+        self.assertEqual(2, flow_report.lost_packets)
+        self.assertEqual(1, flow_report.duplicate_packets)
+        self.assertEqual(1, flow_report.reordered_packets)
+        self.assertAlmostEqual(2.0 / 6, report.loss_ratio())
+        self.assertAlmostEqual(0.02, flow_report.latency[50])
+
+        self.assertEqual(None, percentile([], 50))
+        self.assertEqual(10, percentile(range(1, 11), 100))
+        self.assertEqual(1, percentile(range(1, 11), 1))
+        self.assertEqual(1, percentile(range(1, 11), 0))
+
+        # The rank is exact when pct percent of the values is a whole
+        # number of them
+        self.assertEqual(50, percentile(range(1, 101), 50))
+        self.assertEqual(99, percentile(range(1, 101), 99))
+        self.assertEqual(9, percentile(range(1, 11), 90))
+        self.assertEqual(1, percentile([1, 2], 50))
+        self.assertEqual(2, percentile([1, 2], 51))
+        self.assertEqual(3, percentile(range(1, 11), 25))
+        self.assertRaises(ArgMismatchException, FlowSpec, '10.0.0.2')
+        self.assertRaises(ArgMismatchException, FlowSpec, '10.0.0.2',
+                          count=1, size=8)
+
+run_unit_test(TrafficGeneratorTest)
@@ -12,6 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import sys
+import threading
+import time
+import traceback
 import unittest
 from zephyr.common import utils
 
@@ -77,4 +81,50 @@ class UtilsTest(unittest.TestCase):
         self.assertFalse(
             utils.check_string_for_tag("foo bar baz", "baz", 0))
 
+    def test_run_concurrently(self):
+        def fail():
+            raise ValueError('bad VM')
+
+        start = time.time()
+        results = utils.run_concurrently(
+            [lambda: time.sleep(0.3) or 'a', fail,
+             lambda: time.sleep(0.3) or 'c'])
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertTrue(all(f.done() for f in results))
+        self.assertEqual(['a', 'c'],
+                         [results[0].result(), results[2].result()])
+        self.assertEqual([None, None],
+                         [results[0].exception(), results[2].exception()])
+        self.assertRaises(ValueError, results[1].result)
+
+        # No more than max_threads run at once
+        running = []
+        most_running = []
+        lock = threading.Lock()
+
+        def count():
+            with lock:
+                running.append(1)
+                most_running.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+        utils.run_concurrently([count] * 8, max_threads=3)
+        self.assertEqual(3, max(most_running))
+        self.assertEqual([], utils.run_concurrently([]))
+
+    def test_reraise(self):
+        try:
+            raise ValueError('bad VM')
+        except ValueError:
+            exc_info = sys.exc_info()
+        try:
+            utils.reraise(exc_info)
+        except ValueError:
+            self.assertIs(exc_info[1], sys.exc_info()[1])
+            # The traceback still reaches back to where it was raised
+            self.assertEqual(
+                'test_reraise',
+                traceback.extract_tb(sys.exc_info()[2])[-1][2])
+
 utils.run_unit_test(UtilsTest)
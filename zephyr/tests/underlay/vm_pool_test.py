@@ -0,0 +1,142 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+
+from zephyr.common.cli import LinuxCLI
+from zephyr.common import exceptions
+from zephyr.common.ip import IP
+from zephyr.common.utils import run_unit_test
+from zephyr.vtm.underlay.direct_underlay_host import DirectUnderlayHost
+from zephyr.vtm.underlay.underlay_host import UnderlayHost
+from zephyr.vtm.underlay.vm_pool import VMPool
+
+
+class PoolTestHost(UnderlayHost):
+    def __init__(self, name, hypervisor=None):
+        super(PoolTestHost, self).__init__(name)
+        self.hypervisor = hypervisor
+        self.vms = []
+        self.resets = 0
+        self.terminated = False
+        self.fail_reset = False
+
+    def create_vm(self, name=None):
+        vm = PoolTestHost(name, hypervisor=self)
+        self.vms.append(vm)
+        return vm
+
+    def reset_vm(self):
+        if self.fail_reset:
+            raise exceptions.SubprocessFailedException('scrub failed')
+        super(PoolTestHost, self).reset_vm()
+        self.resets += 1
+
+    def terminate(self):
+        self.terminated = True
+        self.hypervisor.vms.remove(self)
+
+
+class VMPoolTest(unittest.TestCase):
+    def test_pool(self):
+        hvs = {'hv1': PoolTestHost('hv1'), 'hv2': PoolTestHost('hv2')}
+        pool = VMPool(2)
+        pool.fill(hvs)
+        self.assertEqual(2, pool.idle_count('hv1'))
+        self.assertEqual(2, len(hvs['hv2'].vms))
+        pool.fill(hvs)
+        self.assertEqual(2, len(hvs['hv1'].vms))
+
+        # VMs are handed out, then scrubbed when they are returned
+        vm = pool.take('hv1')
+        self.assertIs(pool, vm.vm_pool)
+        self.assertEqual(1, pool.idle_count('hv1'))
+        vm.cached_ips.add('10.0.0.1')
+        pool.release(vm)
+        self.assertEqual(1, vm.resets)
+        self.assertEqual(set(), vm.cached_ips)
+        self.assertFalse(vm.terminated)
+        self.assertEqual(2, pool.idle_count('hv1'))
+
+        # VMs beyond the pool size (or which can't be scrubbed) are
+        # terminated instead
+        extra = hvs['hv1'].create_vm('extra')
+        pool.adopt(extra, 'hv1')
+        pool.release(extra)
+        self.assertTrue(extra.terminated)
+        self.assertEqual(None, extra.vm_pool)
+        vm = pool.take('hv2')
+        vm.fail_reset = True
+        pool.release(vm)
+        self.assertTrue(vm.terminated)
+        self.assertEqual(1, pool.idle_count('hv2'))
+
+        self.assertEqual(None, pool.take('hv3'))
+        in_use = pool.take('hv1')
+        pool.clear()
+        self.assertEqual(0, pool.idle_count('hv1'))
+        self.assertEqual([in_use], hvs['hv1'].vms + hvs['hv2'].vms)
+
+        # Once the pool is cleared, VMs still in use are terminated when
+        # they are released, and it isn't filled again
+        resets = in_use.resets
+        pool.release(in_use)
+        self.assertTrue(in_use.terminated)
+        self.assertEqual(resets, in_use.resets)
+        self.assertEqual(0, pool.idle_count('hv1'))
+        pool.fill(hvs)
+        self.assertEqual([], hvs['hv1'].vms + hvs['hv2'].vms)
+
+    def test_ipnetns_vm(self):
+        if os.geteuid() != 0:
+            self.skipTest('namespaces not available')
+        hv = DirectUnderlayHost('pool_hv')
+        pool = VMPool(1)
+        pool.fill({'pool_hv': hv})
+        vm = pool.take('pool_hv')
+        netns_name = vm.netns_name()
+        try:
+            # Handed out VMs take the requested name, but keep their
+            # namespace
+            vm.rename_vm('pool_vm1')
+            self.assertIs(vm, hv.vms['pool_vm1'])
+            self.assertEqual(netns_name, vm.netns_name())
+
+            hv.create_tap_interface_for_vm('tappool0', vm, 'eth0')
+            vm.add_ip('eth0', '10.99.0.2/24')
+            vm.add_route(gw_ip=IP('10.99.0.1'))
+            vm.execute('ip neighbour add 10.99.0.9 '
+                       'lladdr 02:00:00:00:00:09 dev eth0')
+            vm.execute('sleep 60', blocking=False)
+            self.assertNotEqual([], vm.cli.get_running_pids())
+            self.assertIn('default via 10.99.0.1',
+                          vm.execute('ip route').stdout)
+            self.assertIn('10.99.0.9', vm.execute('ip neighbour').stdout)
+
+            pool.release(vm)
+            self.assertEqual(1, pool.idle_count('pool_hv'))
+            self.assertEqual([], vm.cli.get_running_pids())
+            self.assertEqual('', vm.execute('ip route').stdout.strip())
+            self.assertEqual('', vm.execute('ip neighbour').stdout.strip())
+            self.assertNotEqual(
+                0, LinuxCLI().cmd('ip link show dev tappool0').ret_code)
+            self.assertEqual({}, hv.taps)
+            self.assertTrue(os.path.exists('/var/run/netns/' + netns_name))
+        finally:
+            pool.clear()
+        self.assertFalse(os.path.exists('/var/run/netns/' + netns_name))
+        self.assertEqual({}, hv.vms)
+
+run_unit_test(VMPoolTest)
@@ -13,14 +13,19 @@
 # limitations under the License.
 
 from collections import namedtuple
+import functools
 import json
 import logging
+import sys
 
 from zephyr.common import exceptions
 from zephyr.common.ip import IP
 from zephyr.common.utils import curl_delete
 from zephyr.common.utils import curl_post
 from zephyr.common.utils import curl_put
+from zephyr.common.utils import reraise
+from zephyr.common.utils import run_concurrently
+from zephyr.common.zephyr_constants import DEFAULT_ECHO_PORT
 from zephyr.tsm.test_case import TestCase
 from zephyr.vtm import neutron_api
 
@@ -126,6 +131,87 @@ class NeutronTestCase(TestCase):
                                              dest_port=dest_port)
         self.assertEqual('ping:pong', echo_response)
 
+    def check_latency(self, vm, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                      count=100, mode='persistent', protocol='tcp',
+                      steady_limits=None, first_packet_limit=None):
+        """
+        Measure the latency from vm to an echo server already running on
+        dest_ip/dest_port, and fail if any probe failed, if the
+        steady-state latency percentiles go over their limits (a dict of
+        percentile to seconds), or if setting up a flow ever took longer
+        than first_packet_limit.
+        :type vm: zephyr.vtm.guest.Guest
+        :type dest_ip: str
+        :type dest_port: int
+        :type count: int
+        :type mode: str
+        :type protocol: str
+        :type steady_limits: dict[float, float]
+        :type first_packet_limit: float
+        :rtype: zephyr.common.latency.LatencyReport
+        """
+        report = vm.measure_latency(dest_ip=dest_ip, dest_port=dest_port,
+                                    count=count, mode=mode,
+                                    protocol=protocol)
+        self.LOG.debug(report.to_str())
+        self.assertEqual(0, report.failures,
+                         'Latency probes failed: ' + str(report.errors))
+        if steady_limits is not None:
+            self.assertLatencyPercentiles(report.steady, steady_limits,
+                                          'steady-state latency')
+        if first_packet_limit is not None:
+            self.assertLatencyPercentiles(report.first_packet,
+                                          {100: first_packet_limit},
+                                          'first packet latency')
+        return report
+
+    def assertLatencyPercentiles(self, histogram, limits, name='latency'):
+        """
+        Fail if any of the histogram's percentiles go over their limits.
+        :type histogram: zephyr.common.latency.LatencyHistogram
+        :type limits: dict[float, float]
+        :type name: str
+        """
+        if not histogram.count:
+            self.fail('No ' + name + ' samples')
+        over = ['p' + str(pct) + '=' + str(histogram.percentile(pct)) +
+                's (limit: ' + str(limit) + 's)'
+                for pct, limit in sorted(limits.iteritems())
+                if histogram.percentile(pct) > limit]
+        if over:
+            self.fail(name.capitalize() + ' over limit: ' +
+                      ', '.join(over) + ' [' + histogram.to_str() + ']')
+
+    def check_throughput(self, vm, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                         min_bps=0, size=None, duration=None,
+                         directions=('upload', 'download')):
+        """
+        Stream data between vm and an echo server already running on
+        dest_ip/dest_port in each of the given directions, and fail if
+        all of the data didn't arrive or the goodput fell under min_bps.
+        :type vm: zephyr.vtm.guest.Guest
+        :type dest_ip: str
+        :type dest_port: int
+        :type min_bps: float
+        :type size: int
+        :type duration: float
+        :type directions: tuple[str]
+        :rtype: list[zephyr.common.netns_agent.ThroughputReport]
+        """
+        reports = []
+        for direction in directions:
+            report = vm.measure_throughput(
+                dest_ip=dest_ip, dest_port=dest_port, direction=direction,
+                size=size, duration=duration)
+            self.LOG.debug(report.to_str())
+            if size:
+                self.assertEqual(size, report.bytes)
+            self.assertTrue(report.goodput_bps() >= min_bps,
+                            'Throughput under ' + str(min_bps) +
+                            ' bit/s: ' + report.to_str())
+            reports.append(report)
+        return reports
+
     def check_ping_and_tcp(self, vm, dest_ip, count=2):
         self.assertTrue(vm.ping(target_ip=dest_ip, count=count, timeout=20))
 
@@ -274,6 +360,34 @@ class NeutronTestCase(TestCase):
 
         return cleanup_errors
 
+    @staticmethod
+    def make_vm_port_data(name, net_id, sgs=list(),
+                          allowed_address_pairs=None,
+                          port_security_enabled=None, router_ip=None):
+        """
+        :rtype: dict[str, any]
+        """
+        port_data = {'name': name,
+                     'network_id': net_id,
+                     'admin_state_up': True,
+                     'tenant_id': 'admin'}
+        if sgs:
+            port_data['security_groups'] = sgs
+        if port_security_enabled is not None:
+            port_data['port_security_enabled'] = port_security_enabled
+        if allowed_address_pairs:
+            port_data['allowed_address_pairs'] = (
+                [{'ip_address': pair[0],
+                  'mac_address': pair[1]} if len(pair) > 1
+                 else {'ip_address': pair[0]}
+                 for pair in allowed_address_pairs])
+        if router_ip:
+            opt = {"opt_value": router_ip,
+                   "ip_version": 4,
+                   "opt_name": "3"}
+            port_data['extra_dhcp_opts'] = [opt]
+        return port_data
+
     def create_vm_server(self, name, net_id=None, gw_ip=None, sgs=list(),
                          allowed_address_pairs=None, hv_host=None,
                          port_security_enabled=None, use_dhcp=True,
@@ -287,25 +401,11 @@ class NeutronTestCase(TestCase):
                     "If no existing port is specified, a network "
                     "ID on which to create a new port MUST be provided")
 
-            port_data = {'name': name,
-                         'network_id': net_id,
-                         'admin_state_up': True,
-                         'tenant_id': 'admin'}
-            if sgs:
-                port_data['security_groups'] = sgs
-            if port_security_enabled is not None:
-                port_data['port_security_enabled'] = port_security_enabled
-            if allowed_address_pairs:
-                port_data['allowed_address_pairs'] = (
-                    [{'ip_address': pair[0],
-                      'mac_address': pair[1]} if len(pair) > 1
-                     else {'ip_address': pair[0]}
-                     for pair in allowed_address_pairs])
-            if router_ip:
-                opt = {"opt_value": router_ip,
-                       "ip_version": 4,
-                       "opt_name": "3"}
-                port_data['extra_dhcp_opts'] = [opt]
+            port_data = self.make_vm_port_data(
+                name, net_id, sgs=sgs,
+                allowed_address_pairs=allowed_address_pairs,
+                port_security_enabled=port_security_enabled,
+                router_ip=router_ip)
             port = self.api.create_port({'port': port_data})['port']
             self.LOG.debug("Created port for VM: " + str(port))
         else:
@@ -329,6 +429,80 @@ class NeutronTestCase(TestCase):
                 vm.terminate()
             raise
 
+    def create_vm_servers(self, specs, max_threads=None):
+        """
+        Create several VM servers at once: the ports which are needed are
+        created with one bulk request, then the VMs are created, plugged
+        in and set up (waiting for DHCP) in parallel.  If any of them
+        fails, every VM and port created here is cleaned up and the first
+        failure is raised.
+        :param specs: list[dict[str, any]]: create_vm_server arguments
+        for each VM
+        :param max_threads: int: Most VMs to set up at once (default: all)
+        :rtype: list[(dict[str, str], zephyr.vtm.guest.Guest, str)]
+        """
+        new_port_specs = [spec for spec in specs
+                          if not spec.get('neutron_port')]
+        for spec in new_port_specs:
+            if not spec.get('net_id'):
+                raise exceptions.ArgMismatchException(
+                    "If no existing port is specified, a network "
+                    "ID on which to create a new port MUST be provided")
+
+        new_ports = []
+        if new_port_specs:
+            new_ports = self.api.create_port(
+                {'ports': [self.make_vm_port_data(
+                    spec['name'], spec['net_id'],
+                    sgs=spec.get('sgs', list()),
+                    allowed_address_pairs=spec.get('allowed_address_pairs'),
+                    port_security_enabled=spec.get('port_security_enabled'),
+                    router_ip=spec.get('router_ip'))
+                    for spec in new_port_specs]})['ports']
+            self.LOG.debug("Created ports for VMs: " + str(new_ports))
+        new_port_iter = iter(new_ports)
+        ports = [spec.get('neutron_port') or next(new_port_iter)
+                 for spec in specs]
+
+        vms = []
+        try:
+            vms = self.vtm.create_vms(
+                [{'name': spec['name'], 'hv_host': spec.get('hv_host')}
+                 for spec in specs],
+                max_threads=max_threads)
+
+            def setup_vm(vm, port, spec):
+                vm.plugin_port('eth0', port['id'], mac=port['mac_address'])
+                ip_addr = (None if spec.get('use_dhcp', True)
+                           else port['fixed_ips'][0]['ip_address'])
+                vm.setup_vm_network(ip_addr=ip_addr, gw_ip=spec.get('gw_ip'))
+                return ip_addr, vm.get_ip('eth0')
+
+            setup_futures = run_concurrently(
+                [functools.partial(setup_vm, vm, port, spec)
+                 for vm, port, spec in zip(vms, ports, specs)],
+                max_threads=max_threads)
+            failures = [f for f in setup_futures
+                        if f.exception() is not None]
+            if failures:
+                self.LOG.error('Failed to set up ' + str(len(failures)) +
+                               ' of ' + str(len(specs)) + ' VMs')
+                failures[0].result()
+
+            servers = []
+            for vm, port, future in zip(vms, ports, setup_futures):
+                ip_addr, vm_ip = future.result()
+                self.servers.append((vm, ip_addr, port))
+                servers.append((port, vm, vm_ip))
+            return servers
+
+        except Exception:
+            exc_info = sys.exc_info()
+            self.cleanup_vms(
+                [(vm, None) for vm in vms] +
+                [(None, port) for port in new_ports])
+            reraise(exc_info)
+
     def clean_vm_servers(self):
         cleanup_errors = []
         for (vm, ip_addr, port) in self.servers:
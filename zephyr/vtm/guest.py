@@ -14,7 +14,11 @@
 
 import time
 from zephyr.common import exceptions
+from zephyr.common.traffic_generator import TrafficReport
 from zephyr.common.zephyr_constants import DEFAULT_ECHO_PORT
+from zephyr.common.zephyr_constants import DEFAULT_TRAFFIC_PORT
+
+TRAFFIC_DRAIN_TIME = 1
 
 PACKET_CAPTURE_TIMEOUT = 10
 
@@ -107,7 +111,8 @@ class Guest(object):
     def start_capture(self, on_iface='eth0',
                       count=0, ptype='', pfilter=None,
                       callback=None, callback_args=None,
-                      save_dump_file=False, save_dump_filename=None):
+                      save_dump_file=False, save_dump_filename=None,
+                      capture_buffer=None):
         """
         :param on_iface: str: Interface to capture on ('any' is
         also acceptable)
@@ -121,30 +126,38 @@ class Guest(object):
         capture file
         :param save_dump_filename: str: Filename to save temporary packet
         capture file
+        :param capture_buffer: CaptureBuffer: Optional buffer (with its own
+        size bounds and drop policy) to hold the captured packets
         """
         self.vm_underlay.start_capture(interface=on_iface,
                                        count=count, ptype=ptype,
                                        pfilter=pfilter, callback=callback,
                                        callback_args=callback_args,
                                        save_dump_file=save_dump_file,
-                                       save_dump_filename=save_dump_filename)
+                                       save_dump_filename=save_dump_filename,
+                                       capture_buffer=capture_buffer)
 
     def capture_packets(self, on_iface='eth0', count=1,
-                        timeout=PACKET_CAPTURE_TIMEOUT):
+                        timeout=PACKET_CAPTURE_TIMEOUT, match=None):
         """
         Capture (count) number of packets that have come into the given
         interface on an running capture (raises ObjectNotFoundException if
         capture isn't running already), or wait (timeout) seconds for all
         the packets to arrive.  Returns the packet list and throws a
         SubprocessTimeoutException if the packets do not all arrive in time.
+        If match (a predicate taking a PCAPPacket, or a PcapRule) is given,
+        only matching packets are returned and counted, and the others
+        are discarded.  The returned list also carries the number of
+        packets the capture has dropped (see CapturedPackets).
         :param on_iface: str
         :param count: int
         :param timeout: int
-        :return: list[PCAPPacket]
+        :param match: callable | PcapRule
+        :return: zephyr.common.capture_buffer.CapturedPackets
         """
         return self.vm_underlay.capture_packets(
             interface=on_iface, count=count,
-            timeout=timeout)
+            timeout=timeout, match=match)
 
     def stop_capture(self, on_iface='eth0'):
         """
@@ -228,7 +241,7 @@ class Guest(object):
         localhost:80).  If echo service has not been started, do nothing.
         :param ip_addr: str
         :param port: int
-        :return: (file, file) | None
+        :return: int | None The number of echo servers stopped
         """
         return self.vm_underlay.stop_echo_server(ip_addr, port)
 
@@ -251,6 +264,136 @@ class Guest(object):
             echo_request=echo_request, protocol=protocol,
             timeout=timeout)
 
+    def send_echo_requests(self, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                           count=1, concurrency=10, timeout=10,
+                           echo_request='ping', protocol='tcp'):
+        """
+        Send [count] echo requests to dest_ip on dest_port from this
+        guest, each over its own connection, with up to [concurrency] of
+        them in flight at once.  Returns the replies per responder,
+        timeouts, errors, mismatched replies and each request's latency.
+        :param dest_ip: str
+        :param dest_port: int
+        :param count: int
+        :param concurrency: int
+        :param timeout: int
+        :param echo_request: str
+        :param protocol: str
+        :return: zephyr.common.netns_agent.EchoBatchResult
+        """
+        return self.vm_underlay.send_echo_requests(
+            dest_ip=dest_ip, dest_port=dest_port, count=count,
+            concurrency=concurrency, echo_request=echo_request,
+            protocol=protocol, timeout=timeout)
+
+    def measure_latency(self, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                        count=100, mode='persistent', protocol='tcp',
+                        interval=0, timeout=10):
+        """
+        Measure the latency from this guest to an echo server with
+        [count] timestamped probes, either over one connection
+        ('persistent') or a new connection each ('connect').  New flows'
+        setup (first packet) latency is reported apart from steady-state
+        round trips.
+        :param dest_ip: str
+        :param dest_port: int
+        :param count: int
+        :param mode: str
+        :param protocol: str
+        :param interval: float
+        :param timeout: int
+        :return: zephyr.common.latency.LatencyReport
+        """
+        return self.vm_underlay.measure_latency(
+            dest_ip=dest_ip, dest_port=dest_port, count=count, mode=mode,
+            protocol=protocol, interval=interval, timeout=timeout)
+
+    def measure_throughput(self, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                           direction='upload', size=None, duration=None,
+                           timeout=10):
+        """
+        Stream [size] bytes, or stream for [duration] seconds, between
+        this guest and an echo server, to the server ('upload') or from
+        it ('download'), and report the goodput, completion time and the
+        sender's TCP retransmissions.
+        :param dest_ip: str
+        :param dest_port: int
+        :param direction: str
+        :param size: int
+        :param duration: float
+        :param timeout: int
+        :return: zephyr.common.netns_agent.ThroughputReport
+        """
+        return self.vm_underlay.measure_throughput(
+            dest_ip=dest_ip, dest_port=dest_port, direction=direction,
+            size=size, duration=duration, timeout=timeout)
+
+    def probe(self, dest_ip, dest_port, protocol='tcp', payload=None,
+              timeout=3):
+        """
+        Check from this guest whether anything answers on the given port
+        (a TCP connection can be made, or a UDP datagram gets a reply).
+        :param dest_ip: str
+        :param dest_port: int
+        :param protocol: str
+        :param payload: str
+        :param timeout: float
+        :return: dict[str, any] See zephyr.common.netns_agent.probe
+        """
+        return self.vm_underlay.probe(dest_ip, dest_port, protocol,
+                                      payload, timeout)
+
+    def start_traffic_sink(self, port=DEFAULT_TRAFFIC_PORT, port_count=1,
+                           protocol='udp'):
+        """
+        Start receiving generated traffic on this guest, on [port_count]
+        ports starting at the given port.
+        :param port: int
+        :param port_count: int
+        :param protocol: str
+        :return: zephyr.common.traffic_generator.TrafficSink
+        """
+        return self.vm_underlay.start_traffic_sink(port, port_count,
+                                                   protocol)
+
+    def stop_traffic_sink(self, port=DEFAULT_TRAFFIC_PORT):
+        """
+        Stop the traffic sink on the given port and return what it
+        received, by flow ID.
+        :param port: int
+        :return: dict[int, zephyr.common.traffic_generator.FlowReceiveStats]
+        """
+        return self.vm_underlay.stop_traffic_sink(port)
+
+    def send_traffic(self, flows, sink_guest=None,
+                     sink_port=DEFAULT_TRAFFIC_PORT,
+                     drain_time=TRAFFIC_DRAIN_TIME):
+        """
+        Send the flows (see FlowSpec) from this guest at their target
+        rates and return a TrafficReport.  If the guest running the sink
+        is given, the report compares what was sent with what that sink
+        received (once drain_time seconds have passed for packets still
+        in flight), giving loss, reordering, throughput and latency per
+        flow.  Otherwise it only covers what was sent.
+        :param flows: list[zephyr.common.traffic_generator.FlowSpec]
+        :param sink_guest: Guest
+        :param sink_port: int
+        :param drain_time: float
+        :return: TrafficReport
+        """
+        if sink_guest is not None:
+            # Start the counts afresh, as flow IDs are reused across runs
+            sink_guest.vm_underlay.traffic_sink_stats(sink_port, reset=True)
+
+        sent = self.vm_underlay.send_traffic(flows)
+
+        received = None
+        if sink_guest is not None:
+            time.sleep(drain_time)
+            received = sink_guest.vm_underlay.traffic_sink_stats(
+                sink_port, reset=True)
+        return TrafficReport(sent, received)
+
     def execute(self, cmd_line, timeout=None, blocking=True):
         """
         Execute the given cmd_line command on this guest, using an optional
@@ -272,10 +415,13 @@ class Guest(object):
 
     def terminate(self):
         """
-        Kill this VM.
+        Kill this VM (or, if it came from a VM pool, return it there).
         :return:
         """
         for p in self.open_ports_by_id:
             self.vm_underlay.unplug_port(p)
         self.open_ports_by_id.clear()
-        self.vm_underlay.terminate()
+        if self.vm_underlay.vm_pool is not None:
+            self.vm_underlay.vm_pool.release(self.vm_underlay)
+        else:
+            self.vm_underlay.terminate()
@@ -12,14 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import errno
 import logging
+import socket
 import uuid
 
+from zephyr.common.capture_service import CaptureService
 from zephyr.common import cli
+from zephyr.common.echo_server import EchoServer
+from zephyr.common.echo_server import EchoService
 from zephyr.common import exceptions
 from zephyr.common.ip import IP
+from zephyr.common import netns_agent
 from zephyr.common.tcp_dump import TCPDump
 from zephyr.common.tcp_sender import TCPSender
+from zephyr.common.traffic_generator import TrafficGenerator
+from zephyr.common.traffic_generator import TrafficSink
 from zephyr.common import utils
 from zephyr.common import zephyr_constants
 from zephyr.vtm.underlay import underlay_host
@@ -34,8 +42,12 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
         super(DirectUnderlayHost, self).__init__(name)
         self.cli = cli.LinuxCLI()
         self.overlay = overlay
-        self.echo_server_procs = {}
-        self.packet_captures = []
+        self.echo_service = None
+        """ :type: EchoService"""
+        self.traffic_sinks = {}
+        """ :type: dict[int, TrafficSink]"""
+        self.packet_captures = {}
+        self.capture_service = None
         self.vm_type = vm_type
         self.vms = {}
         self.hypervisor = hypervisor
@@ -68,6 +80,7 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
             overlay=self.overlay,
             hypervisor=self,
             logger=self.LOG)
+        new_vm.create()
 
         self.vms[name] = new_vm
         return new_vm
@@ -105,6 +118,7 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
                 "Can only create a tap for a VM on a hypervisor host")
 
         peer_name = vm_host.name
+        vm_netns = vm_host.netns_name()
 
         self.LOG.debug(
             "Creating TAP interface: " + tap_iface_name + " to connect to"
@@ -121,7 +135,7 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
 
         self.execute(
             'ip link set dev ' + peer_name + ' netns ' +
-            self.name + ' name ' + vm_iface_name)
+            vm_netns + ' name ' + vm_iface_name)
 
         self.execute('ip link set dev ' + tap_iface_name + ' up')
         vm_host.execute('ip link set dev ' + vm_iface_name + ' up')
@@ -130,8 +144,8 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
             'ip link add dev ' + tap_iface_name +
             ' type veth peer name ' + tap_iface_name + '.p')
 
-        if vm_host.name not in self.taps:
-            self.taps[vm_host.name] = set()
+        if vm_host.unique_id not in self.taps:
+            self.taps[vm_host.unique_id] = set()
         self.taps[vm_host.unique_id].add(tap_iface_name)
 
         self.LOG.debug("Creating tap interface on hypervisor [" +
@@ -140,9 +154,17 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
 
     def remove_taps(self, vm_host):
         if vm_host.unique_id in self.taps:
-            for tap in self.taps[vm_host.unique_id]:
+            for tap in self.taps.pop(vm_host.unique_id):
                 self.execute('ip link del dev ' + tap)
 
+    def netns_name(self):
+        """
+        Name of the network namespace this host's commands run in, or
+        None for the root namespace.
+        :return: str
+        """
+        return self.cli.name if isinstance(self.cli, cli.NetNSCLI) else None
+
     def get_hypervisor_name(self):
         raise exceptions.ArgMismatchException(
             "Error; getting hypervisor operation only valid on a VM host")
@@ -205,18 +227,118 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
     def do_start_echo_server(self, ip_addr='localhost',
                              port=zephyr_constants.DEFAULT_ECHO_PORT,
                              echo_data="pong", protocol='tcp'):
-        pass
+        # All of the host's echo servers are served by one thread
+        if self.echo_service is None:
+            self.echo_service = EchoService(netns_name=self.netns_name(),
+                                            logger=self.LOG)
+            self.echo_service.start()
+        self.echo_service.add_listener(ip_addr, port, echo_data, protocol)
 
     def do_stop_echo_server(self, ip_addr='localhost',
                             port=zephyr_constants.DEFAULT_ECHO_PORT):
-        return None
+        if self.echo_service is None:
+            return None
+        return self.echo_service.remove_listener(ip_addr, port)
+
+    def stop_echo_service(self):
+        if self.echo_service is not None:
+            self.echo_service.stop()
+            self.echo_service = None
 
     def do_send_echo_request(self, dest_ip='localhost',
                              dest_port=zephyr_constants.DEFAULT_ECHO_PORT,
                              echo_request='ping',
                              protocol='tcp', timeout=10):
-        out_str = ""
-        return out_str
+        try:
+            return EchoServer.send(dest_ip, dest_port, echo_request,
+                                   protocol=protocol, timeout=timeout,
+                                   netns_name=self.netns_name())
+        except socket.error as e:
+            raise exceptions.SubprocessFailedException(
+                'Echo send to ' + dest_ip + ':' + str(dest_port) +
+                ' failed: ' + str(e))
+
+    def do_send_echo_requests(self, dest_ip,
+                              dest_port=zephyr_constants.DEFAULT_ECHO_PORT,
+                              count=1, concurrency=10, echo_request='ping',
+                              protocol='tcp', timeout=10):
+        return netns_agent.send_echo_requests(
+            dest_ip, dest_port, count, concurrency, echo_request, protocol,
+            timeout, netns_name=self.netns_name())
+
+    def measure_latency(self, dest_ip,
+                        dest_port=zephyr_constants.DEFAULT_ECHO_PORT,
+                        count=100, mode='persistent', protocol='tcp',
+                        interval=0, timeout=10):
+        return netns_agent.measure_latency(
+            dest_ip, dest_port, count, mode, protocol, interval, timeout,
+            netns_name=self.netns_name())
+
+    def measure_throughput(self, dest_ip,
+                           dest_port=zephyr_constants.DEFAULT_ECHO_PORT,
+                           direction='upload', size=None, duration=None,
+                           timeout=10):
+        try:
+            return netns_agent.measure_throughput(
+                dest_ip, dest_port, direction, size, duration, timeout,
+                netns_name=self.netns_name())
+        except socket.error as e:
+            raise exceptions.SubprocessFailedException(
+                'Bulk transfer to ' + dest_ip + ':' + str(dest_port) +
+                ' failed: ' + str(e))
+
+    def probe(self, dest_ip, dest_port, protocol='tcp', payload=None,
+              timeout=3):
+        return netns_agent.probe(dest_ip, dest_port, protocol, payload,
+                                 timeout, netns_name=self.netns_name())
+
+    def start_traffic_sink(self, port=zephyr_constants.DEFAULT_TRAFFIC_PORT,
+                           port_count=1, protocol='udp'):
+        """
+        Start receiving generated traffic on [port_count] ports starting
+        at the given port (replacing any sink already on that port).
+        :type port: int
+        :type port_count: int
+        :type protocol: str
+        :rtype: TrafficSink
+        """
+        self.stop_traffic_sink(port)
+        sink = TrafficSink(port=port, port_count=port_count,
+                           protocol=protocol, netns_name=self.netns_name())
+        self.traffic_sinks[port] = sink.start()
+        return sink
+
+    def traffic_sink_stats(self, port=zephyr_constants.DEFAULT_TRAFFIC_PORT,
+                           reset=False):
+        """
+        :type port: int
+        :type reset: bool
+        :rtype: dict[int, zephyr.common.traffic_generator.FlowReceiveStats]
+        """
+        if port not in self.traffic_sinks:
+            raise exceptions.ObjectNotFoundException(
+                'No traffic sink on port ' + str(port) + ' on host: ' +
+                self.name)
+        return self.traffic_sinks[port].stats(reset=reset)
+
+    def stop_traffic_sink(self, port=zephyr_constants.DEFAULT_TRAFFIC_PORT):
+        """
+        Stop the traffic sink on the given port, if there is one, and
+        return what it received.
+        :type port: int
+        :rtype: dict[int, zephyr.common.traffic_generator.FlowReceiveStats]
+        """
+        sink = self.traffic_sinks.pop(port, None)
+        return sink.stop() if sink is not None else None
+
+    def send_traffic(self, flows):
+        """
+        Send the flows from this host, each paced to its own rate, and
+        return what was sent once they have all finished.
+        :type flows: list[zephyr.common.traffic_generator.FlowSpec]
+        :rtype: list[zephyr.common.traffic_generator.FlowSendStats]
+        """
+        return TrafficGenerator(flows, netns_name=self.netns_name()).run()
 
     # Specialized host-testing methods
     def send_custom_packet(self, iface, **kwargs):
@@ -250,14 +372,15 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
         tcps = TCPSender()
         opt_map = {'command': command}
         if source_mac is not None:
-            opt_map = {'smac': source_mac}
+            opt_map['smac'] = source_mac
         if dest_mac is not None:
-            opt_map = {'tmac': dest_mac}
+            opt_map['tmac'] = dest_mac
         if source_ip is not None:
-            opt_map = {'sip': source_ip}
+            opt_map['sip'] = source_ip
         if dest_ip is not None:
-            opt_map = {'tip': dest_ip}
-        opt_map += packet_options
+            opt_map['tip'] = dest_ip
+        if packet_options is not None:
+            opt_map.update(packet_options)
         return tcps.send_packet(self.cli, interface=iface, dest_ip=dest_ip,
                                 packet_type='arp',
                                 packet_options=opt_map, count=count).stdout
@@ -290,14 +413,25 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
     def do_ping(self, target_ip, iface=None, count=1, timeout=None):
         """
         Ping a target IP.  Can specify the interface to use and/or the number
-        of pings to send.  Returns true if all pings succeeded, false
-        otherwise.
+        of pings to send.  Returns true if any ping got a reply, false
+        otherwise.  The pings are sent from this process where raw sockets
+        are allowed, and with the ping command otherwise.
         :param target_ip: str: target IP in CIDR format
         :param iface: str: Interface or IP to act as source
         :param count: int: Number of pings to send
         :param timeout: int: Timeout before packets is marked as failed
         :rtype: bool
         """
+        try:
+            return netns_agent.ping(
+                target_ip, iface, count, timeout,
+                netns_name=self.netns_name())['received'] > 0
+        except socket.error as e:
+            if e.errno not in (errno.EPERM, errno.EACCES):
+                self.LOG.debug('Ping failed: ' + str(e))
+                return False
+            self.LOG.debug('Native ping unavailable, running ping: ' +
+                           str(e))
         iface_str = (('-I ' + iface) if iface is not None else '')
         timeout_str = (('-W ' + str(timeout) + ' ')
                        if timeout is not None
@@ -309,7 +443,7 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
 
     def start_capture(self, interface, count=0, ptype='', pfilter=None,
                       callback=None, callback_args=None, save_dump_file=False,
-                      save_dump_filename=None):
+                      save_dump_filename=None, capture_buffer=None):
         """
         Starts the capture of packets on the host's interface with
         pcap_filter tools (e.g. tcpdump). This will start a process
@@ -337,6 +471,8 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
         packet capture file
         :param save_dump_filename: str: Filename to save temporary
         packet capture file
+        :param capture_buffer: CaptureBuffer: Optional buffer (with its
+        own size bounds and drop policy) to hold the captured packets
         :rtype:
         """
         tcpd = (self.packet_captures[interface]
@@ -346,16 +482,23 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
 
         self.LOG.debug('Starting tcpdump on host: ' + self.name)
 
+        # All of the host's native captures are read by one thread
+        if self.capture_service is None:
+            self.capture_service = CaptureService(self.name,
+                                                  logger=self.LOG)
+
         tcpd.start_capture(cli=self.cli, interface=interface, count=count,
                            packet_type=ptype, pcap_filter=pfilter,
                            callback=callback, callback_args=callback_args,
                            save_dump_file=save_dump_file,
                            save_dump_filename=save_dump_filename,
-                           blocking=False)
+                           blocking=False,
+                           capture_service=self.capture_service,
+                           capture_buffer=capture_buffer)
 
         self.packet_captures[interface] = tcpd
 
-    def capture_packets(self, interface, count=1, timeout=None):
+    def capture_packets(self, interface, count=1, timeout=None, match=None):
         """
         Wait for and return a list of [count] received packets on the given
         interface. The optional timeout can be specified to bound the time
@@ -366,6 +509,10 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
         return what is buffered)
         :param timeout: int: Upper bound on length of time to wait before
         exception is raised
+        :param match: callable | PcapRule: Only return (and count) the
+        packets which match this predicate or rule, discarding the rest
+        The returned list also carries the capture's drop counts, which
+        are logged if any packets have been dropped.
         :rtype: list [PCAPPacket]
         """
         if interface not in self.packet_captures:
@@ -373,7 +520,14 @@ class DirectUnderlayHost(underlay_host.UnderlayHost):
                 'No packet capture is running or was run on host/interface' +
                 self.name + '/' + interface)
         tcpd = self.packet_captures[interface]
-        return tcpd.wait_for_packets(count, timeout)
+        if match is not None:
+            ret = tcpd.wait_for_matching_packets(match, count, timeout)
+        else:
+            ret = tcpd.wait_for_packets(count, timeout)
+        if ret.drop_summary():
+            self.LOG.warning('Capture on ' + self.name + '/' + interface +
+                             ': ' + ret.drop_summary())
+        return ret
 
     def stop_capture(self, interface):
         """
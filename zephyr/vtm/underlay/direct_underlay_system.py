@@ -88,6 +88,8 @@ class DirectUnderlaySystem(underlay_system.UnderlaySystem):
                     "Unrecognized host type: " + host_type)
 
             self.hosts[name] = new_host
+            if hypervisor:
+                self.hypervisors[name] = new_host
 
     def get_topology_feature(self, name):
         return self.features.get(name, None)
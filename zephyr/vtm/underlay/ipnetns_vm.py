@@ -23,20 +23,23 @@ from zephyr.vtm.underlay import vm_base
 
 class IPNetnsVM(direct_underlay_host.DirectUnderlayHost,
                 vm_base.VMBase):
-    def __init__(self, name, overlay, host, logger=None):
-        super(IPNetnsVM, self).__init__(name, overlay, hypervisor=False,
-                                        logger=logger)
+    def __init__(self, name, overlay, hypervisor, logger=None):
+        super(IPNetnsVM, self).__init__(name, overlay=overlay,
+                                        hypervisor=False, logger=logger)
+        # The namespace keeps this name if the VM is renamed
         self.cli = cli.NetNSCLI(self.name)
-        self.host = host
+        self.host = hypervisor
         self.main_iface_name = 'eth0'
 
     def create_vm(self, name=None):
         raise exceptions.ArgMismatchException(
             "Cannot create a VM inside a VM.")
 
-    def vm_startup(self, ip_addr=None, gw_ip=None):
-        cli.CREATENSCMD(self.name)
+    def create(self):
+        cli.CREATENSCMD(self.cli.name)
+        self.execute('ip link set dev lo up')
 
+    def vm_startup(self, ip_addr=None, gw_ip=None):
         if ip_addr is not None:
             self.execute('ip addr add ' + str(ip.IP.make_ip(ip_addr)) +
                          ' dev ' + self.main_iface_name)
@@ -53,11 +56,11 @@ class IPNetnsVM(direct_underlay_host.DirectUnderlayHost,
         pass
 
     def get_hypervisor_name(self):
-        return self.hypervisor.name
+        return self.host.name
 
     def plugin_port(self, iface, port_id, mac=None, vlans=None):
         tapname = 'tap' + port_id[0:8]
-        self.hypervisor.create_tap_interface_for_vm(
+        self.host.create_tap_interface_for_vm(
             tap_iface_name=tapname, vm_host=self,
             vm_iface_name=iface, vm_mac=mac, vm_vlans=vlans)
 
@@ -98,13 +101,45 @@ class IPNetnsVM(direct_underlay_host.DirectUnderlayHost,
             self.cli.rm('/run/dhclient-' + file_name + '.pid')
             self.cli.rm('/var/lib/dhcp/dhclient-' + file_name + '.lease')
 
+    def rename_vm(self, name):
+        self.host.vms.pop(self.name)
+        super(IPNetnsVM, self).rename_vm(name)
+        self.host.vms[name] = self
+
+    def reset_vm(self):
+        """
+        Scrub this VM for reuse: stop everything running in it, release
+        its DHCP lease and remove its taps (taking its port interfaces
+        and their addresses with them), then flush what is left of its
+        routes and ARP table.
+        """
+        super(IPNetnsVM, self).reset_vm()
+        for port in self.traffic_sinks.keys():
+            self.stop_traffic_sink(port)
+        self.stop_echo_service()
+        for iface in self.packet_captures.keys():
+            self.stop_capture(iface)
+        self.packet_captures.clear()
+        for iface in list(self.dhcpcd_is_running):
+            self.stop_dhcp_client(iface)
+        self.dhcpcd_is_running.clear()
+        for pid in self.cli.get_running_pids():
+            self.cli.cmd('kill -9 ' + pid)
+        self.host.remove_taps(self)
+        self.flush_arp()
+        self.execute('ip route flush table main')
+        self.main_ip = '127.0.0.1'
+
     def terminate(self):
         """
         Kill this Host.
         :return:
         """
+        for port in self.traffic_sinks.keys():
+            self.stop_traffic_sink(port)
+        self.stop_echo_service()
         self.host.remove_taps(self)
-        cli.REMOVENSCMD(self.name)
+        cli.REMOVENSCMD(self.cli.name)
         self.host.vms.pop(self.name)
 
         if self.main_iface_name in self.dhcpcd_is_running:
@@ -16,6 +16,7 @@ import abc
 import time
 from zephyr.common import exceptions
 from zephyr.common.zephyr_constants import DEFAULT_ECHO_PORT
+from zephyr.common.zephyr_constants import DEFAULT_TRAFFIC_PORT
 
 
 class UnderlayHost(object):
@@ -25,6 +26,8 @@ class UnderlayHost(object):
         self.main_ip = None
         self.overlay_settings = None
         self.cached_ips = set()
+        self.vm_pool = None
+        """ :type: zephyr.vtm.underlay.vm_pool.VMPool"""
 
     def create_vm(self, name=None):
         return None
@@ -103,19 +106,13 @@ class UnderlayHost(object):
                 conn_resp = ''
 
             if time.time() > timeout:
-                out = self.stop_echo_server(ip_addr, port)
-                stdout = out[0] if out else ''
-                stderr = out[1] if out else ''
+                self.stop_echo_server(ip_addr, port)
                 self.LOG.error(
-                    'Echo server listener failed to bind to port '
-                    'within timeout (stdout/stderr): ' +
-                    str(stdout.replace('\\n', '\n')) + " / " +
-                    str(stderr.replace('\\n', '\n')))
+                    'Echo server listener did not answer on port ' +
+                    str(port) + ' within timeout')
                 raise exceptions.SubprocessTimeoutException(
-                    'Echo server listener failed to bind to port '
-                    'within timeout (stdout/stderr): ' +
-                    str(stdout.replace('\\n', '\n')) + " / " +
-                    str(stderr.replace('\\n', '\n')))
+                    'Echo server listener did not answer on port ' +
+                    str(port) + ' within timeout')
         return True
 
     @abc.abstractmethod
@@ -129,7 +126,7 @@ class UnderlayHost(object):
         localhost:80).  If echo service has not been started, do nothing.
         :param ip_addr: str
         :param port: int
-        :rtype: (file, file)
+        :rtype: int | None The number of echo servers stopped
         """
         self.LOG.debug('Stopping echo server on host [' + self.name +
                        '] on IP and port: ' +
@@ -155,20 +152,7 @@ class UnderlayHost(object):
         :param timeout: int
         :rtype: str
         """
-        overlay_settings = self.get_overlay_settings()
-        if (dest_ip != 'localhost' and
-                dest_ip != '127.0.0.1' and
-                dest_ip not in self.cached_ips and
-                'pre_caching_required' in overlay_settings and
-                overlay_settings['pre_caching_required']):
-            self.LOG.debug(
-                'Sending packet to pre-cache topology to: ' +
-                dest_ip + '/' + str(dest_port))
-            try:
-                self.do_send_echo_request(dest_ip, dest_port, 'pre-cache')
-            except exceptions.SubprocessFailedException:
-                pass
-            self.cached_ips.add(dest_ip)
+        self.pre_cache_echo(dest_ip, dest_port)
 
         self.LOG.debug(
             'Sending TCP echo [' + echo_request +
@@ -187,6 +171,89 @@ class UnderlayHost(object):
                              protocol='tcp', timeout=10):
         return None
 
+    def send_echo_requests(self, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                           count=1, concurrency=10, echo_request='ping',
+                           protocol='tcp', timeout=10):
+        """
+        Send [count] echo requests to dest_ip on dest_port, each over its
+        own connection, with up to [concurrency] of them in flight at
+        once, and return what came of them.
+        :param dest_ip: str
+        :param dest_port: int
+        :param count: int
+        :param concurrency: int
+        :param echo_request: str
+        :param protocol: str
+        :param timeout: int
+        :rtype: zephyr.common.netns_agent.EchoBatchResult
+        """
+        self.pre_cache_echo(dest_ip, dest_port)
+
+        self.LOG.debug(
+            'Sending ' + str(count) + ' echo requests (' +
+            str(concurrency) + ' at a time) to far host IP: ' + dest_ip +
+            ' on port: ' + str(dest_port))
+        result = self.do_send_echo_requests(
+            dest_ip, dest_port, count, concurrency, echo_request, protocol,
+            timeout)
+        if result is not None:
+            self.LOG.debug(result.to_str())
+        return result
+
+    def do_send_echo_requests(self, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                              count=1, concurrency=10, echo_request='ping',
+                              protocol='tcp', timeout=10):
+        return None
+
+    def pre_cache_echo(self, dest_ip, dest_port=DEFAULT_ECHO_PORT):
+        """
+        Send a first echo request to dest_ip if the overlay needs its
+        topology pre-cached and this host hasn't sent there yet.
+        :param dest_ip: str
+        :param dest_port: int
+        """
+        overlay_settings = self.get_overlay_settings()
+        if (dest_ip != 'localhost' and
+                dest_ip != '127.0.0.1' and
+                dest_ip not in self.cached_ips and
+                'pre_caching_required' in overlay_settings and
+                overlay_settings['pre_caching_required']):
+            self.LOG.debug(
+                'Sending packet to pre-cache topology to: ' +
+                dest_ip + '/' + str(dest_port))
+            try:
+                self.do_send_echo_request(dest_ip, dest_port, 'pre-cache')
+            except exceptions.SubprocessFailedException:
+                pass
+            self.cached_ips.add(dest_ip)
+
+    def measure_latency(self, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                        count=100, mode='persistent', protocol='tcp',
+                        interval=0, timeout=10):
+        return None
+
+    def measure_throughput(self, dest_ip, dest_port=DEFAULT_ECHO_PORT,
+                           direction='upload', size=None, duration=None,
+                           timeout=10):
+        return None
+
+    def probe(self, dest_ip, dest_port, protocol='tcp', payload=None,
+              timeout=3):
+        return None
+
+    def start_traffic_sink(self, port=DEFAULT_TRAFFIC_PORT, port_count=1,
+                           protocol='udp'):
+        return None
+
+    def traffic_sink_stats(self, port=DEFAULT_TRAFFIC_PORT, reset=False):
+        return None
+
+    def stop_traffic_sink(self, port=DEFAULT_TRAFFIC_PORT):
+        return None
+
+    def send_traffic(self, flows):
+        return None
+
     def send_custom_packet(self, iface, **kwargs):
         return None
 
@@ -228,10 +295,10 @@ class UnderlayHost(object):
 
     def start_capture(self, interface, count=0, ptype='', pfilter=None,
                       callback=None, callback_args=None, save_dump_file=False,
-                      save_dump_filename=None):
+                      save_dump_filename=None, capture_buffer=None):
         return None
 
-    def capture_packets(self, interface, count=1, timeout=None):
+    def capture_packets(self, interface, count=1, timeout=None, match=None):
         return None
 
     def stop_capture(self, interface):
@@ -249,5 +316,20 @@ class UnderlayHost(object):
     def execute(self, cmd_line, timeout=None, blocking=True):
         return None
 
+    def rename_vm(self, name):
+        """
+        Give this VM a new name (when a VM pool hands it out to be used
+        under the name it was asked for).
+        :type name: str
+        """
+        self.name = name
+
+    def reset_vm(self):
+        """
+        Scrub this VM (once its ports are unplugged) so that a VM pool
+        can hand it out again as if it were new.
+        """
+        self.cached_ips.clear()
+
     def terminate(self):
         return None
@@ -13,8 +13,10 @@
 # limitations under the License.
 
 import logging
+import threading
 from zephyr.common import exceptions
 from zephyr.common import zephyr_constants as z_con
+from zephyr.vtm.underlay import vm_pool
 
 
 class UnderlaySystem(object):
@@ -27,6 +29,13 @@ class UnderlaySystem(object):
         self.debug = debug
         self.log_manager = log_manager
         self.hypervisors = {}
+        # VMs being created on each hypervisor (by name), so concurrent
+        # creations are spread out as serial ones would be
+        self.pending_vms = {}
+        """ :type: dict[str, int]"""
+        self.placement_lock = threading.Lock()
+        self.vm_pool = None
+        """ :type: vm_pool.VMPool"""
         self.log_file_name = log_file
         self.log_level = (logging.DEBUG
                           if debug is True
@@ -47,6 +56,10 @@ class UnderlaySystem(object):
 
     def read_config(self, config_map):
         self.log_dir = config_map.get('log_dir', '.')
+        # Idle VMs to keep ready on each hypervisor (none by default)
+        pool_size = config_map.get('vm_pool_size', 0)
+        if pool_size:
+            self.vm_pool = vm_pool.VMPool(pool_size, logger=self.LOG)
 
     def get_topology_feature(self, name):
         return None
@@ -69,6 +82,39 @@ class UnderlaySystem(object):
             (' on host: ' + str(requested_host) if requested_host else '') +
             (' with name: ' + name if name else ''))
 
+        with self.placement_lock:
+            start_hv_host, requested_vm_name = self.place_vm(
+                hv_map, vm_count_fn, name, requested_host)
+            pooled_vm = (self.vm_pool.take(start_hv_host.name)
+                         if self.vm_pool else None)
+            if pooled_vm is None:
+                self.pending_vms[start_hv_host.name] = (
+                    self.pending_vms.get(start_hv_host.name, 0) + 1)
+        if pooled_vm is not None:
+            # Pooled VMs take the name which was asked for (or generated),
+            # though their namespaces keep the names they were created with
+            self.LOG.debug('Using pooled VM ' + pooled_vm.name + ' for: ' +
+                           requested_vm_name)
+            pooled_vm.rename_vm(requested_vm_name)
+            return pooled_vm
+        try:
+            new_vm = start_hv_host.create_vm(name=requested_vm_name)
+        finally:
+            with self.placement_lock:
+                self.pending_vms[start_hv_host.name] -= 1
+        if self.vm_pool:
+            self.vm_pool.adopt(new_vm, start_hv_host.name)
+        return new_vm
+
+    def place_vm(self, hv_map, vm_count_fn, name=None, requested_host=None):
+        """
+        Choose the hypervisor (and name) for a new VM.
+        :type hv_map: dict[str, UnderlayHost]
+        :type vm_count_fn: runnable
+        :type name: str
+        :type requested_host: str | list[str]
+        :rtype: (UnderlayHost, str)
+        """
         if name is not None:
             requested_vm_name = name
         else:
@@ -103,10 +149,33 @@ class UnderlaySystem(object):
             raise exceptions.ObjectNotFoundException(
                 'No suitable hypervisor found to launch VM')
 
+        def vm_count(host):
+            # Idle pooled VMs run on their hypervisor, but aren't load
+            idle = self.vm_pool.idle_count(host.name) if self.vm_pool else 0
+            return (vm_count_fn(host) + self.pending_vms.get(host.name, 0) -
+                    idle)
+
         start_hv_host = reduce(
-            lambda a, b: a if vm_count_fn(a) <= vm_count_fn(b) else b,
+            lambda a, b: a if vm_count(a) <= vm_count(b) else b,
             valid_host_map.values())
-        return start_hv_host.create_vm(name=requested_vm_name)
+        return start_hv_host, requested_vm_name
+
+    def fill_vm_pool(self):
+        """
+        Create idle VMs until every hypervisor has a full VM pool (if VM
+        pooling is configured), so even the first VMs needn't be created
+        from scratch.
+        """
+        if self.vm_pool:
+            self.vm_pool.fill(self.hypervisors)
+
+    def clear_vm_pool(self):
+        """
+        Terminate all of the idle VMs in the VM pool (if there is one),
+        and close it so VMs still in use are terminated once released.
+        """
+        if self.vm_pool:
+            self.vm_pool.clear()
 
     def restart_hosts(self):
         for h in self.hosts.values():
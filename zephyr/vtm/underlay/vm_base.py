@@ -14,5 +14,8 @@
 
 
 class VMBase(object):
+    def create(self):
+        pass
+
     def vm_startup(self, ip_addr=None, gw_ip=None):
         pass
@@ -0,0 +1,158 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import functools
+import logging
+import threading
+
+from zephyr.common import utils
+
+POOL_VM_PREFIX = 'vmpool'
+
+
+class VMPool(object):
+    def __init__(self, size, logger=None):
+        """
+        Idle VMs kept ready on each hypervisor, so that a new VM only has
+        to be plugged in to its port rather than having its namespace
+        (and agent) created, and torn down again when it is terminated.
+        VMs returned to the pool are scrubbed by their reset_vm(), and
+        terminated instead if the pool is already full, or has been
+        cleared.
+        :type size: int
+        :type logger: logging.Logger
+        """
+        self.size = size
+        self.idle = {}
+        """ :type: dict[str, list[UnderlayHost]]"""
+        self.homes = {}
+        """ :type: dict[UnderlayHost, str]"""
+        self.next_id = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        if logger:
+            self.LOG = logger
+        else:
+            self.LOG = logging.getLogger('vm-pool')
+            self.LOG.addHandler(logging.NullHandler())
+
+    def idle_count(self, hv_name):
+        """
+        :type hv_name: str
+        :return: int
+        """
+        with self.lock:
+            return len(self.idle.get(hv_name, []))
+
+    def adopt(self, vm, hv_name):
+        """
+        Make a VM (running on the given hypervisor) part of the pool, so it
+        is returned to the pool rather than terminated once it is done.
+        :type vm: UnderlayHost
+        :type hv_name: str
+        """
+        with self.lock:
+            self.homes[vm] = hv_name
+        vm.vm_pool = self
+
+    def take(self, hv_name):
+        """
+        Hand out an idle VM on the given hypervisor, or None if there is
+        none.
+        :type hv_name: str
+        :return: UnderlayHost | None
+        """
+        with self.lock:
+            idle = self.idle.get(hv_name)
+            return idle.pop() if idle else None
+
+    def fill(self, hv_map):
+        """
+        Create VMs (in parallel) until each hypervisor has a full pool of
+        idle VMs.
+        :type hv_map: dict[str, UnderlayHost]
+        """
+        funcs = []
+        with self.lock:
+            if self.closed:
+                return
+            for hv_name, hv in hv_map.iteritems():
+                missing = self.size - len(self.idle.get(hv_name, []))
+                for _ in range(0, missing):
+                    name = POOL_VM_PREFIX + str(self.next_id)
+                    self.next_id += 1
+                    funcs.append(functools.partial(
+                        self.create_idle_vm, hv, hv_name, name))
+        if not funcs:
+            return
+        self.LOG.debug('Filling VM pools with ' + str(len(funcs)) + ' VMs')
+        failures = [f for f in utils.run_concurrently(funcs)
+                    if f.exception() is not None]
+        if failures:
+            self.LOG.error('Failed to create ' + str(len(failures)) +
+                           ' pooled VMs')
+            failures[0].result()
+
+    def create_idle_vm(self, hv, hv_name, name):
+        vm = hv.create_vm(name=name)
+        self.adopt(vm, hv_name)
+        with self.lock:
+            self.idle.setdefault(hv_name, []).append(vm)
+
+    def release(self, vm):
+        """
+        Return a VM which is done with to the pool, or terminate it if its
+        hypervisor's pool is full (or it could not be scrubbed, or the
+        pool has been cleared).
+        :type vm: UnderlayHost
+        """
+        hv_name = self.homes.get(vm)
+        with self.lock:
+            keep = (hv_name is not None and not self.closed and
+                    len(self.idle.get(hv_name, [])) < self.size)
+        if keep:
+            try:
+                vm.reset_vm()
+            except Exception as e:
+                self.LOG.error('Error scrubbing pooled VM: ' + vm.name +
+                               ': ' + str(e))
+                keep = False
+        with self.lock:
+            if (keep and not self.closed and
+                    len(self.idle.get(hv_name, [])) < self.size):
+                self.LOG.debug('Returning VM to pool: ' + vm.name)
+                self.idle.setdefault(hv_name, []).append(vm)
+                return
+            self.homes.pop(vm, None)
+        vm.vm_pool = None
+        vm.terminate()
+
+    def clear(self):
+        """
+        Terminate every idle VM in the pool, and close it, so VMs still in
+        use are terminated (rather than kept) when they are released, and
+        it isn't filled again.
+        """
+        with self.lock:
+            vms = [vm for idle in self.idle.itervalues() for vm in idle]
+            self.idle = {}
+            self.homes = {}
+            self.closed = True
+        for vm in vms:
+            vm.vm_pool = None
+            try:
+                vm.terminate()
+            except Exception as e:
+                self.LOG.error('Error terminating pooled VM: ' + vm.name +
+                               ': ' + str(e))
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import json
 import logging
 
@@ -90,6 +91,36 @@ class VirtualTopologyManager(object):
             hv_host=hv_host, name=name)
         return Guest(vm_underlay=vm_underlay)
 
+    def create_vms(self, specs, max_threads=None):
+        """
+        Creates several guest VMs at once, each on a thread of its own.  If
+        any VM fails to be created, the ones which were created are
+        terminated and the first failure is raised.
+        :param specs: list[dict[str, any]]: create_vm arguments (hv_host
+        and name) for each VM
+        :param max_threads: int: Most VMs to create at once (default: all)
+        :return: list[Guest]: The VMs, in the order of specs
+        """
+        if not self.underlay_system:
+            raise exceptions.ArgMismatchException(
+                "Can't create VM without an underlay system")
+        vm_futures = utils.run_concurrently(
+            [functools.partial(self.create_vm, **spec) for spec in specs],
+            max_threads=max_threads)
+        failures = [f for f in vm_futures if f.exception() is not None]
+        if failures:
+            self.LOG.error('Failed to create ' + str(len(failures)) +
+                           ' of ' + str(len(specs)) + ' VMs')
+            for vm in [f.result() for f in vm_futures
+                       if f.exception() is None]:
+                try:
+                    vm.terminate()
+                except Exception as e:
+                    self.LOG.error('Error terminating VM: ' + vm.name +
+                                   ': ' + str(e))
+            failures[0].result()
+        return [f.result() for f in vm_futures]
+
     def read_underlay_config(
             self,
             config_json=zephyr_constants.DEFAULT_UNDERLAY_CONFIG):
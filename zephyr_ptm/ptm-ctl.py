@@ -29,8 +29,9 @@ from zephyr_ptm.ptm.physical_topology_manager import PhysicalTopologyManager
 
 def usage(except_obj):
     und_file = zc.DEFAULT_UNDERLAY_CONFIG
-    print("Usage: ptm-ctl.py --startup [-c <config_file>] [-d]")
-    print("       ptm-ctl.py --shutdown [-d]")
+    print("Usage: ptm-ctl.py --startup [-c <config_file>] [-d] [-b] "
+          "[-n <mode>]")
+    print("       ptm-ctl.py --shutdown [-d] [-b]")
     print("       ptm-ctl.py --print")
     print("       ptm-ctl.py --features")
     print("       ptm-ctl.py --json")
@@ -68,6 +69,18 @@ def usage(except_obj):
     print("        zephyr underlay: " + und_file + ".  This file will be")
     print("        used to display the underlay topology of the currently")
     print("        running system, so it must be accurate and current.")
+    print('')
+    print("Options:")
+    print("    -b, --cli-broker")
+    print("        Run privileged commands through a single long-lived root")
+    print("        helper process instead of one 'sudo' per command.")
+    print("    -n, --net-config <mode>")
+    print("        How host bridges, interfaces, addresses and routes are")
+    print("        configured on startup: 'cli' (default) runs one 'ip' or")
+    print("        'brctl' command per change, 'netlink' applies each host's")
+    print("        changes as batched netlink requests (requires root),")
+    print("        'batch' runs each start tier's changes through a single")
+    print("        'ip -batch' and 'iptables-restore' per host.")
 
     if except_obj is not None:
         raise except_obj
@@ -95,10 +108,10 @@ def print_json(ptm_imp, dbg_on, log_base_dir, output_file=None):
 
 try:
     arg_map, extra_args = getopt.getopt(
-        sys.argv[1:], 'hdpc:l:fju:',
+        sys.argv[1:], 'hdpc:l:fju:bn:',
         ['help', 'debug', 'startup', 'shutdown',
          'print', 'features', 'config-file=',
-         'log-dir=', 'json'])
+         'log-dir=', 'json', 'cli-broker', 'net-config='])
 
     # Defaults
     ptm_ctl_dir = os.path.dirname(os.path.abspath(__file__))
@@ -112,6 +125,8 @@ try:
     neutron_command = ''
     log_dir = '/tmp/zephyr/logs'
     debug = False
+    use_cli_broker = False
+    net_config_mode = None
     underlay_config_file = conf_dir + '/' + zc.DEFAULT_UNDERLAY_CONFIG
 
     for arg, value in arg_map:
@@ -134,6 +149,10 @@ try:
             command = 'features'
         elif arg in ('-j', '--json'):
             command = 'json'
+        elif arg in ('-b', '--cli-broker'):
+            use_cli_broker = True
+        elif arg in ('-n', '--net-config'):
+            net_config_mode = value
         else:
             usage(exceptions.ArgMismatchException('Invalid argument' + arg))
 
@@ -141,6 +160,9 @@ try:
         usage(exceptions.ArgMismatchException(
             'Must specify at least one command option'))
 
+    if use_cli_broker:
+        cli.start_command_broker()
+
     log_manager = LogManager(root_dir=log_dir)
     if command == 'startup':
         log_manager.rollover_logs_fresh(file_filter='ptm*.log')
@@ -148,6 +170,8 @@ try:
     ptm = PhysicalTopologyManager(root_dir=root_dir,
                                   log_manager=log_manager)
     ptm.configure_logging(debug=debug)
+    if net_config_mode is not None:
+        ptm.set_net_config_mode(net_config_mode)
 
     if cli.LinuxCLI().exists(underlay_config_file):
         with open(underlay_config_file, "r") as f:
@@ -190,3 +214,5 @@ except exceptions.TestException as e:
     print('Unknown exception: ' + str(e))
     traceback.print_tb(sys.exc_traceback)
     exit(2)
+finally:
+    cli.stop_command_broker()
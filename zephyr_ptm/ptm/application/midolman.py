@@ -273,27 +273,22 @@ class Midolman(application.Application):
 
     def wait_for_process_stop(self):
         if self.cli.exists('/run/midolman/pid'):
-            pid = self.cli.read_from_file('/run/midolman/pid')
+            pid = self.cli.read_from_file('/run/midolman/pid').strip()
             self.cli.cmd('kill ' + str(pid))
 
-            deadline = datetime.datetime.now() + datetime.timedelta(seconds=30)
-            while LinuxCLI().is_pid_running(pid):
-                if datetime.datetime.now() > deadline:
+            if not self.cli.wait_for_pid_exit(pid, timeout=30):
+                self.LOG.error(
+                    "Process " + str(pid) +
+                    " not stopping, killing with extreme prejudice "
+                    "(kill -9)")
+                self.cli.cmd('kill -9 ' + str(pid))
+
+                if not self.cli.wait_for_pid_exit(pid, timeout=30):
                     self.LOG.error(
                         "Process " + str(pid) +
-                        " not stopping, killing with extreme prejudice "
-                        "(kill -9)")
-                    self.cli.cmd('kill -9' + str(pid))
-
-                    deadline2 = (datetime.datetime.now() +
-                                 datetime.timedelta(seconds=30))
-                    while LinuxCLI().is_pid_running(pid):
-                        if datetime.datetime.now() > deadline2:
-                            self.LOG.error(
-                                "Process " + str(pid) +
-                                " not stopped, even with SIGKILL")
-                            raise exceptions.SubprocessTimeoutException(
-                                "Couldn't stop process: midolman")
+                        " not stopped, even with SIGKILL")
+                    raise exceptions.SubprocessTimeoutException(
+                        "Couldn't stop process: midolman")
 
             self.cli.rm('/run/midolman/pid')
 
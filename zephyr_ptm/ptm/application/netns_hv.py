@@ -55,13 +55,17 @@ class NetnsHV(application.Application):
         new_host.net_up()
         new_host.net_up()
         new_host.net_finalize()
-        self.vms[new_host.id] = new_host
-        if new_host.name not in self.vms_by_name:
-            self.vms_by_name[new_host.name] = [new_host]
-        else:
-            self.vms_by_name[new_host.name].append(new_host)
+        new_host.start_agent()
+        self.add_vm(new_host)
         return new_host
 
+    def add_vm(self, vm):
+        self.vms[vm.id] = vm
+        if vm.name not in self.vms_by_name:
+            self.vms_by_name[vm.name] = [vm]
+        else:
+            self.vms_by_name[vm.name].append(vm)
+
     def remove_vm(self, vm):
         if vm.id in self.vms:
             self.vms.pop(vm.id)
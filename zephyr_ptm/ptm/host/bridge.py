@@ -33,7 +33,15 @@ class Bridge(Interface):
         self.linked_interfaces = {}
         """ :type: dict [str, Interface]"""
 
-    def create(self):
+    def create(self, tx=None):
+        """
+        :type tx: zephyr.common.netlink.NetlinkTransaction
+        """
+        if tx is not None:
+            tx.link_add_bridge(self.host.netns_name(), self.get_name(),
+                               stp='stp' in self.options, owner=self)
+            return
+
         self.cli.cmd('brctl addbr ' + self.get_name())
         # Link all configured interfaces to this bridge
         # Set any configured options
@@ -42,7 +50,10 @@ class Bridge(Interface):
             if i == 'stp':
                 self.cli.cmd('brctl stp ' + self.get_name() + ' on')
 
-    def remove(self):
+    def remove(self, tx=None):
+        """
+        :type tx: zephyr.common.netlink.NetlinkTransaction
+        """
         if len(self.ip_list) > 0:
             for i in self.linked_interfaces.itervalues():
                 # If this bridge has an IP, and the interface is a veth
@@ -50,18 +61,27 @@ class Bridge(Interface):
                 # pointing to this bridge
                 if i.state is Interface.UP and isinstance(i, VirtualInterface):
                     """ :type i: VirtualInterface"""
-                    i.peer_interface.host.del_route(IP('0.0.0.0', '0'))
+                    i.peer_interface.host.del_route(IP('0.0.0.0', '0'), tx)
         # Remove the bridge (note, bridge interface must be DOWN for
         # removal to work)
-        self.cli.cmd('brctl delbr ' + self.get_name())
+        if tx is not None:
+            tx.link_del(self.host.netns_name(), self.get_name(), owner=self)
+        else:
+            self.cli.cmd('brctl delbr ' + self.get_name())
 
-    def link_interface(self, iface):
+    def link_interface(self, iface, tx=None):
         """
         Link an interface to this bridge.
         :param iface: Interface Interface to link
+        :param tx: NetlinkTransaction Queue the change on this transaction
+        instead of running brctl
         :return:
         """
-        self.cli.cmd('brctl addif ' + self.get_name() + ' ' + iface.name)
+        if tx is not None:
+            tx.link_set(self.host.netns_name(), iface.name,
+                        master=self.get_name(), owner=iface)
+        else:
+            self.cli.cmd('brctl addif ' + self.get_name() + ' ' + iface.name)
         self.linked_interfaces[iface.name] = iface
 
     def unlink_interface(self, iface):
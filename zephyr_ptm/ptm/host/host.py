@@ -12,17 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
 import datetime
 import json
 import logging
 import time
 import uuid
 
+from zephyr.common.capture_service import CaptureService
 from zephyr.common.cli import LinuxCLI
 from zephyr.common import exceptions
 from zephyr.common.ip import IP
+from zephyr.common.ip_batch import IPBatchTransaction
+from zephyr.common.netlink import NetlinkTransaction
+from zephyr.common.netns_agent import NetNSAgentClient
 from zephyr.common.tcp_dump import TCPDump
 from zephyr.common.tcp_sender import TCPSender
+from zephyr.common.traffic_generator import TrafficGenerator
+from zephyr.common.traffic_generator import TrafficSink
 from zephyr.common.utils import get_class_from_fqn
 from zephyr.common import zephyr_constants
 from zephyr_ptm.ptm.application import application
@@ -33,6 +40,10 @@ from zephyr_ptm.ptm.physical_topology_config import *
 from zephyr_ptm.ptm import ptm_constants
 from zephyr_ptm.ptm.ptm_object import PTMObject
 
+# Where hosts' agents put their control sockets
+AGENT_CONTROL_DIR = '/tmp'
+AGENT_START_TIMEOUT = 10
+
 
 class Host(PTMObject):
     def __init__(self, name, ptm, cli=LinuxCLI(),
@@ -55,6 +66,8 @@ class Host(PTMObject):
         """ :type: logging.Logger"""
         self.packet_captures = {}
         """ :type: dict[str, TCPDump]"""
+        self.capture_service = None
+        """ :type: CaptureService"""
         self.log_manager = (self.ptm.log_manager
                             if self.ptm is not None
                             else None)
@@ -64,14 +77,16 @@ class Host(PTMObject):
         self.applications_by_type = {}
         """ :type: dict[int, list[ptm.application.application.Application]]"""
         self.ip_forward_rules = []
-        """ :type: list[(str, str)]"""
+        """ :type: list[IPForwardRuleDef]"""
         self.route_rules = []
         """ :type: list[(IP, IP, str)]"""
         self.debug = False
         """ :type bool"""
         self.log_level = logging.INFO
-        self.echo_server_procs = {}
-        """ :type: dict[int, zephyr.common.cli.CommandStatus]"""
+        self.agent_proc = None
+        """ :type: zephyr.common.cli.CommandStatus"""
+        self.traffic_sinks = {}
+        """ :type: dict[int, TrafficSink]"""
         self.on_namespace = False
         self.log_file_name = zephyr_constants.ZEPHYR_LOG_FILE_NAME
         self.main_ip = '127.0.0.1'
@@ -152,7 +167,7 @@ class Host(PTMObject):
             self.main_ip = main_iface.ip_list[0].ip
 
         for ip_rule in ip_rules:
-            self.ip_forward_rules.append((ip_rule.exterior, ip_rule.interior))
+            self.ip_forward_rules.append(ip_rule)
 
         for route in route_rules:
             self.route_rules.append((route.dest, route.gw, route.dev))
@@ -276,87 +291,164 @@ class Host(PTMObject):
         if self.remove_func is not None:
             self.remove_func(self.name)
 
-    def boot(self):
-        # Create and bring up all bridges since they are local
-        for bridge in self.bridges.values():
-            self.LOG.debug('Creating and bringing up bridge: ' + bridge.name)
-            bridge.create()
-            bridge.config_addr()
-            bridge.up()
-
-        # Create all interfaces, but wait to bring them up
-        for interface in self.interfaces.itervalues():
-            self.LOG.debug('Creating interface: ' + interface.name)
-            interface.create()
-
-        self.set_loopback()
+    def netns_name(self):
+        """
+        Name of the network namespace this host's links live in, or None
+        for the root namespace.
+        :return: str
+        """
+        return self.name if self.on_namespace else None
 
-    def shutdown(self):
-        for interface in self.interfaces.itervalues():
-            if interface.name in self.dhcpcd_is_running:
-                self.stop_dhcp_client(interface.name)
-            interface.remove()
+    def net_config_mode(self):
+        return (self.ptm.net_config_mode if self.ptm is not None
+                else ptm_constants.NET_CONFIG_CLI)
 
-        for bridge in self.bridges.itervalues():
-            bridge.remove()
+    def start_net_transaction(self):
+        """
+        Returns a new transaction to queue this host's network changes on,
+        depending on the PTM's net config mode: a NetlinkTransaction
+        ('netlink'), an IPBatchTransaction ('batch'), or None to run one
+        'ip', 'brctl' or 'iptables' command per change ('cli').
+        :return: NetlinkTransaction | IPBatchTransaction
+        """
+        mode = self.net_config_mode()
+        if mode == ptm_constants.NET_CONFIG_NETLINK:
+            return NetlinkTransaction()
+        if mode == ptm_constants.NET_CONFIG_BATCH:
+            return IPBatchTransaction()
+        return None
+
+    def commit_net_transaction(self, tx):
+        """
+        :type tx: NetlinkTransaction | IPBatchTransaction
+        """
+        if tx is None:
+            return
+        self.LOG.debug('Applying ' + str(len(tx)) +
+                       ' network changes for host: ' + self.name)
+        try:
+            tx.commit()
+        except (exceptions.NetlinkException,
+                exceptions.IPBatchException) as e:
+            self.LOG.error('Network configuration failed on host: ' +
+                           self.name + ': ' + str(e))
+            raise
+
+    @contextlib.contextmanager
+    def net_transaction(self, tx=None):
+        """
+        Yields the given transaction (which the caller will commit, e.g.
+        for a whole PTM start tier), or starts a new one for this host
+        and commits it when the block finishes.
+        :type tx: NetlinkTransaction | IPBatchTransaction
+        """
+        if tx is not None:
+            yield tx
+            return
+        tx = self.start_net_transaction()
+        yield tx
+        self.commit_net_transaction(tx)
+
+    def boot(self, tx=None):
+        with self.net_transaction(tx) as tx:
+            # Create and bring up all bridges since they are local
+            for bridge in self.bridges.values():
+                self.LOG.debug('Creating and bringing up bridge: ' +
+                               bridge.name)
+                bridge.create(tx)
+                bridge.config_addr(tx)
+                bridge.up(tx)
+
+            # Create all interfaces, but wait to bring them up
+            for interface in self.interfaces.itervalues():
+                self.LOG.debug('Creating interface: ' + interface.name)
+                interface.create(tx)
+
+            self.set_loopback(tx=tx)
+
+    def shutdown(self, tx=None):
+        self.stop_agent()
+        with self.net_transaction(tx) as tx:
+            for interface in self.interfaces.itervalues():
+                if interface.name in self.dhcpcd_is_running:
+                    self.stop_dhcp_client(interface.name)
+                interface.remove(tx)
+
+            for bridge in self.bridges.itervalues():
+                bridge.remove(tx)
 
     def reboot(self):
         self.shutdown()
         self.boot()
 
-    def net_up(self):
-        # Configure and bring up all network 'devices'
-        for interface in self.interfaces.itervalues():
-            self.LOG.debug('Bringing up interface: ' + interface.name +
-                           ' and configuring addresses: ' +
-                           str(map(str, interface.ip_list)))
-            interface.up()
-            interface.config_addr()
-            interface.start_vlans()
-
-    def net_finalize(self):
-        # Special for VETH pairs, set the peer's default route to this host's
-        # bridge if a) it is present and b) it has IP addresses
-        for interface in self.interfaces.itervalues():
-            if isinstance(interface, VirtualInterface):
-                """ :type interface: VirtualInterface"""
-                interface.add_peer_route()
-
-        # Set up any IP forward rules
-        for exterior, interior in self.ip_forward_rules:
-            self.cli.cmd('iptables -t nat -A POSTROUTING -o ' +
-                         exterior + ' -j MASQUERADE')
-            self.cli.cmd('/sbin/iptables -A FORWARD -i ' +
-                         interior + ' -o ' + exterior + ' -j ACCEPT')
-            self.cli.cmd('/sbin/iptables -A FORWARD -i ' +
-                         exterior + ' -o ' + interior +
-                         ' -m state --state RELATED,ESTABLISHED -j ACCEPT')
-
-        # Set up any IP forward rules
-        for dest, gw, dev in self.route_rules:
-            self.add_route(dest, gw, dev)
-
-    def net_down(self):
-        # Set up any IP forward rules
-        for dest, gw, dev in self.route_rules:
-            self.del_route(dest)
-
-        # Set up any IP forward rules
-        for exterior, interior in self.ip_forward_rules:
-            self.cli.cmd('iptables -t nat -D POSTROUTING -o ' +
-                         exterior + ' -j MASQUERADE')
-            self.cli.cmd('/sbin/iptables -D FORWARD -i ' +
-                         interior + ' -o ' + exterior + ' -j ACCEPT')
-            self.cli.cmd('/sbin/iptables -D FORWARD -i ' +
-                         exterior + ' -o ' + interior +
-                         ' -m state --state RELATED,ESTABLISHED -j ACCEPT')
-
-        for interface in self.interfaces.itervalues():
-            interface.stop_vlans()
-            interface.down()
-
-        for bridge in self.bridges.itervalues():
-            bridge.down()
+    def net_up(self, tx=None):
+        with self.net_transaction(tx) as tx:
+            # Configure and bring up all network 'devices'
+            for interface in self.interfaces.itervalues():
+                self.LOG.debug('Bringing up interface: ' + interface.name +
+                               ' and configuring addresses: ' +
+                               str(map(str, interface.ip_list)))
+                interface.up(tx)
+                interface.config_addr(tx)
+                interface.start_vlans(tx)
+
+    def net_finalize(self, tx=None):
+        with self.net_transaction(tx) as tx:
+            # Special for VETH pairs, set the peer's default route to this
+            # host's bridge if a) it is present and b) it has IP addresses
+            for interface in self.interfaces.itervalues():
+                if isinstance(interface, VirtualInterface):
+                    """ :type interface: VirtualInterface"""
+                    interface.add_peer_route(tx)
+
+            # Set up any IP forward rules
+            for rule in self.ip_forward_rules:
+                self.ip_forward_rule_cmd('-A', rule, tx)
+
+            # Set up any IP forward rules
+            for dest, gw, dev in self.route_rules:
+                self.add_route(dest, gw, dev, tx=tx)
+
+    def net_down(self, tx=None):
+        with self.net_transaction(tx) as tx:
+            # Set up any IP forward rules
+            for dest, gw, dev in self.route_rules:
+                self.del_route(dest, tx)
+
+            # Set up any IP forward rules
+            for rule in self.ip_forward_rules:
+                self.ip_forward_rule_cmd('-D', rule, tx)
+
+            for interface in self.interfaces.itervalues():
+                interface.stop_vlans(tx)
+                interface.down(tx)
+
+            for bridge in self.bridges.itervalues():
+                bridge.down(tx)
+
+    def ip_forward_rule_cmd(self, action, rule, tx=None):
+        """
+        Add ('-A') or delete ('-D') the NAT/forwarding iptables rules for
+        an IP forward rule.
+        :type action: str
+        :type rule: IPForwardRuleDef
+        :type tx: NetlinkTransaction | IPBatchTransaction
+        """
+        rules = [('nat', action + ' POSTROUTING -o ' + rule.exterior +
+                  ' -j MASQUERADE'),
+                 ('filter', action + ' FORWARD -i ' + rule.interior +
+                  ' -o ' + rule.exterior + ' -j ACCEPT'),
+                 ('filter', action + ' FORWARD -i ' + rule.exterior +
+                  ' -o ' + rule.interior +
+                  ' -m state --state RELATED,ESTABLISHED -j ACCEPT')]
+        for table, iptables_rule in rules:
+            # Netlink can't program iptables, so only the batch mode
+            # queues these
+            if isinstance(tx, IPBatchTransaction):
+                tx.iptables(self.netns_name(), table, iptables_rule,
+                            owner=rule)
+            else:
+                self.cli.cmd('iptables -t ' + table + ' ' + iptables_rule)
 
     def prepare_applications(self, lm):
         for app in self.applications:
@@ -411,7 +503,13 @@ class Host(PTMObject):
         self.start_applications(app_type=app_type)
         self.wait_for_all_applications_to_start(app_type=app_type)
 
-    def set_loopback(self, ip_addr=IP('127.0.0.1', '8')):
+    def set_loopback(self, ip_addr=IP('127.0.0.1', '8'), tx=None):
+        if tx is not None:
+            tx.addr_add(self.netns_name(), 'lo', ip_addr, replace=True,
+                        owner=self)
+            tx.link_set(self.netns_name(), 'lo', up=True, owner=self)
+            return
+
         if not self.cli.grep_cmd('ip addr | grep lo | grep inet',
                                  str(ip_addr)):
             self.cli.cmd('ip addr add ' + str(ip_addr) + ' dev lo')
@@ -421,24 +519,37 @@ class Host(PTMObject):
         self.cli.cmd('ip route del default')
         self.cli.cmd('ip route add default via ' + ip_addr)
 
-    def add_route(self, route_ip='default', gw_ip=None, dev=None):
+    def add_route(self, route_ip='default', gw_ip=None, dev=None, tx=None):
         """
         :type route_ip: IP|str
         :type gw_ip: IP
         :type dev: str
+        :type tx: NetlinkTransaction
         :return:
         """
-        if gw_ip is None:
-            if dev is None:
-                raise exceptions.ArgMismatchException(
-                    'Must specify either next-hop GW or device to add a route')
+        if gw_ip is None and dev is None:
+            raise exceptions.ArgMismatchException(
+                'Must specify either next-hop GW or device to add a route')
+
+        if tx is not None:
+            tx.route_add(self.netns_name(), route_ip,
+                         gw_ip.ip if gw_ip is not None else None,
+                         str(dev) if dev else None, owner=self)
+        elif gw_ip is None:
             self.cli.cmd('ip route add ' + str(route_ip) + ' dev ' + str(dev))
         else:
             self.cli.cmd('ip route add ' + str(route_ip) + ' via ' + gw_ip.ip +
                          (' dev ' + str(dev) if dev else ''))
 
-    def del_route(self, route_ip):
-        self.cli.cmd('ip route del ' + str(route_ip.ip))
+    def del_route(self, route_ip, tx=None):
+        """
+        :type route_ip: IP
+        :type tx: NetlinkTransaction | IPBatchTransaction
+        """
+        if tx is not None:
+            tx.route_del(self.netns_name(), route_ip, owner=self)
+        else:
+            self.cli.cmd('ip route del ' + str(route_ip.ip))
 
     # noinspection PyUnresolvedReferences
     def get_ip(self, iface_name):
@@ -503,9 +614,9 @@ class Host(PTMObject):
 
     def remove_taps(self, vm_id):
         if vm_id in self.tap_interfaces:
-            taps_for_vm = self.tap_interfaces[vm_id]
-            for iface in taps_for_vm:
-                iface.remove()
+            tap_if = self.tap_interfaces.pop(vm_id)
+            tap_if.remove()
+            self.interfaces.pop(tap_if.name, None)
 
     def create_tap_interface_for_vm(
             self, tap_iface_name,
@@ -574,53 +685,90 @@ class Host(PTMObject):
 
         return LinuxCLI().cmd(cmd, blocking=False).process
 
+    def agent_control_path(self):
+        """
+        Path of the control socket of this host's agent.
+        :return: str
+        """
+        return (AGENT_CONTROL_DIR + '/zephyr-agent-' +
+                (self.netns_name() or self.name) + '.ctl')
+
+    def start_agent(self):
+        """
+        Start this host's agent (a single echo-server.py process which
+        serves all of the host's echo ports and sends its echo requests,
+        pings and probes) if it isn't running, and return a client for
+        its control socket.
+        :return: NetNSAgentClient
+        """
+        client = NetNSAgentClient(self.agent_control_path())
+        if self.agent_proc is not None and client.is_running():
+            return client
+
+        self.stop_agent()
+        cmd = [self.ptm.root_dir + '/echo-server.py',
+               '-s', self.agent_control_path(),
+               '-l', self.log_file_name,
+               '-r', self.log_manager.root_dir,
+               '-n', 'agent-' + self.name]
+        if self.debug:
+            cmd.append('-d')
+        self.agent_proc = self.cli.cmd_pipe([cmd], blocking=False)
+
+        deadline = time.time() + AGENT_START_TIMEOUT
+        while not client.is_running():
+            if time.time() > deadline:
+                self.stop_agent()
+                raise exceptions.SubprocessTimeoutException(
+                    'Agent failed to start on host: ' + self.name)
+            time.sleep(0.1)
+        return client
+
+    def stop_agent(self):
+        """
+        Stop this host's agent, along with all of its echo servers.
+        """
+        if self.agent_proc is None:
+            return
+        try:
+            NetNSAgentClient(self.agent_control_path()).shutdown()
+        except exceptions.TestException:
+            pass
+        self.agent_proc.terminate()
+        self.agent_proc = None
+
     def start_echo_server(self, ip_addr='localhost',
                           port=zephyr_constants.DEFAULT_ECHO_PORT,
                           echo_data="pong", protocol='tcp'):
         """
         Start an echo server listening on given ip/port (default to
         localhost:80) which returns the echo_data on any TCP
-        connection made to the port.
+        connection made to the port.  The server is added to the host's
+        agent (replacing any already on the same ip/port) rather than
+        run as a process of its own.
         :param ip_addr: str
         :param port: int
         :param echo_data: str
         :param protocol: str
-        :return: CommandStatus
+        :return: bool
         """
-        cmd = [self.ptm.root_dir + '/echo-server.py',
-               '-i', ip_addr,
-               '-p', str(port),
-               '-l', self.log_file_name,
-               '-r', self.log_manager.root_dir,
-               '-o', echo_data,
-               '-c', protocol,
-               '-n', 'echo_server-' + self.name]
-        if self.debug:
-            cmd.append('-d')
-
-        if (port in self.echo_server_procs and
-                self.echo_server_procs[port] is not None):
-            self.stop_echo_server(ip_addr, port)
-        es_process = self.cli.cmd_pipe([cmd], blocking=False)
-        self.echo_server_procs[port] = es_process
+        self.start_agent().start_listener(
+            ip_addr, port, echo_data, protocol)
         return True
 
     def stop_echo_server(self, ip_addr='localhost',
                          port=zephyr_constants.DEFAULT_ECHO_PORT):
         """
         Stop an echo server that has been started on given ip/port (defaults to
-        localhost:80).  If echo service has not been started, do nothing.
+        localhost:80).  If the agent has not been started, do nothing.
         :param ip_addr: str
         :param port: int
-        :return: (file, file) | None
+        :return: int | None The number of echo servers stopped
         """
-        out = None
-        if (port in self.echo_server_procs and
-                self.echo_server_procs[port] is not None):
-            es_proc = self.echo_server_procs[port]
-            out = es_proc.terminate()
-            self.echo_server_procs.pop(port)
-        return out
+        if self.agent_proc is None:
+            return None
+        return NetNSAgentClient(self.agent_control_path()).stop_listener(
+            ip_addr, port)
 
     def send_echo_request(self, dest_ip='localhost',
                           dest_port=zephyr_constants.DEFAULT_ECHO_PORT,
@@ -629,6 +777,7 @@ class Host(PTMObject):
         """
         Create a TCP connection to send specified request string to dest_ip
         on dest_port (defaults to localhost:80) and return the response.
+        The request is sent by the host's agent.
         :param dest_ip: str
         :param dest_port: int
         :param echo_request: str
@@ -636,18 +785,134 @@ class Host(PTMObject):
         :param timeout: int
         :return: str
         """
-        cmd = [self.ptm.root_dir + '/echo-send.py',
-               '-i', dest_ip,
-               '-p', str(dest_port),
-               '-t', str(timeout),
-               '-o', echo_request,
-               '-c', protocol]
+        try:
+            return self.start_agent().send_echo_request(
+                dest_ip, dest_port, echo_request, protocol, timeout)
+        except exceptions.SocketException as e:
+            raise exceptions.SubprocessFailedException(
+                'Echo Send failed: ' + str(e))
 
-        es_process = self.cli.cmd_pipe([cmd], blocking=True)
-        if es_process.ret_code != 0:
+    def send_echo_requests(self, dest_ip,
+                           dest_port=zephyr_constants.DEFAULT_ECHO_PORT,
+                           count=1, concurrency=10, echo_request='ping',
+                           protocol='tcp', timeout=10):
+        """
+        Send [count] echo requests to dest_ip on dest_port through the
+        host's agent, with up to [concurrency] of them in flight at once.
+        :param dest_ip: str
+        :param dest_port: int
+        :param count: int
+        :param concurrency: int
+        :param echo_request: str
+        :param protocol: str
+        :param timeout: int
+        :return: zephyr.common.netns_agent.EchoBatchResult
+        """
+        try:
+            return self.start_agent().send_echo_requests(
+                dest_ip, dest_port, count, concurrency, echo_request,
+                protocol, timeout)
+        except exceptions.SocketException as e:
             raise exceptions.SubprocessFailedException(
-                "Echo Send failed: " + es_process.stderr)
-        return es_process.stdout.strip()
+                'Echo Send failed: ' + str(e))
+
+    def measure_latency(self, dest_ip,
+                        dest_port=zephyr_constants.DEFAULT_ECHO_PORT,
+                        count=100, mode='persistent', protocol='tcp',
+                        interval=0, timeout=10):
+        """
+        Measure the latency to an echo server through the host's agent.
+        :param dest_ip: str
+        :param dest_port: int
+        :param count: int
+        :param mode: str
+        :param protocol: str
+        :param interval: float
+        :param timeout: int
+        :return: zephyr.common.latency.LatencyReport
+        """
+        return self.start_agent().measure_latency(
+            dest_ip, dest_port, count, mode, protocol, interval, timeout)
+
+    def measure_throughput(self, dest_ip,
+                           dest_port=zephyr_constants.DEFAULT_ECHO_PORT,
+                           direction='upload', size=None, duration=None,
+                           timeout=10):
+        """
+        Stream data to or from an echo server through the host's agent
+        and report the goodput.
+        :param dest_ip: str
+        :param dest_port: int
+        :param direction: str
+        :param size: int
+        :param duration: float
+        :param timeout: int
+        :return: zephyr.common.netns_agent.ThroughputReport
+        """
+        return self.start_agent().measure_throughput(
+            dest_ip, dest_port, direction, size, duration, timeout)
+
+    def probe(self, dest_ip, dest_port, protocol='tcp', payload=None,
+              timeout=3):
+        """
+        Check from this host whether anything answers on the given port.
+        :type dest_ip: str
+        :type dest_port: int
+        :type protocol: str
+        :type payload: str
+        :type timeout: float
+        :return: dict[str, any] See zephyr.common.netns_agent.probe
+        """
+        return self.start_agent().probe(dest_ip, dest_port, protocol,
+                                        payload, timeout)
+
+    def start_traffic_sink(self, port=zephyr_constants.DEFAULT_TRAFFIC_PORT,
+                           port_count=1, protocol='udp'):
+        """
+        Start receiving generated traffic on [port_count] ports starting
+        at the given port (replacing any sink already on that port).
+        :type port: int
+        :type port_count: int
+        :type protocol: str
+        :rtype: TrafficSink
+        """
+        self.stop_traffic_sink(port)
+        sink = TrafficSink(port=port, port_count=port_count,
+                           protocol=protocol, netns_name=self.netns_name())
+        self.traffic_sinks[port] = sink.start()
+        return sink
+
+    def traffic_sink_stats(self, port=zephyr_constants.DEFAULT_TRAFFIC_PORT,
+                           reset=False):
+        """
+        :type port: int
+        :type reset: bool
+        :rtype: dict[int, zephyr.common.traffic_generator.FlowReceiveStats]
+        """
+        if port not in self.traffic_sinks:
+            raise exceptions.ObjectNotFoundException(
+                'No traffic sink on port ' + str(port) + ' on host: ' +
+                self.name)
+        return self.traffic_sinks[port].stats(reset=reset)
+
+    def stop_traffic_sink(self, port=zephyr_constants.DEFAULT_TRAFFIC_PORT):
+        """
+        Stop the traffic sink on the given port, if there is one, and
+        return what it received.
+        :type port: int
+        :rtype: dict[int, zephyr.common.traffic_generator.FlowReceiveStats]
+        """
+        sink = self.traffic_sinks.pop(port, None)
+        return sink.stop() if sink is not None else None
+
+    def send_traffic(self, flows):
+        """
+        Send the flows from this host, each paced to its own rate, and
+        return what was sent once they have all finished.
+        :type flows: list[zephyr.common.traffic_generator.FlowSpec]
+        :rtype: list[zephyr.common.traffic_generator.FlowSendStats]
+        """
+        return TrafficGenerator(flows, netns_name=self.netns_name()).run()
 
     @staticmethod
     def is_virtual_network_host():
@@ -690,14 +955,15 @@ class Host(PTMObject):
         tcps = TCPSender()
         opt_map = {'command': command}
         if source_mac is not None:
-            opt_map = {'smac': source_mac}
+            opt_map['smac'] = source_mac
         if dest_mac is not None:
-            opt_map = {'tmac': dest_mac}
+            opt_map['tmac'] = dest_mac
         if source_ip is not None:
-            opt_map = {'sip': source_ip}
+            opt_map['sip'] = source_ip
         if dest_ip is not None:
-            opt_map = {'tip': dest_ip}
-        opt_map += packet_options
+            opt_map['tip'] = dest_ip
+        if packet_options is not None:
+            opt_map.update(packet_options)
         return tcps.send_packet(self.cli, interface=iface, dest_ip=dest_ip,
                                 packet_type='arp',
                                 packet_options=opt_map, count=count).stdout
@@ -730,26 +996,25 @@ class Host(PTMObject):
     def ping(self, target_ip, iface=None, count=1, timeout=None):
         """
         Ping a target IP.  Can specify the interface to use and/or the number
-        of pings to send.  Returns true if all pings succeeded, false
-        otherwise.
+        of pings to send.  Returns true if any ping got a reply, false
+        otherwise.  The pings are sent by the host's agent.
         :param target_ip: str: target IP in CIDR format
         :param iface: str: Interface or IP to act as source
         :param count: int: Number of pings to send
         :param timeout: int: Timeout before packets is marked as failed
         :return: bool
         """
-        iface_str = (('-I ' + iface) if iface is not None else '')
-        timeout_str = (('-W ' + str(timeout) + ' ')
-                       if timeout is not None
-                       else '')
-        return self.cli.cmd('ping -n ' + iface_str +
-                            ' -c ' + str(count) + ' ' +
-                            timeout_str +
-                            target_ip).ret_code == 0
+        try:
+            result = self.start_agent().ping(target_ip, iface, count,
+                                             timeout)
+        except exceptions.TestException as e:
+            self.LOG.error('Ping failed: ' + str(e))
+            return False
+        return result['received'] > 0
 
     def start_capture(self, interface, count=0, ptype='', pfilter=None,
                       callback=None, callback_args=None, save_dump_file=False,
-                      save_dump_filename=None):
+                      save_dump_filename=None, capture_buffer=None):
         """
         Starts the capture of packets on the host's interface with
         pcap_filter tools (e.g. tcpdump). This will start a process
@@ -777,6 +1042,8 @@ class Host(PTMObject):
         packet capture file
         :param save_dump_filename: str: Filename to save temporary
         packet capture file
+        :param capture_buffer: CaptureBuffer: Optional buffer (with its
+        own size bounds and drop policy) to hold the captured packets
         :return:
         """
         tcpd = (self.packet_captures[interface]
@@ -790,18 +1057,25 @@ class Host(PTMObject):
         if self.debug:
             self.cli.log_cmd = True
 
+        # All of the host's native captures are read by one thread
+        if self.capture_service is None:
+            self.capture_service = CaptureService(self.name,
+                                                  logger=self.LOG)
+
         tcpd.start_capture(cli=self.cli, interface=interface, count=count,
                            packet_type=ptype, pcap_filter=pfilter,
                            callback=callback, callback_args=callback_args,
                            save_dump_file=save_dump_file,
                            save_dump_filename=save_dump_filename,
-                           blocking=False)
+                           blocking=False,
+                           capture_service=self.capture_service,
+                           capture_buffer=capture_buffer)
 
         self.cli.log_cmd = old_log
 
         self.packet_captures[interface] = tcpd
 
-    def capture_packets(self, interface, count=1, timeout=None):
+    def capture_packets(self, interface, count=1, timeout=None, match=None):
         """
         Wait for and return a list of [count] received packets on the given
         interface. The optional timeout can be specified to bound the time
@@ -812,6 +1086,10 @@ class Host(PTMObject):
         return what is buffered)
         :param timeout: int: Upper bound on length of time to wait before
         exception is raised
+        :param match: callable | PcapRule: Only return (and count) the
+        packets which match this predicate or rule, discarding the rest
+        The returned list also carries the capture's drop counts, which
+        are logged if any packets have been dropped.
         :return: list [PCAPPacket]
         """
         if interface not in self.packet_captures:
@@ -819,7 +1097,14 @@ class Host(PTMObject):
                 'No packet capture is running or was run on host/interface' +
                 self.name + '/' + interface)
         tcpd = self.packet_captures[interface]
-        return tcpd.wait_for_packets(count, timeout)
+        if match is not None:
+            ret = tcpd.wait_for_matching_packets(match, count, timeout)
+        else:
+            ret = tcpd.wait_for_packets(count, timeout)
+        if ret.drop_summary():
+            self.LOG.warning('Capture on ' + self.name + '/' + interface +
+                             ': ' + ret.drop_summary())
+        return ret
 
     def stop_capture(self, interface):
         """
@@ -44,13 +44,25 @@ class Interface(PTMObject):
         self.linked_bridge = linked_bridge
         self.vlans = vlans
 
-    def create(self):
+    def create(self, tx=None):
         pass
 
-    def remove(self):
+    def remove(self, tx=None):
         pass
 
-    def config_addr(self):
+    def config_addr(self, tx=None):
+        """
+        :type tx: zephyr.common.netlink.NetlinkTransaction
+        """
+        if tx is not None:
+            if self.mac is not None:
+                tx.link_set(self.host.netns_name(), self.get_name(),
+                            mac=self.mac, owner=self)
+            for ip in self.ip_list:
+                tx.addr_add(self.host.netns_name(), self.get_name(), ip,
+                            owner=self)
+            return
+
         if self.mac is not None:
             self.cli.cmd('ip link set dev ' + self.get_name() +
                          ' address ' + self.mac)
@@ -58,12 +70,26 @@ class Interface(PTMObject):
         for ip in self.ip_list:
             self.cli.cmd('ip addr add ' + str(ip) + ' dev ' + self.get_name())
 
-    def up(self):
-        self.cli.cmd('ip link set dev ' + self.get_name() + ' up')
+    def up(self, tx=None):
+        """
+        :type tx: zephyr.common.netlink.NetlinkTransaction
+        """
+        if tx is not None:
+            tx.link_set(self.host.netns_name(), self.get_name(), up=True,
+                        owner=self)
+        else:
+            self.cli.cmd('ip link set dev ' + self.get_name() + ' up')
         self.state = Interface.UP
 
-    def down(self):
-        self.cli.cmd('ip link set dev ' + self.get_name() + ' down')
+    def down(self, tx=None):
+        """
+        :type tx: zephyr.common.netlink.NetlinkTransaction
+        """
+        if tx is not None:
+            tx.link_set(self.host.netns_name(), self.get_name(), up=False,
+                        owner=self)
+        else:
+            self.cli.cmd('ip link set dev ' + self.get_name() + ' down')
         self.state = Interface.DOWN
 
     def set_mac(self, new_mac):
@@ -86,30 +112,45 @@ class Interface(PTMObject):
                      ' dev ' + self.get_name())
         self.ip_list.remove(new_ip)
 
-    def start_vlans(self):
+    def start_vlans(self, tx=None):
         if self.vlans is not None:
             for vlan_id, vlan_ips in self.vlans.iteritems():
-                self.link_vlan(vlan_id, vlan_ips)
+                self.link_vlan(vlan_id, vlan_ips, tx)
 
-    def stop_vlans(self):
+    def stop_vlans(self, tx=None):
         if self.vlans is not None:
             for vlan_id in self.vlans.iterkeys():
-                self.unlink_vlan(vlan_id)
+                self.unlink_vlan(vlan_id, tx)
 
-    def link_vlan(self, vlan_id, ip_list):
+    def link_vlan(self, vlan_id, ip_list, tx=None):
         """
         :type vlan_id: str
         :type ip_list: list[IP]
+        :type tx: zephyr.common.netlink.NetlinkTransaction
         """
         vlan_iface = self.name + '.' + str(vlan_id)
+        if tx is not None:
+            ns = self.host.netns_name()
+            tx.link_add_vlan(ns, vlan_iface, self.name, vlan_id, owner=self)
+            tx.link_set(ns, vlan_iface, up=True, owner=self)
+            for ip in ip_list:
+                tx.addr_add(ns, vlan_iface, ip, owner=self)
+            return
+
         self.cli.cmd('ip link add link ' + self.name + ' name ' +
                      vlan_iface + ' type vlan id ' + str(vlan_id))
         self.cli.cmd('ip link set dev ' + vlan_iface + ' up')
         for ip in ip_list:
             self.cli.cmd('ip addr add ' + str(ip) + ' dev ' + vlan_iface)
 
-    def unlink_vlan(self, vlan_id):
+    def unlink_vlan(self, vlan_id, tx=None):
         vlan_iface = self.name + '.' + str(vlan_id)
+        if tx is not None:
+            tx.link_set(self.host.netns_name(), vlan_iface, up=False,
+                        owner=self)
+            tx.link_del(self.host.netns_name(), vlan_iface, owner=self)
+            return
+
         self.cli.cmd('ip link set dev ' + vlan_iface + ' down')
         self.cli.cmd('ip link del ' + vlan_iface)
 
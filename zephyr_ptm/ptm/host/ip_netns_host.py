@@ -27,3 +27,14 @@ class IPNetNSHost(Host):
         super(IPNetNSHost, self).__init__(name, ptm, NetNSCLI(name),
                                           CREATENSCMD, REMOVENSCMD)
         self.on_namespace = True
+
+    # The namespace is named for the host when it is created, and keeps
+    # that name if the host is renamed (see VMHost.rename)
+    def create(self):
+        self.create_func(self.cli.name)
+
+    def remove(self):
+        self.remove_func(self.cli.name)
+
+    def netns_name(self):
+        return self.cli.name
@@ -42,11 +42,15 @@ class VirtualInterface(Interface):
         self.peer_interface = far_interface
         self.use_namespace = use_namespace
 
-    def create(self):
+    def create(self, tx=None):
         """
         Link a veth peer to a far host and return the new interface
+        :type tx: zephyr.common.netlink.NetlinkTransaction
         :return: Interface The peer on the far host, configured and ready
         """
+        if tx is not None:
+            return self.create_netlink(tx)
+
         self.cli.cmd(
             'ip link add dev ' + self.get_name() +
             ' type veth peer name ' +
@@ -65,7 +69,7 @@ class VirtualInterface(Interface):
         if self.use_namespace:
             # move peer interface onto far host's namespace
             self.cli.cmd('ip link set dev ' + self.peer_name + ' netns ' +
-                         self.peer_interface.host.name + ' name ' +
+                         self.peer_interface.host.netns_name() + ' name ' +
                          self.peer_interface.name)
 
         # In the unlikely chance that the peer is also linked to a bridge,
@@ -78,22 +82,57 @@ class VirtualInterface(Interface):
         # far host and should be treated accordingly
         return self.peer_interface
 
-    def remove(self):
-        self.cli.cmd('ip link del dev ' + self.get_name())
+    def create_netlink(self, tx):
+        """
+        Same as create(), but queued on a netlink transaction.  The peer
+        is created directly in the far host's namespace under its final
+        name, rather than being created locally and then moved/renamed.
+        :type tx: zephyr.common.netlink.NetlinkTransaction
+        :return: Interface
+        """
+        if self.peer_interface is None:
+            peer_name = self.peer_name
+            peer_ns = None
+        else:
+            peer_name = self.peer_interface.name
+            peer_ns = (self.peer_interface.host.netns_name()
+                       if self.use_namespace else None)
+
+        tx.link_add_veth(self.host.netns_name(), self.get_name(), peer_name,
+                         peer_netns_name=peer_ns, owner=self)
+
+        if self.linked_bridge is not None:
+            self.linked_bridge.link_interface(self, tx)
+
+        if self.peer_interface is None:
+            return
+
+        if self.peer_interface.linked_bridge is not None:
+            self.peer_interface.linked_bridge.link_interface(
+                self.peer_interface, tx)
+
+        return self.peer_interface
+
+    def remove(self, tx=None):
+        if tx is not None:
+            tx.link_del(self.host.netns_name(), self.get_name(), owner=self)
+        else:
+            self.cli.cmd('ip link del dev ' + self.get_name())
 
-    def config_addr(self):
+    def config_addr(self, tx=None):
         # Perform the normal address configuration, then set the
         # peer's default route
-        super(VirtualInterface, self).config_addr()
+        super(VirtualInterface, self).config_addr(tx)
 
-    def add_peer_route(self):
+    def add_peer_route(self, tx=None):
         # If linked bridge has an IP, and the interface is a veth
         # device, add a route on the peer's host (far-end) for all
         # default traffic to come to the linked bridge
         if (self.linked_bridge is not None and
                 len(self.linked_bridge.ip_list) > 0):
             self.peer_interface.host.add_route(IP('0.0.0.0', '0'),
-                                               self.linked_bridge.ip_list[0])
+                                               self.linked_bridge.ip_list[0],
+                                               tx=tx)
 
     def print_config(self, indent=0):
         print(('    ' * indent) + self.name + ' with peer: ' +
@@ -13,15 +13,17 @@
 # limitations under the License.
 
 import uuid
+from zephyr.common.netns_agent import NetNSAgentClient
+from zephyr.common import process_table
 from zephyr_ptm.ptm.host.ip_netns_host import IPNetNSHost
 
 
 class VMHost(IPNetNSHost):
-    def __init__(self, name, hypervisor_app, uniqueid=uuid.uuid4()):
+    def __init__(self, name, hypervisor_app, uniqueid=None):
         super(VMHost, self).__init__(name, hypervisor_app.host.ptm)
         self.hypervisor_app = hypervisor_app
         self.hypervisor_host = hypervisor_app.host
-        self.id = str(uniqueid)
+        self.id = str(uniqueid if uniqueid is not None else uuid.uuid4())
 
     def wait_for_process_start(self):
         pass
@@ -29,7 +31,61 @@ class VMHost(IPNetNSHost):
     def wait_for_process_stop(self):
         pass
 
-    def shutdown(self):
-        super(VMHost, self).shutdown()
+    def reset(self):
+        """
+        Scrub this VM so its hypervisor can hand it out again: stop
+        everything running in it but its agent (whose echo servers are
+        stopped), release its DHCP leases and remove its taps (taking its
+        interfaces and their addresses with them), then flush what is
+        left of its routes and ARP table.
+        """
+        for port in self.traffic_sinks.keys():
+            self.stop_traffic_sink(port)
+        for iface in self.packet_captures.keys():
+            self.stop_capture(iface)
+        self.packet_captures.clear()
+        if self.agent_proc is not None:
+            client = NetNSAgentClient(self.agent_control_path())
+            for listener in client.list_listeners():
+                client.stop_listener(listener['ip_addr'], listener['port'],
+                                     listener['protocol'])
+        for iface in list(self.dhcpcd_is_running):
+            self.stop_dhcp_client(iface)
+        self.dhcpcd_is_running.clear()
+        agent_pids = self.agent_pids()
+        for pid in self.cli.get_running_pids():
+            if pid not in agent_pids:
+                self.cli.cmd('kill -9 ' + pid)
+        self.hypervisor_host.remove_taps(self.id)
+        self.interfaces.clear()
+        self.flush_arp()
+        self.cli.cmd('ip route flush table main')
+        self.main_ip = '127.0.0.1'
+
+    def agent_pids(self):
+        """
+        The PIDS of this VM's agent: the process it was started as (e.g.
+        sudo) and everything under it, which includes the agent itself.
+        :return: set[str]
+        """
+        if self.agent_proc is None:
+            return set()
+        pid = self.agent_proc.process.pid
+        return set([str(pid)] +
+                   [str(p.pid) for p in
+                    process_table.PROCESS_TABLE.descendants(pid)])
+
+    def rename(self, name):
+        """
+        Give this VM a new name (e.g. when it is handed out by a VM pool).
+        Its namespace (and agent) keep the name it was created with.
+        :type name: str
+        """
+        self.hypervisor_app.remove_vm(self)
+        self.name = name
+        self.hypervisor_app.add_vm(self)
+
+    def shutdown(self, tx=None):
+        super(VMHost, self).shutdown(tx)
         self.hypervisor_host.remove_taps(self)
         self.hypervisor_app.remove_vm(self)
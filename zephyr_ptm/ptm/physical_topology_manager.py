@@ -19,13 +19,16 @@ import os
 from zephyr.common import cli
 from zephyr.common import exceptions
 from zephyr.common import file_location
+from zephyr.common.ip_batch import IPBatchTransaction
 from zephyr.common.log_manager import LogManager
+from zephyr.common import netlink
 from zephyr.common.utils import get_class_from_fqn
 from zephyr.common import zephyr_constants
 from zephyr_ptm.ptm.application.netns_hv import NetnsHV
 from zephyr_ptm.ptm.fixtures import midonet_setup_fixture
 from zephyr_ptm.ptm.fixtures import neutron_setup_fixture
 from zephyr_ptm.ptm.physical_topology_config import PhysicalTopologyConfig
+from zephyr_ptm.ptm import ptm_constants
 
 
 class PhysicalTopologyManager(object):
@@ -63,6 +66,50 @@ class PhysicalTopologyManager(object):
         self.config_file = None
         self.hosts = []
         self.topo_file = None
+        self.net_config_mode = ptm_constants.NET_CONFIG_CLI
+
+    def set_net_config_mode(self, mode):
+        """
+        Select how host networks are configured on startup (see
+        ptm_constants.NET_CONFIG_MODES).  Netlink mode needs root, so
+        this falls back to 'cli' mode if it isn't available.
+        :type mode: str
+        """
+        if mode not in ptm_constants.NET_CONFIG_MODES:
+            raise exceptions.ArgMismatchException(
+                'Invalid network config mode: ' + mode)
+        if (mode == ptm_constants.NET_CONFIG_NETLINK and
+                not netlink.netlink_available()):
+            self.LOG.warning('Netlink network config is not available '
+                             '(requires root), using cli mode')
+            mode = ptm_constants.NET_CONFIG_CLI
+        self.net_config_mode = mode
+
+    def start_tier_transaction(self):
+        """
+        In batch mode, all hosts in a start tier share one transaction,
+        so the whole tier is applied with a single 'ip -batch' (and
+        'iptables-restore') per namespace.  Otherwise each host manages
+        its own transaction (if any).
+        :return: IPBatchTransaction
+        """
+        if self.net_config_mode == ptm_constants.NET_CONFIG_BATCH:
+            return IPBatchTransaction()
+        return None
+
+    def commit_tier_transaction(self, tx):
+        """
+        :type tx: IPBatchTransaction
+        """
+        if tx is None:
+            return
+        self.LOG.debug('Applying ' + str(len(tx)) +
+                       ' network changes for start tier')
+        try:
+            tx.commit()
+        except exceptions.IPBatchException as e:
+            self.LOG.error('Network configuration failed: ' + str(e))
+            raise
 
     def configure_logging(self, log_file_name=None,
                           log_name='ptm-root', debug=False):
@@ -282,20 +329,26 @@ class PhysicalTopologyManager(object):
                 h.create()
 
         for l in self.host_by_start_order:
+            tx = self.start_tier_transaction()
             for h in l:
                 self.LOG.debug('ptm booting host: ' + h.name)
-                h.boot()
+                h.boot(tx)
+            self.commit_tier_transaction(tx)
 
         self.LOG.debug('ptm starting host network')
         for l in self.host_by_start_order:
+            tx = self.start_tier_transaction()
             for h in l:
                 self.LOG.debug('ptm starting networks on host: ' + h.name)
-                h.net_up()
+                h.net_up(tx)
+            self.commit_tier_transaction(tx)
 
         for l in self.host_by_start_order:
+            tx = self.start_tier_transaction()
             for h in l:
                 self.LOG.debug('ptm finalizing networks on host: ' + h.name)
-                h.net_finalize()
+                h.net_finalize(tx)
+            self.commit_tier_transaction(tx)
 
         self.LOG.debug('ptm starting host applications')
         for l in self.host_by_start_order:
@@ -347,28 +400,44 @@ class PhysicalTopologyManager(object):
 
         self.LOG.debug('ptm stopping networks')
         for l in reversed(self.host_by_start_order):
+            tx = self.start_tier_transaction()
             for h in l:
                 try:
                     self.LOG.debug('ptm bringing down network on host: ' +
                                    h.name)
-                    h.net_down()
+                    h.net_down(tx)
                 except Exception as e:
                     self.LOG.fatal(
                         'Fatal error shutting down ptm host '
                         'networks, trying to continue to next host: ' +
                         str(e))
+            try:
+                self.commit_tier_transaction(tx)
+            except Exception as e:
+                self.LOG.fatal(
+                    'Fatal error shutting down ptm host '
+                    'networks, trying to continue to next tier: ' +
+                    str(e))
 
         self.LOG.debug('ptm stopping hosts')
         for l in reversed(self.host_by_start_order):
+            tx = self.start_tier_transaction()
             for h in l:
                 try:
                     self.LOG.debug('ptm stopping host: ' + h.name)
-                    h.shutdown()
+                    h.shutdown(tx)
                 except Exception as e:
                     self.LOG.fatal(
                         'Fatal error shutting down ptm hosts, trying '
                         'to continue to next host: ' +
                         str(e))
+            try:
+                self.commit_tier_transaction(tx)
+            except Exception as e:
+                self.LOG.fatal(
+                    'Fatal error shutting down ptm hosts, trying '
+                    'to continue to next tier: ' +
+                    str(e))
 
         for l in reversed(self.host_by_start_order):
             for h in l:
@@ -17,3 +17,11 @@ CONTROL_CMD_NAME = 'ptm-ctl.py'
 HOST_CONTROL_CMD_NAME = 'ptm-host-ctl.py'
 
 APPLICATION_START_TIMEOUT = 45
+
+# How host bridges, interfaces, addresses and routes are configured:
+# one 'ip'/'brctl' command per change, batched rtnetlink requests, or
+# one 'ip -batch'/'iptables-restore' exec per start tier
+NET_CONFIG_CLI = 'cli'
+NET_CONFIG_NETLINK = 'netlink'
+NET_CONFIG_BATCH = 'batch'
+NET_CONFIG_MODES = [NET_CONFIG_CLI, NET_CONFIG_NETLINK, NET_CONFIG_BATCH]
@@ -170,6 +170,48 @@ class PTMUnderlayHost(underlay_host.UnderlayHost):
             echo_request=echo_request, protocol=protocol,
             timeout=timeout)
 
+    def do_send_echo_requests(self, dest_ip,
+                              dest_port=zephyr_constants.DEFAULT_ECHO_PORT,
+                              count=1, concurrency=10, echo_request='ping',
+                              protocol='tcp', timeout=10):
+        return self.underlay_host_obj.send_echo_requests(
+            dest_ip, dest_port, count, concurrency, echo_request, protocol,
+            timeout)
+
+    def measure_latency(self, dest_ip,
+                        dest_port=zephyr_constants.DEFAULT_ECHO_PORT,
+                        count=100, mode='persistent', protocol='tcp',
+                        interval=0, timeout=10):
+        return self.underlay_host_obj.measure_latency(
+            dest_ip, dest_port, count, mode, protocol, interval, timeout)
+
+    def measure_throughput(self, dest_ip,
+                           dest_port=zephyr_constants.DEFAULT_ECHO_PORT,
+                           direction='upload', size=None, duration=None,
+                           timeout=10):
+        return self.underlay_host_obj.measure_throughput(
+            dest_ip, dest_port, direction, size, duration, timeout)
+
+    def probe(self, dest_ip, dest_port, protocol='tcp', payload=None,
+              timeout=3):
+        return self.underlay_host_obj.probe(
+            dest_ip, dest_port, protocol, payload, timeout)
+
+    def start_traffic_sink(self, port=zephyr_constants.DEFAULT_TRAFFIC_PORT,
+                           port_count=1, protocol='udp'):
+        return self.underlay_host_obj.start_traffic_sink(
+            port, port_count, protocol)
+
+    def traffic_sink_stats(self, port=zephyr_constants.DEFAULT_TRAFFIC_PORT,
+                           reset=False):
+        return self.underlay_host_obj.traffic_sink_stats(port, reset)
+
+    def stop_traffic_sink(self, port=zephyr_constants.DEFAULT_TRAFFIC_PORT):
+        return self.underlay_host_obj.stop_traffic_sink(port)
+
+    def send_traffic(self, flows):
+        return self.underlay_host_obj.send_traffic(flows)
+
     def send_custom_packet(self, iface, **kwargs):
         return self.underlay_host_obj.send_custom_packet(iface, **kwargs)
 
@@ -194,14 +236,15 @@ class PTMUnderlayHost(underlay_host.UnderlayHost):
 
     def start_capture(self, interface, count=0, ptype='', pfilter=None,
                       callback=None, callback_args=None, save_dump_file=False,
-                      save_dump_filename=None):
+                      save_dump_filename=None, capture_buffer=None):
         return self.underlay_host_obj.start_capture(
             interface, count, ptype, pfilter,
-            callback, callback_args, save_dump_file, save_dump_filename)
+            callback, callback_args, save_dump_file, save_dump_filename,
+            capture_buffer)
 
-    def capture_packets(self, interface, count=1, timeout=None):
+    def capture_packets(self, interface, count=1, timeout=None, match=None):
         return self.underlay_host_obj.capture_packets(
-            interface, count, timeout)
+            interface, count, timeout, match)
 
     def stop_capture(self, interface):
         return self.underlay_host_obj.stop_capture(interface)
@@ -214,6 +257,21 @@ class PTMUnderlayHost(underlay_host.UnderlayHost):
             cmd_line, timeout=timeout, blocking=blocking)
         return result
 
+    def rename_vm(self, name):
+        if not self.vm_host:
+            raise exceptions.ArgMismatchException(
+                "Error; rename_vm operation only valid on a VM host")
+        super(PTMUnderlayHost, self).rename_vm(name)
+        self.underlay_host_obj.rename(name)
+
+    def reset_vm(self):
+        if not self.vm_host:
+            raise exceptions.ArgMismatchException(
+                "Error; reset_vm operation only valid on a VM host")
+        super(PTMUnderlayHost, self).reset_vm()
+        self.underlay_host_obj.reset()
+        self.main_ip = self.underlay_host_obj.main_ip
+
     def terminate(self):
         """
         Kill this Host.
@@ -23,6 +23,7 @@ from zephyr_ptm.ptm.host.ip_netns_host import *
 from zephyr_ptm.ptm.host.root_host import RootHost
 from zephyr_ptm.ptm.physical_topology_config import *
 from zephyr_ptm.ptm.physical_topology_manager import PhysicalTopologyManager
+from zephyr_ptm.ptm import ptm_constants
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__)) + '/../../../..'
 
@@ -32,7 +33,7 @@ class DummyInterface(Interface):
         super(DummyInterface, self).__init__(
             name, host, linked_bridge=linked_bridge)
 
-    def create(self):
+    def create(self, tx=None):
         self.cli.cmd('ip link add dev ' + self.get_name() + ' type dummy')
         # Add interface to the linked bridge, if there is one
         if self.linked_bridge is not None:
@@ -172,6 +173,57 @@ class IPNetNSHostTest(unittest.TestCase):
         h1.shutdown()
         h1.remove()
 
+    def test_veth_connection_netlink(self):
+        lm = LogManager('./test-logs')
+        ptm = PhysicalTopologyManager(
+            root_dir=ROOT_DIR,
+            log_manager=lm)
+        ptm.configure_logging(log_file_name="test-ptm.log", debug=True)
+        ptm.set_net_config_mode(ptm_constants.NET_CONFIG_NETLINK)
+        if ptm.net_config_mode != ptm_constants.NET_CONFIG_NETLINK:
+            self.skipTest('netlink network config not available')
+
+        h1cfg = HostDef('test',
+                        bridges={'br0': BridgeDef(
+                            'br0', ip_addresses=[IP.make_ip('192.168.1.1')])},
+                        interfaces={
+                            'testi': InterfaceDef('testi',
+                                                  linked_bridge='br0')})
+        h2cfg = HostDef('test2',
+                        interfaces={
+                            'testp': InterfaceDef(
+                                'testp',
+                                [IP.make_ip('192.168.1.3')])})
+        icfg = ImplementationDef('test', 'IPNetNSHost', [])
+
+        h1 = IPNetNSHost(h1cfg.name, ptm)
+        h2 = IPNetNSHost(h2cfg.name, ptm)
+        h1.configure_logging(log_file_name="test-ptm.log", debug=True)
+        h2.configure_logging(log_file_name="test-ptm.log", debug=True)
+        h1.config_from_ptc_def(h1cfg, icfg)
+        h2.config_from_ptc_def(h2cfg, icfg)
+
+        h1.link_interface(h1.interfaces['testi'], h2, h2.interfaces['testp'])
+
+        h1.create()
+        h2.create()
+        h1.boot()
+        h2.boot()
+        h1.net_up()
+        h2.net_up()
+        h1.net_finalize()
+        h2.net_finalize()
+
+        # Peer is created directly on the far host, with its final name
+        self.assertTrue(h1.cli.grep_cmd('ip l | grep testi', 'br0'))
+        self.assertFalse(h1.cli.grep_cmd('ip l', 'testi.p'))
+        self.assertTrue(h2.cli.grep_cmd('ip a | grep testp', '192.168.1.3'))
+        self.assertTrue(h2.cli.grep_cmd('ip r | grep default',
+                                        '192.168.1.1'))
+
+        h2.remove()
+        h1.remove()
+
     def tearDown(self):
         LinuxCLI().cmd('ip netns del test')
         LinuxCLI().cmd('ip netns del test2')
@@ -0,0 +1,93 @@
+# Copyright 2016 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+
+from zephyr.common.cli import LinuxCLI
+from zephyr.common.ip import IP
+from zephyr.common.log_manager import LogManager
+from zephyr.common.utils import run_unit_test
+from zephyr_ptm.ptm.application import application
+from zephyr_ptm.ptm.application.netns_hv import NetnsHV
+from zephyr_ptm.ptm.host.root_host import RootHost
+from zephyr_ptm.ptm.physical_topology_manager import PhysicalTopologyManager
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__)) + '/../../../..'
+
+
+class VMHostResetTest(unittest.TestCase):
+    def test_reset(self):
+        lm = LogManager('./test-logs')
+        ptm = PhysicalTopologyManager(root_dir=ROOT_DIR, log_manager=lm)
+        ptm.configure_logging(log_file_name='test-ptm.log')
+        hypervisor = RootHost('pool_hv', ptm)
+        hv_app = NetnsHV(hypervisor)
+        hypervisor.applications.append(hv_app)
+        hypervisor.applications_by_type[
+            application.APPLICATION_TYPE_HYPERVISOR] = [hv_app]
+
+        vm1 = hv_app.create_vm('vmpool_a')
+        vm2 = hv_app.create_vm('vmpool_b')
+        try:
+            # Each VM (and so each VM's tap) has an ID of its own
+            self.assertNotEqual(vm1.id, vm2.id)
+            self.assertEqual(2, hv_app.get_vm_count())
+            hypervisor.create_tap_interface_for_vm(
+                tap_iface_name='tappoola', vm_host=vm1,
+                vm_iface_name='eth0', vm_ip_list=[IP('10.99.1.2', '24')])
+            hypervisor.create_tap_interface_for_vm(
+                tap_iface_name='tappoolb', vm_host=vm2,
+                vm_iface_name='eth0', vm_ip_list=[IP('10.99.2.2', '24')])
+
+            vm1.add_route(gw_ip=IP('10.99.1.1'))
+            vm1.cli.cmd('ip neighbour add 10.99.1.9 '
+                        'lladdr 02:00:00:00:00:09 dev eth0')
+            vm1.start_echo_server(ip_addr='127.0.0.1', port=5096)
+            vm1.cli.cmd('sleep 60', blocking=False)
+            agent_pids = vm1.agent_pids()
+
+            # Renaming a VM keeps its namespace (and agent)
+            vm1.rename('vm1')
+            self.assertIs(vm1, hv_app.get_vm('vm1'))
+            self.assertIsNone(hv_app.get_vm('vmpool_a'))
+            self.assertEqual('vmpool_a', vm1.netns_name())
+
+            vm1.reset()
+            self.assertEqual('', vm1.cli.cmd('ip route').stdout.strip())
+            self.assertEqual('',
+                             vm1.cli.cmd('ip neighbour').stdout.strip())
+            self.assertNotEqual(
+                0, LinuxCLI().cmd('ip link show dev tappoola').ret_code)
+            self.assertEqual({}, vm1.interfaces)
+            # Only the agent (and whatever it was started through) is left
+            # running, and it still answers (with its echo servers stopped)
+            self.assertEqual(agent_pids, set(vm1.cli.get_running_pids()))
+            self.assertEqual(agent_pids, vm1.agent_pids())
+            self.assertEqual([], vm1.start_agent().list_listeners())
+            vm1.start_echo_server(ip_addr='127.0.0.1', port=5096)
+            self.assertEqual('ping:pong',
+                             vm1.send_echo_request(dest_ip='127.0.0.1',
+                                                   dest_port=5096))
+
+            # The other VM's tap is left alone
+            self.assertEqual(
+                0, LinuxCLI().cmd('ip link show dev tappoolb').ret_code)
+        finally:
+            for vm in (vm1, vm2):
+                vm.shutdown()
+                vm.remove()
+            hypervisor.cli.cmd('ip link del dev tappoolb')
+
+run_unit_test(VMHostResetTest)